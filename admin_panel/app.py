@@ -202,7 +202,8 @@ def setup_bot(candidate_id):
         try:
             # اگر توکن معتبر است، بات را راه‌اندازی کن
             if bot_token and len(bot_token) > 20:
-                bot_manager.start_bot(bot_instance.id)
+                # اگر بات در حال اجراست با توکن جدید دوباره راه‌اندازی می‌شود
+                bot_manager.restart_bot(bot_instance.id)
                 flash(f'✅ بات @{bot_username} با موفقیت راه‌اندازی شد و آماده دریافت پیام است', 'success')
             else:
                 flash(f'⚠️ توکن بات ذخیره شد اما برای راه‌اندازی کامل باید از BotFather توکن معتبر دریافت کنید', 'warning')
@@ -215,6 +216,30 @@ def setup_bot(candidate_id):
     return render_template('admin/setup_bot.html', candidate=candidate)
 
 
+@app.route('/candidate/<int:candidate_id>/bot-toggle', methods=['POST'])
+@login_required
+def toggle_bot(candidate_id):
+    """فعال/غیرفعال کردن بات نماینده (افزودن یا حذف از runtime بدون ریستارت سرور)"""
+    candidate = Candidate.query.get_or_404(candidate_id)
+    bot_instance = BotInstance.query.filter_by(candidate_id=candidate.id).first()
+    
+    if not bot_instance:
+        flash('برای این نماینده هنوز باتی راه‌اندازی نشده است', 'warning')
+        return redirect(url_for('setup_bot', candidate_id=candidate.id))
+    
+    bot_instance.is_active = not bot_instance.is_active
+    safe_commit(db, "Database commit failed")
+    
+    if bot_instance.is_active:
+        bot_manager.start_bot(bot_instance.id)
+        flash(f'✅ بات @{bot_instance.bot_username} فعال شد', 'success')
+    else:
+        bot_manager.stop_bot(bot_instance.id)
+        flash(f'⛔ بات @{bot_instance.bot_username} غیرفعال شد', 'info')
+    
+    return redirect(url_for('setup_bot', candidate_id=candidate.id))
+
+
 @app.route('/candidate/<int:candidate_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_candidate(candidate_id):
@@ -270,7 +295,7 @@ def delete_candidate(candidate_id):
             TrialPeriod, ReferralProgram, ReferralReward, MonthlyTopCitizen,
             VIPInteraction, LiveEvent, PartyMembership, CoalitionMembership,
             DataExportLog, BetaTester, BotChannel, ScheduledPost,
-            BroadcastMessage, Poll, AutoReply
+            BroadcastMessage, Poll, AutoReply, CandidateCounter, AnalyticsHourly
         )
         
         # حذف تمام رکوردهای وابسته به candidate
@@ -297,6 +322,8 @@ def delete_candidate(candidate_id):
         BroadcastMessage.query.filter_by(candidate_id=candidate_id).delete()
         Poll.query.filter_by(candidate_id=candidate_id).delete()
         AutoReply.query.filter_by(candidate_id=candidate_id).delete()
+        CandidateCounter.query.filter_by(candidate_id=candidate_id).delete()
+        AnalyticsHourly.query.filter_by(candidate_id=candidate_id).delete()
         
         # حذف رکوردهای referred_by (نمایندگانی که این candidate آنها را معرفی کرده)
         Candidate.query.filter_by(referred_by=candidate_id).update({Candidate.referred_by: None})
@@ -550,6 +577,21 @@ def bot_status(bot_id):
     })
 
 
+@app.route('/api/bots/runtime')
+@login_required
+def bots_runtime_stats():
+    """آمار runtime بات‌ها: تعداد task و تخمین حافظه هر بات (API)"""
+    return jsonify(bot_manager.get_stats())
+
+
+@app.route('/api/db/pool')
+@login_required
+def db_pool_stats():
+    """وضعیت connection pool مشترک: checked-out، overflow و زمان انتظار (API)"""
+    from database.engine import get_pool_stats
+    return jsonify(get_pool_stats())
+
+
 @app.route('/candidate/<int:id>/activate-trial', methods=['POST'])
 @login_required
 def activate_trial(id):
@@ -841,8 +883,7 @@ def approve_referral_reward(reward_id):
 @app.route('/broadcast', methods=['GET', 'POST'])
 @login_required
 def broadcast_message():
-    from database.models import Candidate
-    from bot_engine.broadcast_sender import send_broadcast_message
+    from database.models import Candidate, AdminBroadcast
     candidates = Candidate.query.filter(Candidate.telegram_id.isnot(None)).all()
     # جمع‌آوری آمار مشابه داشبورد
     from database.models import BotInstance, Plan
@@ -853,7 +894,11 @@ def broadcast_message():
         'active_plans': Plan.query.filter(Plan.price > 0).count()
     }
     if request.method == 'POST':
-        message_type = request.form.get('message_type')
+        from werkzeug.utils import secure_filename
+        from config.settings import UPLOAD_FOLDER
+        from bot_engine.admin_broadcast import create_admin_broadcast, submit_admin_broadcast
+        
+        message_type = request.form.get('message_type') or 'text'
         message_text = request.form.get('message_text')
         recipients = request.form.getlist('recipients')
         file = request.files.get('file')
@@ -864,11 +909,55 @@ def broadcast_message():
             recipient_ids = [int(r) for r in recipients]
         selected_candidates = [c for c in candidates if c.id in recipient_ids]
         telegram_ids = [c.telegram_id for c in selected_candidates if c.telegram_id]
-        # ارسال پیام
-        send_broadcast_message(telegram_ids, message_type, message_text, file)
-        flash(f'پیام به {len(telegram_ids)} نماینده ارسال شد.', 'success')
-        return redirect(url_for('broadcast_message'))
-    return render_template('admin/broadcast_message.html', candidates=candidates, stats=stats)
+        
+        if not telegram_ids:
+            flash('❌ هیچ نماینده‌ای با آیدی تلگرام انتخاب نشده است', 'danger')
+            return redirect(url_for('broadcast_message'))
+        
+        # فایل روی دیسک همین نود ذخیره می‌شود؛ ارسال پس‌زمینه همین‌جا شروع می‌شود و
+        # file_id اولین آپلود روی job ذخیره می‌شود تا ادامه روی نود دیگر به فایل نیاز نداشته باشد
+        file_path = file_name = None
+        if message_type != 'text':
+            if not file or not file.filename:
+                flash('❌ برای ارسال عکس یا فایل، فایل را انتخاب کنید', 'danger')
+                return redirect(url_for('broadcast_message'))
+            import uuid
+            file_name = secure_filename(file.filename) or 'file'
+            upload_dir = os.path.join(UPLOAD_FOLDER, 'broadcasts')
+            os.makedirs(upload_dir, exist_ok=True)
+            file_path = os.path.join(upload_dir, f"{uuid.uuid4().hex}_{file_name}")
+            file.save(file_path)
+        
+        try:
+            job = create_admin_broadcast(
+                db.session, telegram_ids, message_type, message_text, file_path, file_name
+            )
+        except ValueError as e:
+            flash(f'❌ {str(e)}', 'danger')
+            return redirect(url_for('broadcast_message'))
+        
+        if not safe_commit(db, '❌ خطا در ثبت پیام'):
+            return redirect(url_for('broadcast_message'))
+        
+        # ارسال در پس‌زمینه روی موتور broadcast؛ پاسخ بلافاصله برمی‌گردد
+        submit_admin_broadcast(job.id)
+        flash(f'📨 ارسال پیام به {len(telegram_ids)} نماینده آغاز شد.', 'success')
+        return redirect(url_for('broadcast_message', job=job.id))
+    
+    job = None
+    job_id = request.args.get('job', type=int)
+    if job_id:
+        job = AdminBroadcast.query.get(job_id)
+    return render_template('admin/broadcast_message.html', candidates=candidates, stats=stats, job=job)
+
+
+@app.route('/broadcast/<int:job_id>/progress')
+@login_required
+def broadcast_progress(job_id):
+    """وضعیت پیشرفت ارسال پیام ادمین (API)"""
+    from database.models import AdminBroadcast
+    job = AdminBroadcast.query.get_or_404(job_id)
+    return jsonify(job.progress())
 
 
 if __name__ == '__main__':
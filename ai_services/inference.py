@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Batched ML Inference
+====================
+اجرای دسته‌ای مدل‌های transformers روی تعداد زیادی متن
+
+متن‌ها بر اساس طول مرتب می‌شوند تا هر batch متن‌های هم‌اندازه داشته باشد و
+padding هر batch (که pipeline یک بار برای کل batch انجام می‌دهد) حداقل شود؛
+کل لیست با یک فراخوانی pipeline و batch_size ثابت پردازش می‌شود و نتیجه‌ها
+به ترتیب ورودی برگردانده می‌شوند.
+"""
+
+from typing import Dict, List, Sequence
+import os
+
+# تعداد متن در هر forward pass مدل
+ML_BATCH_SIZE = int(os.getenv('ML_BATCH_SIZE', '32'))
+
+
+def batched_predict(model, texts: Sequence[str], batch_size: int = ML_BATCH_SIZE) -> List[Dict]:
+    """
+    پیش‌بینی دسته‌ای یک pipeline
+
+    Args:
+        model: pipeline متنی transformers (text-classification / sentiment-analysis)
+        texts: متن‌های تمیزشده
+        batch_size: تعداد متن در هر batch
+
+    Returns:
+        list: بهترین پیش‌بینی ({'label', 'score'}) هر متن به ترتیب ورودی
+    """
+    if not texts:
+        return []
+
+    order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+    outputs = model([texts[index] for index in order], batch_size=batch_size, truncation=True)
+
+    predictions: List[Dict] = [None] * len(texts)
+    for index, output in zip(order, outputs):
+        # با top_k برای هر متن لیستی از پیش‌بینی‌ها برگردانده می‌شود
+        predictions[index] = output[0] if isinstance(output, list) else output
+    return predictions
@@ -12,10 +12,17 @@ Message Categorization Service
 - criticism (انتقاد): انتقادات سازنده
 """
 
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 import logging
+import os
 from datetime import datetime
 import re
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_services.text_normalizer import get_text_normalizer
+from ai_services.inference import batched_predict, ML_BATCH_SIZE
 
 # برای حالت fallback اگر مدل ML در دسترس نبود
 KEYWORD_PATTERNS = {
@@ -64,6 +71,104 @@ PRIORITY_MAP = {
 logger = logging.getLogger(__name__)
 
 
+# اجزای مجاز الگوهای کلیدواژه: کاراکتر ساده یا escape با کمیت‌نمای اختیاری (\s*، \s+، \?)
+_PATTERN_ATOM = re.compile(r'\\.[*+?]?|.')
+# حداکثر تعداد متن منطبق متمایز که دسته‌های آن نگه داشته می‌شود
+_MATCH_CACHE_SIZE = 10000
+
+
+def _pattern_atoms(pattern: str) -> List[str]:
+    atoms = _PATTERN_ATOM.findall(pattern)
+    if any(atom in '[](){}|.^$*+?' for atom in atoms):
+        raise ValueError(f"الگوی کلیدواژه پشتیبانی نمی‌شود: {pattern}")
+    return atoms
+
+
+def _trie_regex(node: dict) -> str:
+    """تبدیل trie اجزای الگوها به regex (پیشوندهای مشترک فقط یک بار امتحان می‌شوند)"""
+    branches = [
+        (atom if atom.startswith('\\') else re.escape(atom)) + _trie_regex(child)
+        for atom, child in node.items() if atom
+    ]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # الگویی که اینجا تمام می‌شود: ادامه طولانی‌تر (greedy) اولویت دارد
+    return f'(?:{body})?' if '' in node else body
+
+
+def compile_keyword_patterns(patterns: Dict[str, List[str]]) -> Tuple["re.Pattern", List[Tuple["re.Pattern", str]]]:
+    """
+    کامپایل همه الگوهای کلیدواژه در یک regex ترکیبی به شکل trie
+
+    regex ساده «الگو۱|الگو۲|...» در re پایتون در هر موقعیت همه شاخه‌ها را
+    امتحان می‌کند و از ۷۳ findall جداگانه هم کندتر است؛ در شکل trie هر
+    پیشوند مشترک یک بار بررسی می‌شود و طولانی‌ترین کلیدواژه آن موقعیت
+    منطبق می‌شود. الگوهای تکی برای شمردن کلیدواژه‌های کوتاه‌تری است که از
+    همان موقعیت شروع می‌شوند (مثل «متاسف» در «متاسفانه»).
+
+    Returns:
+        tuple: (regex کامپایل‌شده، فهرست (الگوی کامپایل‌شده، دسته))
+    """
+    trie: dict = {}
+    compiled: List[Tuple["re.Pattern", str]] = []
+
+    for category, items in patterns.items():
+        for pattern in items:
+            node = trie
+            for atom in _pattern_atoms(pattern):
+                node = node.setdefault(atom, {})
+            node[''] = True
+            compiled.append((re.compile(pattern, re.IGNORECASE), category))
+
+    return re.compile(_trie_regex(trie), re.IGNORECASE), compiled
+
+
+_KEYWORD_REGEX, _KEYWORD_PATTERNS = compile_keyword_patterns(KEYWORD_PATTERNS)
+# lookahead: هر موقعیت متن بررسی می‌شود، حتی داخل کلیدواژه منطبق قبلی
+# («نه» در «متاسفانه»، «می شود» در «نمی شود»)، مثل findall جداگانه هر الگو
+_KEYWORD_SCANNER = re.compile(f'(?=({_KEYWORD_REGEX.pattern}))', re.IGNORECASE)
+_MATCH_CATEGORIES: Dict[str, Tuple[Tuple[int, str, int], ...]] = {}
+
+
+def _match_categories(keyword: str) -> Tuple[Tuple[int, str, int], ...]:
+    """
+    الگوهایی که از ابتدای طولانی‌ترین کلیدواژه یک موقعیت منطبق می‌شوند
+
+    Returns:
+        tuple: (شماره الگو، دسته، طول تطابق) برای هر الگو
+    """
+    matches = _MATCH_CATEGORIES.get(keyword)
+    if matches is None:
+        matches = tuple(
+            (index, category, match.end())
+            for index, (pattern, category) in enumerate(_KEYWORD_PATTERNS)
+            for match in [pattern.match(keyword)] if match
+        )
+        if len(_MATCH_CATEGORIES) < _MATCH_CACHE_SIZE:
+            _MATCH_CATEGORIES[keyword] = matches
+    return matches
+
+
+def keyword_scores(text: str) -> Dict[str, int]:
+    """
+    تعداد کلیدواژه‌های هر دسته در متن با یک پیمایش
+
+    نتیجه همان جمع findall جداگانه هر الگوی KEYWORD_PATTERNS است؛
+    کلیدواژه‌های تو در تو هم شمرده می‌شوند («متاسفانه» = متاسف + متاسفانه + نه)
+    ولی تطابق‌های هم‌پوشان یک الگو (دو «اما» در «اماما») یک بار، مثل findall.
+    """
+    scores = dict.fromkeys(KEYWORD_PATTERNS, 0)
+    pattern_ends: Dict[int, int] = {}
+    for match in _KEYWORD_SCANNER.finditer(text):
+        start = match.start()
+        for index, category, length in _match_categories(match.group(1)):
+            if pattern_ends.get(index, 0) <= start:
+                pattern_ends[index] = start + length
+                scores[category] += 1
+    return scores
+
+
 class MessageCategorizer:
     """
     کلاس اصلی برای دسته‌بندی پیام‌ها
@@ -73,6 +178,9 @@ class MessageCategorizer:
     2. Rule-based: الگوهای کلیدواژه برای fallback
     """
     
+    # حداقل اطمینان مدل برای پذیرفتن نتیجه ML (در غیر این صورت rule-based)
+    ml_threshold = 0.5
+    
     def __init__(self, use_ml: bool = True):
         """
         Args:
@@ -133,7 +241,7 @@ class MessageCategorizer:
         if self.use_ml and self.ml_model:
             try:
                 result = self._categorize_ml(text)
-                if result['confidence'] > 0.5:  # threshold
+                if result['confidence'] > self.ml_threshold:
                     return result
             except Exception as e:
                 logger.error(f"ML categorization failed: {e}")
@@ -145,23 +253,20 @@ class MessageCategorizer:
         """دسته‌بندی با ML"""
         # در حالت واقعی باید مدل fine-tune شده باشه
         # این فقط یک مثال است
-        result = self.ml_model(text)[0]
-        
+        return self._ml_result(self.ml_model(text)[0])
+    
+    def _ml_result(self, prediction: Dict) -> Dict:
+        """تبدیل پیش‌بینی مدل به نتیجه استاندارد"""
         # map کردن label به category
-        category = self._map_label_to_category(result['label'])
-        confidence = result['score']
+        category = self._map_label_to_category(prediction['label'])
+        confidence = prediction['score']
         
         return self._create_result(category, confidence, 'ml')
     
     def _categorize_rule_based(self, text: str) -> Dict:
         """دسته‌بندی بر اساس کلیدواژه"""
-        scores = {cat: 0 for cat in KEYWORD_PATTERNS.keys()}
-        
-        # محاسبه امتیاز هر دسته
-        for category, patterns in KEYWORD_PATTERNS.items():
-            for pattern in patterns:
-                matches = len(re.findall(pattern, text, re.IGNORECASE))
-                scores[category] += matches
+        # محاسبه امتیاز هر دسته (یک پیمایش regex ترکیبی)
+        scores = keyword_scores(text)
         
         # انتخاب دسته با بالاترین امتیاز
         if max(scores.values()) == 0:
@@ -186,20 +291,7 @@ class MessageCategorizer:
     
     def _clean_text(self, text: str) -> str:
         """تمیز کردن و نرمال‌سازی متن"""
-        # حذف کاراکترهای اضافی
-        text = re.sub(r'[\r\n\t]+', ' ', text)
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
-        
-        # نرمال‌سازی با hazm (اگر نصب باشد)
-        try:
-            from hazm import Normalizer
-            normalizer = Normalizer()
-            text = normalizer.normalize(text)
-        except ImportError:
-            pass
-        
-        return text
+        return get_text_normalizer().normalize(text)
     
     def _map_label_to_category(self, label: str) -> str:
         """تبدیل label مدل به category"""
@@ -220,9 +312,36 @@ class MessageCategorizer:
         else:
             return 'unknown'
     
-    def batch_categorize(self, texts: List[str]) -> List[Dict]:
-        """دسته‌بندی دسته‌جمعی"""
-        return [self.categorize(text) for text in texts]
+    def batch_categorize(self, texts: List[str], batch_size: int = ML_BATCH_SIZE) -> List[Dict]:
+        """
+        دسته‌بندی دسته‌جمعی
+        
+        در حالت ML همه متن‌ها در batchهای batch_size تایی به مدل داده می‌شوند
+        (به‌جای یک forward pass برای هر متن)؛ نتیجه‌های کم‌اطمینان مثل
+        categorize به rule-based برمی‌گردند.
+        """
+        results: List[Optional[Dict]] = [None] * len(texts)
+        cleaned: Dict[int, str] = {}
+        for index, text in enumerate(texts):
+            if not text or not text.strip():
+                results[index] = self._create_result('unknown', 0.0, 'empty')
+            else:
+                cleaned[index] = self._clean_text(text)
+        
+        predictions: Dict[int, Dict] = {}
+        if self.use_ml and self.ml_model and cleaned:
+            try:
+                predictions = dict(zip(cleaned, batched_predict(self.ml_model, list(cleaned.values()), batch_size)))
+            except Exception as e:
+                logger.error(f"ML batch categorization failed: {e}")
+        
+        for index, text in cleaned.items():
+            result = self._ml_result(predictions[index]) if index in predictions else None
+            if result is None or result['confidence'] <= self.ml_threshold:
+                result = self._categorize_rule_based(text)
+            results[index] = result
+        
+        return results
     
     def get_statistics(self, results: List[Dict]) -> Dict:
         """آمار دسته‌بندی"""
@@ -10,11 +10,19 @@ Sentiment Analysis Service
 - negative (منفی): -1.0 تا -0.3
 """
 
-from typing import Dict, Optional, List
+from typing import Dict, Iterable, Iterator, Optional, List, Tuple, Union
+import json
 import logging
+import os
 import re
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_services.text_normalizer import get_text_normalizer
+from ai_services.inference import batched_predict, ML_BATCH_SIZE
+
 logger = logging.getLogger(__name__)
 
 # واژگان احساسی فارسی (Sentiment Lexicon)
@@ -44,6 +52,220 @@ INTENSIFIERS = {
 
 NEGATIONS = ['نه', 'نی', 'ندارم', 'نیست', 'نمی', 'هیچ', 'بدون']
 
+# پیشوندهایی که فعل را منفی می‌کنند (نمی‌خواهم، نمی‌دانم)
+NEGATION_PREFIXES = ['نمی']
+
+# وندهای صرفی فارسی برای یافتن ریشه واژه‌های lexicon در متن (خوبی، دوستان، راضی‌ام)
+VERB_PREFIXES = ['می', 'ب']
+INFLECTION_SUFFIXES = [
+    'ها', 'های', 'هایی', 'ان', 'ین', 'ی', 'یی', 'ای', 'ه',
+    'م', 'ت', 'ش', 'ام', 'ات', 'اش', 'مان', 'تان', 'شان', 'مون', 'تون', 'شون',
+    'یم', 'ید', 'ند', 'ست', 'تر', 'ترین',
+]
+
+# مسیر پیش‌فرض فایل lexicon (در صورت تنظیم، جایگزین واژگان بالا می‌شود)
+SENTIMENT_LEXICON_PATH = os.getenv('SENTIMENT_LEXICON_PATH')
+
+POSITIVE = 'positive'
+NEGATIVE = 'negative'
+NEGATION = 'negation'
+INTENSIFIER = 'intensifier'
+
+_ZWNJ = '\u200c'
+_TOKEN = re.compile(r'[\w\u200c]+')
+
+
+class SentimentLexicon:
+    """
+    ایندکس واژگان احساسی برای امتیازدهی خطی نسبت به طول پیام
+
+    - dict تطابق دقیق: واژه -> {نوع: وزن}
+    - trie پیشوند و پسوند برای حالت‌های صرفی (نمی‌خواهم، خوبی‌ها، راضی‌ام)
+    - عبارت‌های چندکلمه‌ای (خسته نباشید، به شدت) با ایندکس کلمه اول
+
+    هزینه هر توکن به تعداد وندها (ثابت) بستگی دارد نه به اندازه lexicon؛
+    نتیجه توکن‌های تکراری هم در حافظه نگه داشته می‌شود.
+    """
+
+    MIN_STEM_LENGTH = 2
+    MAX_SUFFIXES = 2
+    TOKEN_CACHE_SIZE = 50000
+
+    def __init__(self, positive: Union[Iterable[str], Dict[str, float]] = (),
+                 negative: Union[Iterable[str], Dict[str, float]] = (),
+                 negations: Iterable[str] = (), intensifiers: Optional[Dict[str, float]] = None,
+                 negation_prefixes: Iterable[str] = NEGATION_PREFIXES,
+                 verb_prefixes: Iterable[str] = VERB_PREFIXES,
+                 suffixes: Iterable[str] = INFLECTION_SUFFIXES):
+        self._words: Dict[str, Dict[str, float]] = {}
+        # کلمه اول -> [(توکن‌های عبارت، نوع‌ها)] به ترتیب طول نزولی
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], Dict[str, float]]]] = {}
+        self._cache: Dict[str, Dict[str, float]] = {}
+
+        for kind, entries in ((POSITIVE, positive), (NEGATIVE, negative),
+                              (NEGATION, negations), (INTENSIFIER, intensifiers or {})):
+            weights = entries if isinstance(entries, dict) else dict.fromkeys(entries, 1.0)
+            for entry, weight in weights.items():
+                self.add(entry, kind, weight)
+
+        self._negation_prefixes = self._build_trie(negation_prefixes)
+        self._verb_prefixes = self._build_trie(verb_prefixes)
+        # پسوندها برعکس ذخیره می‌شوند تا از انتهای توکن پیمایش شوند
+        self._suffixes = self._build_trie(suffix[::-1] for suffix in suffixes)
+
+    @classmethod
+    def default(cls) -> 'SentimentLexicon':
+        """lexicon واژگان داخلی ماژول"""
+        return cls(POSITIVE_WORDS, NEGATIVE_WORDS, NEGATIONS, INTENSIFIERS)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'SentimentLexicon':
+        """
+        بارگذاری lexicon از فایل JSON
+
+        کلیدها: positive، negative (لیست واژه یا dict واژه -> وزن)، negations (لیست)،
+        intensifiers (dict واژه -> ضریب) و اختیاری negation_prefixes، verb_prefixes، suffixes
+        """
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        optional = {key: data[key] for key in ('negation_prefixes', 'verb_prefixes', 'suffixes') if key in data}
+        lexicon = cls(
+            data.get('positive', ()), data.get('negative', ()),
+            data.get('negations', ()), data.get('intensifiers', {}),
+            **optional
+        )
+        logger.info(f"Sentiment lexicon loaded from {path}: {len(lexicon)} entries")
+        return lexicon
+
+    def add(self, entry: str, kind: str, weight: float = 1.0):
+        tokens = tuple(token.strip(_ZWNJ) for token in _TOKEN.findall(entry.casefold()))
+        if not tokens:
+            return
+        if len(tokens) == 1:
+            self._words.setdefault(tokens[0], {})[kind] = weight
+        else:
+            phrases = self._phrases.setdefault(tokens[0], [])
+            for phrase_tokens, kinds in phrases:
+                if phrase_tokens == tokens:
+                    kinds[kind] = weight
+                    break
+            else:
+                phrases.append((tokens, {kind: weight}))
+                phrases.sort(key=lambda phrase: len(phrase[0]), reverse=True)
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._words) + sum(len(phrases) for phrases in self._phrases.values())
+
+    @staticmethod
+    def _build_trie(affixes: Iterable[str]) -> dict:
+        trie: dict = {}
+        for affix in affixes:
+            node = trie
+            for char in affix:
+                node = node.setdefault(char, {})
+            node[''] = True
+        return trie
+
+    @staticmethod
+    def _affix_lengths(trie: dict, chars: Iterable[str]) -> List[int]:
+        """طول همه وندهای trie که ابتدای chars هستند (بلندترین اول)"""
+        lengths = []
+        node = trie
+        for length, char in enumerate(chars, start=1):
+            node = node.get(char)
+            if node is None:
+                break
+            if '' in node:
+                lengths.append(length)
+        return lengths[::-1]
+
+    def lookup(self, token: str) -> Dict[str, float]:
+        """نوع‌های احساسی یک توکن (تطابق دقیق، سپس با حذف وندهای صرفی)"""
+        kinds = self._cache.get(token)
+        if kinds is None:
+            kinds = self._lookup(token)
+            if len(self._cache) >= self.TOKEN_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[token] = kinds
+        return kinds
+
+    def _lookup(self, token: str) -> Dict[str, float]:
+        if token not in self._words:
+            for length in self._affix_lengths(self._negation_prefixes, token):
+                if len(token) - length >= self.MIN_STEM_LENGTH:
+                    return {NEGATION: 1.0}
+
+        base = self.base_word(token)
+        return self._words[base] if base else {}
+
+    def base_word(self, token: str) -> Optional[str]:
+        """واژه lexicon که توکن شکل صرف‌شده آن است (یا خود توکن)"""
+        if token in self._words:
+            return token
+
+        stems = [token]
+        for length in self._affix_lengths(self._verb_prefixes, token):
+            stems.append(token[length:].lstrip(_ZWNJ))
+
+        for stem in stems:
+            base = stem if stem in self._words else self._strip_suffixes(stem, self.MAX_SUFFIXES)
+            if base:
+                return base
+        return None
+
+    def _strip_suffixes(self, stem: str, depth: int) -> Optional[str]:
+        if depth == 0:
+            return None
+        for length in self._affix_lengths(self._suffixes, reversed(stem)):
+            base = stem[:-length].rstrip(_ZWNJ)
+            if len(base) < self.MIN_STEM_LENGTH:
+                continue
+            if base in self._words:
+                return base
+            base = self._strip_suffixes(base, depth - 1)
+            if base:
+                return base
+        return None
+
+    def _inflects(self, token: str, word: str) -> bool:
+        if token == word:
+            return True
+        # واژه آخر عبارت‌ها در ایندکس تک‌واژه‌ای نیست؛ فقط پسوند حذف می‌شود
+        return self._strip_suffixes_to(token, word, self.MAX_SUFFIXES)
+
+    def _strip_suffixes_to(self, stem: str, word: str, depth: int) -> bool:
+        if depth == 0:
+            return False
+        for length in self._affix_lengths(self._suffixes, reversed(stem)):
+            base = stem[:-length].rstrip(_ZWNJ)
+            if base == word or self._strip_suffixes_to(base, word, depth - 1):
+                return True
+        return False
+
+    def scan(self, text: str) -> Iterator[Dict[str, float]]:
+        """
+        نوع‌های احساسی هر واژه یا عبارت متن، به ترتیب (یک پیمایش)
+
+        برای واژه‌های خارج از lexicon dict خالی برمی‌گردد تا مجاورت واژه‌ها حفظ شود.
+        """
+        tokens = [token.strip(_ZWNJ) for token in _TOKEN.findall(text.casefold())]
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            for phrase_tokens, kinds in self._phrases.get(token, ()):
+                end = i + len(phrase_tokens)
+                # کلمه آخر عبارت می‌تواند صرف شده باشد (خسته نباشید)
+                if (end <= len(tokens) and tokens[i + 1:end - 1] == list(phrase_tokens[1:-1])
+                        and self._inflects(tokens[end - 1], phrase_tokens[-1])):
+                    yield kinds
+                    i = end
+                    break
+            else:
+                yield self.lookup(token)
+                i += 1
+
 
 class SentimentAnalyzer:
     """
@@ -54,13 +276,22 @@ class SentimentAnalyzer:
     2. ML-based: مدل‌های deep learning (در آینده)
     """
     
-    def __init__(self, use_ml: bool = False):
+    # حداقل اطمینان مدل برای پذیرفتن نتیجه ML (در غیر این صورت lexicon)
+    ml_threshold = 0.6
+    
+    def __init__(self, use_ml: bool = False, lexicon: Optional[SentimentLexicon] = None,
+                 lexicon_path: Optional[str] = SENTIMENT_LEXICON_PATH):
         """
         Args:
             use_ml: استفاده از مدل ML (فعلاً False)
+            lexicon: lexicon آماده (اولویت دارد)
+            lexicon_path: فایل JSON واژگان؛ در غیر این صورت واژگان داخلی
         """
         self.use_ml = use_ml
         self.ml_model = None
+        if lexicon is None:
+            lexicon = SentimentLexicon.from_file(lexicon_path) if lexicon_path else SentimentLexicon.default()
+        self.lexicon = lexicon
         
         if use_ml:
             try:
@@ -110,7 +341,7 @@ class SentimentAnalyzer:
         if self.use_ml and self.ml_model:
             try:
                 result = self._analyze_ml(text)
-                if result['confidence'] > 0.6:
+                if result['confidence'] > self.ml_threshold:
                     return result
             except Exception as e:
                 logger.error(f"ML sentiment analysis failed: {e}")
@@ -120,10 +351,12 @@ class SentimentAnalyzer:
     
     def _analyze_ml(self, text: str) -> Dict:
         """تحلیل با ML"""
-        result = self.ml_model(text)[0]
-        
+        return self._ml_result(self.ml_model(text)[0])
+    
+    def _ml_result(self, prediction: Dict) -> Dict:
+        """تبدیل پیش‌بینی مدل به نتیجه استاندارد"""
         # تبدیل label به score
-        label = result['label'].lower()
+        label = prediction['label'].lower()
         if 'positive' in label or 'pos' in label:
             score = 0.7
             label = 'positive'
@@ -134,48 +367,52 @@ class SentimentAnalyzer:
             score = 0.0
             label = 'neutral'
         
-        confidence = result['score']
+        confidence = prediction['score']
         
         return self._create_result(score, label, confidence, 'ml')
     
     def _analyze_lexicon(self, text: str) -> Dict:
-        """تحلیل بر اساس واژگان"""
-        words = text.split()
-        
-        positive_count = 0
-        negative_count = 0
+        """تحلیل بر اساس واژگان (یک پیمایش روی ایندکس lexicon)"""
+        counts = {POSITIVE: 0.0, NEGATIVE: 0.0}
+        opposite = {POSITIVE: NEGATIVE, NEGATIVE: POSITIVE}
         intensity_factor = 1.0
         has_negation = False
+        last = None  # (قطبیت، مقدار، منفی‌شده) واژه احساسی قبلی، اگر بلافاصله قبل بوده
         
-        for i, word in enumerate(words):
+        for kinds in self.lexicon.scan(text):
             # بررسی نفی
-            if any(neg in word for neg in NEGATIONS):
-                has_negation = True
+            if NEGATION in kinds:
+                if last:
+                    # نفی بعد از واژه در فارسی رایج است: «راضی نیستم»، «خوب نیست»؛
+                    # اگر واژه قبلاً منفی شده باشد («هیچ مشکلی نیست») نفی دوباره اعمال نمی‌شود
+                    polarity, amount, negated = last
+                    if not negated:
+                        counts[polarity] -= amount
+                        counts[opposite[polarity]] += amount
+                    last = None
+                else:
+                    has_negation = True
                 continue
             
             # بررسی تشدید
-            for intensifier, factor in INTENSIFIERS.items():
-                if intensifier in word:
-                    intensity_factor = factor
-                    break
+            if INTENSIFIER in kinds:
+                intensity_factor = kinds[INTENSIFIER]
             
-            # بررسی کلمات مثبت
-            if any(pos in word for pos in POSITIVE_WORDS):
-                if has_negation:
-                    negative_count += intensity_factor
+            # بررسی کلمات مثبت و منفی
+            polarity = POSITIVE if POSITIVE in kinds else NEGATIVE if NEGATIVE in kinds else None
+            last = None
+            if polarity:
+                amount = kinds[polarity] * intensity_factor
+                negated = has_negation
+                if negated:
+                    polarity = opposite[polarity]
                     has_negation = False
-                else:
-                    positive_count += intensity_factor
-                intensity_factor = 1.0
-            
-            # بررسی کلمات منفی
-            elif any(neg in word for neg in NEGATIVE_WORDS):
-                if has_negation:
-                    positive_count += intensity_factor
-                    has_negation = False
-                else:
-                    negative_count += intensity_factor
+                counts[polarity] += amount
                 intensity_factor = 1.0
+                last = (polarity, amount, negated)
+        
+        positive_count = counts[POSITIVE]
+        negative_count = counts[NEGATIVE]
         
         # محاسبه نمره
         total = positive_count + negative_count
@@ -245,23 +482,37 @@ class SentimentAnalyzer:
     
     def _clean_text(self, text: str) -> str:
         """تمیز کردن متن"""
-        text = re.sub(r'[\r\n\t]+', ' ', text)
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
+        return get_text_normalizer().normalize(text)
+    
+    def batch_analyze(self, texts: List[str], batch_size: int = ML_BATCH_SIZE) -> List[Dict]:
+        """
+        تحلیل دسته‌جمعی
         
-        # نرمال‌سازی با hazm
-        try:
-            from hazm import Normalizer
-            normalizer = Normalizer()
-            text = normalizer.normalize(text)
-        except ImportError:
-            pass
+        در حالت ML همه متن‌ها در batchهای batch_size تایی به مدل داده می‌شوند؛
+        نتیجه‌های کم‌اطمینان مثل analyze به lexicon برمی‌گردند.
+        """
+        results: List[Optional[Dict]] = [None] * len(texts)
+        cleaned: Dict[int, str] = {}
+        for index, text in enumerate(texts):
+            if not text or not text.strip():
+                results[index] = self._create_result(0.0, 'neutral', 0.0, 'empty')
+            else:
+                cleaned[index] = self._clean_text(text)
         
-        return text
-    
-    def batch_analyze(self, texts: List[str]) -> List[Dict]:
-        """تحلیل دسته‌جمعی"""
-        return [self.analyze(text) for text in texts]
+        predictions: Dict[int, Dict] = {}
+        if self.use_ml and self.ml_model and cleaned:
+            try:
+                predictions = dict(zip(cleaned, batched_predict(self.ml_model, list(cleaned.values()), batch_size)))
+            except Exception as e:
+                logger.error(f"ML batch sentiment analysis failed: {e}")
+        
+        for index, text in cleaned.items():
+            result = self._ml_result(predictions[index]) if index in predictions else None
+            if result is None or result['confidence'] <= self.ml_threshold:
+                result = self._analyze_lexicon(text)
+            results[index] = result
+        
+        return results
     
     def get_sentiment_trend(self, results: List[Dict]) -> Dict:
         """روند احساسات"""
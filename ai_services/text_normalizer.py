@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Text Normalizer Service
+=======================
+نرمال‌سازی مشترک متن فارسی برای سرویس‌های تحلیل پیام
+
+Normalizer کتابخانه hazm فقط یک بار (در اولین استفاده) ساخته می‌شود و همه
+تحلیل‌گرها از همین instance استفاده می‌کنند. نتیجه نرمال‌سازی پیام‌ها در یک
+کش LRU نگه داشته می‌شود تا پیام تکراری (مثلاً دسته‌بندی و تحلیل احساس یک
+پیام) دوباره پردازش نشود. اگر hazm نصب نباشد، نرمال‌سازی سبک کاراکتری
+(یکسان‌سازی حروف عربی و حذف اعراب) انجام می‌شود.
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# حداکثر تعداد متن نرمال‌شده در کش
+TEXT_NORMALIZER_CACHE_SIZE = int(os.getenv('TEXT_NORMALIZER_CACHE_SIZE', '10000'))
+
+# متن‌های طولانی‌تر کش نمی‌شوند (تکراری بودنشان بعید است و حافظه زیادی می‌گیرند)
+MAX_CACHED_LENGTH = 2000
+
+_WHITESPACE = re.compile(r'\s+')
+
+# یکسان‌سازی حروف عربی با معادل فارسی و حذف اعراب/کشیده (حالت بدون hazm)
+_FALLBACK_TRANSLATION = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی',
+    'ك': 'ک',
+    'ة': 'ه', 'ۀ': 'ه',
+    'ؤ': 'و',
+    'إ': 'ا', 'أ': 'ا', 'ٱ': 'ا',
+    **{chr(code): None for code in range(0x064B, 0x0653)},  # فتحه، کسره، ضمه، تنوین، تشدید، سکون
+    'ـ': None,  # کشیده
+})
+
+
+def fallback_normalize(text: str) -> str:
+    """نرمال‌سازی سبک بدون hazm"""
+    return text.translate(_FALLBACK_TRANSLATION)
+
+
+class TextNormalizer:
+    """
+    سرویس نرمال‌سازی متن با کش LRU
+
+    متد normalize تمیزکاری فاصله‌ها و نرمال‌سازی hazm (یا fallback) را انجام
+    می‌دهد و thread-safe است.
+    """
+
+    def __init__(self, cache_size: int = TEXT_NORMALIZER_CACHE_SIZE, use_hazm: bool = True):
+        self.cache_size = cache_size
+        self.use_hazm = use_hazm
+        self._normalize: Optional[Callable[[str], str]] = None
+        self._backend: Optional[str] = None
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self) -> str:
+        """'hazm' یا 'fallback'"""
+        self._get_normalize()
+        return self._backend
+
+    def _get_normalize(self) -> Callable[[str], str]:
+        if self._normalize is None:
+            with self._lock:
+                if self._normalize is None:
+                    self._normalize = self._build_normalize()
+        return self._normalize
+
+    def _build_normalize(self) -> Callable[[str], str]:
+        if self.use_hazm:
+            try:
+                from hazm import Normalizer
+                normalizer = Normalizer()
+                self._backend = 'hazm'
+                logger.info("✅ Normalizer کتابخانه hazm بارگذاری شد")
+                return normalizer.normalize
+            except ImportError:
+                logger.warning("⚠️ hazm نصب نیست، از نرمال‌سازی ساده استفاده می‌شود")
+
+        self._backend = 'fallback'
+        return fallback_normalize
+
+    def normalize(self, text: str) -> str:
+        """تمیز کردن فاصله‌ها و نرمال‌سازی متن"""
+        if not text:
+            return ''
+
+        cacheable = len(text) <= MAX_CACHED_LENGTH
+        if cacheable:
+            with self._lock:
+                cached = self._cache.get(text)
+                if cached is not None:
+                    self._cache.move_to_end(text)
+                    self.hits += 1
+                    return cached
+
+        normalized = self._get_normalize()(_WHITESPACE.sub(' ', text).strip())
+
+        if cacheable:
+            with self._lock:
+                self.misses += 1
+                self._cache[text] = normalized
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return normalized
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': self._backend,
+                'cached': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Instance سراسری
+_normalizer_instance = None
+
+
+def get_text_normalizer() -> TextNormalizer:
+    """دریافت instance سراسری"""
+    global _normalizer_instance
+    if _normalizer_instance is None:
+        _normalizer_instance = TextNormalizer()
+    return _normalizer_instance
@@ -0,0 +1,326 @@
+"""
+ارسال پیام ادمین به نماینده‌ها در پس‌زمینه
+
+پنل ادمین فقط یک AdminBroadcast ثبت می‌کند و بلافاصله پاسخ می‌دهد؛ ارسال روی
+همان BroadcastEngine (محدودیت نرخ، retry و lease) با توکن بات اصلی انجام
+می‌شود و پیشرفت آن در جدول admin_broadcasts قابل پیگیری است.
+فایل پیوست فقط روی دیسک نودی است که آن را دریافت کرده؛ file_id اولین آپلود
+روی خود job ذخیره می‌شود تا ادامه ارسال روی هر نودی بدون فایل محلی ممکن باشد.
+"""
+import sys
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.models import AdminBroadcast
+from database.leasing import acquire_lease, renew_lease, release_lease
+from bot_engine.db_executor import run_db
+from bot_engine.media_cache import extract_file_id, is_invalid_file_id_error
+from bot_engine.broadcast_engine import (
+    broadcast_engine, SessionFactory, BroadcastProgress, ProgressFlusher, LeaseLost
+)
+from config.settings import TELEGRAM_BOT_TOKEN, BROADCAST_LEASE_TTL
+
+logger = logging.getLogger(__name__)
+
+# کلید محدودیت نرخ بات اصلی در BroadcastEngine (شناسه BotInstance ها از ۱ شروع می‌شود)
+MAIN_BOT_KEY = 0
+
+# متن ادمین escape نمی‌شود و مثل قبل بدون parse_mode (متن ساده) ارسال می‌شود
+ADMIN_PARSE_MODE = None
+
+# نوع پیام فرم ادمین -> نوع رسانه BroadcastEngine
+MESSAGE_MEDIA_TYPES = {
+    'text': None,
+    'photo': 'photo',
+    'document': 'document',
+}
+
+
+def create_admin_broadcast(session, telegram_ids: List[int], message_type: str, message_text: str,
+                           file_path: Optional[str] = None, file_name: Optional[str] = None) -> AdminBroadcast:
+    """ثبت یک ارسال ادمین در صف (commit با فراخواننده)"""
+    if message_type not in MESSAGE_MEDIA_TYPES:
+        raise ValueError(f"نوع پیام نامعتبر: {message_type}")
+    if message_type != 'text' and not file_path:
+        raise ValueError("برای ارسال رسانه فایل لازم است")
+
+    job = AdminBroadcast(
+        message_type=message_type,
+        message_text=message_text,
+        file_path=file_path,
+        file_name=file_name,
+        recipients=json.dumps(list(telegram_ids)),
+        total_users=len(telegram_ids),
+        status='pending',
+    )
+    session.add(job)
+    return job
+
+
+def submit_admin_broadcast(job_id: int) -> bool:
+    """شروع ارسال یک AdminBroadcast روی BroadcastEngine (بدون انتظار)"""
+    return broadcast_engine.run_job(f"admin:{job_id}", lambda: _run_admin_broadcast(job_id))
+
+
+def running_admin_broadcasts():
+    """شناسه AdminBroadcastهایی که در همین پروسه در حال ارسال هستند"""
+    return [int(key.split(':', 1)[1]) for key in broadcast_engine.running_jobs()
+            if key.startswith('admin:')]
+
+
+async def _send_to_recipient(job: dict, telegram_id: int, prime_lock: asyncio.Lock):
+    """
+    ارسال به یک گیرنده؛ فایل فقط یک بار آپلود و بقیه ارسال‌ها با file_id انجام می‌شود
+    """
+    args = (MAIN_BOT_KEY, TELEGRAM_BOT_TOKEN, telegram_id, job['message_text'], job['media_type'])
+    if job['media_type'] is None:
+        return await broadcast_engine.send(*args, parse_mode=ADMIN_PARSE_MODE)
+
+    if job['file_id'] is None:
+        async with prime_lock:
+            if job['file_id'] is None:
+                success, error, result = await broadcast_engine.send_with_result(
+                    *args, upload=(job['file_name'], job['file_content']), parse_mode=ADMIN_PARSE_MODE
+                )
+                if success:
+                    job['file_id'] = extract_file_id(job['media_type'], result)
+                    if job['file_id']:
+                        job['file_content'] = None
+                        await run_db(_store_admin_file_id, job['id'], job['file_id'])
+                return success, error
+
+    file_id = job['file_id']
+    success, error, _ = await broadcast_engine.send_with_result(
+        *args, file_id, parse_mode=ADMIN_PARSE_MODE
+    )
+    if not success and is_invalid_file_id_error(error) and job['file_content'] is None:
+        logger.warning(f"⚠️ file_id پیام ادمین #{job['id']} نامعتبر است؛ آپلود دوباره")
+        try:
+            job['file_content'] = await run_db(_read_file, job['file_path'])
+        except OSError as e:
+            # ادامه ارسال روی نودی که فایل پیوست را ندارد
+            return False, f"فایل پیوست در این نود موجود نیست: {str(e)}"
+        if job['file_id'] == file_id:
+            job['file_id'] = None
+        return await _send_to_recipient(job, telegram_id, prime_lock)
+    return success, error
+
+
+async def _run_admin_broadcast(job_id: int):
+    lease_ttl = broadcast_engine.lease_ttl
+    flusher: Optional[ProgressFlusher] = None
+    flush_task = None
+    prime_lock = asyncio.Lock()
+
+    try:
+        job = await run_db(_start_admin_broadcast, job_id, lease_ttl)
+        if not job:
+            return
+
+        progress = BroadcastProgress(job['sent_count'], job['failed_count'], job['processed_count'])
+        flusher = ProgressFlusher(
+            f"پیام ادمین #{job_id}", job_id, progress, _flush_admin_progress,
+            lease_ttl, broadcast_engine.flush_interval
+        )
+        flush_task = asyncio.create_task(flusher.run_periodically())
+
+        # جایگاه گیرنده در لیست (از ۱) نقش BotUser.id را در cursor دارد
+        queue: asyncio.Queue = asyncio.Queue()
+        for position, telegram_id in enumerate(job['recipients'], start=1):
+            if position > job['processed_count']:
+                queue.put_nowait((position, telegram_id))
+
+        async def worker():
+            while not queue.empty() and not flusher.lease_lost:
+                position, telegram_id = queue.get_nowait()
+                progress.dispatched(position)
+
+                success, error = await _send_to_recipient(job, telegram_id, prime_lock)
+                if not success:
+                    logger.warning(f"⚠️ خطا در ارسال پیام ادمین به {telegram_id}: {error}")
+
+                progress.record(position, telegram_id, success, error)
+
+        workers = min(broadcast_engine.workers_per_broadcast, max(1, queue.qsize()))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        if flusher.lease_lost:
+            return
+
+        flush_task.cancel()
+        await flusher.flush()
+        await run_db(
+            _finish_admin_broadcast, job_id, 'completed',
+            progress.sent_count, progress.failed_count
+        )
+        logger.info(
+            f"✅ ارسال پیام ادمین #{job_id} تکمیل شد - "
+            f"موفق: {progress.sent_count}, ناموفق: {progress.failed_count}"
+        )
+
+    except asyncio.CancelledError:
+        if flusher is not None:
+            await flusher.flush()
+            if not flusher.lease_lost:
+                await run_db(_release_admin_broadcast, job_id)
+        raise
+    except Exception as e:
+        logger.error(f"❌ خطا در ارسال پیام ادمین #{job_id}: {str(e)}")
+        if flusher is not None:
+            await flusher.flush()
+            await run_db(
+                _finish_admin_broadcast, job_id, 'failed',
+                flusher.progress.sent_count, flusher.progress.failed_count, str(e)
+            )
+        else:
+            await run_db(_finish_admin_broadcast, job_id, 'failed', error=str(e))
+    finally:
+        if flush_task is not None:
+            flush_task.cancel()
+
+
+# ------------------------------------------------------------
+# عملیات دیتابیس (روی executor اجرا می‌شوند)
+# ------------------------------------------------------------
+
+def _read_file(file_path: str) -> bytes:
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def _store_admin_file_id(job_id: int, file_id: str):
+    """ذخیره file_id اولین آپلود روی job (برای ادامه ارسال روی نود دیگر)"""
+    session = SessionFactory()
+    try:
+        session.query(AdminBroadcast).filter_by(id=job_id).update({'file_id': file_id})
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در ذخیره file_id پیام ادمین #{job_id}: {str(e)}")
+    finally:
+        session.close()
+
+
+def _start_admin_broadcast(job_id: int, lease_ttl: float = BROADCAST_LEASE_TTL):
+    """claim ارسال ادمین و آماده‌سازی اطلاعات آن؛ ارسال نیمه‌تمام از processed_count ادامه می‌یابد"""
+    session = SessionFactory()
+    try:
+        if not acquire_lease(session, AdminBroadcast, job_id, lease_ttl,
+                             AdminBroadcast.status.in_(('pending', 'sending'))):
+            return None
+
+        job = session.query(AdminBroadcast).get(job_id)
+        if not job:
+            return None
+
+        media_type = MESSAGE_MEDIA_TYPES.get(job.message_type)
+        file_content = None
+        try:
+            recipients = json.loads(job.recipients or '[]')
+            # با file_id ذخیره‌شده به فایل محلی نیازی نیست
+            if media_type and not job.file_id:
+                file_content = _read_file(job.file_path)
+        except (ValueError, OSError) as e:
+            error = str(e)
+            if isinstance(e, OSError):
+                error = f"فایل پیوست در این نود موجود نیست و هنوز در تلگرام آپلود نشده: {error}"
+            logger.error(f"❌ پیام ادمین #{job_id} قابل ارسال نیست: {error}")
+            release_lease(session, AdminBroadcast, job_id, {'status': 'failed', 'error_message': error})
+            session.commit()
+            return None
+
+        resuming = job.status == 'sending'
+        processed_count = (job.processed_count or 0) if resuming else 0
+        sent_count = (job.sent_count or 0) if resuming else 0
+        failed_count = (job.failed_count or 0) if resuming else 0
+
+        job.status = 'sending'
+        if not resuming or not job.started_at:
+            job.started_at = datetime.utcnow()
+        job.total_users = len(recipients)
+        job.processed_count = processed_count
+        job.sent_count = sent_count
+        job.failed_count = failed_count
+        session.commit()
+
+        if resuming:
+            logger.info(f"🔁 ادامه ارسال پیام ادمین #{job_id} از گیرنده {processed_count + 1}")
+        else:
+            logger.info(f"🚀 شروع ارسال پیام ادمین #{job_id} به {len(recipients)} نماینده")
+
+        return {
+            'id': job.id,
+            'message_text': job.message_text,
+            'media_type': media_type,
+            'file_path': job.file_path,
+            'file_name': job.file_name or os.path.basename(job.file_path or ''),
+            'file_content': file_content,
+            'file_id': job.file_id,
+            'recipients': recipients,
+            'processed_count': processed_count,
+            'sent_count': sent_count,
+            'failed_count': failed_count,
+        }
+    finally:
+        session.close()
+
+
+def _flush_admin_progress(job_id: int, snapshot: dict, lease_ttl: float = BROADCAST_LEASE_TTL):
+    """به‌روزرسانی شمارنده‌ها، cursor و lease (پیام ادمین لاگ جداگانه ندارد)"""
+    session = SessionFactory()
+    try:
+        renewed = renew_lease(session, AdminBroadcast, job_id, lease_ttl, {
+            'sent_count': snapshot['sent_count'],
+            'failed_count': snapshot['failed_count'],
+            'processed_count': snapshot['last_user_id'],
+        })
+        if not renewed:
+            raise LeaseLost(job_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _finish_admin_broadcast(job_id: int, status: str, sent_count: Optional[int] = None,
+                            failed_count: Optional[int] = None, error: Optional[str] = None):
+    session = SessionFactory()
+    try:
+        values = {
+            'status': status,
+            'completed_at': datetime.utcnow() if status == 'completed' else None,
+        }
+        if sent_count is not None:
+            values['sent_count'] = sent_count
+            values['failed_count'] = failed_count
+        if status == 'completed':
+            values['processed_count'] = AdminBroadcast.total_users
+        if error:
+            values['error_message'] = error
+        release_lease(session, AdminBroadcast, job_id, values)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در به‌روزرسانی پیام ادمین #{job_id}: {str(e)}")
+    finally:
+        session.close()
+
+
+def _release_admin_broadcast(job_id: int):
+    """آزاد کردن lease بدون تغییر وضعیت (توقف موتور در میانه ارسال)"""
+    session = SessionFactory()
+    try:
+        release_lease(session, AdminBroadcast, job_id)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در آزاد کردن lease پیام ادمین #{job_id}: {str(e)}")
+    finally:
+        session.close()
@@ -0,0 +1,341 @@
+"""
+ثبت دسته‌ای رویدادهای آمار بات (analytics و analytics_hourly)
+
+handlerها فقط رویداد (/start، مشاهده منو، پیام، مشارکت) را در حافظه می‌شمارند؛
+یک thread پس‌زمینه هر چند ثانیه یا با رسیدن تعداد رویدادها به سقف، شمارش‌ها را
+به ازای نماینده و ساعت/روز جمع و با upsert به ردیف‌های analytics_hourly و
+analytics اضافه می‌کند. صفحه آمار پنل فقط همین ردیف‌های از پیش جمع‌شده را
+می‌خواند.
+
+کاربران فعال با مجموعه کاربران دیده‌شده در روز و ساعت جاری (در حافظه) شمرده
+می‌شوند؛ پس از راه‌اندازی دوباره پروسه کاربری که همان روز دیده شده دوباره
+شمرده می‌شود.
+"""
+import sys
+import os
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Analytics, AnalyticsHourly, BotInstance, BotUser
+from database.engine import get_engine
+from bot_engine.content_cache import RESUME, PROGRAMS, HEADQUARTERS
+from config.settings import ANALYTICS_FLUSH_INTERVAL, ANALYTICS_FLUSH_BATCH
+
+logger = logging.getLogger(__name__)
+
+# رویدادها
+START = 'start'
+MESSAGE = 'message'
+CONTRIBUTION = 'contribution'
+
+# رویداد -> ستون شمارش (رویدادهای دیگر فقط تعامل و کاربر فعال هستند)
+EVENT_COLUMNS = {
+    MESSAGE: 'total_messages',
+    CONTRIBUTION: 'contributions',
+    RESUME: 'resume_views',
+    PROGRAMS: 'programs_views',
+    HEADQUARTERS: 'headquarters_views',
+}
+
+NEW_USERS = 'new_users'
+ACTIVE_USERS = 'active_users'
+INTERACTIONS = 'total_interactions'
+# کاربران فعال روزانه جدا از ساعتی شمرده می‌شوند (فقط در بافر)
+_DAY_ACTIVE_USERS = 'active_users:day'
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def upsert_rollups(connection, table, keys: Tuple[str, ...], rows: Dict[tuple, Dict[str, int]],
+                   replace: Iterable[str] = ()):
+    """
+    افزودن شمارش‌ها به ردیف‌های rollup (INSERT ... ON CONFLICT DO UPDATE روی sqlite و postgres)
+
+    Args:
+        table: جدول rollup با unique روی keys
+        keys: ستون‌های کلید ردیف
+        rows: کلید -> {ستون: مقدار}
+        replace: ستون‌هایی که جایگزین می‌شوند (بقیه جمع می‌شوند)
+    """
+    replace = set(replace)
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(connection.dialect.name)
+
+    def merged(column, value):
+        if column in replace:
+            return value
+        return func.coalesce(table.c[column], 0) + value
+
+    for key, values in sorted(rows.items()):
+        if not any(values.values()):
+            continue
+        where = dict(zip(keys, key))
+        if dialect is not None:
+            stmt = dialect.insert(table).values(**where, **values)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=list(keys),
+                set_={column: merged(column, stmt.excluded[column]) for column in values}
+            ))
+            continue
+
+        updated = connection.execute(table.update().where(
+            *(table.c[column] == value for column, value in where.items())
+        ).values({column: merged(column, value) for column, value in values.items()})).rowcount
+        if not updated:
+            connection.execute(table.insert().values(**where, **values))
+
+
+class AnalyticsBuffer:
+    """
+    بافر رویدادهای آمار و flush دسته‌ای به ازای (نماینده، ساعت) و (نماینده، روز)
+
+    - رویدادها به ازای (بات، ساعت) در حافظه جمع می‌شوند؛ handlerها کوئری نمی‌زنند
+    - flush هر flush_interval ثانیه یا وقتی تعداد رویدادها به batch_size برسد
+    - بات به نماینده هنگام flush (با یک کوئری برای بات‌های جدید) نگاشت می‌شود
+    """
+
+    def __init__(self, flush_interval: float = ANALYTICS_FLUSH_INTERVAL,
+                 batch_size: int = ANALYTICS_FLUSH_BATCH,
+                 session_factory=None):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._session_factory = session_factory
+
+        self._pending: Dict[Tuple[int, datetime], Dict[str, int]] = {}
+        self._events = 0
+        self._seen_days: Dict[tuple, Set[int]] = {}
+        self._seen_hours: Dict[tuple, Set[int]] = {}
+        self._candidates: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.flushed_events = 0
+        self.flushes = 0
+
+    # ------------------------------------------------------------
+    # ثبت رویداد (از handlerها - بدون کوئری)
+    # ------------------------------------------------------------
+
+    def record(self, bot_instance_id: int, telegram_id: int, event: str,
+               at: Optional[datetime] = None):
+        """ثبت یک تعامل کاربر؛ فقط در حافظه"""
+        if bot_instance_id is None:
+            return
+
+        at = at or datetime.utcnow()
+        hour = hour_bucket(at)
+        column = EVENT_COLUMNS.get(event)
+
+        self.start()
+
+        with self._lock:
+            counts = self._bucket_locked(bot_instance_id, hour)
+            counts[INTERACTIONS] += 1
+            if column:
+                counts[column] += 1
+            if telegram_id is not None:
+                # کاربر فعال: اولین دیده‌شدن در روز و ساعت جاری
+                seen_day = self._seen_days.setdefault((bot_instance_id, at.date()), set())
+                if telegram_id not in seen_day:
+                    seen_day.add(telegram_id)
+                    counts[_DAY_ACTIVE_USERS] += 1
+                seen_hour = self._seen_hours.setdefault((bot_instance_id, hour), set())
+                if telegram_id not in seen_hour:
+                    seen_hour.add(telegram_id)
+                    counts[ACTIVE_USERS] += 1
+            should_flush = self._count_event_locked()
+
+        if should_flush:
+            self._wakeup.set()
+
+    def record_new_user(self, bot_instance_id: int, at: Optional[datetime] = None):
+        """ثبت عضویت کاربر جدید بات"""
+        if bot_instance_id is None:
+            return
+
+        self.start()
+
+        with self._lock:
+            self._bucket_locked(bot_instance_id, hour_bucket(at or datetime.utcnow()))[NEW_USERS] += 1
+            should_flush = self._count_event_locked()
+
+        if should_flush:
+            self._wakeup.set()
+
+    def _bucket_locked(self, bot_instance_id, hour):
+        counts = self._pending.get((bot_instance_id, hour))
+        if counts is None:
+            counts = self._pending[(bot_instance_id, hour)] = defaultdict(int)
+        return counts
+
+    def _count_event_locked(self) -> bool:
+        self._events += 1
+        return self._events >= self.batch_size
+
+    # ------------------------------------------------------------
+    # thread پس‌زمینه
+    # ------------------------------------------------------------
+
+    def start(self):
+        """راه‌اندازی thread flush (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name='AnalyticsFlusher', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """توقف thread و flush نهایی"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 30)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ خطا در flush آمار بات‌ها: {str(e)}")
+
+    # ------------------------------------------------------------
+    # flush دسته‌ای
+    # ------------------------------------------------------------
+
+    def flush(self, now: Optional[datetime] = None) -> int:
+        """
+        جمع رویدادهای بافر به ازای نماینده و upsert ردیف‌های ساعتی و روزانه
+
+        Returns:
+            int: تعداد رویدادهای flush شده
+        """
+        with self._lock:
+            self._prune_seen_locked(now or datetime.utcnow())
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            events, self._events = self._events, 0
+
+        session = self._get_session_factory()()
+        try:
+            candidates = self._resolve_candidates(session, {bot_id for bot_id, _ in pending})
+            hourly, daily = self._rollup(pending, candidates)
+
+            connection = session.connection()
+            upsert_rollups(connection, AnalyticsHourly.__table__, ('candidate_id', 'hour'), hourly)
+            upsert_rollups(connection, Analytics.__table__, ('candidate_id', 'date'),
+                           self._with_total_users(session, daily, candidates), replace=('total_users',))
+            session.commit()
+        except Exception:
+            session.rollback()
+            self._requeue(pending, events)
+            raise
+        finally:
+            session.close()
+
+        self.flushed_events += events
+        self.flushes += 1
+        logger.debug(f"آمار {events} رویداد در {len(daily)} ردیف روزانه ثبت شد")
+        return events
+
+    def _resolve_candidates(self, session, bot_ids: Set[int]) -> Dict[int, int]:
+        """نگاشت بات به نماینده (بات‌های ناشناخته با یک کوئری)"""
+        unknown = [bot_id for bot_id in bot_ids if bot_id not in self._candidates]
+        if unknown:
+            rows = session.query(BotInstance.id, BotInstance.candidate_id).filter(
+                BotInstance.id.in_(unknown)
+            ).all()
+            with self._lock:
+                self._candidates.update(dict(rows))
+        return {bot_id: self._candidates[bot_id] for bot_id in bot_ids if bot_id in self._candidates}
+
+    @staticmethod
+    def _rollup(pending, candidates):
+        hourly: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        daily: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+        for (bot_id, hour), counts in pending.items():
+            candidate_id = candidates.get(bot_id)
+            if candidate_id is None:
+                logger.debug(f"آمار بات ناشناخته {bot_id} نادیده گرفته شد")
+                continue
+            for column, value in counts.items():
+                if column == _DAY_ACTIVE_USERS:
+                    daily[(candidate_id, hour.date())][ACTIVE_USERS] += value
+                    continue
+                hourly[(candidate_id, hour)][column] += value
+                if column != ACTIVE_USERS:
+                    daily[(candidate_id, hour.date())][column] += value
+        return hourly, daily
+
+    @staticmethod
+    def _with_total_users(session, daily, candidates):
+        """کل کاربران بات هر نماینده در لحظه flush (یک کوئری گروه‌بندی‌شده)"""
+        if not daily:
+            return daily
+        totals = dict(session.query(BotInstance.candidate_id, func.count(BotUser.id)).join(
+            BotUser, BotUser.bot_instance_id == BotInstance.id
+        ).filter(
+            BotInstance.candidate_id.in_(set(candidates.values()))
+        ).group_by(BotInstance.candidate_id).all())
+
+        for (candidate_id, _), values in daily.items():
+            values['total_users'] = totals.get(candidate_id, 0)
+        return daily
+
+    def _prune_seen_locked(self, now: datetime):
+        """فراموش کردن کاربران دیده‌شده روزها و ساعت‌های گذشته"""
+        today, hour = now.date(), hour_bucket(now)
+        self._seen_days = {key: seen for key, seen in self._seen_days.items() if key[1] >= today}
+        self._seen_hours = {key: seen for key, seen in self._seen_hours.items() if key[1] >= hour}
+
+    def _requeue(self, pending, events):
+        """بازگرداندن شمارش‌ها به بافر پس از خطا"""
+        with self._lock:
+            for key, counts in pending.items():
+                bucket = self._bucket_locked(*key)
+                for column, value in counts.items():
+                    bucket[column] += value
+            self._events += events
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(bind=get_engine())
+        return self._session_factory
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'pending_buckets': len(self._pending),
+                'pending_events': self._events,
+                'flushed_events': self.flushed_events,
+                'flushes': self.flushes,
+            }
+
+
+# Instance سراسری
+analytics_events = AnalyticsBuffer()
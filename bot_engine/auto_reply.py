@@ -0,0 +1,260 @@
+"""
+پاسخ خودکار بات بر اساس کلمات کلیدی نماینده (AutoReply)
+
+قوانین هر بات یک بار به یک automaton چندالگویی Aho-Corasick کامپایل می‌شوند؛
+تطبیق هر پیام O(طول پیام) است و به تعداد قوانین بستگی ندارد. automaton
+فقط وقتی قوانین تغییر کنند دوباره ساخته می‌شود: پنل نماینده در همان پروسه
+آن را باطل می‌کند و بقیه پروسه‌ها هر چند ثانیه امضای ارزان قوانین
+(تعداد و بیشترین id) را با دیتابیس مقایسه می‌کنند.
+"""
+import sys
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from database.models import AutoReply, BotInstance
+from database.engine import get_engine
+from config.settings import AUTO_REPLY_REVALIDATE_INTERVAL
+
+
+class Rule(NamedTuple):
+    id: int
+    keyword: str
+    reply_text: str
+
+
+class AhoCorasick:
+    """
+    automaton Aho-Corasick برای یافتن همه الگوها در یک پیمایش متن
+
+    گره‌ها آرایه‌ای از dict انتقال هستند؛ خروجی هر گره شامل خروجی‌های
+    زنجیره fail هم می‌شود تا جستجو بدون دنبال کردن زنجیره انجام شود.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[object]] = [[]]
+
+        for pattern, value in patterns:
+            if pattern:
+                self._add(pattern, value)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, value):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(value)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def __len__(self):
+        return len(self._goto)
+
+    def iter_matches(self, text: str):
+        """همه (موقعیت پایان، مقدار) الگوهای یافت‌شده در متن"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                for value in output[node]:
+                    yield index, value
+
+
+def normalize_keyword(text: str, case_sensitive: bool) -> str:
+    text = (text or '').strip()
+    return text if case_sensitive else text.casefold()
+
+
+class AutoReplyMatcher:
+    """
+    قوانین کامپایل‌شده یک نماینده
+
+    - exact_match: کل پیام برابر کلمه کلیدی (جستجوی dict)
+    - در غیر این صورت: کلمه کلیدی جایی در پیام آمده باشد (Aho-Corasick)
+
+    قوانین تطابق دقیق اولویت دارند؛ بین بقیه، طولانی‌ترین کلمه کلیدی (دقیق‌ترین)
+    و سپس قدیمی‌ترین قانون انتخاب می‌شود.
+    """
+
+    def __init__(self, rules: Iterable):
+        self._exact: Dict[str, Rule] = {}
+        self._exact_sensitive: Dict[str, Rule] = {}
+        contains, contains_sensitive = [], []
+        self.rule_count = 0
+
+        for rule in sorted(rules, key=lambda r: r.id):
+            keyword = normalize_keyword(rule.keyword, rule.case_sensitive)
+            if not keyword:
+                continue
+            compiled = Rule(rule.id, keyword, rule.reply_text)
+            self.rule_count += 1
+
+            if rule.exact_match:
+                target = self._exact_sensitive if rule.case_sensitive else self._exact
+                target.setdefault(keyword, compiled)
+            elif rule.case_sensitive:
+                contains_sensitive.append((keyword, compiled))
+            else:
+                contains.append((keyword, compiled))
+
+        self._contains = AhoCorasick(contains) if contains else None
+        self._contains_sensitive = AhoCorasick(contains_sensitive) if contains_sensitive else None
+
+    def match(self, text: str) -> Optional[Rule]:
+        """قانون منطبق با پیام یا None"""
+        if not text:
+            return None
+
+        stripped = text.strip()
+        folded = stripped.casefold()
+
+        rule = self._exact_sensitive.get(stripped) or self._exact.get(folded)
+        if rule:
+            return rule
+
+        best = None
+        for automaton, haystack in ((self._contains_sensitive, stripped), (self._contains, folded)):
+            if automaton is None:
+                continue
+            for _, rule in automaton.iter_matches(haystack):
+                if best is None or (len(rule.keyword), -rule.id) > (len(best.keyword), -best.id):
+                    best = rule
+        return best
+
+
+class AutoReplyIndex:
+    """
+    کش matcher کامپایل‌شده به ازای هر بات
+
+    تا AUTO_REPLY_REVALIDATE_INTERVAL ثانیه پس از آخرین بررسی هیچ کوئری‌ای
+    زده نمی‌شود؛ پس از آن فقط امضای قوانین خوانده و در صورت تغییر، قوانین
+    دوباره بارگذاری و کامپایل می‌شوند. متدها blocking هستند (run_db).
+    """
+
+    def __init__(self, revalidate_interval: float = AUTO_REPLY_REVALIDATE_INTERVAL, session_factory=None):
+        self.revalidate_interval = revalidate_interval
+        self._session_factory = session_factory
+        # bot_instance_id -> (زمان بررسی بعدی، candidate_id، امضا، matcher)
+        self._entries: Dict[int, Tuple[float, int, tuple, AutoReplyMatcher]] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get_matcher(self, bot_instance_id: int) -> Optional[AutoReplyMatcher]:
+        with self._lock:
+            entry = self._entries.get(bot_instance_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[3]
+
+        session = self._get_session_factory()()
+        try:
+            if entry:
+                candidate_id = entry[1]
+            else:
+                candidate_id = session.query(BotInstance.candidate_id).filter_by(id=bot_instance_id).scalar()
+                if candidate_id is None:
+                    return None
+
+            signature = self._signature(session, candidate_id)
+            if entry and entry[2] == signature:
+                matcher = entry[3]
+            else:
+                rules = session.query(
+                    AutoReply.id, AutoReply.keyword, AutoReply.reply_text,
+                    AutoReply.case_sensitive, AutoReply.exact_match
+                ).filter(
+                    AutoReply.candidate_id == candidate_id,
+                    AutoReply.is_active == True
+                ).all()
+                matcher = AutoReplyMatcher(rules)
+                self.builds += 1
+        finally:
+            session.close()
+
+        with self._lock:
+            self._entries[bot_instance_id] = (
+                time.monotonic() + self.revalidate_interval, candidate_id, signature, matcher
+            )
+        return matcher
+
+    def match(self, bot_instance_id: int, text: str) -> Optional[Rule]:
+        """
+        یافتن پاسخ خودکار پیام و افزایش شمارنده استفاده قانون
+
+        Returns:
+            Rule: قانون منطبق (reply_text برای پاسخ) یا None
+        """
+        matcher = self.get_matcher(bot_instance_id)
+        rule = matcher.match(text) if matcher else None
+        if rule:
+            session = self._get_session_factory()()
+            try:
+                session.query(AutoReply).filter_by(id=rule.id).update(
+                    {'usage_count': func.coalesce(AutoReply.usage_count, 0) + 1},
+                    synchronize_session=False
+                )
+                session.commit()
+            except Exception:
+                session.rollback()
+            finally:
+                session.close()
+        return rule
+
+    @staticmethod
+    def _signature(session, candidate_id: int) -> tuple:
+        # قوانین فقط افزوده یا حذف می‌شوند: هر افزودن بیشترین id و هر حذف تعداد را تغییر می‌دهد
+        return tuple(session.query(func.count(AutoReply.id), func.max(AutoReply.id)).filter(
+            AutoReply.candidate_id == candidate_id,
+            AutoReply.is_active == True
+        ).one())
+
+    def invalidate(self, candidate_id: int):
+        """باطل کردن matcher نماینده پس از تغییر قوانین در پنل"""
+        with self._lock:
+            for bot_instance_id in [k for k, v in self._entries.items() if v[1] == candidate_id]:
+                del self._entries[bot_instance_id]
+
+    def invalidate_bot(self, bot_instance_id: int):
+        with self._lock:
+            self._entries.pop(bot_instance_id, None)
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(bind=get_engine())
+        return self._session_factory
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {'bots': len(self._entries), 'builds': self.builds}
+
+
+# Instance سراسری
+auto_replies = AutoReplyIndex()
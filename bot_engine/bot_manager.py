@@ -3,7 +3,6 @@
 """
 import sys
 import os
-from threading import Thread
 from typing import Dict
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,38 +11,50 @@ from database.models import BotInstance
 
 
 class BotManager:
-    """مدیریت چند بات به‌صورت همزمان"""
-    
-    def __init__(self):
-        self.active_bots: Dict[int, Thread] = {}
-    
+    """مدیریت چند بات به‌صورت همزمان روی runtime مشترک"""
+
+    def __init__(self, runtime=None):
+        if runtime is None:
+            from bot_engine.bot_runtime import bot_runtime
+            runtime = bot_runtime
+        self.runtime = runtime
+
+    @property
+    def active_bots(self) -> Dict[int, object]:
+        """Applicationهای در حال اجرا به تفکیک شناسه بات"""
+        return dict(self.runtime.applications)
+
     def start_bot(self, bot_instance_id: int):
         """راه‌اندازی یک بات"""
-        from bot_engine.telegram_bot import run_bot
-        
-        if bot_instance_id in self.active_bots:
+        if self.runtime.has_bot(bot_instance_id):
             print(f"بات {bot_instance_id} قبلاً راه‌اندازی شده است")
             return
-        
-        # ایجاد thread جدید برای بات
-        bot_thread = Thread(target=run_bot, args=(bot_instance_id,), daemon=True)
-        bot_thread.start()
-        
-        self.active_bots[bot_instance_id] = bot_thread
-        print(f"✅ بات {bot_instance_id} راه‌اندازی شد")
-    
+
+        if self.runtime.add_bot(bot_instance_id):
+            print(f"✅ بات {bot_instance_id} راه‌اندازی شد")
+        else:
+            print(f"❌ راه‌اندازی بات {bot_instance_id} ناموفق بود")
+
     def stop_bot(self, bot_instance_id: int):
-        """توقف یک بات"""
-        if bot_instance_id in self.active_bots:
-            # TODO: پیاده‌سازی توقف صحیح بات
-            del self.active_bots[bot_instance_id]
+        """توقف یک بات (غیرفعال‌سازی صریح؛ webhook بات هم حذف می‌شود)"""
+        if self.runtime.remove_bot(bot_instance_id, delete_webhook=True):
             print(f"⛔ بات {bot_instance_id} متوقف شد")
-    
+
     def restart_bot(self, bot_instance_id: int):
-        """ریستارت بات"""
-        self.stop_bot(bot_instance_id)
-        self.start_bot(bot_instance_id)
-    
+        """ریستارت بات (نسخه قبلی پیش از شروع نسخه جدید کامل متوقف می‌شود)"""
+        if self.runtime.restart_bot(bot_instance_id):
+            print(f"🔄 بات {bot_instance_id} ریستارت شد")
+        else:
+            print(f"❌ ریستارت بات {bot_instance_id} ناموفق بود")
+
+    def shutdown(self):
+        """توقف همه بات‌ها و آزادسازی thread و event loop runtime"""
+        self.runtime.shutdown()
+
     def get_active_bots(self):
         """لیست بات‌های فعال"""
-        return list(self.active_bots.keys())
+        return self.runtime.get_active_bots()
+
+    def get_stats(self):
+        """آمار runtime (تعداد task و حافظه هر بات)"""
+        return self.runtime.get_stats()
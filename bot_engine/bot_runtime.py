@@ -0,0 +1,515 @@
+"""
+Runtime چندمستاجره بات‌ها - میزبانی همه بات‌ها روی یک event loop مشترک
+به‌جای یک thread و یک event loop به ازای هر بات
+"""
+import sys
+import os
+import asyncio
+import hashlib
+import hmac
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.models import BotInstance
+from bot_engine.content_cache import content_cache
+from bot_engine.auto_reply import auto_replies
+from bot_engine.db_executor import shutdown_db_executor
+from bot_engine.user_activity import user_activity
+from bot_engine.analytics_events import analytics_events
+from config.settings import (
+    BOT_RUNTIME_POOL_SIZE, BOT_RUNTIME_POLL_POOL_SIZE, BOT_RUNTIME_START_TIMEOUT,
+    BOT_STOP_DRAIN_TIMEOUT,
+    BOT_WEBHOOK_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SharedHTTPXRequest(HTTPXRequest):
+    """
+    HTTPXRequest مشترک بین چند بات
+
+    Bot.shutdown() به‌صورت پیش‌فرض کلاینت HTTP را می‌بندد؛ چون این کلاینت
+    بین همه بات‌ها مشترک است، بستن واقعی فقط با close() و توسط runtime انجام می‌شود.
+    """
+
+    async def shutdown(self) -> None:
+        """بستن توسط هر بات نادیده گرفته می‌شود"""
+        return
+
+    async def close(self) -> None:
+        """بستن واقعی connection pool"""
+        await super().shutdown()
+
+
+def webhook_path_secret(bot_token: str) -> str:
+    """مسیر مخفی اختصاصی هر بات در endpoint مشترک webhook (مشتق از توکن)"""
+    return hmac.new(
+        WEBHOOK_SECRET.encode(), f"path:{bot_token}".encode(), hashlib.sha256
+    ).hexdigest()[:40]
+
+
+def webhook_header_secret(bot_token: str) -> str:
+    """مقدار هدر X-Telegram-Bot-Api-Secret-Token برای هر بات"""
+    return hmac.new(
+        WEBHOOK_SECRET.encode(), f"header:{bot_token}".encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def _deep_sizeof(obj, seen=None) -> int:
+    """تخمین حجم حافظه یک شیء و محتوای آن (بایت)"""
+    if seen is None:
+        seen = set()
+    obj_id = id(obj)
+    if obj_id in seen:
+        return 0
+    seen.add(obj_id)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+class BotRuntime:
+    """
+    میزبان همه BotInstanceها به‌صورت Application روی یک event loop
+
+    - یک thread و یک event loop برای کل پروسه
+    - یک connection pool مشترک برای فراخوانی‌های API و یکی برای getUpdates
+    - افزودن و حذف بات در حین اجرا (hot add/remove)
+    - توقف graceful: آپدیت‌های در جریان تا مهلت drain_timeout پردازش و سپس لغو می‌شوند
+    - حالت webhook: همه بات‌ها پشت یک endpoint و بدون polling
+    """
+
+    def __init__(self, pool_size: int = BOT_RUNTIME_POOL_SIZE,
+                 poll_pool_size: int = BOT_RUNTIME_POLL_POOL_SIZE,
+                 webhook_mode: bool = BOT_WEBHOOK_MODE,
+                 drain_timeout: float = BOT_STOP_DRAIN_TIMEOUT):
+        self.pool_size = pool_size
+        self.poll_pool_size = poll_pool_size
+        self.webhook_mode = webhook_mode
+        self.drain_timeout = drain_timeout
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.applications: Dict[int, Application] = {}
+        self.started_at: Dict[int, datetime] = {}
+        # مسیر مخفی webhook -> شناسه بات
+        self.webhook_routes: Dict[str, int] = {}
+        self._header_secrets: Dict[int, str] = {}
+        # قفل هر بات تا start/stop/restart یک بات هرگز همزمان اجرا نشوند
+        self._bot_locks: Dict[int, asyncio.Lock] = {}
+
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._request: Optional[SharedHTTPXRequest] = None
+        self._poll_request: Optional[SharedHTTPXRequest] = None
+
+    # ------------------------------------------------------------
+    # چرخه حیات event loop
+    # ------------------------------------------------------------
+
+    def start(self):
+        """راه‌اندازی thread و event loop مشترک (idempotent)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            self._ready.clear()
+            self._thread = threading.Thread(
+                target=self._run_loop, name='BotRuntime', daemon=True
+            )
+            self._thread.start()
+
+        self._ready.wait()
+        logger.info("✅ Bot Runtime شروع شد")
+
+    def _run_loop(self):
+        """اجرای event loop مشترک در thread اختصاصی"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        # connection pool مشترک - باید روی همین loop ساخته شود
+        self._request = SharedHTTPXRequest(connection_pool_size=self.pool_size)
+        self._poll_request = SharedHTTPXRequest(
+            connection_pool_size=self.poll_pool_size,
+            read_timeout=30
+        )
+
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+            self.loop = None
+
+    def _submit(self, coroutine, timeout: float = BOT_RUNTIME_START_TIMEOUT):
+        """اجرای یک coroutine روی loop مشترک و انتظار برای نتیجه"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        return future.result(timeout)
+
+    def shutdown(self):
+        """
+        توقف کامل runtime: توقف graceful همه بات‌ها، بستن connection poolها
+        و آزادسازی event loop و thread آن
+        """
+        with self._lock:
+            thread = self._thread
+            if not thread or not thread.is_alive() or not self.loop:
+                return
+
+            try:
+                future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+                future.result(self.drain_timeout + BOT_RUNTIME_START_TIMEOUT)
+            except Exception as e:
+                logger.error(f"❌ خطا در توقف runtime: {str(e)}")
+            finally:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                thread.join(timeout=BOT_RUNTIME_START_TIMEOUT)
+                self._thread = None
+                shutdown_db_executor(wait=False)
+                user_activity.stop()
+                analytics_events.stop()
+
+        logger.info("⛔ Bot Runtime متوقف شد")
+
+    async def _shutdown(self):
+        await asyncio.gather(
+            *(self._locked_remove(bot_id) for bot_id in list(self.applications)),
+            return_exceptions=True
+        )
+
+        for request in (self._request, self._poll_request):
+            if request:
+                await request.close()
+        self._request = None
+        self._poll_request = None
+
+        # taskهای باقی‌مانده (مثلاً executor callbackها) پیش از بستن loop لغو می‌شوند
+        current = asyncio.current_task()
+        leftovers = [t for t in asyncio.all_tasks() if t is not current]
+        for task in leftovers:
+            task.cancel()
+        await asyncio.gather(*leftovers, return_exceptions=True)
+
+    # ------------------------------------------------------------
+    # افزودن و حذف بات
+    # ------------------------------------------------------------
+
+    def add_bot(self, bot_instance_id: int) -> bool:
+        """افزودن یک بات به runtime"""
+        try:
+            return self._submit(self._locked_add(bot_instance_id))
+        except Exception as e:
+            logger.error(f"❌ خطا در راه‌اندازی بات {bot_instance_id}: {str(e)}")
+            return False
+
+    def remove_bot(self, bot_instance_id: int, delete_webhook: bool = False) -> bool:
+        """
+        حذف یک بات از runtime (با drain آپدیت‌های در جریان)
+
+        Args:
+            delete_webhook: حذف webhook بات در تلگرام؛ فقط برای غیرفعال‌سازی صریح.
+                worker‌های دیگر همین بات را میزبانی می‌کنند، پس توقف پروسه
+                (redeploy یا خروج یک worker) نباید webhook را حذف کند.
+        """
+        if bot_instance_id not in self.applications:
+            return False
+
+        try:
+            return self._submit(
+                self._locked_remove(bot_instance_id, delete_webhook),
+                timeout=self.drain_timeout + BOT_RUNTIME_START_TIMEOUT
+            )
+        except Exception as e:
+            logger.error(f"❌ خطا در توقف بات {bot_instance_id}: {str(e)}")
+            return False
+
+    def restart_bot(self, bot_instance_id: int) -> bool:
+        """
+        ریستارت بات: توقف کامل نسخه قبلی و سپس راه‌اندازی دوباره
+
+        هر دو مرحله زیر یک قفل انجام می‌شوند تا هرگز دو poller برای یک توکن
+        همزمان فعال نباشند.
+        """
+        try:
+            return self._submit(
+                self._restart_bot(bot_instance_id),
+                timeout=self.drain_timeout + 2 * BOT_RUNTIME_START_TIMEOUT
+            )
+        except Exception as e:
+            logger.error(f"❌ خطا در ریستارت بات {bot_instance_id}: {str(e)}")
+            return False
+
+    def has_bot(self, bot_instance_id: int) -> bool:
+        """آیا بات در runtime در حال اجراست؟"""
+        return bot_instance_id in self.applications
+
+    def get_active_bots(self):
+        """لیست شناسه بات‌های در حال اجرا"""
+        return list(self.applications.keys())
+
+    def _bot_lock(self, bot_instance_id: int) -> asyncio.Lock:
+        lock = self._bot_locks.get(bot_instance_id)
+        if lock is None:
+            lock = self._bot_locks[bot_instance_id] = asyncio.Lock()
+        return lock
+
+    async def _locked_add(self, bot_instance_id: int) -> bool:
+        async with self._bot_lock(bot_instance_id):
+            return await self._add_bot(bot_instance_id)
+
+    async def _locked_remove(self, bot_instance_id: int, delete_webhook: bool = False) -> bool:
+        async with self._bot_lock(bot_instance_id):
+            return await self._remove_bot(bot_instance_id, delete_webhook)
+
+    async def _restart_bot(self, bot_instance_id: int) -> bool:
+        async with self._bot_lock(bot_instance_id):
+            await self._remove_bot(bot_instance_id)
+            return await self._add_bot(bot_instance_id)
+
+    async def _add_bot(self, bot_instance_id: int) -> bool:
+        if bot_instance_id in self.applications:
+            logger.info(f"بات {bot_instance_id} قبلاً در runtime است")
+            return True
+
+        from bot_engine.telegram_bot import build_application
+
+        bot_instance = await self.loop.run_in_executor(
+            None, _load_bot_instance, bot_instance_id
+        )
+        if not bot_instance:
+            logger.warning(f"❌ بات با ID {bot_instance_id} یافت نشد")
+            return False
+
+        application = build_application(
+            bot_instance,
+            request=self._request,
+            get_updates_request=self._poll_request,
+            webhook_mode=self.webhook_mode
+        )
+
+        await application.initialize()
+
+        try:
+            if self.webhook_mode:
+                path_secret = webhook_path_secret(bot_instance.bot_token)
+                header_secret = webhook_header_secret(bot_instance.bot_token)
+                await application.start()
+                await application.bot.set_webhook(
+                    url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}/{path_secret}",
+                    secret_token=header_secret,
+                    allowed_updates=Update.ALL_TYPES
+                )
+                self.webhook_routes[path_secret] = bot_instance_id
+                self._header_secrets[bot_instance_id] = header_secret
+            else:
+                await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+                await application.start()
+        except Exception:
+            # راه‌اندازی نیمه‌کاره نباید poller یا task یتیم باقی بگذارد
+            await self._stop_application(bot_instance_id, application)
+            raise
+
+        self.applications[bot_instance_id] = application
+        self.started_at[bot_instance_id] = datetime.utcnow()
+
+        await self.loop.run_in_executor(None, _mark_bot_active, bot_instance_id)
+
+        logger.info(f"✅ بات @{bot_instance.bot_username} به runtime اضافه شد")
+        return True
+
+    async def _remove_bot(self, bot_instance_id: int, delete_webhook: bool = False) -> bool:
+        application = self.applications.pop(bot_instance_id, None)
+        self.started_at.pop(bot_instance_id, None)
+
+        if not application:
+            return False
+
+        self._drop_webhook_route(bot_instance_id)
+        content_cache.invalidate_bot(bot_instance_id)
+        auto_replies.invalidate_bot(bot_instance_id)
+        if self.webhook_mode and delete_webhook:
+            try:
+                await application.bot.delete_webhook()
+            except Exception as e:
+                logger.warning(f"⚠️ خطا در حذف webhook بات {bot_instance_id}: {str(e)}")
+
+        await self._stop_application(bot_instance_id, application)
+
+        logger.info(f"⛔ بات {bot_instance_id} از runtime حذف شد")
+        return True
+
+    async def _stop_application(self, bot_instance_id: int, application: Application):
+        """
+        توقف graceful یک Application
+
+        ابتدا دریافت آپدیت جدید (polling) قطع می‌شود، سپس آپدیت‌های صف و
+        taskهای در جریان تا drain_timeout فرصت اتمام دارند؛ بعد از آن
+        همه taskهای باقی‌مانده همین بات لغو می‌شوند.
+        """
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+
+        if application.running:
+            stop_task = asyncio.ensure_future(application.stop())
+            done, _ = await asyncio.wait({stop_task}, timeout=self.drain_timeout)
+
+            if not done:
+                prefix = f"Application:{application.bot.id}:"
+                leftovers = [
+                    t for t in asyncio.all_tasks()
+                    if t.get_name().startswith(prefix) and not t.done()
+                ]
+                logger.warning(
+                    f"⚠️ مهلت drain بات {bot_instance_id} تمام شد؛ "
+                    f"{len(leftovers)} task لغو می‌شود"
+                )
+                for task in leftovers:
+                    task.cancel()
+                # لغو stop() taskهای create_task بدون نام را هم از طریق gather لغو می‌کند
+                stop_task.cancel()
+                await asyncio.gather(stop_task, *leftovers, return_exceptions=True)
+
+        try:
+            await application.shutdown()
+        except Exception as e:
+            logger.warning(f"⚠️ خطا در shutdown بات {bot_instance_id}: {str(e)}")
+
+    # ------------------------------------------------------------
+    # دریافت آپدیت از endpoint مشترک webhook
+    # ------------------------------------------------------------
+
+    def feed_webhook_update(self, path_secret: str, payload: dict,
+                            header_secret: Optional[str] = None) -> int:
+        """
+        تحویل یک آپدیت webhook به Application بات مربوطه
+
+        منتظر پردازش نمی‌ماند؛ آپدیت فقط در صف بات قرار می‌گیرد تا worker
+        سریعاً به تلگرام پاسخ دهد.
+
+        Returns:
+            int: کد HTTP (200 پذیرفته شد، 403 هدر نامعتبر، 404 بات ناشناخته، 400 آپدیت نامعتبر)
+        """
+        bot_instance_id = self.webhook_routes.get(path_secret)
+        application = self.applications.get(bot_instance_id) if bot_instance_id else None
+
+        if not application or not self.loop:
+            return 404
+
+        expected = self._header_secrets.get(bot_instance_id)
+        if not expected or not hmac.compare_digest(expected, header_secret or ''):
+            return 403
+
+        try:
+            update = Update.de_json(payload, application.bot)
+        except Exception as e:
+            logger.warning(f"⚠️ آپدیت نامعتبر برای بات {bot_instance_id}: {str(e)}")
+            return 400
+
+        if update is None:
+            return 400
+
+        self.loop.call_soon_threadsafe(application.update_queue.put_nowait, update)
+        return 200
+
+    def _drop_webhook_route(self, bot_instance_id: int):
+        for path_secret, routed_id in list(self.webhook_routes.items()):
+            if routed_id == bot_instance_id:
+                del self.webhook_routes[path_secret]
+        self._header_secrets.pop(bot_instance_id, None)
+
+    # ------------------------------------------------------------
+    # آمار
+    # ------------------------------------------------------------
+
+    def get_stats(self) -> Dict:
+        """آمار runtime و هر بات (تعداد task و تخمین حافظه)"""
+        if not self.loop or not self.applications:
+            return {'total_bots': 0, 'total_tasks': 0, 'bots': {}}
+
+        try:
+            return self._submit(self._collect_stats(), timeout=10)
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت آمار runtime: {str(e)}")
+            return {'total_bots': len(self.applications), 'total_tasks': 0, 'bots': {}}
+
+    async def _collect_stats(self) -> Dict:
+        all_tasks = asyncio.all_tasks(self.loop)
+        bots = {}
+
+        for bot_instance_id, application in list(self.applications.items()):
+            prefix = f"Application:{application.bot.id}:"
+            bot_tasks = [t for t in all_tasks if t.get_name().startswith(prefix)]
+
+            approx_memory = (
+                _deep_sizeof(application.bot_data)
+                + _deep_sizeof(dict(application.user_data))
+                + _deep_sizeof(dict(application.chat_data))
+            )
+
+            bots[bot_instance_id] = {
+                'username': application.bot.username,
+                'tasks': len(bot_tasks),
+                'pending_updates': application.update_queue.qsize(),
+                'users_in_memory': len(application.user_data),
+                'approx_memory_bytes': approx_memory,
+                'started_at': self.started_at.get(bot_instance_id).isoformat()
+                if self.started_at.get(bot_instance_id) else None,
+            }
+
+        return {
+            'mode': 'webhook' if self.webhook_mode else 'polling',
+            'total_bots': len(bots),
+            'total_tasks': len(all_tasks),
+            'bots': bots,
+            'user_activity': user_activity.get_stats(),
+            'analytics_events': analytics_events.get_stats(),
+        }
+
+
+def _load_bot_instance(bot_instance_id: int):
+    """خواندن BotInstance از دیتابیس (در executor اجرا می‌شود)"""
+    from bot_engine.telegram_bot import Session
+
+    session = Session()
+    try:
+        bot_instance = session.query(BotInstance).filter_by(id=bot_instance_id).first()
+        if bot_instance:
+            session.expunge(bot_instance)
+        return bot_instance
+    finally:
+        session.close()
+
+
+def _mark_bot_active(bot_instance_id: int):
+    """به‌روزرسانی وضعیت بات در دیتابیس"""
+    from bot_engine.telegram_bot import Session
+
+    session = Session()
+    try:
+        bot_instance = session.query(BotInstance).filter_by(id=bot_instance_id).first()
+        if bot_instance:
+            bot_instance.is_active = True
+            bot_instance.last_active = datetime.utcnow()
+            session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در به‌روزرسانی وضعیت بات {bot_instance_id}: {str(e)}")
+    finally:
+        session.close()
+
+
+# Instance سراسری
+bot_runtime = BotRuntime()
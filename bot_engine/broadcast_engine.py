@@ -0,0 +1,790 @@
+"""
+موتور ارسال انبوه async با محدودیت نرخ
+
+- یک connection pool مشترک HTTP (httpx) برای همه ارسال‌ها
+- token bucket برای هر بات (محدودیت کلی تلگرام ~30 پیام در ثانیه)
+- فاصله حداقل بین دو پیام به یک چت (محدودیت هر چت)
+- اجرای همزمان چند broadcast برای بات‌های مختلف
+- رعایت retry_after در پاسخ‌های 429
+- خواندن گیرندگان به‌صورت keyset و pipeline شده با ارسال (حافظه ثابت)
+- ارسال رسانه با file_id کش‌شده (فقط اولین ارسال هر بات با آدرس رسانه)
+- ثبت دسته‌ای لاگ‌ها و شمارنده‌ها همراه با cursor ادامه ارسال (last_user_id)
+- lease هر broadcast تا با اجرای زمان‌بند روی چند سرور هیچ پیامی دوبار ارسال نشود
+"""
+import sys
+import os
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+from database.models import BroadcastMessage, BroadcastLog, BotInstance, BotUser
+from database.engine import get_engine
+from database.leasing import acquire_lease, renew_lease, release_lease
+from bot_engine.db_executor import run_db
+from bot_engine.media_cache import media_cache, extract_file_id, is_invalid_file_id_error, MEDIA_TYPES
+from config.settings import (
+    TELEGRAM_API_BASE, BROADCAST_PER_BOT_RATE, BROADCAST_PER_CHAT_INTERVAL,
+    BROADCAST_MAX_CONCURRENCY, BROADCAST_WORKERS_PER_BROADCAST, BROADCAST_MAX_RETRIES,
+    BROADCAST_FETCH_CHUNK, BROADCAST_LOG_BATCH, BROADCAST_FLUSH_INTERVAL, BROADCAST_LEASE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+SessionFactory = sessionmaker(bind=get_engine())
+
+# متد API و نام فیلد رسانه به ازای نوع رسانه
+MEDIA_METHODS = {
+    None: ('sendMessage', None),
+    'none': ('sendMessage', None),
+    'photo': ('sendPhoto', 'photo'),
+    'video': ('sendVideo', 'video'),
+    'document': ('sendDocument', 'document'),
+}
+
+
+class TokenBucket:
+    """
+    token bucket برای استفاده روی یک event loop
+
+    pause() در پاسخ به 429 کل bucket را تا پایان retry_after متوقف می‌کند.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class ChatRateLimiter:
+    """حداقل فاصله بین دو پیام یک بات به یک چت"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_allowed: Dict[Tuple[int, int], float] = {}
+
+    async def wait(self, bot_key: int, chat_id: int):
+        key = (bot_key, chat_id)
+        now = time.monotonic()
+        next_allowed = self._next_allowed.get(key, 0.0)
+        self._next_allowed[key] = max(now, next_allowed) + self.interval
+
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+
+        if len(self._next_allowed) > 50000:
+            self._prune(now)
+
+    def _prune(self, now: float):
+        for key in [k for k, t in self._next_allowed.items() if t < now]:
+            del self._next_allowed[key]
+
+
+def build_send_request(media_type, chat_id, text, media_url=None, parse_mode='HTML'):
+    """
+    ساخت متد و بدنه درخواست ارسال بر اساس نوع رسانه
+
+    parse_mode=None متن را بدون قالب‌بندی (مثل send_message ساده) ارسال می‌کند.
+    """
+    if media_type not in MEDIA_METHODS:
+        raise ValueError(f"نوع رسانه نامعتبر: {media_type}")
+
+    method, media_field = MEDIA_METHODS[media_type]
+    if media_field:
+        data = {'chat_id': chat_id, media_field: media_url, 'caption': text}
+    else:
+        data = {'chat_id': chat_id, 'text': text}
+    if parse_mode:
+        data['parse_mode'] = parse_mode
+    return method, data
+
+
+class LeaseLost(Exception):
+    """lease این broadcast منقضی شده و نود دیگری ارسال را ادامه می‌دهد"""
+
+
+class BroadcastProgress:
+    """
+    بافر نتایج ارسال یک broadcast و cursor ادامه ارسال
+
+    گیرندگان به ترتیب BotUser.id توزیع می‌شوند ولی ارسال‌ها همزمان و خارج از
+    ترتیب تمام می‌شوند؛ cursor فقط تا جایی جلو می‌رود که همه گیرندگان قبلی
+    تمام شده باشند، پس پس از ری‌استارت هیچ گیرنده‌ای جا نمی‌افتد.
+    """
+
+    def __init__(self, sent_count: int = 0, failed_count: int = 0, last_user_id: int = 0):
+        self.sent_count = sent_count
+        self.failed_count = failed_count
+        self.last_user_id = last_user_id
+        self._dispatched: deque = deque()
+        self._done: Set[int] = set()
+        self._logs: List[dict] = []
+        self._flushed_cursor = last_user_id
+
+    def dispatched(self, user_id: int):
+        """ثبت شروع ارسال به یک گیرنده (باید به ترتیب id صدا زده شود)"""
+        self._dispatched.append(user_id)
+
+    def record(self, user_id: int, telegram_id: int, success: bool, error: Optional[str] = None):
+        """ثبت نتیجه ارسال در بافر"""
+        if success:
+            self.sent_count += 1
+        else:
+            self.failed_count += 1
+
+        self._logs.append({
+            'user_telegram_id': telegram_id,
+            'status': 'sent' if success else 'failed',
+            'error_message': error,
+            'sent_at': datetime.utcnow() if success else None,
+        })
+
+        self._done.add(user_id)
+        while self._dispatched and self._dispatched[0] in self._done:
+            self.last_user_id = self._dispatched.popleft()
+            self._done.discard(self.last_user_id)
+
+    @property
+    def pending_logs(self) -> int:
+        return len(self._logs)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._logs) or self.last_user_id != self._flushed_cursor
+
+    def take(self) -> dict:
+        """برداشتن لاگ‌های بافر و وضعیت فعلی برای یک flush"""
+        logs, self._logs = self._logs, []
+        self._flushed_cursor = self.last_user_id
+        return {
+            'logs': logs,
+            'sent_count': self.sent_count,
+            'failed_count': self.failed_count,
+            'last_user_id': self.last_user_id,
+        }
+
+    def restore(self, snapshot: dict):
+        """بازگرداندن لاگ‌های یک flush ناموفق به بافر"""
+        self._logs[:0] = snapshot['logs']
+        self._flushed_cursor = None
+
+
+class ProgressFlusher:
+    """
+    flush دسته‌ای/دوره‌ای BroadcastProgress یک ارسال به دیتابیس
+
+    flush_func(job_id, snapshot, lease_ttl) روی executor اجرا می‌شود و باید
+    در همان تراکنش lease را تمدید کند؛ اگر LeaseLost بدهد ارسال باید متوقف شود.
+    """
+
+    def __init__(self, label: str, job_id: int, progress: BroadcastProgress, flush_func,
+                 lease_ttl: float, interval: float):
+        self.label = label
+        self.job_id = job_id
+        self.progress = progress
+        self.flush_func = flush_func
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.lease_lost = False
+        self._lock = asyncio.Lock()
+
+    async def flush(self, renew: bool = False):
+        # یک flush در هر لحظه؛ لاگ‌ها، شمارنده‌ها، cursor و تمدید lease در یک تراکنش
+        async with self._lock:
+            if self.lease_lost or not (self.progress.dirty or renew):
+                return
+            snapshot = self.progress.take()
+            try:
+                await run_db(self.flush_func, self.job_id, snapshot, self.lease_ttl)
+            except LeaseLost:
+                self.lease_lost = True
+                logger.warning(f"⚠️ lease {self.label} از دست رفت؛ ارسال در این نود متوقف شد")
+            except Exception as e:
+                self.progress.restore(snapshot)
+                logger.error(f"❌ خطا در ثبت لاگ {self.label}: {str(e)}")
+
+    async def run_periodically(self):
+        """flush و تمدید lease هر interval ثانیه (حتی بدون تغییر)"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush(renew=True)
+
+
+class BroadcastEngine:
+    """
+    اجرای broadcastها روی یک event loop اختصاصی
+
+    هر broadcast چند worker دارد؛ همه workerهای یک بات از token bucket همان
+    بات و همه درخواست‌ها از یک connection pool و semaphore مشترک استفاده می‌کنند.
+    """
+
+    def __init__(self, per_bot_rate: float = BROADCAST_PER_BOT_RATE,
+                 per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+                 max_concurrency: int = BROADCAST_MAX_CONCURRENCY,
+                 workers_per_broadcast: int = BROADCAST_WORKERS_PER_BROADCAST,
+                 max_retries: int = BROADCAST_MAX_RETRIES,
+                 api_base: str = TELEGRAM_API_BASE,
+                 fetch_chunk: int = BROADCAST_FETCH_CHUNK,
+                 log_batch: int = BROADCAST_LOG_BATCH,
+                 flush_interval: float = BROADCAST_FLUSH_INTERVAL,
+                 lease_ttl: float = BROADCAST_LEASE_TTL):
+        self.per_bot_rate = per_bot_rate
+        self.max_concurrency = max_concurrency
+        self.workers_per_broadcast = workers_per_broadcast
+        self.max_retries = max_retries
+        self.fetch_chunk = fetch_chunk
+        self.log_batch = log_batch
+        self.flush_interval = flush_interval
+        self.lease_ttl = lease_ttl
+        self.api_base = api_base.rstrip('/')
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._chat_limiter = ChatRateLimiter(per_chat_interval)
+        self._running: Set[int] = set()
+        self._jobs: Set[str] = set()
+
+    # ------------------------------------------------------------
+    # چرخه حیات event loop
+    # ------------------------------------------------------------
+
+    def start(self):
+        """راه‌اندازی thread و event loop موتور (idempotent)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            self._ready.clear()
+            self._thread = threading.Thread(
+                target=self._run_loop, name='BroadcastEngine', daemon=True
+            )
+            self._thread.start()
+
+        self._ready.wait()
+        logger.info("✅ Broadcast Engine شروع شد")
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            )
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+            self.loop = None
+
+    def shutdown(self, timeout: float = 30):
+        """لغو broadcastهای در حال اجرا و بستن connection pool"""
+        # قفل در حین انتظار نگه داشته نمی‌شود؛ broadcastهای لغوشده در finally به آن نیاز دارند
+        with self._lock:
+            thread, loop = self._thread, self.loop
+            if not thread or not thread.is_alive() or not loop:
+                return
+
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            logger.error(f"❌ خطا در توقف Broadcast Engine: {str(e)}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=timeout)
+            with self._lock:
+                self._thread = None
+
+    async def _shutdown(self):
+        current = asyncio.current_task()
+        tasks = [t for t in asyncio.all_tasks() if t is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._client.aclose()
+
+    # ------------------------------------------------------------
+    # API عمومی
+    # ------------------------------------------------------------
+
+    def submit(self, broadcast_id: int) -> bool:
+        """
+        شروع ارسال یک broadcast در پس‌زمینه
+
+        Returns:
+            bool: False اگر همین broadcast از قبل در حال ارسال باشد
+        """
+        self.start()
+        with self._lock:
+            if broadcast_id in self._running:
+                return False
+            self._running.add(broadcast_id)
+
+        asyncio.run_coroutine_threadsafe(self._run_broadcast(broadcast_id), self.loop)
+        return True
+
+    def run_job(self, key: str, coroutine_factory) -> bool:
+        """
+        اجرای یک کار ارسال دیگر (مثلاً پیام ادمین) روی همین موتور
+
+        Returns:
+            bool: False اگر کاری با همین کلید در حال اجرا باشد
+        """
+        self.start()
+        with self._lock:
+            if key in self._jobs:
+                return False
+            self._jobs.add(key)
+
+        async def run():
+            try:
+                await coroutine_factory()
+            finally:
+                with self._lock:
+                    self._jobs.discard(key)
+
+        asyncio.run_coroutine_threadsafe(run(), self.loop)
+        return True
+
+    def running_jobs(self):
+        """کلید کارهای در حال اجرا (به‌جز broadcastها)"""
+        with self._lock:
+            return sorted(self._jobs)
+
+    def running_broadcasts(self):
+        """شناسه broadcastهای در حال ارسال"""
+        with self._lock:
+            return sorted(self._running)
+
+    def bucket(self, bot_key: int) -> TokenBucket:
+        bucket = self._buckets.get(bot_key)
+        if bucket is None:
+            bucket = self._buckets[bot_key] = TokenBucket(self.per_bot_rate)
+        return bucket
+
+    # ------------------------------------------------------------
+    # ارسال
+    # ------------------------------------------------------------
+
+    async def send(self, bot_key: int, bot_token: str, chat_id: int, text: str,
+                   media_type=None, media_url=None, parse_mode='HTML') -> Tuple[bool, Optional[str]]:
+        """
+        ارسال یک پیام با رعایت محدودیت نرخ و retry
+
+        Returns:
+            tuple: (موفق؟، پیام خطا)
+        """
+        success, error, _ = await self.send_with_result(
+            bot_key, bot_token, chat_id, text, media_type, media_url, parse_mode=parse_mode
+        )
+        return success, error
+
+    async def send_with_result(self, bot_key: int, bot_token: str, chat_id: int, text: str,
+                               media_type=None, media_url=None,
+                               upload: Optional[Tuple[str, bytes]] = None,
+                               parse_mode='HTML') -> Tuple[bool, Optional[str], Optional[dict]]:
+        """
+        مانند send، به‌علاوه پیام برگشتی تلگرام (برای استخراج file_id)
+
+        Args:
+            upload: (نام فایل، محتوا) برای آپلود multipart به‌جای media_url
+            parse_mode: قالب متن؛ None برای متن ساده
+        """
+        method, data = build_send_request(media_type, chat_id, text, media_url, parse_mode)
+        files = None
+        if upload:
+            media_field = MEDIA_METHODS[media_type][1]
+            data.pop(media_field, None)
+            files = {media_field: upload}
+        url = f"{self.api_base}/bot{bot_token}/{method}"
+        bucket = self.bucket(bot_key)
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            await self._chat_limiter.wait(bot_key, chat_id)
+            await bucket.acquire()
+
+            try:
+                async with self._semaphore:
+                    if files:
+                        response = await self._client.post(url, data=data, files=files)
+                    else:
+                        response = await self._client.post(url, json=data)
+                payload = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                error = f"network: {str(e)}"
+                await asyncio.sleep(min(2 ** attempt, 30))
+                continue
+
+            if payload.get('ok'):
+                return True, None, payload.get('result')
+
+            error = payload.get('description') or f"HTTP {response.status_code}"
+
+            if response.status_code == 429:
+                retry_after = (payload.get('parameters') or {}).get('retry_after', 1)
+                logger.warning(f"⏳ محدودیت نرخ تلگرام برای بات {bot_key}: {retry_after} ثانیه صبر")
+                bucket.pause(retry_after)
+                continue
+
+            if response.status_code >= 500:
+                await asyncio.sleep(min(2 ** attempt, 30))
+                continue
+
+            # 400/403 (چت نامعتبر، بلاک شدن بات و ...) قابل تکرار نیستند
+            return False, error, None
+
+        return False, error, None
+
+    async def _send_to_recipient(self, job: dict, telegram_id: int, prime_lock: asyncio.Lock):
+        """
+        ارسال پیام broadcast به یک گیرنده با استفاده از file_id کش‌شده
+
+        اگر file_id رسانه هنوز در کش نیست، یک ارسال (زیر prime_lock) با آدرس
+        رسانه انجام و file_id برگشتی ذخیره می‌شود؛ بقیه ارسال‌ها از file_id
+        استفاده می‌کنند. file_id نامعتبر حذف و ارسال دوباره با آدرس انجام می‌شود.
+        """
+        args = (job['bot_instance_id'], job['bot_token'], telegram_id, job['message_text'], job['media_type'])
+        if job['media_type'] not in MEDIA_TYPES or not job['media_url']:
+            return await self.send(*args, job['media_url'])
+
+        if job['media_file_id'] is None and job['media_priming']:
+            async with prime_lock:
+                if job['media_file_id'] is None and job['media_priming']:
+                    success, error, result = await self.send_with_result(*args, job['media_url'])
+                    if success:
+                        job['media_priming'] = False
+                        file_id = extract_file_id(job['media_type'], result)
+                        if file_id:
+                            job['media_file_id'] = file_id
+                            await run_db(
+                                media_cache.store, job['bot_instance_id'],
+                                job['media_type'], job['media_url'], file_id
+                            )
+                    return success, error
+
+        file_id = job['media_file_id']
+        if file_id is None:
+            return await self.send(*args, job['media_url'])
+
+        success, error, _ = await self.send_with_result(*args, file_id)
+        if not success and is_invalid_file_id_error(error):
+            if job['media_file_id'] == file_id:
+                logger.warning(f"⚠️ file_id رسانه بات {job['bot_instance_id']} نامعتبر است؛ ارسال با آدرس")
+                job['media_file_id'] = None
+                job['media_priming'] = True
+                await run_db(
+                    media_cache.invalidate, job['bot_instance_id'], job['media_type'], job['media_url']
+                )
+            return await self._send_to_recipient(job, telegram_id, prime_lock)
+        return success, error
+
+    async def _run_broadcast(self, broadcast_id: int):
+        flusher: Optional[ProgressFlusher] = None
+        prime_lock = asyncio.Lock()
+        flush_task = producer = None
+
+        try:
+            job = await run_db(_start_broadcast, broadcast_id, self.lease_ttl)
+            if not job:
+                return
+
+            progress = BroadcastProgress(job['sent_count'], job['failed_count'], job['last_user_id'])
+            flusher = ProgressFlusher(
+                f"broadcast #{broadcast_id}", broadcast_id, progress, _flush_progress,
+                self.lease_ttl, self.flush_interval
+            )
+            flush_task = asyncio.create_task(flusher.run_periodically())
+
+            # صف محدود: chunk بعدی همزمان با ارسال chunk فعلی خوانده می‌شود
+            workers = min(self.workers_per_broadcast, max(1, job['total_users']))
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.fetch_chunk)
+
+            async def produce():
+                after_user_id = job['last_user_id']
+                error = None
+                try:
+                    while not flusher.lease_lost:
+                        chunk = await run_db(_fetch_recipients, broadcast_id, after_user_id, self.fetch_chunk)
+                        for user_id, telegram_id in chunk:
+                            if telegram_id not in job['skip_telegram_ids']:
+                                await queue.put((user_id, telegram_id))
+                        if len(chunk) < self.fetch_chunk:
+                            break
+                        after_user_id = chunk[-1][0]
+                except Exception as e:
+                    error = e
+
+                # پایان صف برای workerها، حتی پس از خطا
+                for _ in range(workers):
+                    await queue.put(None)
+                if error:
+                    raise error
+
+            async def worker():
+                while True:
+                    recipient = await queue.get()
+                    if recipient is None or flusher.lease_lost:
+                        return
+                    user_id, telegram_id = recipient
+                    progress.dispatched(user_id)
+
+                    success, error = await self._send_to_recipient(job, telegram_id, prime_lock)
+                    if not success:
+                        logger.warning(f"⚠️ خطا در ارسال به {telegram_id}: {error}")
+
+                    progress.record(user_id, telegram_id, success, error)
+                    if progress.pending_logs >= self.log_batch:
+                        await flusher.flush()
+
+            producer = asyncio.create_task(produce())
+            await asyncio.gather(*(worker() for _ in range(workers)))
+            if flusher.lease_lost:
+                return
+            # خطای خواندن گیرندگان (در صورت وجود) اینجا بالا می‌آید
+            await producer
+
+            flush_task.cancel()
+            await flusher.flush()
+            await run_db(
+                _finish_broadcast, broadcast_id, 'completed',
+                progress.sent_count, progress.failed_count
+            )
+            logger.info(
+                f"✅ ارسال broadcast #{broadcast_id} تکمیل شد - "
+                f"موفق: {progress.sent_count}, ناموفق: {progress.failed_count}"
+            )
+
+        except asyncio.CancelledError:
+            # توقف موتور: وضعیت sending می‌ماند و lease آزاد می‌شود تا همین نود پس از
+            # ری‌استارت یا نود دیگری بلافاصله از cursor ادامه دهد
+            if flusher is not None:
+                await flusher.flush()
+                if not flusher.lease_lost:
+                    await run_db(_release_broadcast, broadcast_id)
+            raise
+        except Exception as e:
+            logger.error(f"❌ خطا در ارسال broadcast #{broadcast_id}: {str(e)}")
+            if flusher is not None:
+                await flusher.flush()
+                await run_db(
+                    _finish_broadcast, broadcast_id, 'failed',
+                    flusher.progress.sent_count, flusher.progress.failed_count
+                )
+            else:
+                await run_db(_finish_broadcast, broadcast_id, 'failed')
+        finally:
+            for task in (producer, flush_task):
+                if task is not None:
+                    task.cancel()
+            with self._lock:
+                self._running.discard(broadcast_id)
+
+
+# ------------------------------------------------------------
+# عملیات دیتابیس (روی executor اجرا می‌شوند)
+# ------------------------------------------------------------
+
+def _start_broadcast(broadcast_id: int, lease_ttl: float = BROADCAST_LEASE_TTL):
+    """
+    علامت‌گذاری broadcast به‌عنوان در حال ارسال و آماده‌سازی اطلاعات ارسال
+
+    broadcastی که از قبل در وضعیت sending است (ری‌استارت وسط ارسال) از
+    last_user_id و شمارنده‌های ذخیره‌شده ادامه می‌یابد.
+    """
+    from bot_engine.broadcast_sender import broadcast_sender
+
+    session = SessionFactory()
+    try:
+        # claim اتمیک؛ اگر نود دیگری lease معتبر دارد این نود ارسال نمی‌کند
+        if not acquire_lease(session, BroadcastMessage, broadcast_id, lease_ttl,
+                             BroadcastMessage.status.in_(('pending', 'sending'))):
+            return None
+
+        broadcast = session.query(BroadcastMessage).get(broadcast_id)
+        if not broadcast:
+            return None
+
+        bot_instance = session.query(BotInstance).get(broadcast.bot_instance_id)
+        if not bot_instance or not bot_instance.is_active:
+            logger.error(f"❌ بات {broadcast.bot_instance_id} یافت نشد یا غیرفعال است")
+            release_lease(session, BroadcastMessage, broadcast_id, {'status': 'failed'})
+            session.commit()
+            return None
+
+        resuming = broadcast.status == 'sending'
+        last_user_id = broadcast.last_user_id or 0
+        sent_count = (broadcast.sent_count or 0) if resuming else 0
+        failed_count = (broadcast.failed_count or 0) if resuming else 0
+
+        remaining = broadcast_sender.target_users_query(broadcast, session).filter(
+            BotUser.id > last_user_id
+        ).count()
+
+        skip_telegram_ids = set()
+        if resuming and remaining:
+            # ارسال‌های همزمان جلوتر از cursor که لاگشان ثبت شده دوباره ارسال نمی‌شوند
+            skip_telegram_ids = {
+                telegram_id for (telegram_id,) in session.query(BroadcastLog.user_telegram_id).filter(
+                    BroadcastLog.broadcast_id == broadcast.id,
+                    BroadcastLog.user_telegram_id.in_(
+                        session.query(BotUser.telegram_id).filter(
+                            BotUser.bot_instance_id == broadcast.bot_instance_id,
+                            BotUser.id > last_user_id
+                        )
+                    )
+                )
+            }
+            remaining = max(0, remaining - len(skip_telegram_ids))
+
+        broadcast.status = 'sending'
+        if not resuming or not broadcast.started_at:
+            broadcast.started_at = datetime.utcnow()
+        broadcast.sent_count = sent_count
+        broadcast.failed_count = failed_count
+        broadcast.total_users = sent_count + failed_count + remaining
+        session.commit()
+
+        if resuming:
+            logger.info(
+                f"🔁 ادامه ارسال broadcast #{broadcast.id} از کاربر {last_user_id} - "
+                f"{remaining} کاربر باقی‌مانده"
+            )
+        else:
+            logger.info(f"🚀 شروع ارسال broadcast #{broadcast.id} به {remaining} کاربر")
+
+        return {
+            'bot_instance_id': bot_instance.id,
+            'bot_token': bot_instance.bot_token,
+            'message_text': broadcast.message_text,
+            'media_type': broadcast.media_type,
+            'media_url': broadcast.media_url,
+            'media_file_id': media_cache.get(bot_instance.id, broadcast.media_type, broadcast.media_url),
+            'media_priming': True,
+            'total_users': broadcast.total_users,
+            'skip_telegram_ids': skip_telegram_ids,
+            'sent_count': sent_count,
+            'failed_count': failed_count,
+            'last_user_id': last_user_id,
+        }
+    finally:
+        session.close()
+
+
+def _fetch_recipients(broadcast_id: int, after_user_id: int, limit: int):
+    """یک chunk keyset از گیرندگان بعد از after_user_id: [(BotUser.id, telegram_id), ...]"""
+    from bot_engine.broadcast_sender import broadcast_sender
+
+    session = SessionFactory()
+    try:
+        broadcast = session.query(BroadcastMessage).get(broadcast_id)
+        if not broadcast:
+            return []
+        chunks = broadcast_sender.iter_target_users(broadcast, session, after_user_id, chunk_size=limit)
+        return next(chunks, [])
+    finally:
+        session.close()
+
+
+def _flush_progress(broadcast_id: int, snapshot: dict, lease_ttl: float = BROADCAST_LEASE_TTL):
+    """درج دسته‌ای لاگ‌ها و به‌روزرسانی شمارنده‌ها، cursor و lease در یک تراکنش"""
+    session = SessionFactory()
+    try:
+        if snapshot['logs']:
+            session.bulk_insert_mappings(BroadcastLog, [
+                dict(log, broadcast_id=broadcast_id) for log in snapshot['logs']
+            ])
+        renewed = renew_lease(session, BroadcastMessage, broadcast_id, lease_ttl, {
+            'sent_count': snapshot['sent_count'],
+            'failed_count': snapshot['failed_count'],
+            'last_user_id': snapshot['last_user_id'],
+        })
+        if not renewed:
+            raise LeaseLost(broadcast_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _finish_broadcast(broadcast_id: int, status: str,
+                      sent_count: Optional[int] = None, failed_count: Optional[int] = None):
+    session = SessionFactory()
+    try:
+        values = {
+            'status': status,
+            'completed_at': datetime.utcnow() if status == 'completed' else None,
+        }
+        if sent_count is not None:
+            values['sent_count'] = sent_count
+            values['failed_count'] = failed_count
+        release_lease(session, BroadcastMessage, broadcast_id, values)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در به‌روزرسانی broadcast #{broadcast_id}: {str(e)}")
+    finally:
+        session.close()
+
+
+def _release_broadcast(broadcast_id: int):
+    """آزاد کردن lease بدون تغییر وضعیت (توقف موتور در میانه ارسال)"""
+    session = SessionFactory()
+    try:
+        release_lease(session, BroadcastMessage, broadcast_id)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در آزاد کردن lease broadcast #{broadcast_id}: {str(e)}")
+    finally:
+        session.close()
+
+
+# Instance سراسری
+broadcast_engine = BroadcastEngine()
@@ -6,20 +6,15 @@ import os
 import time
 import logging
 from datetime import datetime, timedelta
-import requests
-from telegram import Bot
-try:
-    from config.settings import TELEGRAM_BOT_TOKEN
-except ImportError:
-    TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
-    logging.warning('TELEGRAM_BOT_TOKEN could not be imported from config.settings. Using fallback value.')
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database.models import db, BroadcastMessage, BroadcastLog, BotUser, BotInstance
+from database.models import db, BroadcastMessage, BotUser, AdminBroadcast
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
-from config.settings import DATABASE_URI
+from database.engine import get_engine
+from database.leasing import lease_available
+from config.settings import BROADCAST_FETCH_CHUNK
 
 # تنظیمات لاگ
 logging.basicConfig(
@@ -33,51 +28,58 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ایجاد engine و session
-engine = create_engine(DATABASE_URI)
+engine = get_engine()
 SessionFactory = sessionmaker(bind=engine)
 
 
 class BroadcastSender:
     """کلاس مدیریت ارسال پیام‌های انبوه"""
     
-    def __init__(self):
-        self.sending = False
-        self.delay_between_messages = 0.05  # 50ms تاخیر بین هر پیام (محدودیت تلگرام)
+    def __init__(self, engine=None):
+        if engine is None:
+            from bot_engine.broadcast_engine import broadcast_engine
+            engine = broadcast_engine
+        self.engine = engine
     
     def check_and_send_broadcasts(self):
-        """چک کردن و ارسال پیام‌های انبوه"""
-        if self.sending:
-            logger.info("⏳ در حال ارسال پیام قبلی...")
-            return
-        
+        """چک کردن پیام‌های آماده و سپردن آن‌ها به موتور ارسال (به‌صورت موازی)"""
         session = SessionFactory()
         
         try:
             # یافتن پیام‌های آماده ارسال
             now = datetime.utcnow()
             
-            # پیام‌های فوری (بدون زمان‌بندی)
-            immediate_broadcasts = session.query(BroadcastMessage).filter(
-                BroadcastMessage.status == 'pending',
-                BroadcastMessage.scheduled_time.is_(None)
+            # پیام‌های فوری (بدون زمان‌بندی) و زمان‌بندی شده‌هایی که وقتشون رسیده،
+            # به‌علاوه پیام‌هایی که وسط ارسال رها شده‌اند (ری‌استارت یا از کار افتادن نود
+            # دیگر و انقضای lease آن) تا از cursor ادامه یابند
+            due_broadcasts = session.query(BroadcastMessage.id).filter(
+                or_(
+                    and_(
+                        BroadcastMessage.status == 'pending',
+                        or_(
+                            BroadcastMessage.scheduled_time.is_(None),
+                            BroadcastMessage.scheduled_time <= now
+                        )
+                    ),
+                    BroadcastMessage.status == 'sending'
+                ),
+                # broadcastهایی که نود دیگری در حال ارسالشان است
+                lease_available(BroadcastMessage)
             ).all()
             
-            # پیام‌های زمان‌بندی شده که وقتشون رسیده
-            scheduled_broadcasts = session.query(BroadcastMessage).filter(
-                BroadcastMessage.status == 'pending',
-                BroadcastMessage.scheduled_time.isnot(None),
-                BroadcastMessage.scheduled_time <= now
-            ).all()
+            running = set(self.engine.running_broadcasts())
+            due_broadcasts = [row for row in due_broadcasts if row.id not in running]
             
-            all_broadcasts = immediate_broadcasts + scheduled_broadcasts
+            self.resume_admin_broadcasts(session)
             
-            if not all_broadcasts:
+            if not due_broadcasts:
                 return
             
-            logger.info(f"📢 {len(all_broadcasts)} پیام انبوه برای ارسال یافت شد")
+            logger.info(f"📢 {len(due_broadcasts)} پیام انبوه برای ارسال یافت شد")
             
-            for broadcast in all_broadcasts:
-                self.send_broadcast(broadcast, session)
+            for (broadcast_id,) in due_broadcasts:
+                if not self.engine.submit(broadcast_id):
+                    logger.info(f"⏳ broadcast #{broadcast_id} در حال ارسال است")
         
         except Exception as e:
             logger.error(f"❌ خطا در چک کردن پیام‌های انبوه: {str(e)}")
@@ -86,98 +88,28 @@ class BroadcastSender:
         finally:
             session.close()
     
-    def send_broadcast(self, broadcast, session):
-        """ارسال یک پیام انبوه به تمام کاربران"""
-        try:
-            self.sending = True
-            
-            # به‌روزرسانی وضعیت
-            broadcast.status = 'sending'
-            broadcast.started_at = datetime.utcnow()
-            session.commit()
-            
-            logger.info(f"🚀 شروع ارسال broadcast #{broadcast.id}")
-            
-            # دریافت اطلاعات بات
-            bot_instance = session.query(BotInstance).get(broadcast.bot_instance_id)
-            
-            if not bot_instance or not bot_instance.is_active:
-                raise Exception(f"بات {broadcast.bot_instance_id} یافت نشد یا غیرفعال است")
-            
-            # دریافت لیست کاربران بر اساس فیلتر
-            users = self.get_target_users(broadcast, session)
-            
-            broadcast.total_users = len(users)
-            session.commit()
-            
-            logger.info(f"👥 تعداد کاربران هدف: {len(users)}")
-            
-            sent_count = 0
-            failed_count = 0
-            
-            # ارسال به هر کاربر
-            for user in users:
-                try:
-                    # ارسال پیام
-                    success = self.send_to_user(
-                        bot_token=bot_instance.bot_token,
-                        telegram_id=user.telegram_id,
-                        message_text=broadcast.message_text,
-                        media_type=broadcast.media_type,
-                        media_url=broadcast.media_url
-                    )
-                    
-                    if success:
-                        sent_count += 1
-                        log_status = 'sent'
-                        error_msg = None
-                    else:
-                        failed_count += 1
-                        log_status = 'failed'
-                        error_msg = 'Unknown error'
-                
-                except Exception as e:
-                    failed_count += 1
-                    log_status = 'failed'
-                    error_msg = str(e)
-                    logger.warning(f"⚠️ خطا در ارسال به {user.telegram_id}: {error_msg}")
-                
-                # ثبت لاگ
-                log = BroadcastLog(
-                    broadcast_id=broadcast.id,
-                    user_telegram_id=user.telegram_id,
-                    status=log_status,
-                    error_message=error_msg,
-                    sent_at=datetime.utcnow() if log_status == 'sent' else None
-                )
-                session.add(log)
-                
-                # به‌روزرسانی شمارنده‌ها
-                broadcast.sent_count = sent_count
-                broadcast.failed_count = failed_count
-                session.commit()
-                
-                # تاخیر بین پیام‌ها (جلوگیری از محدودیت تلگرام)
-                time.sleep(self.delay_between_messages)
-            
-            # تکمیل ارسال
-            broadcast.status = 'completed'
-            broadcast.completed_at = datetime.utcnow()
-            session.commit()
-            
-            logger.info(f"✅ ارسال broadcast #{broadcast.id} تکمیل شد - موفق: {sent_count}, ناموفق: {failed_count}")
+    def resume_admin_broadcasts(self, session):
+        """
+        ادامه پیام‌های ادمینی که پنل ثبت کرده ولی ارسالشان شروع یا تمام نشده
+        (مثلاً worker پنل وسط ارسال ری‌استارت شده و lease آن منقضی شده است)
+        """
+        from bot_engine.admin_broadcast import submit_admin_broadcast, running_admin_broadcasts
         
-        except Exception as e:
-            logger.error(f"❌ خطا در ارسال broadcast #{broadcast.id}: {str(e)}")
-            broadcast.status = 'failed'
-            session.commit()
+        jobs = session.query(AdminBroadcast.id).filter(
+            AdminBroadcast.status.in_(('pending', 'sending')),
+            lease_available(AdminBroadcast)
+        ).all()
         
-        finally:
-            self.sending = False
+        running = set(running_admin_broadcasts())
+        for (job_id,) in jobs:
+            if job_id not in running and submit_admin_broadcast(job_id):
+                logger.info(f"📨 ارسال پیام ادمین #{job_id} از سر گرفته شد")
     
-    def get_target_users(self, broadcast, session):
-        """دریافت لیست کاربران هدف بر اساس فیلتر"""
-        query = session.query(BotUser).filter_by(bot_instance_id=broadcast.bot_instance_id)
+    def target_users_query(self, broadcast, session):
+        """کوئری کاربران هدف بر اساس فیلتر (فقط id و telegram_id)"""
+        query = session.query(BotUser.id, BotUser.telegram_id).filter(
+            BotUser.bot_instance_id == broadcast.bot_instance_id
+        )
         
         if broadcast.target_filter == 'active':
             # کاربرانی که در 7 روز گذشته فعال بودند
@@ -190,66 +122,36 @@ class BroadcastSender:
             query = query.filter(BotUser.joined_at >= three_days_ago)
         
         # همه کاربران (all) - فیلتر پیش‌فرض
-        return query.all()
+        return query
     
-    def send_to_user(self, bot_token, telegram_id, message_text, media_type=None, media_url=None):
-        """ارسال پیام به یک کاربر"""
-        try:
-            base_url = f"https://api.telegram.org/bot{bot_token}"
-            
-            # ارسال متن ساده
-            if not media_type or media_type == 'none':
-                url = f"{base_url}/sendMessage"
-                data = {
-                    'chat_id': telegram_id,
-                    'text': message_text,
-                    'parse_mode': 'HTML'
-                }
-            
-            # ارسال عکس
-            elif media_type == 'photo':
-                url = f"{base_url}/sendPhoto"
-                data = {
-                    'chat_id': telegram_id,
-                    'photo': media_url,
-                    'caption': message_text,
-                    'parse_mode': 'HTML'
-                }
-            
-            # ارسال ویدیو
-            elif media_type == 'video':
-                url = f"{base_url}/sendVideo"
-                data = {
-                    'chat_id': telegram_id,
-                    'video': media_url,
-                    'caption': message_text,
-                    'parse_mode': 'HTML'
-                }
-            
-            # ارسال فایل
-            elif media_type == 'document':
-                url = f"{base_url}/sendDocument"
-                data = {
-                    'chat_id': telegram_id,
-                    'document': media_url,
-                    'caption': message_text,
-                    'parse_mode': 'HTML'
-                }
-            
-            else:
-                raise Exception(f"نوع رسانه نامعتبر: {media_type}")
+    def iter_target_users(self, broadcast, session, after_user_id=0, chunk_size=BROADCAST_FETCH_CHUNK):
+        """
+        پیمایش کاربران هدف به‌صورت keyset (WHERE id > cursor ORDER BY id LIMIT n)
+        
+        حافظه مستقل از تعداد مخاطبان است؛ هر chunk یک کوئری جدا روی index
+        (bot_instance_id, id) است.
+        
+        Args:
+            after_user_id: فقط کاربران با id بزرگ‌تر (ادامه ارسال از cursor)
+            chunk_size: تعداد کاربر در هر chunk
+        
+        Yields:
+            list: chunkی از (BotUser.id, telegram_id) به ترتیب id
+        """
+        query = self.target_users_query(broadcast, session)
+        last_id = after_user_id or 0
+        
+        while True:
+            rows = query.filter(BotUser.id > last_id).order_by(BotUser.id).limit(chunk_size).all()
+            if not rows:
+                return
             
-            response = requests.post(url, json=data, timeout=10)
+            chunk = [(row.id, row.telegram_id) for row in rows]
+            yield chunk
             
-            if response.status_code == 200:
-                result = response.json()
-                return result['ok']
-            else:
-                return False
-        
-        except Exception as e:
-            logger.error(f"❌ خطا در ارسال به {telegram_id}: {str(e)}")
-            return False
+            if len(chunk) < chunk_size:
+                return
+            last_id = chunk[-1][0]
     
     def get_broadcast_stats(self, broadcast_id, session):
         """دریافت آمار یک پیام انبوه"""
@@ -286,26 +188,19 @@ def start_broadcast_scheduler():
     # هر 30 ثانیه یک بار چک کن
     schedule.every(30).seconds.do(broadcast_sender.check_and_send_broadcasts)
     
+    # یادآوری رویدادهای زنده (مرحله سررسید هر رویداد، حتی با تأخیر)
+    from bot_engine.event_reminders import event_reminders
+    schedule.every(1).minutes.do(event_reminders.dispatch_due)
+    
+    # اصلاح اختلاف شمارنده‌های داشبورد (تغییرات bulk خارج از ORM)
+    from database.counters import run_reconciliation
+    from config.settings import COUNTER_RECONCILE_INTERVAL
+    schedule.every(COUNTER_RECONCILE_INTERVAL).minutes.do(run_reconciliation)
+    
     while True:
         schedule.run_pending()
         time.sleep(1)
 
 
-def send_broadcast_message(telegram_ids, message_type, message_text, file):
-    bot = Bot(token=TELEGRAM_BOT_TOKEN)
-    for telegram_id in telegram_ids:
-        try:
-            if message_type == 'text':
-                bot.send_message(chat_id=telegram_id, text=message_text)
-            elif message_type == 'photo' and file:
-                file.stream.seek(0)
-                bot.send_photo(chat_id=telegram_id, photo=file.stream, caption=message_text)
-            elif message_type == 'document' and file:
-                file.stream.seek(0)
-                bot.send_document(chat_id=telegram_id, document=file.stream, caption=message_text)
-        except Exception as e:
-            logging.warning(f'خطا در ارسال پیام به {telegram_id}: {e}')
-
-
 if __name__ == '__main__':
     start_broadcast_scheduler()
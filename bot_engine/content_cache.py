@@ -0,0 +1,104 @@
+"""
+کش محتوای منوهای بات - متن و کیبورد رندرشده رزومه، برنامه‌ها، ستادها و تماس
+
+محتوا به ازای هر بات با TTL نگهداری می‌شود و با ویرایش محتوا در پنل
+کاندید (invalidate) فوراً باطل می‌شود.
+"""
+import time
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from config.settings import BOT_CONTENT_CACHE_TTL
+
+# بخش‌هایی که با ویرایش هر صفحه پنل کاندید باطل می‌شوند
+RESUME = 'resume'
+PROGRAMS = 'programs'
+HEADQUARTERS = 'headquarters'
+CONTACT = 'contact'
+MAIN_MENU = 'main_menu'
+
+PROFILE_SECTIONS = (CONTACT, MAIN_MENU, RESUME, PROGRAMS, HEADQUARTERS)  # نام کاندید در همه متن‌ها هست
+
+
+class ContentCache:
+    """
+    کش read-through و thread-safe محتوای رندرشده به ازای (بات، بخش)
+
+    هر entry شناسه کاندید را هم نگه می‌دارد تا پنل کاندید بدون دانستن
+    شناسه بات بتواند محتوای او را باطل کند.
+    """
+
+    def __init__(self, ttl: float = BOT_CONTENT_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[int, str], Tuple[float, int, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bot_instance_id: int, section: str) -> Optional[Any]:
+        """مقدار کش‌شده یا None در صورت نبود یا انقضا"""
+        key = (bot_instance_id, section)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[2]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def set(self, bot_instance_id: int, section: str, candidate_id: int, value: Any):
+        """ذخیره محتوای رندرشده"""
+        with self._lock:
+            self._entries[(bot_instance_id, section)] = (
+                time.monotonic() + self.ttl, candidate_id, value
+            )
+
+    async def get_or_render(self, bot_instance_id: int, section: str,
+                            render: Callable[[], Awaitable[Optional[Tuple[int, Any]]]]) -> Optional[Any]:
+        """
+        خواندن از کش و در صورت miss رندر و ذخیره (از handlerهای بات)
+
+        hit بدون ترک event loop پاسخ داده می‌شود؛ فقط miss رندر را await می‌کند.
+
+        Args:
+            render: coroutine function که (candidate_id, value) یا None (کاندید یافت نشد) برمی‌گرداند
+        """
+        value = self.get(bot_instance_id, section)
+        if value is not None:
+            return value
+
+        rendered = await render()
+        if rendered is None:
+            return None
+
+        candidate_id, value = rendered
+        self.set(bot_instance_id, section, candidate_id, value)
+        return value
+
+    def invalidate(self, candidate_id: int, sections: Optional[Iterable[str]] = None):
+        """باطل کردن محتوای یک کاندید (همه بخش‌ها یا بخش‌های مشخص)"""
+        sections = set(sections) if sections is not None else None
+        with self._lock:
+            for key, (_, owner_id, _) in list(self._entries.items()):
+                if owner_id == candidate_id and (sections is None or key[1] in sections):
+                    del self._entries[key]
+
+    def invalidate_bot(self, bot_instance_id: int):
+        """باطل کردن همه محتوای یک بات (مثلاً هنگام ریستارت)"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == bot_instance_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Instance سراسری
+content_cache = ContentCache()
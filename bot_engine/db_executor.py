@@ -0,0 +1,53 @@
+"""
+اجرای کوئری‌های دیتابیس بات‌ها خارج از event loop
+
+همه بات‌ها روی یک event loop مشترک اجرا می‌شوند؛ یک کوئری کند روی loop
+همه کاربران همه بات‌ها را متوقف می‌کند. توابع sync دیتابیس با run_db روی
+یک ThreadPoolExecutor محدود اجرا می‌شوند تا تعداد اتصال‌های همزمان از
+اندازه connection pool بیشتر نشود.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config.settings import BOT_DB_EXECUTOR_WORKERS
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """executor مشترک کوئری‌های بات (lazy)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=BOT_DB_EXECUTOR_WORKERS,
+                    thread_name_prefix='bot-db'
+                )
+    return _executor
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    اجرای یک تابع sync دیتابیس روی executor و انتظار برای نتیجه
+
+    تابع باید session خودش را باز و بسته کند و به‌جای شیء ORM متصل،
+    داده ساده یا شیء detach شده برگرداند.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def shutdown_db_executor(wait: bool = True):
+    """بستن executor (هنگام توقف runtime)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -0,0 +1,318 @@
+"""
+ارسال یادآوری رویدادهای زنده به ثبت‌نام‌کنندگان
+
+هر رویداد سه مرحله اطلاع‌رسانی دارد (یک روز قبل، یک ساعت قبل، شروع). مرحله
+سررسید هر رویداد بر اساس زمان فعلی انتخاب می‌شود، پس اجرای دیرهنگام زمان‌بند
+یادآوری را از دست نمی‌دهد؛ مرحله‌های قدیمی‌تری که دیگر معنی ندارند رد می‌شوند.
+ارسال روی BroadcastEngine و با توکن بات نماینده انجام می‌شود و نتیجه هر
+ثبت‌نام در event_reminder_logs ثبت می‌شود تا پس از ری‌استارت فقط
+ثبت‌نام‌های باقی‌مانده ارسال شوند.
+"""
+import sys
+import os
+import html
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import and_, or_
+
+from database.models import LiveEvent, EventRegistration, EventReminderLog, BotInstance
+from database.leasing import lease_available, acquire_lease, renew_lease, release_lease
+from bot_engine.db_executor import run_db
+from bot_engine.broadcast_engine import SessionFactory, LeaseLost
+from config.settings import EVENT_REMINDER_BATCH, BROADCAST_LEASE_TTL
+
+logger = logging.getLogger(__name__)
+
+# (مرحله، فاصله تا شروع رویداد، فیلد پرچم LiveEvent) به ترتیب زمانی
+REMINDER_STAGES = (
+    ('1day', timedelta(days=1), 'reminder_1day_sent'),
+    ('1hour', timedelta(hours=1), 'reminder_1hour_sent'),
+    ('starting', timedelta(0), 'starting_notice_sent'),
+)
+STAGE_FLAGS = {stage: flag for stage, _, flag in REMINDER_STAGES}
+STAGE_ORDER = {stage: index for index, (stage, _, _) in enumerate(REMINDER_STAGES)}
+
+
+def event_ends_at(event) -> datetime:
+    return event.starts_at + timedelta(minutes=event.duration_minutes or 60)
+
+
+def due_stage(event, now: Optional[datetime] = None) -> Optional[str]:
+    """
+    مرحله یادآوری سررسید یک رویداد
+
+    آخرین مرحله‌ای که زمانش رسیده انتخاب می‌شود (نه فقط یک پنجره چند دقیقه‌ای)؛
+    رویداد تمام‌شده یا مرحله ارسال‌شده None برمی‌گرداند.
+    """
+    now = now or datetime.utcnow()
+    if event.status not in ('scheduled', 'live') or now >= event_ends_at(event):
+        return None
+
+    stage = None
+    for name, offset, _ in REMINDER_STAGES:
+        if event.starts_at - offset <= now:
+            stage = name
+    # رویدادی که نماینده زودتر شروع کرده فقط اطلاع شروع می‌گیرد
+    if event.status == 'live':
+        stage = 'starting'
+
+    if stage is None or getattr(event, STAGE_FLAGS[stage]):
+        return None
+    return stage
+
+
+def build_reminder_text(stage: str, title: str, stream_url: Optional[str] = None) -> str:
+    # پیام‌های موتور با parse_mode=HTML ارسال می‌شوند
+    title = html.escape(title or '')
+    if stage == '1day':
+        text = f"📅 یادآوری رویداد\n\n«{title}» کمتر از یک روز دیگر برگزار می‌شود."
+    elif stage == '1hour':
+        text = f"⏰ یادآوری رویداد\n\n«{title}» کمتر از یک ساعت دیگر شروع می‌شود."
+    else:
+        text = f"🔴 رویداد «{title}» شروع شد!"
+
+    if stream_url:
+        text += f"\n\n🔗 لینک پخش: {html.escape(stream_url)}"
+    return text
+
+
+class EventReminderDispatcher:
+    """
+    انتخاب رویدادهای سررسید و سپردن ارسال یادآوری آن‌ها به موتور broadcast
+
+    dispatch_due سریع برمی‌گردد؛ ارسال هر رویداد یک کار جدا روی حلقه موتور است
+    و با lease رویداد فقط روی یک نود اجرا می‌شود.
+    """
+
+    def __init__(self, engine=None, batch_size: int = EVENT_REMINDER_BATCH,
+                 lease_ttl: float = BROADCAST_LEASE_TTL):
+        if engine is None:
+            from bot_engine.broadcast_engine import broadcast_engine
+            engine = broadcast_engine
+        self.engine = engine
+        self.batch_size = batch_size
+        self.lease_ttl = lease_ttl
+
+    def dispatch_due(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        سپردن ارسال مراحل سررسید به موتور
+
+        Returns:
+            dict: تعداد رویدادهای ارسال‌شده به موتور به ازای هر مرحله
+        """
+        now = now or datetime.utcnow()
+        stats = {stage: 0 for stage, _, _ in REMINDER_STAGES}
+        session = SessionFactory()
+
+        try:
+            events = session.query(LiveEvent).filter(
+                LiveEvent.status.in_(('scheduled', 'live')),
+                LiveEvent.starts_at <= now + REMINDER_STAGES[0][1],
+                or_(*(getattr(LiveEvent, flag) == False for flag in STAGE_FLAGS.values())),
+                lease_available(LiveEvent)
+            ).all()
+
+            running = set(self.engine.running_jobs())
+            for event in events:
+                if now >= event_ends_at(event):
+                    # رویداد تمام شده؛ یادآوری دیر فایده‌ای ندارد
+                    for flag in STAGE_FLAGS.values():
+                        setattr(event, flag, True)
+                    continue
+
+                stage = due_stage(event, now)
+                if stage is None or f"event:{event.id}" in running:
+                    continue
+                if self.engine.run_job(f"event:{event.id}", lambda event_id=event.id: self._run_event(event_id)):
+                    stats[stage] += 1
+
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"❌ خطا در چک کردن یادآوری رویدادها: {str(e)}")
+        finally:
+            session.close()
+
+        return stats
+
+    async def _run_event(self, event_id: int):
+        try:
+            job = await run_db(_start_event_reminder, event_id, self.lease_ttl)
+            if not job:
+                return
+
+            sent = failed = 0
+            after_id = 0
+            while True:
+                chunk = await run_db(_fetch_pending_registrations, event_id, job['stage'], after_id, self.batch_size)
+                if not chunk:
+                    break
+
+                results = await asyncio.gather(*(
+                    self.engine.send(job['bot_instance_id'], job['bot_token'], telegram_id, job['text'])
+                    for _, telegram_id in chunk
+                ))
+
+                logs = []
+                now = datetime.utcnow()
+                for (registration_id, telegram_id), (success, error) in zip(chunk, results):
+                    if success:
+                        sent += 1
+                    else:
+                        failed += 1
+                        logger.warning(f"⚠️ خطا در ارسال یادآوری به {telegram_id}: {error}")
+                    logs.append({
+                        'event_id': event_id,
+                        'registration_id': registration_id,
+                        'stage': job['stage'],
+                        'status': 'sent' if success else 'failed',
+                        'error_message': error,
+                        'sent_at': now if success else None,
+                    })
+
+                # لاگ‌های هر دسته و تمدید lease در یک تراکنش
+                await run_db(_flush_reminder_logs, event_id, logs, self.lease_ttl)
+
+                if len(chunk) < self.batch_size:
+                    break
+                after_id = chunk[-1][0]
+
+            await run_db(_finish_event_reminder, event_id, job['stage'])
+            logger.info(
+                f"✅ یادآوری {job['stage']} رویداد #{event_id} ارسال شد - "
+                f"موفق: {sent}, ناموفق: {failed}"
+            )
+
+        except LeaseLost:
+            logger.warning(f"⚠️ lease رویداد #{event_id} از دست رفت؛ ارسال در این نود متوقف شد")
+        except asyncio.CancelledError:
+            # لاگ‌های ثبت‌شده باقی می‌مانند و ارسال بعدی از ثبت‌نام‌های باقی‌مانده ادامه می‌یابد
+            await run_db(_release_event, event_id)
+            raise
+        except Exception as e:
+            logger.error(f"❌ خطا در ارسال یادآوری رویداد #{event_id}: {str(e)}")
+            await run_db(_release_event, event_id)
+
+
+# ------------------------------------------------------------
+# عملیات دیتابیس (روی executor اجرا می‌شوند)
+# ------------------------------------------------------------
+
+def _start_event_reminder(event_id: int, lease_ttl: float = BROADCAST_LEASE_TTL):
+    """claim رویداد، رد کردن مراحل قدیمی‌تر و آماده‌سازی اطلاعات ارسال مرحله سررسید"""
+    session = SessionFactory()
+    try:
+        if not acquire_lease(session, LiveEvent, event_id, lease_ttl):
+            return None
+
+        event = session.query(LiveEvent).get(event_id)
+        stage = due_stage(event) if event else None
+        if stage is None:
+            release_lease(session, LiveEvent, event_id)
+            session.commit()
+            return None
+
+        bot_instance = session.query(BotInstance).filter_by(candidate_id=event.candidate_id).first()
+        if not bot_instance or not bot_instance.is_active:
+            # بدون بات ارسالی در کار نیست، ولی مرحله (و وضعیت live در شروع)
+            # مثل ارسال عادی بسته می‌شود تا رویداد هر دقیقه دوباره claim نشود
+            logger.error(
+                f"❌ بات نماینده رویداد #{event_id} یافت نشد یا غیرفعال است؛ "
+                f"یادآوری {stage} ارسال نشد"
+            )
+            values = {flag: True for _, _, flag in REMINDER_STAGES[:STAGE_ORDER[stage] + 1]}
+            if stage == 'starting':
+                values['status'] = 'live'
+            release_lease(session, LiveEvent, event_id, values)
+            session.commit()
+            return None
+
+        # مراحلی که زمانشان گذشته و ارسال نشده‌اند دیگر ارسال نمی‌شوند
+        for name, _, flag in REMINDER_STAGES:
+            if name == stage:
+                break
+            setattr(event, flag, True)
+        session.commit()
+
+        return {
+            'stage': stage,
+            'bot_instance_id': bot_instance.id,
+            'bot_token': bot_instance.bot_token,
+            'text': build_reminder_text(stage, event.title, event.stream_url),
+        }
+    finally:
+        session.close()
+
+
+def _fetch_pending_registrations(event_id: int, stage: str, after_id: int, limit: int) -> List[tuple]:
+    """یک دسته keyset از ثبت‌نام‌هایی که یادآوری این مرحله را نگرفته‌اند"""
+    session = SessionFactory()
+    try:
+        rows = session.query(EventRegistration.id, EventRegistration.citizen_telegram_id).outerjoin(
+            EventReminderLog, and_(
+                EventReminderLog.registration_id == EventRegistration.id,
+                EventReminderLog.stage == stage
+            )
+        ).filter(
+            EventRegistration.event_id == event_id,
+            EventRegistration.id > after_id,
+            EventReminderLog.id.is_(None)
+        ).order_by(EventRegistration.id).limit(limit).all()
+        return [(row.id, row.citizen_telegram_id) for row in rows]
+    finally:
+        session.close()
+
+
+def _flush_reminder_logs(event_id: int, logs: List[dict], lease_ttl: float = BROADCAST_LEASE_TTL):
+    session = SessionFactory()
+    try:
+        session.bulk_insert_mappings(EventReminderLog, logs)
+        sent_ids = [log['registration_id'] for log in logs if log['status'] == 'sent']
+        if sent_ids:
+            session.query(EventRegistration).filter(
+                EventRegistration.id.in_(sent_ids)
+            ).update({'reminder_sent': True}, synchronize_session=False)
+        if not renew_lease(session, LiveEvent, event_id, lease_ttl):
+            raise LeaseLost(event_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _finish_event_reminder(event_id: int, stage: str):
+    session = SessionFactory()
+    try:
+        values = {STAGE_FLAGS[stage]: True}
+        if stage == 'starting':
+            values['status'] = 'live'
+        release_lease(session, LiveEvent, event_id, values)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در به‌روزرسانی رویداد #{event_id}: {str(e)}")
+    finally:
+        session.close()
+
+
+def _release_event(event_id: int):
+    session = SessionFactory()
+    try:
+        release_lease(session, LiveEvent, event_id)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در آزاد کردن lease رویداد #{event_id}: {str(e)}")
+    finally:
+        session.close()
+
+
+# Instance سراسری
+event_reminders = EventReminderDispatcher()
@@ -0,0 +1,169 @@
+"""
+کش file_id رسانه‌های تلگرام به ازای (بات، رسانه)
+
+اولین ارسال یک عکس/ویدیو/فایل با آدرس آن انجام می‌شود و file_id برگشتی
+تلگرام در جدول media_cache ذخیره می‌شود؛ ارسال‌های بعدی همان بات به‌جای
+آدرس از file_id استفاده می‌کنند تا تلگرام رسانه را دوباره دانلود و پردازش نکند.
+file_id هر بات مخصوص همان بات است، پس کلید شامل شناسه بات است.
+"""
+import sys
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from database.models import MediaCache
+from database.engine import get_engine
+
+logger = logging.getLogger(__name__)
+
+# نوع رسانه‌هایی که file_id دارند
+MEDIA_TYPES = ('photo', 'video', 'document')
+
+
+def media_hash(media_type: str, media_url: str) -> str:
+    """کلید رسانه: sha256 نوع و آدرس رسانه"""
+    return hashlib.sha256(f"{media_type}:{media_url}".encode('utf-8')).hexdigest()
+
+
+def extract_file_id(media_type: str, message: Optional[dict]) -> Optional[str]:
+    """
+    استخراج file_id از پیام برگشتی تلگرام
+
+    برای عکس بزرگ‌ترین سایز (آخرین عضو آرایه photo) انتخاب می‌شود.
+    """
+    if not message:
+        return None
+
+    media = message.get(media_type)
+    if media_type == 'photo':
+        return media[-1].get('file_id') if media else None
+
+    # تلگرام گاهی فایل را با نوع دیگری (مثلاً animation) برمی‌گرداند
+    for key in (media_type, 'animation', 'video', 'document'):
+        media = message.get(key)
+        if isinstance(media, dict) and media.get('file_id'):
+            return media['file_id']
+    return None
+
+
+def is_invalid_file_id_error(error: Optional[str]) -> bool:
+    """آیا خطای تلگرام مربوط به file_id نامعتبر/منقضی است؟"""
+    if not error:
+        return False
+    error = error.lower()
+    return 'file identifier' in error or 'file_id' in error or 'file reference' in error
+
+
+class MediaFileCache:
+    """
+    کش دو لایه file_id: دیکشنری در حافظه جلوی جدول media_cache
+
+    متدها blocking هستند؛ از کد async با run_db صدا زده می‌شوند.
+    """
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+        self._memory: Dict[Tuple[int, str], str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bot_instance_id: int, media_type: str, media_url: str) -> Optional[str]:
+        """file_id ذخیره‌شده یا None"""
+        if media_type not in MEDIA_TYPES or not media_url or bot_instance_id is None:
+            return None
+
+        key = (bot_instance_id, media_hash(media_type, media_url))
+        with self._lock:
+            file_id = self._memory.get(key)
+        if file_id:
+            self.hits += 1
+            return file_id
+
+        session = self._get_session_factory()()
+        try:
+            row = session.query(MediaCache.file_id).filter_by(
+                bot_instance_id=bot_instance_id, media_hash=key[1]
+            ).first()
+        finally:
+            session.close()
+
+        if not row:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            self._memory[key] = row.file_id
+        self.hits += 1
+        return row.file_id
+
+    def store(self, bot_instance_id: int, media_type: str, media_url: str, file_id: str):
+        """ذخیره file_id برگشتی اولین ارسال"""
+        if media_type not in MEDIA_TYPES or not media_url or not file_id:
+            return
+
+        key = (bot_instance_id, media_hash(media_type, media_url))
+        with self._lock:
+            self._memory[key] = file_id
+
+        session = self._get_session_factory()()
+        try:
+            updated = session.query(MediaCache).filter_by(
+                bot_instance_id=bot_instance_id, media_hash=key[1]
+            ).update({'file_id': file_id})
+            if not updated:
+                session.add(MediaCache(
+                    bot_instance_id=bot_instance_id,
+                    media_hash=key[1],
+                    media_type=media_type,
+                    media_url=media_url[:500],
+                    file_id=file_id
+                ))
+            session.commit()
+            logger.info(f"📎 file_id رسانه {media_type} برای بات {bot_instance_id} ذخیره شد")
+        except IntegrityError:
+            # پروسه دیگری همزمان همین رسانه را ذخیره کرده است
+            session.rollback()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"❌ خطا در ذخیره file_id: {str(e)}")
+        finally:
+            session.close()
+
+    def invalidate(self, bot_instance_id: int, media_type: str, media_url: str):
+        """حذف file_id نامعتبر؛ ارسال بعدی دوباره با آدرس انجام می‌شود"""
+        key = (bot_instance_id, media_hash(media_type, media_url))
+        with self._lock:
+            self._memory.pop(key, None)
+
+        session = self._get_session_factory()()
+        try:
+            session.query(MediaCache).filter_by(
+                bot_instance_id=bot_instance_id, media_hash=key[1]
+            ).delete()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"❌ خطا در حذف file_id: {str(e)}")
+        finally:
+            session.close()
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(bind=get_engine())
+        return self._session_factory
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._memory), 'hits': self.hits, 'misses': self.misses}
+
+
+# Instance سراسری
+media_cache = MediaFileCache()
@@ -1,11 +1,20 @@
 """
 Post Scheduler - زمان‌بندی و ارسال خودکار پست‌ها به کانال‌ها
+
+پست‌های pending نزدیک به موعد در یک min-heap (بر اساس scheduled_time) نگه
+داشته می‌شوند و thread زمان‌بند دقیقاً تا موعد بعدی می‌خوابد. پست‌های
+سررسیده به تفکیک کانال و به‌صورت همزمان ارسال می‌شوند. دیتابیس مرجع اصلی
+است: heap به‌طور دوره‌ای با آن همگام می‌شود و وضعیت هر پست پیش از ارسال
+دوباره از دیتابیس خوانده می‌شود. هر پست پیش از ارسال با lease
+claim می‌شود تا زمان‌بندهای چند سرور یک پست را دوبار ارسال نکنند.
 """
-import schedule
+import heapq
 import time
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from threading import Thread
+from threading import Thread, Condition
 import sys
 import os
 
@@ -13,8 +22,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.models import db, ScheduledPost, BotChannel, BotInstance
-from config.settings import DATABASE_URI
-from sqlalchemy import create_engine
+from database.engine import get_engine
+from database.leasing import NODE_ID, acquire_lease, lease_available
+from bot_engine.media_cache import media_cache, extract_file_id, is_invalid_file_id_error
+from config.settings import POST_SCHEDULER_RESYNC_INTERVAL, POST_SCHEDULER_WORKERS, POST_LEASE_TTL
 from sqlalchemy.orm import sessionmaker
 
 # Setup logging
@@ -29,50 +40,189 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Database setup
-engine = create_engine(DATABASE_URI)
+engine = get_engine()
 Session = sessionmaker(bind=engine)
 
 
 class PostScheduler:
     """کلاس مدیریت زمان‌بندی و ارسال پست‌ها"""
     
-    def __init__(self):
+    # فاصله اجرای پاکسازی پست‌های قدیمی (ثانیه)
+    CLEANUP_INTERVAL = 24 * 60 * 60
+    
+    def __init__(self, resync_interval=POST_SCHEDULER_RESYNC_INTERVAL,
+                 max_workers=POST_SCHEDULER_WORKERS, session_factory=None,
+                 node_id=NODE_ID, lease_ttl=POST_LEASE_TTL):
         self.running = False
         self.thread = None
+        self.resync_interval = resync_interval
+        self.max_workers = max_workers
+        self.node_id = node_id
+        self.lease_ttl = lease_ttl
+        self.Session = session_factory or Session
+        
+        self._cond = Condition()
+        self._heap = []            # (scheduled_time, post_id, channel_id)
+        self._queued = {}          # post_id -> scheduled_time معتبر در heap
+        self._inflight = set()     # پست‌هایی که به صف ارسال کانال سپرده شده‌اند
+        self._channel_queues = {}  # channel_id -> deque(post_id)؛ ارسال ترتیبی در هر کانال
+        self._resync_requested = False
+        self._executor = None
         logger.info("🚀 Post Scheduler initialized")
     
     def check_and_send_posts(self):
-        """چک کردن و ارسال پست‌های سررسید شده"""
-        session = Session()
+        """همگام‌سازی با دیتابیس و سپردن پست‌های سررسید شده به صف ارسال"""
+        self._resync()
+        self._dispatch_due()
+    
+    # ------------------------------------------------------------
+    # صف اولویت موعدها
+    # ------------------------------------------------------------
+    
+    def schedule_post(self, post_id, scheduled_time, channel_id):
+        """
+        افزودن/به‌روزرسانی موعد یک پست در heap
+        
+        اگر موعد جدید زودتر از موعد فعلی heap باشد thread زمان‌بند بیدار می‌شود.
+        """
+        with self._cond:
+            if post_id in self._inflight or self._queued.get(post_id) == scheduled_time:
+                return
+            
+            self._queued[post_id] = scheduled_time
+            heapq.heappush(self._heap, (scheduled_time, post_id, channel_id))
+            
+            if self._heap[0][1] == post_id:
+                self._cond.notify()
+    
+    def wake(self):
+        """بیدار کردن thread برای همگام‌سازی فوری با دیتابیس (مثلاً پس از ثبت پست جدید)"""
+        with self._cond:
+            self._resync_requested = True
+            self._cond.notify()
+    
+    def _resync(self):
+        """بارگذاری پست‌های pending که تا همگام‌سازی بعدی سررسید می‌شوند"""
+        session = self.Session()
         
         try:
-            # پیدا کردن پست‌های pending که زمانشان رسیده
-            now = datetime.utcnow()
-            pending_posts = session.query(ScheduledPost).filter(
+            horizon = datetime.utcnow() + timedelta(seconds=self.resync_interval * 2)
+            upcoming = session.query(
+                ScheduledPost.id, ScheduledPost.scheduled_time, ScheduledPost.channel_id
+            ).filter(
                 ScheduledPost.status == 'pending',
-                ScheduledPost.scheduled_time <= now
+                ScheduledPost.scheduled_time <= horizon,
+                lease_available(ScheduledPost, self.node_id)
             ).all()
+        except Exception as e:
+            logger.error(f"❌ خطا در چک کردن پست‌ها: {str(e)}")
+            session.rollback()
+            return
+        finally:
+            session.close()
+        
+        for post_id, scheduled_time, channel_id in upcoming:
+            self.schedule_post(post_id, scheduled_time, channel_id)
+    
+    def _pop_due(self):
+        """برداشتن پست‌های سررسید شده از heap (ورودی‌های قدیمی نادیده گرفته می‌شوند)"""
+        now = datetime.utcnow()
+        due = []
+        
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                scheduled_time, post_id, channel_id = heapq.heappop(self._heap)
+                if self._queued.get(post_id) != scheduled_time:
+                    continue
+                del self._queued[post_id]
+                self._inflight.add(post_id)
+                due.append((post_id, channel_id))
+        
+        return due
+    
+    def _dispatch_due(self):
+        """سپردن پست‌های سررسید شده به صف کانال‌ها و اجرای همزمان کانال‌ها"""
+        due = self._pop_due()
+        if not due:
+            return
+        
+        logger.info(f"📬 {len(due)} پست برای ارسال یافت شد")
+        
+        with self._cond:
+            for post_id, channel_id in due:
+                channel_queue = self._channel_queues.get(channel_id)
+                if channel_queue is None:
+                    self._channel_queues[channel_id] = deque([post_id])
+                    self._get_executor().submit(self._drain_channel, channel_id)
+                else:
+                    # یک worker از قبل در حال ارسال به این کانال است
+                    channel_queue.append(post_id)
+    
+    def _drain_channel(self, channel_id):
+        """ارسال ترتیبی پست‌های صف یک کانال"""
+        while True:
+            with self._cond:
+                channel_queue = self._channel_queues.get(channel_id)
+                if not channel_queue:
+                    self._channel_queues.pop(channel_id, None)
+                    return
+                post_id = channel_queue.popleft()
             
-            if not pending_posts:
-                logger.debug("📭 هیچ پست جدیدی برای ارسال نیست")
-                return
+            try:
+                self._send_due_post(post_id)
+            except Exception as e:
+                logger.error(f"❌ خطا در ارسال پست {post_id}: {str(e)}")
+            finally:
+                with self._cond:
+                    self._inflight.discard(post_id)
+    
+    def _send_due_post(self, post_id):
+        """ارسال یک پست سررسید شده با وضعیت فعلی آن در دیتابیس"""
+        session = self.Session()
+        
+        try:
+            post = session.query(ScheduledPost).get(post_id)
             
-            logger.info(f"📬 {len(pending_posts)} پست برای ارسال یافت شد")
+            # لغو، حذف یا ارسال‌شده در فاصله زمان‌بندی تا موعد
+            if not post or post.status != 'pending':
+                return
             
-            for post in pending_posts:
+            if post.scheduled_time > datetime.utcnow() + timedelta(seconds=1):
+                # زمان پست تغییر کرده است
+                next_run = (post.scheduled_time, post.channel_id)
+            elif not acquire_lease(session, ScheduledPost, post_id, self.lease_ttl,
+                                   ScheduledPost.status == 'pending', owner=self.node_id):
+                # نود دیگری در حال ارسال این پست است
+                return
+            else:
                 try:
                     self.send_post(post, session)
+                    self._clear_lease(post)
+                    session.commit()
                 except Exception as e:
                     logger.error(f"❌ خطا در ارسال پست {post.id}: {str(e)}")
+                    session.rollback()
+                    self._clear_lease(post)
                     self.handle_failed_post(post, str(e), session)
-            
-            session.commit()
-            
+                
+                next_run = (post.scheduled_time, post.channel_id) if post.status == 'pending' else None
         except Exception as e:
             logger.error(f"❌ خطا در چک کردن پست‌ها: {str(e)}")
             session.rollback()
+            return
         finally:
             session.close()
+        
+        if next_run:
+            # retry: پس از پایان ارسال فعلی دوباره در heap قرار می‌گیرد
+            with self._cond:
+                self._inflight.discard(post_id)
+            self.schedule_post(post_id, *next_run)
+    
+    @staticmethod
+    def _clear_lease(post):
+        post.lease_owner = None
+        post.lease_expires_at = None
     
     def send_post(self, post, session):
         """ارسال یک پست به کانال"""
@@ -94,7 +244,8 @@ class PostScheduler:
             content=post.content,
             media_type=post.media_type,
             media_url=post.media_url,
-            disable_notification=post.disable_notification
+            disable_notification=post.disable_notification,
+            bot_instance_id=bot_instance.id
         )
         
         if success:
@@ -115,8 +266,16 @@ class PostScheduler:
             raise Exception("ارسال به تلگرام ناموفق بود")
     
     def send_to_telegram(self, bot_token, chat_id, content, media_type=None, 
-                        media_url=None, disable_notification=False):
-        """ارسال پست به تلگرام"""
+                        media_url=None, disable_notification=False, bot_instance_id=None):
+        """
+        ارسال پست به تلگرام
+        
+        با bot_instance_id، رسانه‌ای که قبلاً توسط همین بات ارسال شده با file_id
+        کش‌شده ارسال می‌شود و file_id اولین ارسال ذخیره می‌شود.
+        """
+        cached_file_id = media_cache.get(bot_instance_id, media_type, media_url)
+        media = cached_file_id or media_url
+        
         try:
             import requests
             
@@ -137,7 +296,7 @@ class PostScheduler:
                 url = f"{base_url}/sendPhoto"
                 data = {
                     'chat_id': chat_id,
-                    'photo': media_url,
+                    'photo': media,
                     'caption': content,
                     'disable_notification': disable_notification,
                     'parse_mode': 'HTML'
@@ -148,7 +307,7 @@ class PostScheduler:
                 url = f"{base_url}/sendVideo"
                 data = {
                     'chat_id': chat_id,
-                    'video': media_url,
+                    'video': media,
                     'caption': content,
                     'disable_notification': disable_notification,
                     'parse_mode': 'HTML'
@@ -159,7 +318,7 @@ class PostScheduler:
                 url = f"{base_url}/sendDocument"
                 data = {
                     'chat_id': chat_id,
-                    'document': media_url,
+                    'document': media,
                     'caption': content,
                     'disable_notification': disable_notification,
                     'parse_mode': 'HTML'
@@ -175,6 +334,11 @@ class PostScheduler:
                 if result['ok']:
                     message_id = result['result']['message_id']
                     logger.info(f"✅ پیام با موفقیت ارسال شد (message_id: {message_id})")
+                    if bot_instance_id and not cached_file_id:
+                        media_cache.store(
+                            bot_instance_id, media_type, media_url,
+                            extract_file_id(media_type, result['result'])
+                        )
                     return message_id
                 else:
                     raise Exception(f"خطای تلگرام: {result.get('description', 'Unknown error')}")
@@ -185,6 +349,13 @@ class PostScheduler:
             logger.error(f"❌ خطای شبکه در ارسال به تلگرام: {str(e)}")
             raise
         except Exception as e:
+            if cached_file_id and is_invalid_file_id_error(str(e)):
+                # file_id منقضی/نامعتبر: حذف از کش و ارسال دوباره با آدرس رسانه
+                logger.warning(f"⚠️ file_id نامعتبر برای بات {bot_instance_id}؛ ارسال با آدرس رسانه")
+                media_cache.invalidate(bot_instance_id, media_type, media_url)
+                return self.send_to_telegram(
+                    bot_token, chat_id, content, media_type, media_url, disable_notification, bot_instance_id
+                )
             logger.error(f"❌ خطا در ارسال به تلگرام: {str(e)}")
             raise
     
@@ -228,7 +399,7 @@ class PostScheduler:
     
     def cleanup_old_posts(self):
         """پاک کردن پست‌های قدیمی (بیش از 30 روز)"""
-        session = Session()
+        session = self.Session()
         
         try:
             cutoff_date = datetime.utcnow() - timedelta(days=30)
@@ -257,31 +428,64 @@ class PostScheduler:
         
         self.running = True
         
-        # Schedule jobs
-        schedule.every(1).minutes.do(self.check_and_send_posts)
-        schedule.every(1).days.do(self.cleanup_old_posts)
-        
         logger.info("✅ Post Scheduler شروع شد")
-        logger.info("⏰ بررسی پست‌ها هر 1 دقیقه")
+        logger.info(f"⏰ ارسال در موعد هر پست (همگام‌سازی با دیتابیس هر {self.resync_interval:g} ثانیه)")
         logger.info("🗑️ پاکسازی پست‌های قدیمی هر 1 روز")
         
         # اجرای scheduler در thread جداگانه
-        self.thread = Thread(target=self._run_scheduler, daemon=True)
+        self.thread = Thread(target=self._run_scheduler, name='PostScheduler', daemon=True)
         self.thread.start()
     
     def _run_scheduler(self):
-        """اجرای مداوم scheduler"""
+        """خوابیدن تا موعد بعدی، همگام‌سازی دوره‌ای و ارسال پست‌های سررسید شده"""
+        next_resync = 0
+        next_cleanup = time.monotonic() + self.CLEANUP_INTERVAL
+        
         while self.running:
             try:
-                schedule.run_pending()
-                time.sleep(1)
+                if time.monotonic() >= next_resync:
+                    self._resync()
+                    next_resync = time.monotonic() + self.resync_interval
+                
+                if time.monotonic() >= next_cleanup:
+                    self.cleanup_old_posts()
+                    next_cleanup = time.monotonic() + self.CLEANUP_INTERVAL
+                
+                self._dispatch_due()
+                
+                with self._cond:
+                    timeout = next_resync - time.monotonic()
+                    if self._heap:
+                        until_due = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                        timeout = min(timeout, until_due)
+                    
+                    if self.running and not self._resync_requested and timeout > 0:
+                        self._cond.wait(timeout)
+                    
+                    if self._resync_requested:
+                        next_resync = 0
+                        self._resync_requested = False
             except Exception as e:
                 logger.error(f"❌ خطا در اجرای scheduler: {str(e)}")
                 time.sleep(5)
     
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix='post-sender'
+            )
+        return self._executor
+    
     def stop(self):
         """توقف scheduler"""
         self.running = False
+        self.wake()
+        if self.thread:
+            self.thread.join(timeout=10)
+            self.thread = None
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         logger.info("🛑 Post Scheduler متوقف شد")
 
 
@@ -6,7 +6,7 @@ import os
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler, MessageHandler, 
+    Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler,
     filters, ContextTypes, ConversationHandler
 )
 
@@ -17,8 +17,13 @@ from database.models import (
     CitizenContribution, ContributionVote, ContributionComment, CitizenProfile
 )
 from sqlalchemy.orm import scoped_session, sessionmaker
-from sqlalchemy import create_engine
-from config.settings import DATABASE_URI
+from database.engine import get_engine
+from config.settings import BOT_WEBHOOK_MODE
+from bot_engine.content_cache import content_cache, MAIN_MENU
+from bot_engine.db_executor import run_db
+from bot_engine.user_activity import user_activity, insert_bot_users, new_user_row
+from bot_engine.analytics_events import analytics_events, START, MESSAGE, CONTRIBUTION
+from bot_engine.auto_reply import auto_replies
 from datetime import datetime
 
 # Setup logger
@@ -27,7 +32,7 @@ logging.basicConfig(level=logging.INFO)
 
 
 # تنظیم دیتابیس برای استفاده در بات
-engine = create_engine(DATABASE_URI)
+engine = get_engine()
 SessionFactory = sessionmaker(bind=engine)
 Session = scoped_session(SessionFactory)
 
@@ -44,51 +49,73 @@ def get_candidate_by_bot_id(bot_instance_id: int):
     return None
 
 
-async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """دستور شروع بات"""
-    user = update.effective_user
-    bot_id = context.bot_data.get('bot_instance_id')
+def register_bot_user(bot_id: int, telegram_id: int, username, first_name, last_name):
+    """
+    ثبت کاربر جدید بات در دیتابیس (روی executor اجرا می‌شود)
     
-    # ثبت کاربر در دیتابیس
+    Returns:
+        dict: نتیجه امتیاز عضویت برای کاربر جدید، در غیر این صورت None
+    """
     session = Session()
-    is_new_user = False
     try:
+        # درج یکتا روی (bot_instance_id, telegram_id): اگر flush بافر فعالیت یا
+        # پروسه دیگری زودتر کاربر را ثبت کرده باشد، عضویت دوباره شمرده نمی‌شود
+        inserted = insert_bot_users(session.connection(), [
+            new_user_row(bot_id, telegram_id, username, first_name, last_name)
+        ])
+        if not inserted:
+            session.rollback()
+            return None
+        session.commit()
+        analytics_events.record_new_user(bot_id)
+        
         bot_user = session.query(BotUser).filter_by(
-            telegram_id=user.id,
+            telegram_id=telegram_id,
             bot_instance_id=bot_id
         ).first()
         
-        if not bot_user:
-            bot_user = BotUser(
-                telegram_id=user.id,
-                username=user.username,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                bot_instance_id=bot_id,
-                total_points=0,
-                level=1
-            )
-            session.add(bot_user)
-            session.commit()
-            is_new_user = True
-            
-            # 🎮 Gamification: امتیاز عضویت
-            try:
-                from services.gamification_service import GamificationService
-                result = GamificationService.award_points(bot_user, 'join')
-                if result['success']:
-                    await update.message.reply_text(
-                        f"🎉 تبریک! {result['points_awarded']} امتیاز دریافت کردید!\n"
-                        f"🏆 سطح: {result['level']['emoji']} {result['level']['name']}"
-                    )
-            except Exception as e:
-                import logging
-                logging.error(f"Gamification error: {e}")
+        # 🎮 Gamification: امتیاز عضویت
+        try:
+            from services.gamification_service import GamificationService
+            return GamificationService.award_points(bot_user, 'join')
+        except Exception as e:
+            logger.error(f"Gamification error: {e}")
+            return None
     finally:
         session.close()
+
+
+async def track_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ثبت دیده‌شدن کاربر برای همه آپدیت‌ها (فقط در حافظه؛ flush دسته‌ای)"""
+    user = update.effective_user
+    if user and not user.is_bot:
+        user_activity.record(
+            context.bot_data.get('bot_instance_id'), user.id,
+            username=user.username, first_name=user.first_name, last_name=user.last_name
+        )
+
+
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دستور شروع بات"""
+    user = update.effective_user
+    bot_id = context.bot_data.get('bot_instance_id')
+    analytics_events.record(bot_id, user.id, START)
+    
+    # ثبت کاربر جدید در دیتابیس (کاربر شناخته‌شده هیچ کوئری‌ای ندارد)
+    result = None
+    if not user_activity.is_known(bot_id, user.id):
+        result = await run_db(
+            register_bot_user, bot_id, user.id, user.username, user.first_name, user.last_name
+        )
+        user_activity.mark_known(bot_id, user.id)
+    if result and result.get('success'):
+        await update.message.reply_text(
+            f"🎉 تبریک! {result['points_awarded']} امتیاز دریافت کردید!\n"
+            f"🏆 سطح: {result['level']['emoji']} {result['level']['name']}"
+        )
     
     # دریافت اطلاعات نماینده
-    candidate = get_candidate_by_bot_id(bot_id)
+    candidate = await run_db(get_candidate_by_bot_id, bot_id)
     
     if not candidate:
         await update.message.reply_text("❌ خطا در دریافت اطلاعات")
@@ -124,149 +151,191 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+def _back_markup():
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="back")]])
+
+
+def render_resume(session, candidate):
+    resumes = session.query(Resume).filter_by(candidate_id=candidate.id).order_by(Resume.order).all()
+    
+    if not resumes:
+        text = "📋 رزومه‌ای ثبت نشده است."
+    else:
+        text = f"📋 *رزومه {candidate.full_name}*\n\n"
+        for resume in resumes:
+            text += f"▫️ *{resume.title}* ({resume.year})\n"
+            text += f"   {resume.description}\n\n"
+    
+    return text, _back_markup()
+
+
+def render_programs(session, candidate):
+    programs = session.query(Program).filter_by(candidate_id=candidate.id).all()
+    
+    if not programs:
+        text = "📢 برنامه‌ای ثبت نشده است."
+    else:
+        text = f"📢 *برنامه‌های {candidate.full_name}*\n\n"
+        for program in programs:
+            text += f"🔹 *{program.title}*\n"
+            text += f"📂 دسته: {program.category}\n"
+            text += f"{program.description}\n\n"
+    
+    return text, _back_markup()
+
+
+def render_headquarters(session, candidate):
+    hqs = session.query(Headquarters).filter_by(candidate_id=candidate.id).all()
+    
+    if not hqs:
+        text = "📍 آدرس ستادی ثبت نشده است."
+    else:
+        text = f"📍 *ستادهای {candidate.full_name}*\n\n"
+        for hq in hqs:
+            text += f"🏢 *{hq.name}*\n"
+            text += f"📍 {hq.address}\n"
+            if hq.phone:
+                text += f"📞 {hq.phone}\n"
+            text += "\n"
+    
+    return text, _back_markup()
+
+
+def render_contact(session, candidate):
+    text = f"📞 *تماس با {candidate.full_name}*\n\n"
+    
+    if candidate.phone:
+        text += f"📱 تلفن: {candidate.phone}\n"
+    if candidate.email:
+        text += f"📧 ایمیل: {candidate.email}\n"
+    
+    if not candidate.phone and not candidate.email:
+        text += "اطلاعات تماس ثبت نشده است."
+    
+    return text, _back_markup()
+
+
+def render_main_menu(session, candidate):
+    keyboard = [
+        [InlineKeyboardButton("📋 رزومه", callback_data="resume"),
+         InlineKeyboardButton("📢 برنامه‌ها", callback_data="programs")],
+        [InlineKeyboardButton("📍 آدرس ستادها", callback_data="headquarters"),
+         InlineKeyboardButton("📞 تماس با ما", callback_data="contact")],
+        [InlineKeyboardButton("💬 ارسال پیام", callback_data="send_message")]
+    ]
+    
+    text = f"""
+🌟 منوی اصلی
+
+نماینده: *{candidate.full_name}*
+📍 {candidate.city} - {candidate.district}
+
+از منوی زیر انتخاب کنید:
+"""
+    
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+# رندرکننده‌های منوهایی که خروجی‌شان در content_cache نگهداری می‌شود
+MENU_RENDERERS = {
+    'resume': render_resume,
+    'programs': render_programs,
+    'headquarters': render_headquarters,
+    'contact': render_contact,
+    MAIN_MENU: render_main_menu,
+}
+CACHED_MENU_SECTIONS = ('resume', 'programs', 'headquarters', 'contact')
+
+
+def render_menu_content(bot_instance_id: int, section: str):
+    """
+    رندر یک منو از دیتابیس (روی executor اجرا می‌شود)
+    
+    Returns:
+        tuple: (candidate_id, (text, reply_markup)) یا None
+    """
+    session = Session()
+    try:
+        bot_instance = session.query(BotInstance).filter_by(id=bot_instance_id).first()
+        if not bot_instance:
+            return None
+        candidate = session.query(Candidate).filter_by(id=bot_instance.candidate_id).first()
+        if not candidate:
+            return None
+        return candidate.id, MENU_RENDERERS[section](session, candidate)
+    finally:
+        session.close()
+
+
+async def get_menu_content(bot_instance_id: int, section: str):
+    """
+    متن و کیبورد یک منو از کش؛ در صورت miss از دیتابیس رندر می‌شود
+    
+    Returns:
+        tuple: (text, reply_markup)
+    """
+    content = await content_cache.get_or_render(
+        bot_instance_id, section,
+        lambda: run_db(render_menu_content, bot_instance_id, section)
+    )
+    if content is None:
+        return "❌ خطا در دریافت اطلاعات", None
+    return content
+
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """مدیریت دکمه‌های inline"""
     query = update.callback_query
     await query.answer()
     
     bot_id = context.bot_data.get('bot_instance_id')
-    candidate = get_candidate_by_bot_id(bot_id)
     
-    if not candidate:
-        await query.edit_message_text("❌ خطا در دریافت اطلاعات")
+    # منوهای محتوایی مستقیماً از کش پاسخ داده می‌شوند (بدون کوئری در حالت hit)
+    if query.data in CACHED_MENU_SECTIONS or query.data == "back":
+        section = MAIN_MENU if query.data == "back" else query.data
+        analytics_events.record(bot_id, update.effective_user.id, section)
+        text, reply_markup = await get_menu_content(bot_id, section)
+        await query.edit_message_text(
+            text, reply_markup=reply_markup, parse_mode='Markdown' if reply_markup else None
+        )
         return
     
-    session = Session()
+    if query.data == "leaderboard":
+        # نمایش جدول برترین‌ها
+        await leaderboard_command(update, context)
     
-    try:
-        if query.data == "resume":
-            resumes = session.query(Resume).filter_by(candidate_id=candidate.id).order_by(Resume.order).all()
-            
-            if not resumes:
-                text = "📋 رزومه‌ای ثبت نشده است."
-            else:
-                text = f"📋 *رزومه {candidate.full_name}*\n\n"
-                for resume in resumes:
-                    text += f"▫️ *{resume.title}* ({resume.year})\n"
-                    text += f"   {resume.description}\n\n"
-            
-            keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="back")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif query.data == "programs":
-            programs = session.query(Program).filter_by(candidate_id=candidate.id).all()
-            
-            if not programs:
-                text = "📢 برنامه‌ای ثبت نشده است."
-            else:
-                text = f"📢 *برنامه‌های {candidate.full_name}*\n\n"
-                for program in programs:
-                    text += f"🔹 *{program.title}*\n"
-                    text += f"📂 دسته: {program.category}\n"
-                    text += f"{program.description}\n\n"
-            
-            keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="back")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif query.data == "leaderboard":
-            # نمایش جدول برترین‌ها
-            await leaderboard_command(update, context)
-            return
-        
-        elif query.data == "popular_ideas":
-            # نمایش ایده‌های محبوب
-            context.user_data['ideas_page'] = 0
-            await show_popular_ideas(update, context)
-            return
-        
-        elif query.data in ["ideas_next", "ideas_prev"]:
-            # صفحه‌بندی ایده‌ها
-            await ideas_navigation(update, context)
-            return
+    elif query.data == "popular_ideas":
+        # نمایش ایده‌های محبوب
+        context.user_data['ideas_page'] = 0
+        await show_popular_ideas(update, context)
+    
+    elif query.data in ["ideas_next", "ideas_prev"]:
+        # صفحه‌بندی ایده‌ها
+        await ideas_navigation(update, context)
+    
+    elif query.data == "track_by_code":
+        # درخواست کد پیگیری
+        await track_by_code_prompt(update, context)
+    
+    elif query.data == "send_message":
+        candidate = await run_db(get_candidate_by_bot_id, bot_id)
         
-        elif query.data == "track_by_code":
-            # درخواست کد پیگیری
-            await track_by_code_prompt(update, context)
+        if not candidate:
+            await query.edit_message_text("❌ خطا در دریافت اطلاعات")
             return
         
-        elif query.data == "headquarters":
-            hqs = session.query(Headquarters).filter_by(candidate_id=candidate.id).all()
-            
-            if not hqs:
-                text = "📍 آدرس ستادی ثبت نشده است."
-            else:
-                text = f"📍 *ستادهای {candidate.full_name}*\n\n"
-                for hq in hqs:
-                    text += f"🏢 *{hq.name}*\n"
-                    text += f"📍 {hq.address}\n"
-                    if hq.phone:
-                        text += f"📞 {hq.phone}\n"
-                    text += "\n"
-            
-            keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="back")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        # بررسی فعال بودن پلن ارتباط مردمی
+        has_messaging = any(plan.code == 'PUBLIC_MESSAGING' for plan in candidate.plans)
         
-        elif query.data == "contact":
-            text = f"📞 *تماس با {candidate.full_name}*\n\n"
-            
-            if candidate.phone:
-                text += f"📱 تلفن: {candidate.phone}\n"
-            if candidate.email:
-                text += f"📧 ایمیل: {candidate.email}\n"
-            
-            if not candidate.phone and not candidate.email:
-                text += "اطلاعات تماس ثبت نشده است."
-            
+        if not has_messaging:
+            text = "❌ امکان ارسال پیام در حال حاضر فعال نیست."
             keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="back")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif query.data == "send_message":
-            # بررسی فعال بودن پلن ارتباط مردمی
-            has_messaging = any(plan.code == 'PUBLIC_MESSAGING' for plan in candidate.plans)
-            
-            if not has_messaging:
-                text = "❌ امکان ارسال پیام در حال حاضر فعال نیست."
-                keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="back")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(text, reply_markup=reply_markup)
-            else:
-                text = "💬 لطفاً پیام خود را برای نماینده ارسال کنید:"
-                context.user_data['waiting_for_message'] = True
-                await query.edit_message_text(text)
-        
-        elif query.data == "back":
-            # بازگشت به منوی اصلی
-            keyboard = [
-                [InlineKeyboardButton("📋 رزومه", callback_data="resume"),
-                 InlineKeyboardButton("📢 برنامه‌ها", callback_data="programs")],
-                [InlineKeyboardButton("📍 آدرس ستادها", callback_data="headquarters"),
-                 InlineKeyboardButton("📞 تماس با ما", callback_data="contact")],
-                [InlineKeyboardButton("💬 ارسال پیام", callback_data="send_message")]
-            ]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            text = f"""
-🌟 منوی اصلی
-
-نماینده: *{candidate.full_name}*
-📍 {candidate.city} - {candidate.district}
-
-از منوی زیر انتخاب کنید:
-"""
-            
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-    
-    finally:
-        session.close()
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        else:
+            text = "💬 لطفاً پیام خود را برای نماینده ارسال کنید:"
+            context.user_data['waiting_for_message'] = True
+            await query.edit_message_text(text)
 
 
 # ============================================================
@@ -278,31 +347,48 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
  LOCATION_INPUT, IMAGE_UPLOAD, CONFIRM) = range(7)
 
 
-async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش آمار کاربر"""
-    user = update.effective_user
-    bot_id = context.bot_data.get('bot_instance_id')
+def load_user_stats(bot_id: int, telegram_id: int):
+    """
+    آمار گیمیفیکیشن کاربر (روی executor اجرا می‌شود)
     
+    Returns:
+        tuple: (first_name, last_name, stats) یا None اگر کاربر ثبت نشده باشد
+    """
     session = Session()
     try:
         bot_user = session.query(BotUser).filter_by(
-            telegram_id=user.id,
+            telegram_id=telegram_id,
             bot_instance_id=bot_id
         ).first()
         
         if not bot_user:
-            await update.message.reply_text("❌ کاربر یافت نشد. لطفا /start را بزنید.")
-            return
+            return None
         
-        # دریافت آمار
         from services.gamification_service import GamificationService
         stats = GamificationService.get_user_stats(bot_user)
-        
-        # ساخت پیام
-        text = f"""
+        return bot_user.first_name, bot_user.last_name, stats
+    finally:
+        session.close()
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش آمار کاربر"""
+    user = update.effective_user
+    bot_id = context.bot_data.get('bot_instance_id')
+    
+    user_stats = await run_db(load_user_stats, bot_id, user.id)
+    
+    if not user_stats:
+        await update.message.reply_text("❌ کاربر یافت نشد. لطفا /start را بزنید.")
+        return
+    
+    first_name, last_name, stats = user_stats
+    
+    # ساخت پیام
+    text = f"""
 🏆 *آمار شما*
 
-👤 نام: {bot_user.first_name} {bot_user.last_name or ''}
+👤 نام: {first_name} {last_name or ''}
 
 💎 امتیازات: *{stats['total_points']:,}*
 📊 سطح: {stats['level']['emoji']} *{stats['level']['name']}* (سطح {stats['level']['level']})
@@ -312,24 +398,21 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 🏅 *نشان‌ها ({stats['badges_count']}):*
 """
-        
-        if stats['badges']:
-            for badge in stats['badges']:
-                text += f"  {badge['emoji']} {badge['name']}\n"
-        else:
-            text += "  هنوز نشانی دریافت نکرده‌اید\n"
-        
-        # دکمه‌ها
-        keyboard = [
-            [InlineKeyboardButton("🏆 جدول برترین‌ها", callback_data="leaderboard")],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="back")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-        
-    finally:
-        session.close()
+    
+    if stats['badges']:
+        for badge in stats['badges']:
+            text += f"  {badge['emoji']} {badge['name']}\n"
+    else:
+        text += "  هنوز نشانی دریافت نکرده‌اید\n"
+    
+    # دکمه‌ها
+    keyboard = [
+        [InlineKeyboardButton("🏆 جدول برترین‌ها", callback_data="leaderboard")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
 
 async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -337,7 +420,7 @@ async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     bot_id = context.bot_data.get('bot_instance_id')
     
     from services.gamification_service import GamificationService
-    leaderboard = GamificationService.get_leaderboard(bot_id, limit=10)
+    leaderboard = await run_db(GamificationService.get_leaderboard, bot_id, limit=10)
     
     text = "🏆 *جدول برترین‌ها*\n\n"
     
@@ -635,26 +718,22 @@ async def show_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return CONFIRM
 
 
-async def final_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """تایید نهایی و ذخیره در دیتابیس"""
-    if update.message.text == "❌ انصراف":
-        await update.message.reply_text("❌ عملیات لغو شد.", reply_markup=ReplyKeyboardMarkup([[KeyboardButton("🏠 منوی اصلی")]], resize_keyboard=True))
-        context.user_data.clear()
-        return ConversationHandler.END
+def save_contribution(bot_id: int, telegram_id: int, username, first_name, last_name,
+                      contribution_data: dict):
+    """
+    ثبت مشارکت و اعطای امتیاز (روی executor اجرا می‌شود)
     
-    # ذخیره در دیتابیس
+    Returns:
+        tuple: (tracking_code, total_points) یا None اگر بات یافت نشود
+    """
     session = Session()
     try:
-        user = update.effective_user
-        bot_id = context.bot_data.get('bot_instance_id')
-        
         bot_instance = session.query(BotInstance).filter_by(id=bot_id).first()
         if not bot_instance:
-            await update.message.reply_text("❌ خطا در دریافت اطلاعات بات")
-            return ConversationHandler.END
+            return None
         
         # تولید کد پیگیری
-        prefix = "IDEA" if context.user_data['contrib_type'] == 'idea' else "RPT"
+        prefix = "IDEA" if contribution_data['contrib_type'] == 'idea' else "RPT"
         last = session.query(CitizenContribution).filter(
             CitizenContribution.tracking_code.like(f'{prefix}-%')
         ).order_by(CitizenContribution.id.desc()).first()
@@ -671,18 +750,18 @@ async def final_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         contribution = CitizenContribution(
             tracking_code=tracking_code,
             candidate_id=bot_instance.candidate_id,
-            user_telegram_id=user.id,
-            user_username=user.username,
-            user_first_name=user.first_name,
-            user_last_name=user.last_name,
-            contribution_type=context.user_data['contrib_type'],
-            title=context.user_data['title'],
-            description=context.user_data['description'],
-            category=context.user_data['category'],
-            location_text=context.user_data.get('location_text'),
-            latitude=context.user_data.get('latitude'),
-            longitude=context.user_data.get('longitude'),
-            images=context.user_data.get('images', []),
+            user_telegram_id=telegram_id,
+            user_username=username,
+            user_first_name=first_name,
+            user_last_name=last_name,
+            contribution_type=contribution_data['contrib_type'],
+            title=contribution_data['title'],
+            description=contribution_data['description'],
+            category=contribution_data['category'],
+            location_text=contribution_data.get('location_text'),
+            latitude=contribution_data.get('latitude'),
+            longitude=contribution_data.get('longitude'),
+            images=contribution_data.get('images', []),
             status='pending',
             priority='medium',
             created_at=datetime.utcnow()
@@ -692,12 +771,12 @@ async def final_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         session.commit()
         
         # اعطای امتیاز به کاربر
-        profile = session.query(CitizenProfile).filter_by(telegram_id=user.id).first()
+        profile = session.query(CitizenProfile).filter_by(telegram_id=telegram_id).first()
         if not profile:
             profile = CitizenProfile(
-                telegram_id=user.id,
-                full_name=f"{user.first_name} {user.last_name or ''}".strip(),
-                username=user.username,
+                telegram_id=telegram_id,
+                full_name=f"{first_name} {last_name or ''}".strip(),
+                username=username,
                 total_points=10,
                 level=1,
                 contributions_count=1,
@@ -712,6 +791,34 @@ async def final_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         session.commit()
         
+        return tracking_code, profile.total_points
+    finally:
+        session.close()
+
+
+async def final_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تایید نهایی و ذخیره در دیتابیس"""
+    if update.message.text == "❌ انصراف":
+        await update.message.reply_text("❌ عملیات لغو شد.", reply_markup=ReplyKeyboardMarkup([[KeyboardButton("🏠 منوی اصلی")]], resize_keyboard=True))
+        context.user_data.clear()
+        return ConversationHandler.END
+    
+    # ذخیره در دیتابیس
+    try:
+        user = update.effective_user
+        bot_id = context.bot_data.get('bot_instance_id')
+        
+        saved = await run_db(
+            save_contribution, bot_id, user.id, user.username, user.first_name, user.last_name,
+            dict(context.user_data)
+        )
+        if not saved:
+            await update.message.reply_text("❌ خطا در دریافت اطلاعات بات")
+            return ConversationHandler.END
+        
+        tracking_code, total_points = saved
+        analytics_events.record(bot_id, user.id, CONTRIBUTION)
+        
         type_text = "ایده" if context.user_data['contrib_type'] == 'idea' else "گزارش"
         
         text = f"""
@@ -720,7 +827,7 @@ async def final_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📌 کد پیگیری: `{tracking_code}`
 
 +10 امتیاز دریافت کردید!
-امتیاز کل شما: {profile.total_points}
+امتیاز کل شما: {total_points}
 
 این مشارکت توسط تیم بررسی و در صورت تایید، به شما 50 امتیاز اضافی تعلق می‌گیرد.
 
@@ -739,8 +846,6 @@ async def final_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ خطا در ثبت: {str(e)}")
         return ConversationHandler.END
-    finally:
-        session.close()
 
 
 async def cancel_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -757,98 +862,112 @@ async def cancel_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE
 # لیست ایده‌ها و پیگیری (Ideas List & Tracking)
 # ============================================================
 
-async def show_popular_ideas(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش ایده‌های محبوب"""
-    query = update.callback_query
-    if query:
-        await query.answer()
+def load_popular_ideas(bot_id: int, page: int, per_page: int):
+    """
+    ایده‌های تاییدشده یک صفحه به ترتیب رای (روی executor اجرا می‌شود)
     
-    bot_id = context.bot_data.get('bot_instance_id')
+    Returns:
+        tuple: (contributions, total) یا None اگر بات یافت نشود
+    """
     session = Session()
-    
     try:
         bot_instance = session.query(BotInstance).filter_by(id=bot_id).first()
         if not bot_instance:
-            await (query.message if query else update.message).reply_text("❌ خطا در دریافت اطلاعات")
-            return
+            return None
         
-        # دریافت محبوب‌ترین ایده‌ها (بر اساس رای)
-        page = context.user_data.get('ideas_page', 0)
-        per_page = 5
-        
-        contributions = session.query(CitizenContribution).filter(
+        idea_filter = (
             CitizenContribution.candidate_id == bot_instance.candidate_id,
             CitizenContribution.contribution_type == 'idea',
             CitizenContribution.status.in_(['approved', 'in_progress', 'completed'])
-        ).order_by(
+        )
+        
+        contributions = session.query(CitizenContribution).filter(*idea_filter).order_by(
             CitizenContribution.votes_count.desc()
         ).limit(per_page).offset(page * per_page).all()
         
-        total = session.query(CitizenContribution).filter(
-            CitizenContribution.candidate_id == bot_instance.candidate_id,
-            CitizenContribution.contribution_type == 'idea',
-            CitizenContribution.status.in_(['approved', 'in_progress', 'completed'])
-        ).count()
+        total = session.query(CitizenContribution).filter(*idea_filter).count()
         
-        if not contributions:
-            text = "📋 هنوز ایده تاییدشده‌ای وجود ندارد."
-            keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="back")]]
-        else:
-            text = "💡 *ایده‌های محبوب*\n\n"
-            
-            for idx, contrib in enumerate(contributions, start=page * per_page + 1):
-                status_emoji = {
-                    'approved': '✅',
-                    'in_progress': '🔄',
-                    'completed': '✔️'
-                }.get(contrib.status, '⏳')
-                
-                category_emoji = {
-                    'education': '📚',
-                    'health': '🏥',
-                    'traffic': '🚗',
-                    'security': '🛡️',
-                    'environment': '🌳',
-                    'cultural': '🎭',
-                    'infrastructure': '🏗️',
-                    'economic': '💰',
-                    'welfare': '🤝',
-                    'other': '📋'
-                }.get(contrib.category, '📋')
-                
-                text += f"{idx}️⃣ {status_emoji} *{contrib.title}*\n"
-                text += f"   {category_emoji} | 👍 {contrib.votes_count} | 💬 {contrib.comments_count}\n"
-                text += f"   📍 `{contrib.tracking_code}`\n\n"
-            
-            text += f"📄 صفحه {page + 1} از {(total + per_page - 1) // per_page}"
-            
-            # دکمه‌های صفحه‌بندی
-            keyboard = []
-            nav_row = []
-            
-            if page > 0:
-                nav_row.append(InlineKeyboardButton("◀️ قبلی", callback_data="ideas_prev"))
-            
-            if (page + 1) * per_page < total:
-                nav_row.append(InlineKeyboardButton("بعدی ▶️", callback_data="ideas_next"))
+        session.expunge_all()
+        return contributions, total
+    finally:
+        session.close()
+
+
+async def show_popular_ideas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش ایده‌های محبوب"""
+    query = update.callback_query
+    if query:
+        await query.answer()
+    
+    bot_id = context.bot_data.get('bot_instance_id')
+    
+    # دریافت محبوب‌ترین ایده‌ها (بر اساس رای)
+    page = context.user_data.get('ideas_page', 0)
+    per_page = 5
+    
+    ideas = await run_db(load_popular_ideas, bot_id, page, per_page)
+    if ideas is None:
+        await (query.message if query else update.message).reply_text("❌ خطا در دریافت اطلاعات")
+        return
+    
+    contributions, total = ideas
+    
+    if not contributions:
+        text = "📋 هنوز ایده تاییدشده‌ای وجود ندارد."
+        keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="back")]]
+    else:
+        text = "💡 *ایده‌های محبوب*\n\n"
+        
+        for idx, contrib in enumerate(contributions, start=page * per_page + 1):
+            status_emoji = {
+                'approved': '✅',
+                'in_progress': '🔄',
+                'completed': '✔️'
+            }.get(contrib.status, '⏳')
             
-            if nav_row:
-                keyboard.append(nav_row)
+            category_emoji = {
+                'education': '📚',
+                'health': '🏥',
+                'traffic': '🚗',
+                'security': '🛡️',
+                'environment': '🌳',
+                'cultural': '🎭',
+                'infrastructure': '🏗️',
+                'economic': '💰',
+                'welfare': '🤝',
+                'other': '📋'
+            }.get(contrib.category, '📋')
             
-            keyboard.append([
-                InlineKeyboardButton("🔍 پیگیری با کد", callback_data="track_by_code"),
-                InlineKeyboardButton("🔙 بازگشت", callback_data="back")
-            ])
+            text += f"{idx}️⃣ {status_emoji} *{contrib.title}*\n"
+            text += f"   {category_emoji} | 👍 {contrib.votes_count} | 💬 {contrib.comments_count}\n"
+            text += f"   📍 `{contrib.tracking_code}`\n\n"
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        text += f"📄 صفحه {page + 1} از {(total + per_page - 1) // per_page}"
         
-        if query:
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-        else:
-            await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        # دکمه‌های صفحه‌بندی
+        keyboard = []
+        nav_row = []
+        
+        if page > 0:
+            nav_row.append(InlineKeyboardButton("◀️ قبلی", callback_data="ideas_prev"))
+        
+        if (page + 1) * per_page < total:
+            nav_row.append(InlineKeyboardButton("بعدی ▶️", callback_data="ideas_next"))
+        
+        if nav_row:
+            keyboard.append(nav_row)
+        
+        keyboard.append([
+            InlineKeyboardButton("🔍 پیگیری با کد", callback_data="track_by_code"),
+            InlineKeyboardButton("🔙 بازگشت", callback_data="back")
+        ])
     
-    finally:
-        session.close()
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    if query:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
 
 async def ideas_navigation(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -884,6 +1003,31 @@ async def track_by_code_prompt(update: Update, context: ContextTypes.DEFAULT_TYP
     context.user_data['waiting_for_tracking_code'] = True
 
 
+def load_contribution_by_code(bot_id: int, tracking_code: str):
+    """
+    یافتن مشارکت با کد پیگیری (روی executor اجرا می‌شود)
+    
+    Returns:
+        tuple: (contribution یا None,) یا None اگر بات یافت نشود
+    """
+    session = Session()
+    try:
+        bot_instance = session.query(BotInstance).filter_by(id=bot_id).first()
+        if not bot_instance:
+            return None
+        
+        contrib = session.query(CitizenContribution).filter_by(
+            tracking_code=tracking_code,
+            candidate_id=bot_instance.candidate_id
+        ).first()
+        
+        if contrib:
+            session.expunge(contrib)
+        return (contrib,)
+    finally:
+        session.close()
+
+
 async def track_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش جزئیات مشارکت با کد پیگیری"""
     tracking_code = update.message.text.strip().upper()
@@ -898,52 +1042,47 @@ async def track_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     bot_id = context.bot_data.get('bot_instance_id')
-    session = Session()
     
-    try:
-        bot_instance = session.query(BotInstance).filter_by(id=bot_id).first()
-        if not bot_instance:
-            await update.message.reply_text("❌ خطا در دریافت اطلاعات")
-            return
-        
-        contrib = session.query(CitizenContribution).filter_by(
-            tracking_code=tracking_code,
-            candidate_id=bot_instance.candidate_id
-        ).first()
-        
-        if not contrib:
-            await update.message.reply_text(
-                f"❌ مشارکتی با کد `{tracking_code}` یافت نشد.",
-                parse_mode='Markdown'
-            )
-            return
-        
-        # نمایش جزئیات
-        type_text = "ایده" if contrib.contribution_type == 'idea' else "گزارش"
-        
-        status_text = {
-            'pending': '⏳ در انتظار بررسی',
-            'under_review': '👀 در حال بررسی',
-            'approved': '✅ تایید شده',
-            'in_progress': '🔄 در حال انجام',
-            'completed': '✔️ انجام شده',
-            'rejected': '❌ رد شده'
-        }.get(contrib.status, 'نامشخص')
-        
-        category_name = {
-            'education': '📚 آموزش',
-            'health': '🏥 بهداشت',
-            'traffic': '🚗 ترافیک',
-            'security': '🛡️ امنیت',
-            'environment': '🌳 محیط زیست',
-            'cultural': '🎭 فرهنگی',
-            'infrastructure': '🏗️ زیرساخت',
-            'economic': '💰 اقتصاد',
-            'welfare': '🤝 رفاه',
-            'other': '📋 سایر'
-        }.get(contrib.category, 'نامشخص')
-        
-        text = f"""
+    found = await run_db(load_contribution_by_code, bot_id, tracking_code)
+    if found is None:
+        await update.message.reply_text("❌ خطا در دریافت اطلاعات")
+        return
+    
+    contrib = found[0]
+    
+    if not contrib:
+        await update.message.reply_text(
+            f"❌ مشارکتی با کد `{tracking_code}` یافت نشد.",
+            parse_mode='Markdown'
+        )
+        return
+    
+    # نمایش جزئیات
+    type_text = "ایده" if contrib.contribution_type == 'idea' else "گزارش"
+    
+    status_text = {
+        'pending': '⏳ در انتظار بررسی',
+        'under_review': '👀 در حال بررسی',
+        'approved': '✅ تایید شده',
+        'in_progress': '🔄 در حال انجام',
+        'completed': '✔️ انجام شده',
+        'rejected': '❌ رد شده'
+    }.get(contrib.status, 'نامشخص')
+    
+    category_name = {
+        'education': '📚 آموزش',
+        'health': '🏥 بهداشت',
+        'traffic': '🚗 ترافیک',
+        'security': '🛡️ امنیت',
+        'environment': '🌳 محیط زیست',
+        'cultural': '🎭 فرهنگی',
+        'infrastructure': '🏗️ زیرساخت',
+        'economic': '💰 اقتصاد',
+        'welfare': '🤝 رفاه',
+        'other': '📋 سایر'
+    }.get(contrib.category, 'نامشخص')
+    
+    text = f"""
 📌 *نتیجه پیگیری*
 
 🆔 کد: `{contrib.tracking_code}`
@@ -959,43 +1098,96 @@ async def track_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE)
 💬 نظرات: {contrib.comments_count}
 👁️ بازدیدها: {contrib.views_count}
 """
+    
+    # تاریخچه
+    timeline = []
+    if contrib.created_at:
+        timeline.append(f"✅ ثبت شد ({contrib.created_at.strftime('%Y/%m/%d')})")
+    if contrib.reviewed_at:
+        timeline.append(f"👀 بررسی شد ({contrib.reviewed_at.strftime('%Y/%m/%d')})")
+    if contrib.status == 'in_progress':
+        timeline.append("🔄 عملیات آغاز شد")
+    if contrib.completed_at:
+        timeline.append(f"✔️ اتمام یافت ({contrib.completed_at.strftime('%Y/%m/%d')})")
+    
+    if timeline:
+        text += "\n📅 *تاریخچه:*\n" + "\n".join(timeline)
+    
+    # پاسخ نامزد
+    if contrib.admin_response:
+        text += f"\n\n💬 *پاسخ نامزد:*\n{contrib.admin_response}"
+    
+    # امتیاز کسب شده
+    earned_points = 10  # ارسال
+    if contrib.status == 'approved':
+        earned_points += 50
+    if contrib.status == 'in_progress':
+        earned_points += 75
+    if contrib.status == 'completed':
+        earned_points += 100
+    
+    text += f"\n\n⭐ امتیاز کسب شده: *{earned_points}* امتیاز"
+    
+    keyboard = [[InlineKeyboardButton("🔙 بازگشت به لیست", callback_data="popular_ideas")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    
+    context.user_data['waiting_for_tracking_code'] = False
+
+
+def save_citizen_message(bot_id: int, telegram_id: int, first_name, last_name, message_text: str) -> bool:
+    """
+    ذخیره پیام شهروند همراه با دسته‌بندی و تحلیل احساسات (روی executor اجرا می‌شود)
+    
+    Returns:
+        bool: False اگر ظرفیت پیام پلن نماینده تکمیل شده باشد
+    """
+    session = Session()
+    try:
+        bot_instance = session.query(BotInstance).filter_by(id=bot_id).first()
+        candidate = session.query(Candidate).filter_by(id=bot_instance.candidate_id).first()
         
-        # تاریخچه
-        timeline = []
-        if contrib.created_at:
-            timeline.append(f"✅ ثبت شد ({contrib.created_at.strftime('%Y/%m/%d')})")
-        if contrib.reviewed_at:
-            timeline.append(f"👀 بررسی شد ({contrib.reviewed_at.strftime('%Y/%m/%d')})")
-        if contrib.status == 'in_progress':
-            timeline.append("🔄 عملیات آغاز شد")
-        if contrib.completed_at:
-            timeline.append(f"✔️ اتمام یافت ({contrib.completed_at.strftime('%Y/%m/%d')})")
-        
-        if timeline:
-            text += "\n📅 *تاریخچه:*\n" + "\n".join(timeline)
-        
-        # پاسخ نامزد
-        if contrib.admin_response:
-            text += f"\n\n💬 *پاسخ نامزد:*\n{contrib.admin_response}"
-        
-        # امتیاز کسب شده
-        earned_points = 10  # ارسال
-        if contrib.status == 'approved':
-            earned_points += 50
-        if contrib.status == 'in_progress':
-            earned_points += 75
-        if contrib.status == 'completed':
-            earned_points += 100
+        # بررسی محدودیت پلن
+        if not candidate.can_add_message():
+            return False
         
-        text += f"\n\n⭐ امتیاز کسب شده: *{earned_points}* امتیاز"
+        message = Message(
+            candidate_id=bot_instance.candidate_id,
+            user_telegram_id=telegram_id,
+            user_name=f"{first_name} {last_name or ''}",
+            message_text=message_text,
+            is_read=False
+        )
         
-        keyboard = [[InlineKeyboardButton("🔙 بازگشت به لیست", callback_data="popular_ideas")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # AI دسته‌بندی خودکار پیام
+        try:
+            from ai_services.message_categorization import get_categorizer
+            categorizer = get_categorizer(use_ml=False)  # فعلاً rule-based
+            category_result = categorizer.categorize(message_text)
+            
+            message.category = category_result['category']
+            message.category_fa = category_result['category_fa']
+            message.category_confidence = category_result['confidence']
+            message.category_priority = category_result['priority']
+        except Exception as e:
+            # در صورت خطا، بدون دسته‌بندی ادامه می‌دهد
+            logger.error(f"AI categorization failed: {e}")
         
-        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        # AI تحلیل احساسات
+        try:
+            from ai_services.sentiment_analyzer import get_sentiment_analyzer
+            sentiment_analyzer = get_sentiment_analyzer(use_ml=False)
+            sentiment_result = sentiment_analyzer.analyze(message_text)
+            
+            message.sentiment_score = sentiment_result['score']
+            message.sentiment_label = sentiment_result['label']
+        except Exception as e:
+            logger.error(f"AI sentiment analysis failed: {e}")
         
-        context.user_data['waiting_for_tracking_code'] = False
-    
+        session.add(message)
+        session.commit()
+        return True
     finally:
         session.close()
 
@@ -1014,81 +1206,109 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('waiting_for_message'):
         message_text = update.message.text
         
-        session = Session()
-        try:
-            # ذخیره پیام در دیتابیس
-            bot_instance = session.query(BotInstance).filter_by(id=bot_id).first()
-            candidate = session.query(Candidate).filter_by(id=bot_instance.candidate_id).first()
-            
-            # بررسی محدودیت پلن
-            if not candidate.can_add_message():
-                context.user_data['waiting_for_message'] = False
-                await update.message.reply_text(
-                    "⚠️ متأسفانه ظرفیت دریافت پیام تکمیل شده است.\n"
-                    "لطفاً بعداً دوباره تلاش کنید.",
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🔙 بازگشت به منو", callback_data="back")
-                    ]])
-                )
-                session.close()
-                return
-            
-            message = Message(
-                candidate_id=bot_instance.candidate_id,
-                user_telegram_id=user.id,
-                user_name=f"{user.first_name} {user.last_name or ''}",
-                message_text=message_text,
-                is_read=False
-            )
-            
-            # AI دسته‌بندی خودکار پیام
-            try:
-                from ai_services.message_categorization import get_categorizer
-                categorizer = get_categorizer(use_ml=False)  # فعلاً rule-based
-                category_result = categorizer.categorize(message_text)
-                
-                message.category = category_result['category']
-                message.category_fa = category_result['category_fa']
-                message.category_confidence = category_result['confidence']
-                message.category_priority = category_result['priority']
-            except Exception as e:
-                # در صورت خطا، بدون دسته‌بندی ادامه می‌دهد
-                import logging
-                logging.error(f"AI categorization failed: {e}")
-            
-            # AI تحلیل احساسات
-            try:
-                from ai_services.sentiment_analyzer import get_sentiment_analyzer
-                sentiment_analyzer = get_sentiment_analyzer(use_ml=False)
-                sentiment_result = sentiment_analyzer.analyze(message_text)
-                
-                message.sentiment_score = sentiment_result['score']
-                message.sentiment_label = sentiment_result['label']
-            except Exception as e:
-                import logging
-                logging.error(f"AI sentiment analysis failed: {e}")
-            
-            session.add(message)
-            session.commit()
-            
-            context.user_data['waiting_for_message'] = False
-            
+        # ذخیره پیام در دیتابیس
+        saved = await run_db(
+            save_citizen_message, bot_id, user.id, user.first_name, user.last_name, message_text
+        )
+        
+        context.user_data['waiting_for_message'] = False
+        
+        if not saved:
             await update.message.reply_text(
-                "✅ پیام شما با موفقیت ارسال شد.\n"
-                "نماینده در اسرع وقت به پیام شما پاسخ خواهد داد.",
+                "⚠️ متأسفانه ظرفیت دریافت پیام تکمیل شده است.\n"
+                "لطفاً بعداً دوباره تلاش کنید.",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("🔙 بازگشت به منو", callback_data="back")
                 ]])
             )
-        finally:
-            session.close()
+            return
+        
+        analytics_events.record(bot_id, user.id, MESSAGE)
+        await update.message.reply_text(
+            "✅ پیام شما با موفقیت ارسال شد.\n"
+            "نماینده در اسرع وقت به پیام شما پاسخ خواهد داد.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 بازگشت به منو", callback_data="back")
+            ]])
+        )
     else:
+        # پاسخ خودکار نماینده (automaton کامپایل‌شده؛ معمولاً بدون کوئری)
+        rule = await run_db(auto_replies.match, bot_id, update.message.text)
+        if rule:
+            await update.message.reply_text(rule.reply_text)
+            return
+        
         await update.message.reply_text(
             "لطفاً از دکمه‌های منو استفاده کنید.\n"
             "برای شروع: /start"
         )
 
 
+def register_handlers(application: Application):
+    """ثبت handlerهای بات روی یک Application"""
+    # ایجاد ConversationHandler برای مشارکت شهروندی
+    contribution_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler("contribute", contribute_start),
+            CallbackQueryHandler(contribute_start, pattern="^contribute$")
+        ],
+        states={
+            CONTRIBUTION_TYPE: [CallbackQueryHandler(contribution_type_selected)],
+            CATEGORY_SELECT: [CallbackQueryHandler(category_selected)],
+            TITLE_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, title_received)],
+            DESCRIPTION_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, description_received)],
+            LOCATION_INPUT: [
+                MessageHandler(filters.LOCATION, location_received),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, location_received)
+            ],
+            IMAGE_UPLOAD: [
+                MessageHandler(filters.PHOTO, image_received),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, image_received)
+            ],
+            CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, final_confirm)]
+        },
+        fallbacks=[CommandHandler("cancel", cancel_contribution)]
+    )
+    
+    # افزودن handlers
+    application.add_handler(TypeHandler(Update, track_user_activity), group=-1)
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("leaderboard", leaderboard_command))
+    application.add_handler(contribution_handler)  # اضافه کردن handler مشارکت
+    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+
+
+def build_application(bot_instance, request=None, get_updates_request=None,
+                      webhook_mode: bool = False) -> Application:
+    """
+    ساخت Application برای یک BotInstance
+    
+    Args:
+        bot_instance: رکورد BotInstance
+        request: شیء HTTP مشترک برای فراخوانی‌های API (اختیاری)
+        get_updates_request: شیء HTTP مشترک برای getUpdates (اختیاری)
+        webhook_mode: در حالت webhook آپدیت‌ها از endpoint مشترک می‌رسند و Updater ساخته نمی‌شود
+    """
+    builder = Application.builder().token(bot_instance.bot_token)
+    
+    if request is not None:
+        builder = builder.request(request)
+    if webhook_mode:
+        builder = builder.updater(None)
+    elif get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    
+    application = builder.build()
+    
+    # ذخیره bot_instance_id در bot_data
+    application.bot_data['bot_instance_id'] = bot_instance.id
+    
+    register_handlers(application)
+    return application
+
+
 def run_bot(bot_instance_id: int):
     """اجرای بات"""
     import asyncio
@@ -1108,52 +1328,25 @@ def run_bot(bot_instance_id: int):
                 return
             
             # ایجاد Application
-            application = Application.builder().token(bot_instance.bot_token).build()
-            
-            # ذخیره bot_instance_id در bot_data
-            application.bot_data['bot_instance_id'] = bot_instance_id
-            
-            # ایجاد ConversationHandler برای مشارکت شهروندی
-            contribution_handler = ConversationHandler(
-                entry_points=[
-                    CommandHandler("contribute", contribute_start),
-                    CallbackQueryHandler(contribute_start, pattern="^contribute$")
-                ],
-                states={
-                    CONTRIBUTION_TYPE: [CallbackQueryHandler(contribution_type_selected)],
-                    CATEGORY_SELECT: [CallbackQueryHandler(category_selected)],
-                    TITLE_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, title_received)],
-                    DESCRIPTION_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, description_received)],
-                    LOCATION_INPUT: [
-                        MessageHandler(filters.LOCATION, location_received),
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, location_received)
-                    ],
-                    IMAGE_UPLOAD: [
-                        MessageHandler(filters.PHOTO, image_received),
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, image_received)
-                    ],
-                    CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, final_confirm)]
-                },
-                fallbacks=[CommandHandler("cancel", cancel_contribution)]
-            )
-            
-            # افزودن handlers
-            application.add_handler(CommandHandler("start", start_command))
-            application.add_handler(CommandHandler("stats", stats_command))
-            application.add_handler(CommandHandler("leaderboard", leaderboard_command))
-            application.add_handler(contribution_handler)  # اضافه کردن handler مشارکت
-            application.add_handler(CallbackQueryHandler(button_callback))
-            application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+            application = build_application(bot_instance)
             
             # به‌روزرسانی وضعیت بات
             bot_instance.is_active = True
             bot_instance.last_active = datetime.utcnow()
             session.commit()
             
+            if BOT_WEBHOOK_MODE:
+                logger.warning(
+                    "⚠️ BOT_WEBHOOK_MODE فعال است؛ run_bot فقط برای polling محلی است. "
+                    "در حالت webhook بات‌ها توسط bot_runtime و endpoint مشترک wsgi سرویس می‌شوند."
+                )
+            
             logger.debug(f"✅ بات @{bot_instance.bot_username} در حال اجرا...")
             
             # اجرای بات
             application.run_polling(allowed_updates=Update.ALL_TYPES)
+            user_activity.stop()
+            analytics_events.stop()
         
         except Exception as e:
             logger.debug(f"❌ خطا در راه‌اندازی بات {bot_instance_id}: {str(e)}")
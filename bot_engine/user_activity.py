@@ -0,0 +1,291 @@
+"""
+ثبت دسته‌ای فعالیت کاربران بات (BotUser)
+
+هر handler فقط «دیده‌شدن» کاربر را در حافظه ثبت می‌کند؛ یک thread پس‌زمینه
+هر چند ثانیه یا با رسیدن تعداد رکوردها به سقف، کاربران را با
+INSERT ... ON CONFLICT DO NOTHING درج و last_interaction بقیه را به‌صورت bulk
+به‌روزرسانی می‌کند. یکتایی (bot_instance_id, telegram_id) تضمین می‌کند که
+از flush، register_bot_user و پروسه‌های دیگر فقط یکی کاربر را درج کند و
+همان یکی عضویت را بشمارد.
+"""
+import sys
+import os
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import sessionmaker
+
+from database.models import BotUser
+from database.engine import get_engine
+from bot_engine.analytics_events import analytics_events
+from config.settings import (
+    BOT_USER_FLUSH_INTERVAL, BOT_USER_FLUSH_BATCH, BOT_USER_KNOWN_CACHE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def new_user_row(bot_instance_id: int, telegram_id: int, username=None, first_name=None,
+                 last_name=None, seen_at: Optional[datetime] = None) -> dict:
+    """ستون‌های ردیف کاربر جدید bot_users"""
+    seen_at = seen_at or datetime.utcnow()
+    return {
+        'bot_instance_id': bot_instance_id,
+        'telegram_id': telegram_id,
+        'username': username,
+        'first_name': first_name,
+        'last_name': last_name,
+        'joined_at': seen_at,
+        'last_interaction': seen_at,
+        'total_points': 0,
+        'level': 1,
+    }
+
+
+def insert_bot_users(connection, rows: Iterable[dict]) -> Set[Tuple[int, int]]:
+    """
+    درج کاربران جدید (INSERT ... ON CONFLICT DO NOTHING روی sqlite و postgres)
+
+    کاربری که از قبل (یا همزمان توسط مسیر دیگری) درج شده نادیده گرفته می‌شود.
+
+    Returns:
+        set: (bot_instance_id, telegram_id) کاربرانی که همین فراخوانی درج کرده
+    """
+    rows = list(rows)
+    if not rows:
+        return set()
+
+    table = BotUser.__table__
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(connection.dialect.name)
+    if dialect is not None:
+        stmt = dialect.insert(table).on_conflict_do_nothing(
+            index_elements=['bot_instance_id', 'telegram_id']
+        ).returning(table.c.bot_instance_id, table.c.telegram_id)
+        return {tuple(row) for row in connection.execute(stmt, rows)}
+
+    inserted = set()
+    for row in rows:
+        exists = connection.execute(select(table.c.id).where(
+            table.c.bot_instance_id == row['bot_instance_id'],
+            table.c.telegram_id == row['telegram_id']
+        )).first()
+        if exists is None:
+            connection.execute(table.insert().values(**row))
+            inserted.add((row['bot_instance_id'], row['telegram_id']))
+    return inserted
+
+
+def _touch_bot_users(connection, rows: list):
+    """به‌روزرسانی last_interaction و نام (در صورت وجود) کاربران موجود"""
+    if not rows:
+        return
+    table = BotUser.__table__
+    connection.execute(table.update().where(
+        table.c.bot_instance_id == bindparam('b_bot_instance_id'),
+        table.c.telegram_id == bindparam('b_telegram_id')
+    ).values(
+        last_interaction=bindparam('b_last_interaction'),
+        # نام کاربری ممکن است در تلگرام تغییر کرده باشد
+        **{field: func.coalesce(bindparam(f'b_{field}'), table.c[field]) for field in _NAME_FIELDS}
+    ), [{f'b_{key}': value for key, value in row.items()} for row in rows])
+
+
+class UserActivityBuffer:
+    """
+    بافر دیده‌شدن کاربران و flush دسته‌ای به جدول bot_users
+
+    - چند دیده‌شدن یک کاربر قبل از flush فقط یک رکورد می‌شود
+    - flush هر flush_interval ثانیه یا وقتی بافر به batch_size برسد
+    - کاربرانی که وجودشان در دیتابیس قطعی است در یک LRU نگه داشته می‌شوند
+      تا /start برای کاربر تکراری هیچ کوئری‌ای نزند
+    """
+
+    def __init__(self, flush_interval: float = BOT_USER_FLUSH_INTERVAL,
+                 batch_size: int = BOT_USER_FLUSH_BATCH,
+                 known_cache_size: int = BOT_USER_KNOWN_CACHE_SIZE,
+                 session_factory=None):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.known_cache_size = known_cache_size
+        self._session_factory = session_factory
+
+        self._pending: Dict[Tuple[int, int], dict] = {}
+        self._known: "OrderedDict[Tuple[int, int], None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.flushed_records = 0
+        self.inserted_users = 0
+
+    # ------------------------------------------------------------
+    # ثبت دیده‌شدن (از handlerها - بدون کوئری)
+    # ------------------------------------------------------------
+
+    def record(self, bot_instance_id: int, telegram_id: int, username=None,
+               first_name=None, last_name=None, seen_at: Optional[datetime] = None):
+        """ثبت دیده‌شدن یک کاربر؛ فقط در حافظه"""
+        if bot_instance_id is None or telegram_id is None:
+            return
+
+        self.start()
+
+        with self._lock:
+            self._pending[(bot_instance_id, telegram_id)] = {
+                'username': username,
+                'first_name': first_name,
+                'last_name': last_name,
+                'seen_at': seen_at or datetime.utcnow(),
+            }
+            should_flush = len(self._pending) >= self.batch_size
+
+        if should_flush:
+            self._wakeup.set()
+
+    def is_known(self, bot_instance_id: int, telegram_id: int) -> bool:
+        """آیا کاربر قطعاً در دیتابیس ثبت شده است؟"""
+        key = (bot_instance_id, telegram_id)
+        with self._lock:
+            if key in self._known:
+                self._known.move_to_end(key)
+                return True
+        return False
+
+    def mark_known(self, bot_instance_id: int, telegram_id: int):
+        with self._lock:
+            self._mark_known_locked((bot_instance_id, telegram_id))
+
+    def _mark_known_locked(self, key):
+        self._known[key] = None
+        self._known.move_to_end(key)
+        while len(self._known) > self.known_cache_size:
+            self._known.popitem(last=False)
+
+    # ------------------------------------------------------------
+    # thread پس‌زمینه
+    # ------------------------------------------------------------
+
+    def start(self):
+        """راه‌اندازی thread flush (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name='UserActivityFlusher', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """توقف thread و flush نهایی"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 30)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ خطا در flush فعالیت کاربران: {str(e)}")
+
+    # ------------------------------------------------------------
+    # flush دسته‌ای
+    # ------------------------------------------------------------
+
+    def flush(self) -> int:
+        """
+        نوشتن بافر در دیتابیس: درج کاربران جدید (ON CONFLICT DO NOTHING) و
+        bulk update last_interaction بقیه؛ عضویت فقط برای ردیف‌هایی که همین
+        flush درج کرده شمرده می‌شود
+
+        Returns:
+            int: تعداد رکوردهای flush شده
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+
+        session = self._get_session_factory()()
+        try:
+            connection = session.connection()
+            inserted = insert_bot_users(connection, [
+                new_user_row(bot_instance_id, telegram_id, seen['username'], seen['first_name'],
+                             seen['last_name'], seen['seen_at'])
+                for (bot_instance_id, telegram_id), seen in pending.items()
+            ])
+            _touch_bot_users(connection, [
+                {
+                    'bot_instance_id': bot_instance_id,
+                    'telegram_id': telegram_id,
+                    'last_interaction': seen['seen_at'],
+                    **{field: seen[field] for field in _NAME_FIELDS},
+                }
+                for (bot_instance_id, telegram_id), seen in pending.items()
+                if (bot_instance_id, telegram_id) not in inserted
+            ])
+            session.commit()
+        except Exception:
+            session.rollback()
+            self._requeue(pending)
+            raise
+        finally:
+            session.close()
+
+        with self._lock:
+            for key in pending:
+                self._mark_known_locked(key)
+        for key in inserted:
+            analytics_events.record_new_user(key[0], pending[key]['seen_at'])
+
+        self.flushed_records += len(pending)
+        self.inserted_users += len(inserted)
+        logger.debug(f"فعالیت {len(pending)} کاربر ثبت شد ({len(inserted)} کاربر جدید)")
+        return len(pending)
+
+    def _requeue(self, pending):
+        """بازگرداندن رکوردها به بافر پس از خطا (دیده‌شدن جدیدتر اولویت دارد)"""
+        with self._lock:
+            for key, seen in pending.items():
+                current = self._pending.get(key)
+                if current is None or current['seen_at'] < seen['seen_at']:
+                    self._pending[key] = seen
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(bind=get_engine())
+        return self._session_factory
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'known_users': len(self._known),
+                'flushed_records': self.flushed_records,
+                'inserted_users': self.inserted_users,
+            }
+
+
+# Instance سراسری
+user_activity = UserActivityBuffer()
@@ -16,6 +16,14 @@ from utils.logging_config import setup_logging
 from utils.db_utils import safe_commit
 from utils.validators import Validator, validate_form_data
 from utils.security_headers import SecurityHeaders
+from bot_engine.content_cache import content_cache, RESUME, PROGRAMS, HEADQUARTERS, PROFILE_SECTIONS
+from bot_engine.auto_reply import auto_replies as auto_reply_index
+from candidate_panel.message_utils import get_message_stats, paginate_messages
+from candidate_panel.request_context import (current_candidate, current_plan_codes,
+                                             current_active_plan, current_unread, remember_unread)
+from database.counters import (get_counters, month_counter, contribution_counter,
+                               MESSAGES, MESSAGES_UNREAD, CONTRIBUTIONS, CONTRIBUTION_STATUSES,
+                               PROGRAMS as PROGRAMS_COUNTER, HEADQUARTERS as HEADQUARTERS_COUNTER)
 
 from database.models import (db, Candidate, Resume, Program, Slogan, 
                             Headquarters, Message, Analytics, Plan, 
@@ -27,7 +35,7 @@ from database.models import (db, Candidate, Resume, Program, Slogan,
                             MarketplaceBenchmark, CandidateRanking, TrialPeriod, 
                             ReferralProgram, ReferralReward, MonthlyTopCitizen, VIPInteraction,
                             PoliticalParty, PartyMembership, ElectoralCoalition, CoalitionMembership)
-from config.settings import CANDIDATE_SECRET_KEY, DATABASE_URI, UPLOAD_FOLDER
+from config.settings import CANDIDATE_SECRET_KEY, DATABASE_URI, UPLOAD_FOLDER, CANDIDATE_MESSAGES_PER_PAGE
 from security.security_utils import (
     hash_password, verify_password, sanitize_input
 )
@@ -133,10 +141,7 @@ def has_plan(plan_code):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            candidate_id = session.get('candidate_id')
-            candidate = Candidate.query.get(candidate_id)
-            
-            if not any(plan.code == plan_code for plan in candidate.plans):
+            if plan_code not in current_plan_codes():
                 flash(f'برای استفاده از این امکان باید پلن مربوطه را خریداری کنید', 'warning')
                 return redirect(url_for('dashboard'))
             
@@ -202,29 +207,30 @@ def login():
 @login_required
 def dashboard():
     """داشبورد نماینده"""
-    from datetime import datetime
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate(with_plans=True)
     
     # اطلاعات پلن فعلی
-    active_plan = candidate.get_active_plan()
+    active_plan = current_active_plan()
     latest_purchase = PlanPurchase.query.filter_by(
         candidate_id=candidate.id, is_active=True
     ).order_by(PlanPurchase.end_date.desc()).first()
     
+    # شمارنده‌های نماینده (یک کوئری روی candidate_counters)
+    counters = get_counters(candidate.id, [
+        MESSAGES, MESSAGES_UNREAD, month_counter(), PROGRAMS_COUNTER, HEADQUARTERS_COUNTER
+    ])
+    
     # محاسبه استفاده از محدودیت‌ها
     plan_usage = {}
     if active_plan:
         # استفاده از پیام در ماه جاری
-        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        messages_this_month = Message.query.filter_by(candidate_id=candidate.id).filter(
-            Message.created_at >= month_start
-        ).count()
+        messages_this_month = counters[month_counter()]
         
         # تعداد برنامه‌ها
-        total_programs = Program.query.filter_by(candidate_id=candidate.id).count()
+        total_programs = counters[PROGRAMS_COUNTER]
         
         # تعداد دفاتر
-        total_headquarters = Headquarters.query.filter_by(candidate_id=candidate.id).count()
+        total_headquarters = counters[HEADQUARTERS_COUNTER]
         
         plan_usage = {
             'messages': {
@@ -245,12 +251,12 @@ def dashboard():
         }
     
     # آمار کلی
-    total_messages = Message.query.filter_by(candidate_id=candidate.id).count()
-    unread_messages = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
+    total_messages = counters[MESSAGES]
+    unread_messages = remember_unread(counters[MESSAGES_UNREAD])
     
     # آمار بازدید (اگر پلن آمار فعال باشد)
     analytics_data = None
-    if any(plan.code == 'ANALYTICS' for plan in candidate.plans):
+    if 'ANALYTICS' in current_plan_codes():
         analytics_data = Analytics.query.filter_by(candidate_id=candidate.id).order_by(Analytics.date.desc()).limit(7).all()
     
     return render_template('candidate/dashboard.html',
@@ -269,7 +275,7 @@ def dashboard():
 @rate_limiter.limit("30 per minute")
 def profile():
     """ویرایش اطلاعات شخصی"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     if request.method == 'POST':
         # تغییر رمز عبور
@@ -308,11 +314,12 @@ def profile():
                     file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
                     candidate.photo = filename
             
-            safe_commit(db, "Database commit failed")
+            if safe_commit(db, "Database commit failed"):
+                content_cache.invalidate(candidate.id, PROFILE_SECTIONS)
             flash('اطلاعات با موفقیت به‌روزرسانی شد', 'success')
             return redirect(url_for('profile'))
     
-    unread_messages = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
+    unread_messages = current_unread()
     return render_template('candidate/profile.html', candidate=candidate, unread_messages=unread_messages)
 
 
@@ -320,7 +327,7 @@ def profile():
 @secure_route()
 def resume():
     """مدیریت رزومه"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     resumes = Resume.query.filter_by(candidate_id=candidate.id).order_by(Resume.order).all()
     
     if request.method == 'POST':
@@ -337,11 +344,12 @@ def resume():
         )
         
         db.session.add(resume_item)
-        safe_commit(db, "Database commit failed")
+        if safe_commit(db, "Database commit failed"):
+            content_cache.invalidate(candidate.id, [RESUME])
         flash('آیتم رزومه اضافه شد', 'success')
         return redirect(url_for('resume'))
     
-    unread_messages = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
+    unread_messages = current_unread()
     return render_template('candidate/resume.html', candidate=candidate, resumes=resumes, unread_messages=unread_messages)
 
 
@@ -349,13 +357,13 @@ def resume():
 @secure_route()
 def programs():
     """مدیریت برنامه‌های انتخاباتی"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     programs = Program.query.filter_by(candidate_id=candidate.id).all()
     
     if request.method == 'POST':
         # بررسی محدودیت پلن
         if not candidate.can_add_program():
-            active_plan = candidate.get_active_plan()
+            active_plan = current_active_plan()
             if active_plan:
                 flash(f'شما به حداکثر تعداد برنامه‌ها ({active_plan.max_programs}) رسیده‌اید. برای افزودن برنامه بیشتر، پلن خود را ارتقا دهید.', 'warning')
             else:
@@ -374,11 +382,12 @@ def programs():
         )
         
         db.session.add(program)
-        safe_commit(db, "Database commit failed")
+        if safe_commit(db, "Database commit failed"):
+            content_cache.invalidate(candidate.id, [PROGRAMS])
         flash('برنامه جدید اضافه شد', 'success')
         return redirect(url_for('programs'))
     
-    unread_messages = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
+    unread_messages = current_unread()
     return render_template('candidate/programs.html', candidate=candidate, programs=programs, unread_messages=unread_messages)
 
 
@@ -386,13 +395,13 @@ def programs():
 @secure_route()
 def headquarters():
     """مدیریت ستادهای انتخاباتی"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     hqs = Headquarters.query.filter_by(candidate_id=candidate.id).all()
     
     if request.method == 'POST':
         # بررسی محدودیت پلن
         if not candidate.can_add_headquarters():
-            active_plan = candidate.get_active_plan()
+            active_plan = current_active_plan()
             if active_plan:
                 flash(f'شما به حداکثر تعداد دفاتر ({active_plan.max_headquarters}) رسیده‌اید. برای افزودن دفتر بیشتر، پلن خود را ارتقا دهید.', 'warning')
             else:
@@ -415,11 +424,12 @@ def headquarters():
         )
         
         db.session.add(hq)
-        safe_commit(db, "Database commit failed")
+        if safe_commit(db, "Database commit failed"):
+            content_cache.invalidate(candidate.id, [HEADQUARTERS])
         flash('ستاد جدید اضافه شد', 'success')
         return redirect(url_for('headquarters'))
     
-    unread_messages = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
+    unread_messages = current_unread()
     return render_template('candidate/headquarters.html', candidate=candidate, headquarters=hqs, unread_messages=unread_messages)
 
 
@@ -427,7 +437,7 @@ def headquarters():
 @secure_route()
 def bot_management():
     """مدیریت اطلاعات بات"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     if request.method == 'POST':
         # دریافت اطلاعات از فرم
@@ -466,13 +476,14 @@ def bot_management():
     programs = Program.query.filter_by(candidate_id=candidate.id).all()
     headquarters = Headquarters.query.filter_by(candidate_id=candidate.id).all()
     
-    unread_messages = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
+    unread_messages = current_unread()
     return render_template('candidate/bot.html', 
                          candidate=candidate, 
                          bot_info=bot_info,
                          resume=resume,
                          programs=programs,
-                         headquarters=headquarters)
+                         headquarters=headquarters,
+                         unread_messages=unread_messages)
 
 
 @app.route('/bot/settings', methods=['POST'])
@@ -481,7 +492,7 @@ def bot_management():
 @rate_limiter.limit("50 per minute")
 def update_bot_settings():
     """به‌روزرسانی تنظیمات BotFather"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     if not candidate.bot_instance:
         flash('بات شما هنوز فعال نشده است', 'error')
@@ -527,7 +538,7 @@ def update_bot_settings():
 @login_required
 def messages():
     """پیام‌های دریافتی از مردم با فیلترهای هوشمند"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # دریافت فیلترها از query string
     category_filter = request.args.get('category', 'all')
@@ -551,37 +562,21 @@ def messages():
     elif read_filter == 'unread':
         query = query.filter_by(is_read=False)
     
-    messages_list = query.order_by(Message.created_at.desc()).all()
-    
-    # آمار دسته‌بندی و احساسات
-    stats = {
-        'total': Message.query.filter_by(candidate_id=candidate.id).count(),
-        'unread': Message.query.filter_by(candidate_id=candidate.id, is_read=False).count(),
-        'complaint': Message.query.filter_by(candidate_id=candidate.id, category='complaint').count(),
-        'question': Message.query.filter_by(candidate_id=candidate.id, category='question').count(),
-        'suggestion': Message.query.filter_by(candidate_id=candidate.id, category='suggestion').count(),
-        'support': Message.query.filter_by(candidate_id=candidate.id, category='support').count(),
-        'criticism': Message.query.filter_by(candidate_id=candidate.id, category='criticism').count(),
-        'high_priority': Message.query.filter_by(candidate_id=candidate.id, category_priority='high').count(),
-        # Sentiment stats
-        'positive': Message.query.filter_by(candidate_id=candidate.id, sentiment_label='positive').count(),
-        'neutral': Message.query.filter_by(candidate_id=candidate.id, sentiment_label='neutral').count(),
-        'negative': Message.query.filter_by(candidate_id=candidate.id, sentiment_label='negative').count(),
-    }
+    # صفحه‌بندی keyset (جدیدترین پیام‌ها اول)
+    before_id = request.args.get('before', type=int)
+    messages_list, next_before = paginate_messages(
+        query, candidate.id, before_id, CANDIDATE_MESSAGES_PER_PAGE
+    )
     
-    # محاسبه میانگین رضایت
-    all_sentiments = Message.query.filter_by(candidate_id=candidate.id)\
-        .filter(Message.sentiment_score != None).all()
-    if all_sentiments:
-        avg_sentiment = sum(msg.sentiment_score for msg in all_sentiments) / len(all_sentiments)
-        stats['avg_sentiment'] = round(avg_sentiment, 2)
-        stats['satisfaction_rate'] = round((avg_sentiment + 1) / 2 * 100, 1)  # تبدیل -1,1 به 0-100
-    else:
-        stats['avg_sentiment'] = 0
-        stats['satisfaction_rate'] = 50
+    # آمار دسته‌بندی و احساسات (یک کوئری گروه‌بندی‌شده)
+    stats = get_message_stats(
+        candidate.id,
+        category=None if category_filter == 'all' else category_filter,
+        priority=None if priority_filter == 'all' else priority_filter,
+        read=None if read_filter == 'all' else read_filter
+    )
     
     # استفاده از template جدید با AI features
-    unread_messages = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
     return render_template('candidate/messages_ai.html', 
                          candidate=candidate, 
                          messages=messages_list,
@@ -589,7 +584,9 @@ def messages():
                          category_filter=category_filter,
                          priority_filter=priority_filter,
                          read_filter=read_filter,
-                         unread_messages=unread_messages)
+                         before_id=before_id,
+                         next_before=next_before,
+                         unread_messages=remember_unread(stats['unread']))
 
 
 @app.route('/message/<int:message_id>/read', methods=['POST'])
@@ -612,11 +609,11 @@ def mark_read(message_id):
 @login_required
 def view_plans():
     """مشاهده و مقایسه پلن‌ها"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     all_plans = Plan.query.filter_by(is_active=True).order_by(Plan.display_order).all()
     
     # پلن فعال فعلی کاندیدا
-    active_plan = candidate.get_active_plan()
+    active_plan = current_active_plan()
     
     # آخرین خرید
     latest_purchase = PlanPurchase.query.filter_by(
@@ -628,7 +625,8 @@ def view_plans():
                          candidate=candidate,
                          plans=all_plans,
                          active_plan=active_plan,
-                         latest_purchase=latest_purchase)
+                         latest_purchase=latest_purchase,
+                         unread_messages=current_unread())
 
 
 @app.route('/plans/request-consultation', methods=['POST'])
@@ -637,7 +635,7 @@ def view_plans():
 @rate_limiter.limit("20 per hour")
 def request_consultation():
     """درخواست مشاوره برای خرید پلن"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     plan_id = request.form.get('plan_id')
     phone = request.form.get('phone', '')
@@ -677,7 +675,7 @@ def activate_trial():
     """فعال‌سازی Trial 3 روزه توسط کاندیدا"""
     from datetime import timedelta
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # بررسی استفاده قبلی از Trial
     if candidate.has_used_trial:
@@ -728,7 +726,7 @@ def manage_channels():
     """مدیریت کانال‌ها و گروه‌ها"""
     from database.models import BotChannel
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # دریافت پلن فعال و محدودیت تعداد کانال
     active_purchase = PlanPurchase.query.filter_by(
@@ -774,7 +772,7 @@ def add_channel():
     """افزودن کانال جدید"""
     from database.models import BotChannel, BotInstance
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # چک محدودیت پلن
     active_purchase = PlanPurchase.query.filter_by(
@@ -840,7 +838,7 @@ def delete_channel(channel_id):
     """حذف کانال"""
     from database.models import BotChannel
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     channel = BotChannel.query.filter_by(
         id=channel_id,
         candidate_id=candidate.id
@@ -860,7 +858,7 @@ def schedule_post(channel_id):
     """صفحه زمان‌بندی پست جدید"""
     from database.models import BotChannel, ScheduledPost
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     channel = BotChannel.query.filter_by(
         id=channel_id,
         candidate_id=candidate.id
@@ -892,7 +890,8 @@ def schedule_post(channel_id):
     
     return render_template('candidate/schedule_post.html',
                          candidate=candidate,
-                         channel=channel)
+                         channel=channel,
+                         unread_messages=current_unread())
 
 
 @app.route('/posts/scheduled')
@@ -901,7 +900,7 @@ def view_scheduled_posts():
     """مشاهده تمام پست‌های زمان‌بندی شده"""
     from database.models import ScheduledPost
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # دریافت پست‌های زمان‌بندی شده
     posts = ScheduledPost.query.filter_by(
@@ -910,7 +909,8 @@ def view_scheduled_posts():
     
     return render_template('candidate/scheduled_posts.html',
                          candidate=candidate,
-                         posts=posts)
+                         posts=posts,
+                         unread_messages=current_unread())
 
 
 @app.route('/posts/<int:post_id>/cancel', methods=['POST'])
@@ -919,7 +919,7 @@ def cancel_post(post_id):
     """لغو پست زمان‌بندی شده"""
     from database.models import ScheduledPost
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     post = ScheduledPost.query.filter_by(
         id=post_id,
         candidate_id=candidate.id
@@ -941,7 +941,7 @@ def delete_post(post_id):
     """حذف پست"""
     from database.models import ScheduledPost
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     post = ScheduledPost.query.filter_by(
         id=post_id,
         candidate_id=candidate.id
@@ -961,7 +961,7 @@ def channel_stats(channel_id):
     from database.models import BotChannel, ScheduledPost, ChannelStats
     from datetime import datetime, timedelta
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     channel = BotChannel.query.filter_by(
         id=channel_id,
         candidate_id=candidate.id
@@ -1011,10 +1011,10 @@ def broadcast():
     """صفحه ارسال پیام انبوه"""
     from database.models import BroadcastMessage, BotUser
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # بررسی داشتن پلن ارسال انبوه
-    has_broadcast = any(plan.code == 'MASS_BROADCAST' for plan in candidate.plans)
+    has_broadcast = 'MASS_BROADCAST' in current_plan_codes()
     
     if not has_broadcast:
         flash('برای استفاده از این امکان باید پلن "ارسال پیام انبوه" را فعال کنید', 'warning')
@@ -1045,10 +1045,10 @@ def send_broadcast():
     """ارسال پیام انبوه"""
     from database.models import BroadcastMessage
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # بررسی پلن
-    has_broadcast = any(plan.code == 'MASS_BROADCAST' for plan in candidate.plans)
+    has_broadcast = 'MASS_BROADCAST' in current_plan_codes()
     
     if not has_broadcast:
         return jsonify({'success': False, 'message': 'پلن ارسال انبوه فعال نیست'}), 403
@@ -1098,7 +1098,7 @@ def broadcast_detail(broadcast_id):
     """جزئیات و آمار یک پیام انبوه"""
     from database.models import BroadcastMessage, BroadcastLog
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     broadcast = BroadcastMessage.query.filter_by(id=broadcast_id, candidate_id=candidate.id).first()
     
     if not broadcast:
@@ -1120,7 +1120,7 @@ def cancel_broadcast(broadcast_id):
     """لغو یک پیام انبوه"""
     from database.models import BroadcastMessage
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     broadcast = BroadcastMessage.query.filter_by(id=broadcast_id, candidate_id=candidate.id).first()
     
     if not broadcast:
@@ -1143,52 +1143,55 @@ def analytics():
     from sqlalchemy import func
     from datetime import timedelta
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # بررسی داشتن پلن آمار
-    has_analytics = any(plan.code == 'ANALYTICS' for plan in candidate.plans)
+    has_analytics = 'ANALYTICS' in current_plan_codes()
     
     if not has_analytics:
         flash('برای استفاده از این امکان باید پلن "آمار و تحلیل" را فعال کنید', 'warning')
         return redirect(url_for('view_plans'))
     
-    # آمار 30 روز اخیر
+    # آمار 30 روز اخیر (ردیف‌های روزانه‌ای که بات‌ها با flush دسته‌ای می‌نویسند)
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
     
-    analytics_data = Analytics.query.filter(
+    daily_rows = Analytics.query.filter(
         Analytics.candidate_id == candidate.id,
         Analytics.date >= thirty_days_ago.date()
     ).order_by(Analytics.date.asc()).all()
     
-    # محاسبه کل آمار
-    total_bot_users = Analytics.query.filter_by(candidate_id=candidate.id).with_entities(
-        func.sum(Analytics.new_users)
-    ).scalar() or 0
-    
-    total_interactions = Analytics.query.filter_by(candidate_id=candidate.id).with_entities(
-        func.sum(Analytics.total_interactions)
-    ).scalar() or 0
-    
-    total_messages = Analytics.query.filter_by(candidate_id=candidate.id).with_entities(
-        func.sum(Analytics.total_messages)
-    ).scalar() or 0
-    
-    # محبوب‌ترین بخش‌ها
-    total_views = Analytics.query.filter_by(candidate_id=candidate.id).with_entities(
+    analytics_data = [{
+        'date': row.date.isoformat(),
+        'new_users': row.new_users or 0,
+        'active_users': row.active_users or 0,
+        'total_interactions': row.total_interactions or 0,
+    } for row in daily_rows]
+    
+    # جمع کل آمار از ردیف‌های روزانه (یک کوئری)
+    totals = db.session.query(
+        func.max(Analytics.total_users).label('users'),
+        func.sum(Analytics.total_interactions).label('interactions'),
+        func.sum(Analytics.total_messages).label('messages'),
         func.sum(Analytics.resume_views).label('resume'),
         func.sum(Analytics.programs_views).label('programs'),
         func.sum(Analytics.headquarters_views).label('headquarters')
-    ).first()
+    ).filter(Analytics.candidate_id == candidate.id).one()
+    
+    total_bot_users = totals.users or 0
+    total_interactions = totals.interactions or 0
+    total_messages = totals.messages or 0
     
+    # محبوب‌ترین بخش‌ها
     popular_sections = {
-        'resume': total_views.resume or 0 if total_views else 0,
-        'programs': total_views.programs or 0 if total_views else 0,
-        'headquarters': total_views.headquarters or 0 if total_views else 0
+        'resume': totals.resume or 0,
+        'programs': totals.programs or 0,
+        'headquarters': totals.headquarters or 0
     }
     
     # آمار پیام‌ها
-    total_messages_count = Message.query.filter_by(candidate_id=candidate.id).count()
-    unread_messages_count = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
+    message_counters = get_counters(candidate.id, [MESSAGES, MESSAGES_UNREAD])
+    total_messages_count = message_counters[MESSAGES]
+    unread_messages_count = remember_unread(message_counters[MESSAGES_UNREAD])
     
     # آمار کاربران بات
     bot_instance = BotInstance.query.filter_by(candidate_id=candidate.id).first()
@@ -1218,10 +1221,10 @@ def polls():
     """صفحه نظرسنجی‌ها"""
     from database.models import Poll
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # بررسی پلن
-    has_polls = any(plan.code == 'SURVEYS' for plan in candidate.plans)
+    has_polls = 'SURVEYS' in current_plan_codes()
     
     if not has_polls:
         flash('برای استفاده از این امکان باید پلن "نظرسنجی" را فعال کنید', 'warning')
@@ -1232,7 +1235,8 @@ def polls():
     
     return render_template('candidate/polls.html',
                          candidate=candidate,
-                         polls=polls_list)
+                         polls=polls_list,
+                         unread_messages=current_unread())
 
 
 @app.route('/polls/create', methods=['GET', 'POST'])
@@ -1241,7 +1245,7 @@ def create_poll():
     """ایجاد نظرسنجی جدید"""
     from database.models import Poll, PollOption
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     if request.method == 'POST':
         question = request.form.get('question')
@@ -1293,7 +1297,7 @@ def poll_results(poll_id):
     """نمایش نتایج نظرسنجی"""
     from database.models import Poll
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     poll = Poll.query.filter_by(id=poll_id, candidate_id=candidate.id).first()
     
     if not poll:
@@ -1302,7 +1306,8 @@ def poll_results(poll_id):
     
     return render_template('candidate/poll_results.html',
                          candidate=candidate,
-                         poll=poll)
+                         poll=poll,
+                         unread_messages=current_unread())
 
 
 @app.route('/auto-replies', methods=['GET', 'POST'])
@@ -1311,10 +1316,10 @@ def auto_replies():
     """مدیریت پاسخ‌های خودکار"""
     from database.models import AutoReply
     
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     
     # بررسی پلن
-    has_auto_reply = any(plan.code == 'AI_RESPONDER' for plan in candidate.plans)
+    has_auto_reply = 'AI_RESPONDER' in current_plan_codes()
     
     if not has_auto_reply:
         flash('برای استفاده از این امکان باید پلن "پاسخ‌گوی هوشمند" را فعال کنید', 'warning')
@@ -1339,6 +1344,7 @@ def auto_replies():
             
             db.session.add(auto_reply)
             safe_commit(db, "Database commit failed")
+            auto_reply_index.invalidate(candidate.id)
             
             flash('پاسخ خودکار با موفقیت افزوده شد', 'success')
         
@@ -1348,6 +1354,7 @@ def auto_replies():
             if auto_reply:
                 db.session.delete(auto_reply)
                 safe_commit(db, "Database commit failed")
+                auto_reply_index.invalidate(candidate.id)
                 flash('پاسخ خودکار حذف شد', 'success')
         
         return redirect(url_for('auto_replies'))
@@ -1364,7 +1371,7 @@ def auto_replies():
 @secure_route()
 def purchase_plan(plan_id):
     """خرید پلن"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     plan = Plan.query.get_or_404(plan_id)
     
     if request.method == 'POST':
@@ -1428,7 +1435,7 @@ def purchase_plan(plan_id):
 @login_required
 def my_tickets():
     """تیکت‌های من"""
-    candidate = Candidate.query.get(session['candidate_id'])
+    candidate = current_candidate()
     tickets = Ticket.query.filter_by(candidate_id=candidate.id).order_by(Ticket.created_at.desc()).all()
     
     return render_template('candidate/my_tickets.html',
@@ -1613,16 +1620,10 @@ def contributions():
     
     contributions = query.all()
     
-    # آمار
-    stats = {
-        'total': CitizenContribution.query.filter_by(candidate_id=candidate_id).count(),
-        'pending': CitizenContribution.query.filter_by(candidate_id=candidate_id, status='pending').count(),
-        'under_review': CitizenContribution.query.filter_by(candidate_id=candidate_id, status='under_review').count(),
-        'approved': CitizenContribution.query.filter_by(candidate_id=candidate_id, status='approved').count(),
-        'in_progress': CitizenContribution.query.filter_by(candidate_id=candidate_id, status='in_progress').count(),
-        'completed': CitizenContribution.query.filter_by(candidate_id=candidate_id, status='completed').count(),
-        'rejected': CitizenContribution.query.filter_by(candidate_id=candidate_id, status='rejected').count()
-    }
+    # آمار (شمارنده‌های candidate_counters)
+    counters = get_counters(candidate_id, [CONTRIBUTIONS] + [contribution_counter(status) for status in CONTRIBUTION_STATUSES])
+    stats = {'total': counters[CONTRIBUTIONS]}
+    stats.update({status: counters[contribution_counter(status)] for status in CONTRIBUTION_STATUSES})
     
     # دسته‌بندی‌ها
     categories = [
@@ -1930,7 +1931,7 @@ def benchmark():
     )
     
     candidate_id = session['candidate_id']
-    candidate = Candidate.query.get(candidate_id)
+    candidate = current_candidate()
     
     # محاسبه رتبه جدید
     ranking = calculate_candidate_ranking(candidate_id)
@@ -1955,7 +1956,7 @@ def benchmark():
     else:
         potential_growth = 0
     
-    unread_messages = Message.query.filter_by(candidate_id=candidate.id, is_read=False).count()
+    unread_messages = current_unread()
     return render_template('candidate/benchmark.html',
                          candidate=candidate,
                          comparison=comparison,
@@ -2789,7 +2790,7 @@ def approve_question(event_id, question_id):
 def answer_question(event_id, question_id):
     """پاسخ به سوال"""
     from candidate_panel.events_utils import answer_question as answer_question_util
-    from database.models import LiveEvent, Candidate
+    from database.models import LiveEvent
     
     candidate_id = session.get('candidate_id')
     
@@ -2800,7 +2801,7 @@ def answer_question(event_id, question_id):
         return redirect(url_for('events_dashboard'))
     
     answer_text = request.form.get('answer_text')
-    candidate = Candidate.query.get(candidate_id)
+    candidate = current_candidate()
     answered_by = candidate.full_name if candidate else 'نماینده'
     
     if answer_question_util(question_id, answer_text, answered_by):
@@ -12,7 +12,7 @@
 - آمارگیری از رویدادها
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from database.models import db, LiveEvent, EventRegistration, EventQuestion, Candidate, BotUser
 from sqlalchemy import and_, or_, func
 
@@ -613,58 +613,15 @@ def send_reminders():
     ارسال یادآوری‌های خودکار
     این تابع باید توسط Cron Job یا Celery Beat اجرا شود
     
+    مرحله سررسید هر رویداد (1 روز قبل، 1 ساعت قبل، شروع) انتخاب و ارسال آن
+    به ثبت‌نام‌کنندگان در پس‌زمینه به موتور broadcast سپرده می‌شود؛ اجرای
+    دیرهنگام مرحله را از دست نمی‌دهد.
+    
     Returns:
-        dict با آمار ارسال
+        dict با تعداد رویدادهای در حال ارسال هر مرحله
     """
-    now = datetime.utcnow()
-    stats = {
-        '1day': 0,
-        '1hour': 0,
-        'starting': 0
-    }
-    
-    # یادآوری 1 روز قبل
-    one_day_later = now + timedelta(days=1)
-    events_1day = LiveEvent.query.filter(
-        LiveEvent.status == 'scheduled',
-        LiveEvent.reminder_1day_sent == False,
-        LiveEvent.starts_at.between(one_day_later, one_day_later + timedelta(minutes=10))
-    ).all()
-    
-    for event in events_1day:
-        # TODO: ارسال پیام به ثبت‌نام‌کنندگان
-        event.reminder_1day_sent = True
-        stats['1day'] += 1
-    
-    # یادآوری 1 ساعت قبل
-    one_hour_later = now + timedelta(hours=1)
-    events_1hour = LiveEvent.query.filter(
-        LiveEvent.status == 'scheduled',
-        LiveEvent.reminder_1hour_sent == False,
-        LiveEvent.starts_at.between(one_hour_later, one_hour_later + timedelta(minutes=5))
-    ).all()
-    
-    for event in events_1hour:
-        # TODO: ارسال پیام به ثبت‌نام‌کنندگان
-        event.reminder_1hour_sent = True
-        stats['1hour'] += 1
-    
-    # اطلاع شروع
-    events_starting = LiveEvent.query.filter(
-        LiveEvent.status == 'scheduled',
-        LiveEvent.starting_notice_sent == False,
-        LiveEvent.starts_at <= now
-    ).all()
-    
-    for event in events_starting:
-        # TODO: ارسال پیام شروع
-        event.starting_notice_sent = True
-        event.status = 'live'  # تغییر وضعیت به live
-        stats['starting'] += 1
-    
-    db.session.commit()
-    
-    return stats
+    from bot_engine.event_reminders import event_reminders
+    return event_reminders.dispatch_due()
 
 
 # ═══════════════════════════════════════════════════════════════
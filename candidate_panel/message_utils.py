@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+توابع کمکی صفحه پیام‌های نماینده
+=====================================
+
+این ماژول شامل توابع برای:
+- آمار دسته‌بندی، اولویت و احساس پیام‌ها با یک کوئری گروه‌بندی‌شده
+- صفحه‌بندی keyset لیست پیام‌ها (بدون OFFSET)
+"""
+
+from database.models import db, Message
+from sqlalchemy import and_, or_, func
+
+CATEGORIES = ('complaint', 'question', 'suggestion', 'support', 'criticism')
+SENTIMENTS = ('positive', 'neutral', 'negative')
+
+
+# ═══════════════════════════════════════════════════════════════
+# بخش اول: آمار پیام‌ها
+# ═══════════════════════════════════════════════════════════════
+
+def _matches(row, category, priority, read):
+    if category and row.category != category:
+        return False
+    if priority and row.category_priority != priority:
+        return False
+    if read == 'read' and not row.is_read:
+        return False
+    if read == 'unread' and (row.is_read is None or row.is_read):
+        return False
+    return True
+
+
+def get_message_stats(candidate_id, category=None, priority=None, read=None):
+    """
+    آمار پیام‌های نماینده با یک کوئری
+
+    پیام‌ها بر اساس (دسته، اولویت، خوانده‌شده، احساس) گروه‌بندی می‌شوند؛ همه
+    شمارنده‌ها، میانگین احساس و تعداد پیام‌های منطبق با فیلترهای فعلی از
+    همین چند ردیف محاسبه می‌شوند.
+
+    Args:
+        candidate_id: شناسه نماینده
+        category / priority: فیلتر دسته و اولویت (None = همه)
+        read: 'read'، 'unread' یا None
+
+    Returns:
+        dict: total, unread, هر دسته، high_priority، هر احساس،
+              avg_sentiment، satisfaction_rate و filtered
+    """
+    rows = db.session.query(
+        Message.category,
+        Message.category_priority,
+        Message.is_read,
+        Message.sentiment_label,
+        func.count(Message.id).label('count'),
+        func.count(Message.sentiment_score).label('scored'),
+        func.sum(Message.sentiment_score).label('score_sum'),
+    ).filter(
+        Message.candidate_id == candidate_id
+    ).group_by(
+        Message.category,
+        Message.category_priority,
+        Message.is_read,
+        Message.sentiment_label,
+    ).all()
+
+    stats = {'total': 0, 'unread': 0, 'high_priority': 0, 'filtered': 0}
+    stats.update({name: 0 for name in CATEGORIES + SENTIMENTS})
+    scored = 0
+    score_sum = 0.0
+
+    for row in rows:
+        stats['total'] += row.count
+        if row.is_read is not None and not row.is_read:
+            stats['unread'] += row.count
+        if row.category in CATEGORIES:
+            stats[row.category] += row.count
+        if row.category_priority == 'high':
+            stats['high_priority'] += row.count
+        if row.sentiment_label in SENTIMENTS:
+            stats[row.sentiment_label] += row.count
+        if _matches(row, category, priority, read):
+            stats['filtered'] += row.count
+        scored += row.scored
+        score_sum += row.score_sum or 0.0
+
+    # محاسبه میانگین رضایت
+    if scored:
+        avg_sentiment = score_sum / scored
+        stats['avg_sentiment'] = round(avg_sentiment, 2)
+        stats['satisfaction_rate'] = round((avg_sentiment + 1) / 2 * 100, 1)  # تبدیل -1,1 به 0-100
+    else:
+        stats['avg_sentiment'] = 0
+        stats['satisfaction_rate'] = 50
+
+    return stats
+
+
+# ═══════════════════════════════════════════════════════════════
+# بخش دوم: صفحه‌بندی
+# ═══════════════════════════════════════════════════════════════
+
+def paginate_messages(query, candidate_id, before_id=None, per_page=50):
+    """
+    یک صفحه از پیام‌ها به ترتیب جدیدترین (keyset روی created_at و id)
+
+    صفحه بعد با شناسه آخرین پیام همین صفحه (before_id) خوانده می‌شود؛ هزینه
+    هر صفحه به عمق صفحه بستگی ندارد.
+
+    Args:
+        query: کوئری فیلترشده Message
+        candidate_id: شناسه نماینده (برای اعتبارسنجی before_id)
+        before_id: شناسه آخرین پیام صفحه قبل
+        per_page: تعداد پیام هر صفحه
+
+    Returns:
+        tuple: (لیست پیام‌ها، before_id صفحه بعد یا None)
+    """
+    if before_id:
+        anchor = db.session.query(Message.created_at, Message.id).filter(
+            Message.id == before_id,
+            Message.candidate_id == candidate_id
+        ).first()
+        if anchor:
+            query = query.filter(or_(
+                Message.created_at < anchor.created_at,
+                and_(Message.created_at == anchor.created_at, Message.id < anchor.id)
+            ))
+
+    items = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(per_page + 1).all()
+    next_before = items[per_page - 1].id if len(items) > per_page else None
+    return items[:per_page], next_before
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+بارگذاری نماینده واردشده در طول یک درخواست
+=====================================
+
+نماینده، پلن فعال و تعداد پیام‌های خوانده‌نشده یک بار در هر درخواست خوانده
+و روی flask.g نگه داشته می‌شوند؛ دکوراتورها، route و قالب همه از همین
+مقادیر استفاده می‌کنند.
+
+- Candidate.plans در مدل lazy='subquery' است؛ اینجا lazyload می‌شود تا فقط
+  routeهایی که واقعاً پلن‌ها را لازم دارند (has_plan، داشبورد، ...) یک کوئری
+  برای آن بدهند.
+- پلن فعال از کش entitlements و تعداد خوانده‌نشده از candidate_counters
+  خوانده می‌شود.
+"""
+
+from flask import g, session
+from sqlalchemy.orm import lazyload, selectinload
+
+from database.models import db, Candidate
+from database.counters import get_counter, MESSAGES_UNREAD
+
+_MISSING = object()
+
+
+def current_candidate(with_plans=False):
+    """
+    نماینده واردشده (یا None)
+
+    Args:
+        with_plans: پلن‌ها همراه نماینده بارگذاری شوند (صفحاتی که پلن فعال و
+                    candidate.plans را با هم نمایش می‌دهند)
+    """
+    candidate = g.get('candidate', _MISSING)
+    if candidate is _MISSING:
+        candidate_id = session.get('candidate_id')
+        plans = selectinload(Candidate.plans) if with_plans else lazyload(Candidate.plans)
+        candidate = db.session.get(Candidate, candidate_id, options=[plans]) if candidate_id else None
+        g.candidate = candidate
+    return candidate
+
+
+def current_plan_codes():
+    """کد پلن‌های متصل به نماینده (candidate.plans)"""
+    codes = g.get('plan_codes', _MISSING)
+    if codes is _MISSING:
+        candidate = current_candidate()
+        codes = frozenset(plan.code for plan in candidate.plans) if candidate else frozenset()
+        g.plan_codes = codes
+    return codes
+
+
+def current_active_plan():
+    """پلن فعال نماینده (Candidate.get_active_plan)"""
+    plan = g.get('active_plan', _MISSING)
+    if plan is _MISSING:
+        candidate = current_candidate()
+        plan = candidate.get_active_plan() if candidate else None
+        g.active_plan = plan
+    return plan
+
+
+def current_unread():
+    """تعداد پیام‌های خوانده‌نشده برای منوی کناری"""
+    unread = g.get('unread_messages', _MISSING)
+    if unread is _MISSING:
+        candidate_id = session.get('candidate_id')
+        unread = get_counter(candidate_id, MESSAGES_UNREAD) if candidate_id else 0
+        g.unread_messages = unread
+    return unread
+
+
+def remember_unread(count):
+    """ثبت تعدادی که route خودش خوانده تا قالب دوباره کوئری نزند"""
+    g.unread_messages = count
+    return count
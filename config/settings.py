@@ -15,6 +15,14 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # و در آخر SQLite به عنوان fallback برای Development
 DATABASE_URI = os.getenv('DATABASE_URL') or os.getenv('DATABASE_URI') or f'sqlite:///{BASE_DIR}/election_bot.db'
 
+# Connection pool مشترک هر پروسه (بات‌ها، زمان‌بندها و پنل‌ها همه از یک engine استفاده می‌کنند)
+# مجموع DB_POOL_SIZE + DB_MAX_OVERFLOW ضربدر تعداد پروسه‌ها نباید از max_connections پستگرس بیشتر شود
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '20'))  # تعداد connectionهای permanent
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '40'))  # تعداد اضافی در شرایط peak
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))  # timeout برای گرفتن connection (ثانیه)
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))  # recycle بعد از 1 ساعت
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'True').lower() == 'true'  # بررسی سلامت قبل از استفاده
+
 # کلیدهای امنیتی
 ADMIN_SECRET_KEY = os.getenv('ADMIN_SECRET_KEY', 'admin-secret-key-change-in-production')
 CANDIDATE_SECRET_KEY = os.getenv('CANDIDATE_SECRET_KEY', 'candidate-secret-key-change-in-production')
@@ -25,7 +33,52 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # تنظیمات بات تلگرام
 BOT_WEBHOOK_MODE = os.getenv('BOT_WEBHOOK_MODE', 'False').lower() == 'true'
-WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # آدرس عمومی سرور، مثل https://example.com
+WEBHOOK_PATH = '/telegram/webhook'  # endpoint مشترک همه بات‌ها: {WEBHOOK_PATH}/<secret>
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', 'webhook-secret-change-in-production')
+
+# ارسال انبوه (broadcast)
+TELEGRAM_API_BASE = os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org')  # یا آدرس Bot API Server محلی
+BROADCAST_PER_BOT_RATE = float(os.getenv('BROADCAST_PER_BOT_RATE', '25'))  # پیام در ثانیه برای هر بات (سقف تلگرام ~30)
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', '1.0'))  # حداقل فاصله دو پیام به یک چت (ثانیه)
+BROADCAST_MAX_CONCURRENCY = int(os.getenv('BROADCAST_MAX_CONCURRENCY', '100'))  # درخواست HTTP همزمان کل موتور
+BROADCAST_WORKERS_PER_BROADCAST = int(os.getenv('BROADCAST_WORKERS_PER_BROADCAST', '25'))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+BROADCAST_FETCH_CHUNK = int(os.getenv('BROADCAST_FETCH_CHUNK', '1000'))  # تعداد گیرنده در هر کوئری keyset
+BROADCAST_LOG_BATCH = int(os.getenv('BROADCAST_LOG_BATCH', '200'))  # تعداد لاگ در هر flush
+BROADCAST_FLUSH_INTERVAL = float(os.getenv('BROADCAST_FLUSH_INTERVAL', '2.0'))  # حداکثر فاصله دو flush (ثانیه)
+
+# یادآوری رویدادهای زنده (از طریق موتور broadcast)
+EVENT_REMINDER_BATCH = int(os.getenv('EVENT_REMINDER_BATCH', '200'))  # تعداد ثبت‌نام در هر دسته ارسال و ثبت لاگ
+
+# Lease ردیف‌ها برای اجرای همزمان زمان‌بندها روی چند سرور
+# هر broadcast/پست فقط توسط نودی ارسال می‌شود که lease معتبر آن را دارد
+SCHEDULER_NODE_ID = os.getenv('SCHEDULER_NODE_ID')  # پیش‌فرض: SERVER_ID + hostname + pid
+BROADCAST_LEASE_TTL = int(os.getenv('BROADCAST_LEASE_TTL', '60'))  # در حین ارسال مرتب تمدید می‌شود (ثانیه)
+POST_LEASE_TTL = int(os.getenv('POST_LEASE_TTL', '120'))  # حداکثر زمان ارسال یک پست (ثانیه)
+
+# زمان‌بندی پست کانال‌ها
+POST_SCHEDULER_RESYNC_INTERVAL = float(os.getenv('POST_SCHEDULER_RESYNC_INTERVAL', '10'))  # فاصله همگام‌سازی صف با دیتابیس (ثانیه)
+POST_SCHEDULER_WORKERS = int(os.getenv('POST_SCHEDULER_WORKERS', '8'))  # ارسال همزمان به کانال‌های مختلف
+
+# Runtime مشترک بات‌ها (همه بات‌ها روی یک event loop و یک connection pool)
+BOT_RUNTIME_POOL_SIZE = int(os.getenv('BOT_RUNTIME_POOL_SIZE', '64'))  # اتصال‌های فراخوانی API
+BOT_RUNTIME_POLL_POOL_SIZE = int(os.getenv('BOT_RUNTIME_POLL_POOL_SIZE', '512'))  # اتصال‌های long-poll (حداقل به تعداد بات‌ها)
+BOT_RUNTIME_START_TIMEOUT = int(os.getenv('BOT_RUNTIME_START_TIMEOUT', '30'))  # ثانیه
+BOT_STOP_DRAIN_TIMEOUT = int(os.getenv('BOT_STOP_DRAIN_TIMEOUT', '10'))  # مهلت پردازش آپدیت‌های در جریان هنگام توقف (ثانیه)
+BOT_CONTENT_CACHE_TTL = int(os.getenv('BOT_CONTENT_CACHE_TTL', '300'))  # اعتبار کش منوهای بات (ثانیه)
+BOT_DB_EXECUTOR_WORKERS = int(os.getenv('BOT_DB_EXECUTOR_WORKERS', '8'))  # حداکثر کوئری همزمان بات‌ها (≤ اندازه connection pool)
+BOT_USER_FLUSH_INTERVAL = int(os.getenv('BOT_USER_FLUSH_INTERVAL', '5'))  # فاصله flush دسته‌ای فعالیت کاربران (ثانیه)
+BOT_USER_FLUSH_BATCH = int(os.getenv('BOT_USER_FLUSH_BATCH', '500'))  # flush زودتر با رسیدن به این تعداد کاربر
+BOT_USER_KNOWN_CACHE_SIZE = int(os.getenv('BOT_USER_KNOWN_CACHE_SIZE', '200000'))  # کاربران ثبت‌شده در حافظه (بدون کوئری در /start)
+ANALYTICS_FLUSH_INTERVAL = int(os.getenv('ANALYTICS_FLUSH_INTERVAL', '60'))  # فاصله flush رویدادهای آمار بات به analytics (ثانیه)
+ANALYTICS_FLUSH_BATCH = int(os.getenv('ANALYTICS_FLUSH_BATCH', '5000'))  # flush زودتر با رسیدن به این تعداد رویداد
+AUTO_REPLY_REVALIDATE_INTERVAL = float(os.getenv('AUTO_REPLY_REVALIDATE_INTERVAL', '30'))  # فاصله بررسی تغییر قوانین پاسخ خودکار (ثانیه)
+
+# پنل نماینده
+CANDIDATE_MESSAGES_PER_PAGE = int(os.getenv('CANDIDATE_MESSAGES_PER_PAGE', '50'))  # تعداد پیام هر صفحه در صندوق پیام‌ها
+COUNTER_RECONCILE_INTERVAL = int(os.getenv('COUNTER_RECONCILE_INTERVAL', '60'))  # فاصله اصلاح شمارنده‌های candidate_counters (دقیقه)
+PLAN_CACHE_TTL = float(os.getenv('PLAN_CACHE_TTL', '60'))  # اعتبار کش پلن فعال و مصرف هر نماینده در پروسه‌های دیگر (ثانیه)
 
 # پلن‌های پیش‌فرض
 DEFAULT_PLANS = [
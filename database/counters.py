@@ -0,0 +1,324 @@
+"""
+شمارنده‌های denormalized هر نماینده (candidate_counters)
+
+تغییرات Message، Program، Headquarters و CitizenContribution در رویداد
+after_flush هر Session به دلتای شمارنده تبدیل و در همان تراکنش با یک upsert
+اعمال می‌شوند؛ پس شمارنده‌ها همراه ردیف‌ها commit یا rollback می‌شوند.
+تغییرات خارج از ORM (query.update/delete) رویدادی ندارند: یا شمارنده را
+خودشان با adjust_counters اصلاح می‌کنند یا reconcile_counters دوره‌ای
+اختلاف را برطرف می‌کند.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event, func, case, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, sessionmaker
+
+from database.engine import get_engine
+from database.models import (
+    db, Candidate, CandidateCounter, Message, Program, Headquarters, CitizenContribution
+)
+
+logger = logging.getLogger(__name__)
+
+# نام شمارنده‌ها
+MESSAGES = 'messages'
+MESSAGES_UNREAD = 'messages_unread'
+PROGRAMS = 'programs'
+HEADQUARTERS = 'headquarters'
+CONTRIBUTIONS = 'contributions'
+CONTRIBUTION_STATUSES = ('pending', 'under_review', 'approved', 'in_progress', 'completed', 'rejected')
+
+# مدل -> ستون‌هایی که شمارنده‌ها به آن‌ها بستگی دارند
+TRACKED_COLUMNS = {
+    Message: ('candidate_id', 'created_at', 'is_read'),
+    Program: ('candidate_id',),
+    Headquarters: ('candidate_id',),
+    CitizenContribution: ('candidate_id', 'status'),
+}
+
+
+def month_start(now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.utcnow()).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def month_counter(moment: Optional[datetime] = None) -> str:
+    """شمارنده پیام‌های یک ماه (پیش‌فرض ماه جاری)"""
+    return f"{MESSAGES}:{(moment or datetime.utcnow()):%Y-%m}"
+
+
+def contribution_counter(status: str) -> str:
+    return f"{CONTRIBUTIONS}:{status}"
+
+
+def _row_counters(model, values: dict) -> Iterable[str]:
+    """شمارنده‌هایی که یک ردیف با این مقادیر در آن‌ها شمرده می‌شود"""
+    if model is Message:
+        yield MESSAGES
+        yield month_counter(values['created_at'])
+        if values['is_read'] is not None and not values['is_read']:
+            yield MESSAGES_UNREAD
+    elif model is Program:
+        yield PROGRAMS
+    elif model is Headquarters:
+        yield HEADQUARTERS
+    elif model is CitizenContribution:
+        yield CONTRIBUTIONS
+        if values['status']:
+            yield contribution_counter(values['status'])
+
+
+def _values(obj, columns, old: bool = False) -> dict:
+    """مقادیر فعلی (یا قبل از تغییر) ستون‌ها"""
+    state = inspect(obj)
+    values = {}
+    for column in columns:
+        value = getattr(obj, column)
+        if old:
+            history = state.attrs[column].history
+            if history.deleted:
+                value = history.deleted[0]
+        values[column] = value
+    if 'created_at' in values and values['created_at'] is None:
+        values['created_at'] = datetime.utcnow()
+    return values
+
+
+def _add(deltas: dict, model, values: dict, sign: int):
+    candidate_id = values['candidate_id']
+    if candidate_id is None:
+        return
+    for name in _row_counters(model, values):
+        deltas[(candidate_id, name)] += sign
+
+
+def _changed_deltas(session) -> Dict[tuple, int]:
+    """
+    دلتای ردیف‌های حذف‌شده و تغییرکرده (در before_flush)
+
+    این ردیف‌ها هنوز در دیتابیس هستند و ستون‌های expire شده قابل بارگذاری‌اند.
+    """
+    deltas = defaultdict(int)
+
+    for obj in session.deleted:
+        columns = TRACKED_COLUMNS.get(type(obj))
+        if columns:
+            _add(deltas, type(obj), _values(obj, columns, old=True), -1)
+
+    for obj in session.dirty:
+        columns = TRACKED_COLUMNS.get(type(obj))
+        if not columns or inspect(obj).deleted:
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[column].history.deleted for column in columns):
+            continue
+        _add(deltas, type(obj), _values(obj, columns, old=True), -1)
+        _add(deltas, type(obj), _values(obj, columns), 1)
+
+    # شمارنده‌های نماینده حذف‌شده همراه خودش حذف می‌شوند
+    removed = {obj.id for obj in session.deleted if isinstance(obj, Candidate)}
+    return {key: delta for key, delta in deltas.items() if key[0] not in removed}
+
+
+def _new_deltas(session) -> Dict[tuple, int]:
+    """دلتای ردیف‌های جدید (در after_flush؛ مقادیر پیش‌فرض ستون‌ها اعمال شده‌اند)"""
+    deltas = defaultdict(int)
+    for obj in session.new:
+        columns = TRACKED_COLUMNS.get(type(obj))
+        if columns:
+            _add(deltas, type(obj), _values(obj, columns), 1)
+    return deltas
+
+
+def apply_deltas(connection, deltas: Dict[tuple, int]):
+    """اعمال اتمیک دلتاها (INSERT ... ON CONFLICT DO UPDATE روی sqlite و postgres)"""
+    table = CandidateCounter.__table__
+    now = datetime.utcnow()
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(connection.dialect.name)
+
+    for (candidate_id, name), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        if dialect is not None:
+            stmt = dialect.insert(table).values(
+                candidate_id=candidate_id, name=name, value=delta, updated_at=now
+            )
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=['candidate_id', 'name'],
+                set_={'value': table.c.value + stmt.excluded.value, 'updated_at': now}
+            ))
+            continue
+
+        updated = connection.execute(table.update().where(
+            table.c.candidate_id == candidate_id, table.c.name == name
+        ).values(value=table.c.value + delta, updated_at=now)).rowcount
+        if not updated:
+            connection.execute(table.insert().values(
+                candidate_id=candidate_id, name=name, value=delta, updated_at=now
+            ))
+
+
+_PENDING_KEY = 'candidate_counter_deltas'
+# دلتاهای اعمال‌شده در تراکنش جاری (برای به‌روزرسانی کش‌ها پس از commit)
+APPLIED_KEY = 'candidate_counter_applied'
+
+
+def _record_applied(session, deltas: Dict[tuple, int]):
+    applied = session.info.setdefault(APPLIED_KEY, defaultdict(int))
+    for key, delta in deltas.items():
+        applied[key] += delta
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changed_rows(session, flush_context, instances):
+    session.info[_PENDING_KEY] = _changed_deltas(session)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_counters_after_flush(session, flush_context):
+    deltas = _new_deltas(session)
+    for key, delta in session.info.pop(_PENDING_KEY, {}).items():
+        deltas[key] += delta
+    if any(deltas.values()):
+        apply_deltas(session.connection(), deltas)
+        _record_applied(session, deltas)
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# مقدار قبلی ستون‌های شمارش‌شده هنگام تغییر بارگذاری شود (حتی اگر expire شده باشد)
+for _model, _columns in TRACKED_COLUMNS.items():
+    for _column in _columns:
+        event.listen(getattr(_model, _column), 'set', _load_old_value, active_history=True)
+
+
+def adjust_counters(session, candidate_id: int, deltas: Dict[str, int]):
+    """اصلاح دستی شمارنده‌ها برای تغییرات bulk (commit با فراخواننده)"""
+    deltas = {(candidate_id, name): delta for name, delta in deltas.items() if delta}
+    apply_deltas(session.connection(), deltas)
+    _record_applied(session, deltas)
+
+
+def get_counters(candidate_id: int, names: Iterable[str], session=None) -> Dict[str, int]:
+    """
+    مقدار چند شمارنده نماینده با یک کوئری
+
+    Returns:
+        dict: نام -> مقدار (شمارنده ثبت‌نشده صفر است)
+    """
+    session = session or db.session
+    names = list(names)
+    counters = dict.fromkeys(names, 0)
+    rows = session.query(CandidateCounter.name, CandidateCounter.value).filter(
+        CandidateCounter.candidate_id == candidate_id,
+        CandidateCounter.name.in_(names)
+    ).all()
+    counters.update({row.name: row.value for row in rows})
+    return counters
+
+
+def get_counter(candidate_id: int, name: str, session=None) -> int:
+    return get_counters(candidate_id, [name], session)[name]
+
+
+# ------------------------------------------------------------
+# reconciliation
+# ------------------------------------------------------------
+
+def expected_counters(session, candidate_ids: Optional[Iterable[int]] = None,
+                      now: Optional[datetime] = None) -> Dict[tuple, int]:
+    """محاسبه دوباره همه شمارنده‌ها از جدول‌های اصلی (چند کوئری گروه‌بندی‌شده)"""
+    candidate_ids = list(candidate_ids) if candidate_ids is not None else None
+    current_month = month_counter(now)
+    expected = defaultdict(int)
+
+    def scoped(query, model):
+        if candidate_ids is not None:
+            query = query.filter(model.candidate_id.in_(candidate_ids))
+        return query
+
+    rows = scoped(session.query(
+        Message.candidate_id,
+        func.count(Message.id),
+        func.sum(case((Message.is_read == False, 1), else_=0)),
+        func.sum(case((Message.created_at >= month_start(now), 1), else_=0)),
+    ), Message).group_by(Message.candidate_id).all()
+    for candidate_id, total, unread, this_month in rows:
+        expected[(candidate_id, MESSAGES)] = total
+        expected[(candidate_id, MESSAGES_UNREAD)] = unread or 0
+        expected[(candidate_id, current_month)] = this_month or 0
+
+    for model, name in ((Program, PROGRAMS), (Headquarters, HEADQUARTERS)):
+        rows = scoped(session.query(model.candidate_id, func.count(model.id)), model).group_by(model.candidate_id)
+        for candidate_id, total in rows:
+            expected[(candidate_id, name)] = total
+
+    rows = scoped(session.query(
+        CitizenContribution.candidate_id, CitizenContribution.status, func.count(CitizenContribution.id)
+    ), CitizenContribution).group_by(CitizenContribution.candidate_id, CitizenContribution.status)
+    for candidate_id, status, total in rows:
+        expected[(candidate_id, CONTRIBUTIONS)] += total
+        if status:
+            expected[(candidate_id, contribution_counter(status))] = total
+
+    return expected
+
+
+def reconcile_counters(session, candidate_ids: Optional[Iterable[int]] = None,
+                       now: Optional[datetime] = None) -> int:
+    """
+    اصلاح اختلاف شمارنده‌ها با مقدار واقعی (commit با فراخواننده)
+
+    شمارنده ماه‌های گذشته حذف می‌شوند؛ فقط ماه جاری خوانده می‌شود.
+
+    Returns:
+        int: تعداد شمارنده‌های اصلاح‌شده
+    """
+    candidate_ids = list(candidate_ids) if candidate_ids is not None else None
+    expected = expected_counters(session, candidate_ids, now)
+    current_month = month_counter(now)
+
+    query = session.query(CandidateCounter)
+    if candidate_ids is not None:
+        query = query.filter(CandidateCounter.candidate_id.in_(candidate_ids))
+
+    fixed = 0
+    for counter in query:
+        key = (counter.candidate_id, counter.name)
+        if counter.name.startswith(f"{MESSAGES}:") and counter.name != current_month:
+            session.delete(counter)
+            continue
+        value = expected.pop(key, 0)
+        if counter.value != value:
+            counter.value = value
+            counter.updated_at = datetime.utcnow()
+            fixed += 1
+
+    for (candidate_id, name), value in expected.items():
+        if value:
+            session.add(CandidateCounter(candidate_id=candidate_id, name=name, value=value))
+            fixed += 1
+
+    return fixed
+
+
+def run_reconciliation(candidate_ids: Optional[Iterable[int]] = None) -> int:
+    """اجرای reconciliation با session مستقل (کار دوره‌ای زمان‌بند)"""
+    session = sessionmaker(bind=get_engine())()
+    try:
+        fixed = reconcile_counters(session, candidate_ids)
+        session.commit()
+        if fixed:
+            logger.warning(f"⚠️ {fixed} شمارنده نماینده‌ها با مقدار واقعی اصلاح شد")
+        return fixed
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ خطا در reconciliation شمارنده‌ها: {str(e)}")
+        return 0
+    finally:
+        session.close()
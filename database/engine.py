@@ -0,0 +1,129 @@
+"""
+Engine و connection pool مشترک هر پروسه
+
+بات‌ها، زمان‌بندها، wsgi و هر دو پنل Flask به‌جای create_engine جداگانه
+از get_engine استفاده می‌کنند تا هر پروسه فقط یک pool محدود داشته باشد.
+"""
+import time
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from config.settings import (
+    DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING
+)
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool با ثبت زمان انتظار checkout و تعداد timeoutها"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def get_stats(self) -> Dict:
+        """وضعیت فعلی pool و آمار انتظار checkout"""
+        with self._stats_lock:
+            avg_wait = self.total_wait / self.checkouts if self.checkouts else 0.0
+            return {
+                'size': self.size(),
+                'checked_out': self.checkedout(),
+                'checked_in': self.checkedin(),
+                'overflow': max(self.overflow(), 0),
+                'max_overflow': self._max_overflow,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(avg_wait * 1000, 2),
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+            }
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def uses_shared_pool(url) -> bool:
+    """آیا این آدرس از engine مشترک استفاده می‌کند؟ (همه به‌جز sqlite حافظه‌ای)"""
+    return not _is_memory_sqlite(make_url(url))
+
+
+def engine_options(url) -> Dict:
+    """تنظیمات pool مشترک (از DatabasePoolConfig / config.settings)"""
+    if not uses_shared_pool(url):
+        # دیتابیس حافظه‌ای فقط در تست‌ها؛ pool پیش‌فرض SQLAlchemy لازم است
+        return {}
+
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+
+def get_engine(url: Optional[str] = None) -> Engine:
+    """
+    engine مشترک پروسه برای یک آدرس دیتابیس (lazy و thread-safe)
+
+    Args:
+        url: آدرس دیتابیس؛ پیش‌فرض DATABASE_URI
+    """
+    key = make_url(url or DATABASE_URI).render_as_string(hide_password=False)
+
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = create_engine(key, **engine_options(key))
+                _engines[key] = engine
+    return engine
+
+
+def get_pool_stats() -> Dict[str, Dict]:
+    """آمار pool همه engineهای ساخته‌شده (آدرس بدون رمز عبور)"""
+    stats = {}
+    for key, engine in list(_engines.items()):
+        pool = engine.pool
+        name = make_url(key).render_as_string(hide_password=True)
+        if isinstance(pool, InstrumentedQueuePool):
+            stats[name] = pool.get_stats()
+        else:
+            stats[name] = {'pool': type(pool).__name__, 'status': pool.status()}
+    return stats
+
+
+def dispose_engines():
+    """بستن همه connectionها (مثلاً پس از fork پروسه)"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
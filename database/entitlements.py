@@ -0,0 +1,161 @@
+"""
+کش پلن فعال و مصرف هر نماینده برای بررسی امکانات و محدودیت‌ها
+
+has_feature و can_add_* روی هر پیام شهروند صدا زده می‌شوند؛ به‌جای کوئری
+PlanPurchase و شمارش پیام‌ها در هر فراخوانی، پلن فعال (به صورت dict ستون‌ها)،
+زمان انقضای آن و شمارنده‌های مصرف یک بار بارگذاری می‌شوند.
+
+- تغییر PlanPurchase یا Plan در همین پروسه پس از commit کش را باطل می‌کند
+  (خرید، تأیید تیکت، تمدید، trial و اعطای رایگان همه از همین مسیر می‌گذرند).
+- دلتای شمارنده‌های candidate_counters پس از commit روی مصرف کش اعمال می‌شود.
+- پروسه‌های دیگر پس از PLAN_CACHE_TTL ثانیه، با انقضای پلن یا شروع ماه جدید
+  دوباره بارگذاری می‌کنند.
+"""
+import time
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from config.settings import PLAN_CACHE_TTL
+from database.models import db, Plan, PlanPurchase
+# database.models در انتهای خود این ماژول را import می‌کند؛ ممکن است counters هنوز
+# نیمه‌بارگذاری باشد، پس نام‌ها هنگام فراخوانی از ماژول خوانده می‌شوند
+from database import counters
+
+_CHANGED_KEY = 'plan_entitlements_changed'
+# کلید باطل کردن همه نماینده‌ها (تغییر خود پلن‌ها)
+ALL = '*'
+
+
+class Entitlement:
+    """پلن فعال و مصرف یک نماینده در لحظه بارگذاری"""
+
+    __slots__ = ('plan_id', 'plan', 'expires_at', 'usage', 'month', 'revalidate_at')
+
+    def __init__(self, plan_id: Optional[int], plan: Optional[Dict], expires_at: Optional[datetime],
+                 usage: Dict[str, int], month: str, revalidate_at: float):
+        self.plan_id = plan_id
+        self.plan = plan
+        self.expires_at = expires_at
+        self.usage = usage
+        self.month = month
+        self.revalidate_at = revalidate_at
+
+    @property
+    def messages_this_month(self) -> int:
+        return self.usage.get(self.month, 0)
+
+    def is_fresh(self, now: datetime) -> bool:
+        if time.monotonic() >= self.revalidate_at or self.month != counters.month_counter(now):
+            return False
+        return self.expires_at is None or now < self.expires_at
+
+    def within_limit(self, limit_name: str, used: int) -> bool:
+        """بدون پلن فعال یا با محدودیت -1 همیشه True (مثل رفتار قبلی)"""
+        if not self.plan or self.plan[limit_name] == -1:
+            return True
+        return used < self.plan[limit_name]
+
+
+class EntitlementCache:
+    """
+    کش Entitlement به ازای candidate_id
+
+    متدها blocking هستند؛ session پیش‌فرض db.session است.
+    """
+
+    def __init__(self, ttl: float = PLAN_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[int, Entitlement] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, candidate_id: int, session=None) -> Entitlement:
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entries.get(candidate_id)
+        if entry is not None and entry.is_fresh(now):
+            return entry
+
+        entry = self._load(candidate_id, session or db.session, now)
+        with self._lock:
+            self._entries[candidate_id] = entry
+            self.loads += 1
+        return entry
+
+    def _load(self, candidate_id: int, session, now: datetime) -> Entitlement:
+        purchase = session.query(PlanPurchase.plan_id, PlanPurchase.end_date).filter(
+            PlanPurchase.candidate_id == candidate_id,
+            PlanPurchase.is_active == True,
+            PlanPurchase.end_date > now
+        ).order_by(PlanPurchase.end_date.desc()).first()
+
+        plan = session.get(Plan, purchase.plan_id) if purchase else None
+        snapshot = {column.key: getattr(plan, column.key) for column in Plan.__table__.columns} if plan else None
+
+        month = counters.month_counter(now)
+        usage = counters.get_counters(
+            candidate_id, [month, counters.PROGRAMS, counters.HEADQUARTERS], session
+        )
+
+        return Entitlement(
+            plan.id if plan else None, snapshot,
+            purchase.end_date if purchase else None,
+            usage, month, time.monotonic() + self.ttl
+        )
+
+    def record_usage(self, deltas: Dict[tuple, int]):
+        """اعمال دلتای شمارنده‌های commit‌شده روی مصرف کش‌شده"""
+        with self._lock:
+            for (candidate_id, name), delta in deltas.items():
+                entry = self._entries.get(candidate_id)
+                if entry is not None and name in entry.usage:
+                    entry.usage[name] += delta
+
+    def invalidate(self, candidate_id=ALL):
+        with self._lock:
+            if candidate_id == ALL:
+                self._entries.clear()
+            else:
+                self._entries.pop(candidate_id, None)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {'candidates': len(self._entries), 'loads': self.loads}
+
+
+# Instance سراسری
+entitlements = EntitlementCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_plan_changes(session, flush_context):
+    changed = session.info.setdefault(_CHANGED_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, PlanPurchase):
+            changed.add(obj.candidate_id)
+            # خریدی که به نماینده دیگری منتقل شده
+            history = inspect(obj).attrs.candidate_id.history
+            changed.update(history.deleted or ())
+        elif isinstance(obj, Plan):
+            changed.add(ALL)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_after_commit(session):
+    changed = session.info.pop(_CHANGED_KEY, None)
+    applied = session.info.pop(counters.APPLIED_KEY, None)
+    if changed:
+        for candidate_id in (ALL,) if ALL in changed else changed:
+            entitlements.invalidate(candidate_id)
+    if applied:
+        entitlements.record_usage(applied)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop(_CHANGED_KEY, None)
+    session.info.pop(counters.APPLIED_KEY, None)
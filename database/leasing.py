@@ -0,0 +1,86 @@
+"""
+Lease ردیف‌ها برای تقسیم صف بین چند نود زمان‌بند
+
+هر ردیف (broadcast یا پست) با یک UPDATE شرطی اتمیک claim می‌شود:
+فقط اگر lease آزاد، منقضی یا متعلق به همین نود باشد. نودی که از کار بیفتد
+lease خود را تمدید نمی‌کند و پس از انقضا نود دیگری کار را ادامه می‌دهد.
+روی همه دیتابیس‌ها (sqlite و postgres) یکسان کار می‌کند.
+"""
+import os
+import socket
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from config.settings import SCHEDULER_NODE_ID
+
+
+def _default_node_id() -> str:
+    server_id = os.getenv('SERVER_ID')
+    parts = [server_id] if server_id else []
+    parts += [socket.gethostname(), str(os.getpid())]
+    return ':'.join(parts)[:100]
+
+
+NODE_ID = SCHEDULER_NODE_ID or _default_node_id()
+
+
+def lease_available(model, owner: str = NODE_ID, now: datetime = None):
+    """شرط SQL: lease ردیف آزاد، منقضی یا متعلق به owner است"""
+    now = now or datetime.utcnow()
+    return or_(
+        model.lease_owner.is_(None),
+        model.lease_expires_at.is_(None),
+        model.lease_expires_at < now,
+        model.lease_owner == owner
+    )
+
+
+def acquire_lease(session, model, row_id: int, ttl: float, *criteria, owner: str = NODE_ID) -> bool:
+    """
+    claim اتمیک یک ردیف (commit می‌شود)
+
+    Args:
+        criteria: شرط‌های اضافه، مثلاً status == 'pending'
+
+    Returns:
+        bool: True اگر lease گرفته شد
+    """
+    now = datetime.utcnow()
+    updated = session.query(model).filter(
+        model.id == row_id, lease_available(model, owner, now), *criteria
+    ).update({
+        'lease_owner': owner,
+        'lease_expires_at': now + timedelta(seconds=ttl),
+    }, synchronize_session=False)
+    session.commit()
+    return updated == 1
+
+
+def renew_lease(session, model, row_id: int, ttl: float, values: dict = None,
+                owner: str = NODE_ID) -> bool:
+    """
+    تمدید lease به همراه به‌روزرسانی مقادیر دیگر؛ commit با فراخواننده است
+
+    Returns:
+        bool: False اگر lease دیگر متعلق به این نود نیست
+    """
+    updated = session.query(model).filter(
+        model.id == row_id, model.lease_owner == owner
+    ).update(dict(
+        values or {},
+        lease_expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+    ), synchronize_session=False)
+    return updated == 1
+
+
+def release_lease(session, model, row_id: int, values: dict = None, owner: str = NODE_ID) -> bool:
+    """آزاد کردن lease به همراه به‌روزرسانی مقادیر دیگر؛ commit با فراخواننده است"""
+    updated = session.query(model).filter(
+        model.id == row_id, model.lease_owner == owner
+    ).update(dict(
+        values or {},
+        lease_owner=None,
+        lease_expires_at=None
+    ), synchronize_session=False)
+    return updated == 1
@@ -4,7 +4,24 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 
-db = SQLAlchemy()
+from database.engine import get_engine, uses_shared_pool
+
+
+class SharedEngineSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy که engine پیش‌فرض را از database.engine می‌گیرد
+    
+    هر دو پنل و بات‌ها در یک پروسه یک connection pool مشترک دارند.
+    """
+    
+    def _make_engine(self, bind_key, options, app):
+        url = options.get('url')
+        if bind_key is None and url is not None and uses_shared_pool(url):
+            return get_engine(url)
+        return super()._make_engine(bind_key, options, app)
+
+
+db = SharedEngineSQLAlchemy()
 
 
 # جدول رابطه چند به چند برای نماینده و پلن‌ها
@@ -120,57 +137,41 @@ class Candidate(db.Model):
     def __repr__(self):
         return f'<Candidate {self.full_name}>'
     
+    def get_entitlement(self):
+        """پلن فعال و مصرف کش‌شده (database/entitlements.py)"""
+        from database.entitlements import entitlements
+        return entitlements.get(self.id, db.object_session(self))
+    
     def get_active_plan(self):
         """دریافت پلن فعال فعلی کاندیدا"""
-        from datetime import datetime
-        active_purchase = PlanPurchase.query.filter_by(
-            candidate_id=self.id,
-            is_active=True
-        ).filter(
-            PlanPurchase.end_date > datetime.utcnow()
-        ).order_by(PlanPurchase.end_date.desc()).first()
-        
-        return active_purchase.plan if active_purchase else None
+        plan_id = self.get_entitlement().plan_id
+        if plan_id is None:
+            return None
+        return (db.object_session(self) or db.session).get(Plan, plan_id)
     
     def has_feature(self, feature_name):
         """بررسی دسترسی به یک امکان خاص"""
-        active_plan = self.get_active_plan()
-        if not active_plan:
+        plan = self.get_entitlement().plan
+        if not plan:
             return False
-        return getattr(active_plan, feature_name, False)
+        return plan.get(feature_name) or False
     
     def can_add_message(self):
-        """بررسی امکان دریافت پیام جدید"""
-        active_plan = self.get_active_plan()
-        if not active_plan or active_plan.max_messages == -1:
-            return True
-        
-        from datetime import datetime, timedelta
-        # شمارش پیام‌های این ماه
-        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        message_count = Message.query.filter_by(candidate_id=self.id).filter(
-            Message.created_at >= month_start
-        ).count()
-        
-        return message_count < active_plan.max_messages
+        """بررسی امکان دریافت پیام جدید (پیام‌های این ماه، بدون کوئری)"""
+        entitlement = self.get_entitlement()
+        return entitlement.within_limit('max_messages', entitlement.messages_this_month)
     
     def can_add_program(self):
         """بررسی امکان اضافه کردن برنامه"""
-        active_plan = self.get_active_plan()
-        if not active_plan or active_plan.max_programs == -1:
-            return True
-        
-        program_count = Program.query.filter_by(candidate_id=self.id).count()
-        return program_count < active_plan.max_programs
+        from database.counters import PROGRAMS
+        entitlement = self.get_entitlement()
+        return entitlement.within_limit('max_programs', entitlement.usage[PROGRAMS])
     
     def can_add_headquarters(self):
         """بررسی امکان اضافه کردن دفتر"""
-        active_plan = self.get_active_plan()
-        if not active_plan or active_plan.max_headquarters == -1:
-            return True
-        
-        hq_count = Headquarters.query.filter_by(candidate_id=self.id).count()
-        return hq_count < active_plan.max_headquarters
+        from database.counters import HEADQUARTERS
+        entitlement = self.get_entitlement()
+        return entitlement.within_limit('max_headquarters', entitlement.usage[HEADQUARTERS])
 
 
 class BotInstance(db.Model):
@@ -220,6 +221,10 @@ class BotUser(db.Model):
     streak_days = db.Column(db.Integer, default=0)  # تعداد روزهای حضور پیاپی
     last_daily_login = db.Column(db.Date)  # آخرین حضور روزانه
     
+    __table_args__ = (
+        db.UniqueConstraint('bot_instance_id', 'telegram_id', name='unique_bot_user'),
+    )
+    
     def __repr__(self):
         return f'<BotUser {self.first_name}>'
 
@@ -313,7 +318,12 @@ class Message(db.Model):
 
 
 class Analytics(db.Model):
-    """آمار و تحلیل"""
+    """
+    آمار و تحلیل روزانه هر نماینده
+    
+    از رویدادهای بات با flush دسته‌ای bot_engine/analytics_events.py پر می‌شود
+    (یک ردیف به ازای نماینده و روز).
+    """
     __tablename__ = 'analytics'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -322,15 +332,68 @@ class Analytics(db.Model):
     total_users = db.Column(db.Integer, default=0)
     new_users = db.Column(db.Integer, default=0)
     active_users = db.Column(db.Integer, default=0)
+    total_interactions = db.Column(db.Integer, default=0)
     total_messages = db.Column(db.Integer, default=0)
+    contributions = db.Column(db.Integer, default=0)
     resume_views = db.Column(db.Integer, default=0)
     programs_views = db.Column(db.Integer, default=0)
     headquarters_views = db.Column(db.Integer, default=0)
     
+    __table_args__ = (
+        db.UniqueConstraint('candidate_id', 'date', name='unique_candidate_analytics_date'),
+    )
+    
     def __repr__(self):
         return f'<Analytics {self.date}>'
 
 
+class AnalyticsHourly(db.Model):
+    """آمار ساعتی هر نماینده (همان ستون‌های Analytics به جز total_users)"""
+    __tablename__ = 'analytics_hourly'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.id'), nullable=False)
+    hour = db.Column(db.DateTime, nullable=False)  # شروع ساعت (UTC)
+    new_users = db.Column(db.Integer, default=0)
+    active_users = db.Column(db.Integer, default=0)
+    total_interactions = db.Column(db.Integer, default=0)
+    total_messages = db.Column(db.Integer, default=0)
+    contributions = db.Column(db.Integer, default=0)
+    resume_views = db.Column(db.Integer, default=0)
+    programs_views = db.Column(db.Integer, default=0)
+    headquarters_views = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('candidate_id', 'hour', name='unique_candidate_analytics_hour'),
+    )
+    
+    def __repr__(self):
+        return f'<AnalyticsHourly {self.candidate_id} {self.hour}>'
+
+
+class CandidateCounter(db.Model):
+    """
+    شمارنده‌های denormalized هر نماینده (پیام‌ها، برنامه‌ها، دفاتر، مشارکت‌ها)
+    
+    با رویدادهای ORM در همان تراکنش تغییر ردیف‌ها به‌روز می‌شوند (database/counters.py)
+    و داشبوردها به‌جای COUNT روی جدول‌های اصلی چند ردیف از این جدول را می‌خوانند.
+    """
+    __tablename__ = 'candidate_counters'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('candidates.id'), nullable=False)
+    name = db.Column(db.String(50), nullable=False)  # messages, messages_unread, messages:2026-10, contributions:pending, ...
+    value = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('candidate_id', 'name', name='unique_candidate_counter'),
+    )
+    
+    def __repr__(self):
+        return f'<CandidateCounter {self.candidate_id} {self.name}={self.value}>'
+
+
 class CandidateImage(db.Model):
     """تصاویر نماینده"""
     __tablename__ = 'candidate_images'
@@ -496,6 +559,10 @@ class ScheduledPost(db.Model):
     disable_notification = db.Column(db.Boolean, default=False)
     pin_message = db.Column(db.Boolean, default=False)
     
+    # lease نود ارسال‌کننده (اجرای زمان‌بند روی چند سرور)
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    
     # روابط
     candidate = db.relationship('Candidate', backref='scheduled_posts')
     
@@ -549,6 +616,11 @@ class BroadcastMessage(db.Model):
     total_users = db.Column(db.Integer, default=0)
     sent_count = db.Column(db.Integer, default=0)
     failed_count = db.Column(db.Integer, default=0)
+    # آخرین BotUser.id ارسال‌شده؛ ادامه ارسال پس از ری‌استارت از همین نقطه
+    last_user_id = db.Column(db.Integer, default=0)
+    # lease نود ارسال‌کننده (اجرای زمان‌بند روی چند سرور)
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
     
     # زمان‌ها
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -585,6 +657,80 @@ class BroadcastLog(db.Model):
         return f'<BroadcastLog {self.broadcast_id} - {self.user_telegram_id}>'
 
 
+class MediaCache(db.Model):
+    """file_id رسانه‌های آپلودشده در تلگرام به ازای هر بات"""
+    __tablename__ = 'media_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    bot_instance_id = db.Column(db.Integer, db.ForeignKey('bot_instances.id'), nullable=False)
+    media_hash = db.Column(db.String(64), nullable=False)  # sha256 نوع رسانه + آدرس
+    media_type = db.Column(db.String(20), nullable=False)  # photo, video, document
+    media_url = db.Column(db.String(500))
+    file_id = db.Column(db.String(255), nullable=False)
+    
+    # زمان
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('bot_instance_id', 'media_hash', name='unique_bot_media'),
+    )
+    
+    def __repr__(self):
+        return f'<MediaCache {self.bot_instance_id} - {self.media_type}>'
+
+
+class AdminBroadcast(db.Model):
+    """ارسال پیام ادمین به نماینده‌ها از طریق بات اصلی (در پس‌زمینه)"""
+    __tablename__ = 'admin_broadcasts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # محتوای پیام
+    message_type = db.Column(db.String(20), default='text')  # text, photo, document
+    message_text = db.Column(db.Text)
+    file_path = db.Column(db.String(500))  # فایل آپلودشده ادمین
+    file_name = db.Column(db.String(255))
+    # file_id تلگرام پس از اولین آپلود؛ ادامه ارسال روی نود دیگر به فایل محلی نیاز ندارد
+    file_id = db.Column(db.String(255))
+    
+    # گیرندگان (لیست JSON شناسه‌های تلگرام به ترتیب ارسال)
+    recipients = db.Column(db.Text, nullable=False)
+    
+    # وضعیت
+    status = db.Column(db.String(20), default='pending')  # pending, sending, completed, failed
+    total_users = db.Column(db.Integer, default=0)
+    sent_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    # تعداد گیرندگان ابتدای لیست که ارسالشان قطعی شده؛ ادامه پس از ری‌استارت
+    processed_count = db.Column(db.Integer, default=0)
+    error_message = db.Column(db.Text)
+    
+    # lease نود ارسال‌کننده (اجرای زمان‌بند روی چند سرور)
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    
+    # زمان‌ها
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    
+    def progress(self):
+        """وضعیت پیشرفت برای endpoint پنل ادمین"""
+        done = (self.sent_count or 0) + (self.failed_count or 0)
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total_users': self.total_users or 0,
+            'sent_count': self.sent_count or 0,
+            'failed_count': self.failed_count or 0,
+            'percent': round(done / self.total_users * 100, 1) if self.total_users else 0,
+            'error_message': self.error_message,
+        }
+    
+    def __repr__(self):
+        return f'<AdminBroadcast {self.id} - {self.status}>'
+
+
 class Poll(db.Model):
     """نظرسنجی‌ها"""
     __tablename__ = 'polls'
@@ -1256,6 +1402,10 @@ class LiveEvent(db.Model):
     reminder_1hour_sent = db.Column(db.Boolean, default=False)
     starting_notice_sent = db.Column(db.Boolean, default=False)
     
+    # lease نود ارسال‌کننده یادآوری‌ها (اجرای زمان‌بند روی چند سرور)
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # رابطه
@@ -1302,6 +1452,27 @@ class EventRegistration(db.Model):
         return f'<EventRegistration {self.event_id} {self.citizen_telegram_id}>'
 
 
+class EventReminderLog(db.Model):
+    """لاگ ارسال یادآوری هر مرحله به هر ثبت‌نام رویداد"""
+    __tablename__ = 'event_reminder_logs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('live_events.id'), nullable=False, index=True)
+    registration_id = db.Column(db.Integer, db.ForeignKey('event_registrations.id'), nullable=False)
+    stage = db.Column(db.String(20), nullable=False)  # 1day, 1hour, starting
+    
+    status = db.Column(db.String(20))  # sent, failed
+    error_message = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.UniqueConstraint('registration_id', 'stage', name='unique_registration_reminder'),
+    )
+    
+    def __repr__(self):
+        return f'<EventReminderLog {self.registration_id} - {self.stage}>'
+
+
 class EventQuestion(db.Model):
     """سوالات شهروندان در رویدادها"""
     __tablename__ = 'event_questions'
@@ -1793,4 +1964,6 @@ class Leaderboard(db.Model):
         return f'<Leaderboard rank={self.rank} user={self.bot_user_id}>'
 
 
-
+# نگهداری candidate_counters و کش پلن فعال با رویدادهای ORM (پس از تعریف همه مدل‌ها)
+import database.counters  # noqa: E402,F401
+import database.entitlements  # noqa: E402,F401
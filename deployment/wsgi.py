@@ -3,19 +3,21 @@ WSGI Entry Point برای دیپلوی Production
 """
 import os
 import sys
+import atexit
 from threading import Thread
 import time
 
 # Add the current directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, redirect
+from flask import Flask, redirect, request, jsonify
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 from werkzeug.serving import run_simple
 
 # Import both panels
 from admin_panel.app import app as admin_app
 from candidate_panel.app import app as candidate_app
+from config.settings import WEBHOOK_PATH
 
 # Create main app
 main_app = Flask(__name__)
@@ -78,6 +80,22 @@ def index():
     </html>
     """
 
+@main_app.route(f'{WEBHOOK_PATH}/<path_secret>', methods=['POST'])
+def telegram_webhook(path_secret):
+    """endpoint مشترک webhook برای همه بات‌ها (هر بات با مسیر مخفی خودش)"""
+    from bot_engine.bot_runtime import bot_runtime
+    
+    payload = request.get_json(silent=True)
+    if not payload:
+        return jsonify({'ok': False}), 400
+    
+    status = bot_runtime.feed_webhook_update(
+        path_secret,
+        payload,
+        request.headers.get('X-Telegram-Bot-Api-Secret-Token')
+    )
+    return jsonify({'ok': status == 200}), status
+
 # Combine apps with URL prefixes
 app = DispatcherMiddleware(main_app, {
     '/admin': admin_app,
@@ -85,45 +103,51 @@ app = DispatcherMiddleware(main_app, {
 })
 
 def run_bots_in_background():
-    """راه‌اندازی بات‌ها در بک‌گراند"""
+    """راه‌اندازی بات‌ها در بک‌گراند روی runtime مشترک"""
     time.sleep(15)  # صبر تا سرور کاملاً آماده بشه
     
     try:
         from database.models import BotInstance
-        from sqlalchemy import create_engine
         from sqlalchemy.orm import sessionmaker
-        from config.settings import DATABASE_URI
-        from bot_engine.telegram_bot import run_bot
+        from database.engine import get_engine
+        from bot_engine.bot_runtime import bot_runtime
         
         print("🤖 در حال راه‌اندازی بات‌ها...")
         
-        engine = create_engine(DATABASE_URI, pool_pre_ping=True, pool_recycle=3600)
-        Session = sessionmaker(bind=engine)
+        Session = sessionmaker(bind=get_engine())
         session = Session()
         
         try:
-            active_bots = session.query(BotInstance).filter_by(is_active=True).all()
-            
-            for bot in active_bots:
-                print(f"🚀 راه‌اندازی بات @{bot.bot_username}...")
-                bot_thread = Thread(target=run_bot, args=(bot.id,), daemon=True)
-                bot_thread.start()
-                time.sleep(3)
-            
-            if active_bots:
-                print(f"✅ {len(active_bots)} بات راه‌اندازی شد")
-            else:
-                print("ℹ️  هیچ بات فعالی برای راه‌اندازی وجود ندارد")
+            active_bot_ids = [
+                bot_id for (bot_id,) in session.query(BotInstance.id).filter_by(is_active=True).all()
+            ]
         finally:
             session.close()
+        
+        started = 0
+        for bot_id in active_bot_ids:
+            print(f"🚀 راه‌اندازی بات {bot_id}...")
+            if bot_runtime.add_bot(bot_id):
+                started += 1
+        
+        if active_bot_ids:
+            print(f"✅ {started}/{len(active_bot_ids)} بات راه‌اندازی شد")
+        else:
+            print("ℹ️  هیچ بات فعالی برای راه‌اندازی وجود ندارد")
     except Exception as e:
         print(f"❌ خطا در راه‌اندازی بات‌ها: {e}")
         import traceback
         traceback.print_exc()
 
+def shutdown_bots():
+    """توقف graceful بات‌ها هنگام خروج worker (redeploy)"""
+    from bot_engine.bot_runtime import bot_runtime
+    bot_runtime.shutdown()
+
 # Start bots in background
 bots_thread = Thread(target=run_bots_in_background, daemon=True)
 bots_thread.start()
+atexit.register(shutdown_bots)
 
 if __name__ == '__main__':
     # For local testing
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+بنچمارک تأخیر handlerهای بات زیر آپدیت‌های همزمان
+Bot handler latency benchmark under concurrent updates
+
+تعدادی آپدیت همزمان (ترکیب handlerهای دارای کوئری و بدون کوئری) روی یک
+event loop اجرا و p50/p99 تأخیر هر handler گزارش می‌شود؛ یک بار با
+کوئری‌های blocking روی loop (inline) و یک بار با run_db (offload).
+
+استفاده:
+    python load_tests/bot_handler_benchmark.py --updates 200 --query-delay 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# دیتابیس موقت - باید پیش از import بات تنظیم شود
+_DB_FILE = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_DB_FILE}'
+
+from sqlalchemy import event  # noqa: E402
+
+from database.models import db, Candidate, BotInstance  # noqa: E402
+from bot_engine import telegram_bot  # noqa: E402
+from bot_engine.db_executor import run_db  # noqa: E402
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.message = self
+
+    async def answer(self):
+        return None
+
+    async def edit_message_text(self, *args, **kwargs):
+        return None
+
+    async def reply_text(self, *args, **kwargs):
+        return None
+
+
+def make_callback(data):
+    update = SimpleNamespace(
+        callback_query=FakeQuery(data),
+        effective_user=SimpleNamespace(id=1, username='u', first_name='U', last_name=None),
+        message=None
+    )
+    context = SimpleNamespace(bot_data={'bot_instance_id': 1}, user_data={})
+    return update, context
+
+
+def setup_database(query_delay: float):
+    """ساخت جداول و داده نمونه؛ هر کوئری query_delay ثانیه کند می‌شود"""
+    db.metadata.create_all(telegram_bot.engine)
+
+    session = telegram_bot.Session()
+    candidate = Candidate(username='bench', password='x', full_name='Bench', phone='0912')
+    session.add(candidate)
+    session.commit()
+    session.add(BotInstance(candidate_id=candidate.id, bot_token='1:bench', bot_username='bench_bot'))
+    session.commit()
+    session.close()
+
+    @event.listens_for(telegram_bot.engine, 'before_cursor_execute')
+    def slow_query(*args):
+        time.sleep(query_delay)
+
+
+async def run_round(updates: int):
+    """
+    اجرای همزمان آپدیت‌ها و برگرداندن تأخیر هر handler (میلی‌ثانیه)
+
+    همه آپدیت‌ها در یک لحظه می‌رسند؛ تأخیر از لحظه رسیدن تا پایان handler
+    اندازه‌گیری می‌شود (همان چیزی که کاربر تجربه می‌کند).
+    """
+    latencies = {'db': [], 'no_db': []}
+    arrived = time.perf_counter()
+
+    async def one(i):
+        # نیمی از آپدیت‌ها کوئری دارند (send_message)، نیمی ندارند (track_by_code)
+        kind = 'db' if i % 2 == 0 else 'no_db'
+        update, context = make_callback('send_message' if kind == 'db' else 'track_by_code')
+        await telegram_bot.button_callback(update, context)
+        latencies[kind].append((time.perf_counter() - arrived) * 1000)
+
+    await asyncio.gather(*(one(i) for i in range(updates)))
+    return latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(mode, latencies):
+    print(f"\n[{mode}]")
+    for kind, values in latencies.items():
+        print(
+            f"  {kind:6s} n={len(values):4d}  p50={statistics.median(values):8.1f}ms  "
+            f"p99={percentile(values, 99):8.1f}ms  max={max(values):8.1f}ms"
+        )
+
+
+async def inline_run_db(func, *args, **kwargs):
+    """رفتار قبلی: اجرای مستقیم کوئری روی event loop"""
+    return func(*args, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bot handler latency benchmark')
+    parser.add_argument('--updates', type=int, default=200, help='تعداد آپدیت همزمان')
+    parser.add_argument('--query-delay', type=float, default=0.02, help='تأخیر مصنوعی هر کوئری (ثانیه)')
+    args = parser.parse_args()
+
+    setup_database(args.query_delay)
+
+    telegram_bot.run_db = inline_run_db
+    report('inline (blocking on loop)', asyncio.run(run_round(args.updates)))
+
+    telegram_bot.run_db = run_db
+    report('offload (run_db executor)', asyncio.run(run_round(args.updates)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+بنچمارک تعداد کوئری هر درخواست در پنل نماینده
+Candidate panel queries-per-request benchmark
+
+routeهای اصلی پنل با test client فلسک و یک نماینده لاگین‌شده صدا زده و
+کوئری‌های هر درخواست شمرده می‌شوند؛ یک بار با بارگذاری قبلی (Candidate.query.get
+با plans به صورت subquery و بدون نگهداری روی g) و یک بار با
+candidate_panel/request_context.
+
+استفاده:
+    python load_tests/panel_queries_benchmark.py --messages 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# دیتابیس موقت - باید پیش از import پنل تنظیم شود
+_DB_FILE = os.path.join(tempfile.mkdtemp(), 'panel_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_DB_FILE}'
+
+from flask import session  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from candidate_panel import app as panel  # noqa: E402
+from database.models import db, Candidate, Plan, PlanPurchase, Message  # noqa: E402
+from database.counters import get_counter, MESSAGES_UNREAD  # noqa: E402
+
+ROUTES = ['/dashboard', '/profile', '/resume', '/programs', '/headquarters',
+          '/messages', '/plans', '/polls', '/bot', '/contributions']
+
+
+def setup_database(messages: int) -> int:
+    """ساخت جداول و نماینده نمونه با پلن فعال و پیام؛ شناسه نماینده"""
+    with panel.app.app_context():
+        db.create_all()
+        plans = [
+            Plan(name=code, code=code, price=0, has_analytics=True)
+            for code in ('ANALYTICS', 'SURVEYS', 'MASS_BROADCAST')
+        ]
+        candidate = Candidate(username='bench', password='x', full_name='Bench', phone='0912')
+        candidate.plans.extend(plans)
+        db.session.add(candidate)
+        db.session.flush()
+        db.session.add(PlanPurchase(
+            candidate_id=candidate.id, plan_id=plans[0].id, payment_amount=0, is_active=True,
+            start_date=datetime.utcnow(), end_date=datetime.utcnow() + timedelta(days=30)
+        ))
+        db.session.add_all([
+            Message(candidate_id=candidate.id, user_telegram_id=str(i), message_text=f'پیام {i}', is_read=i % 3 == 0)
+            for i in range(messages)
+        ])
+        db.session.commit()
+        return candidate.id
+
+
+def legacy_loaders():
+    """بارگذاری پیش از request_context: هر فراخوانی مستقیم از دیتابیس/کش"""
+    def current_candidate(with_plans=False):
+        return Candidate.query.get(session['candidate_id'])
+
+    def current_plan_codes():
+        return {plan.code for plan in current_candidate().plans}
+
+    def current_active_plan():
+        return current_candidate().get_active_plan()
+
+    def current_unread():
+        return get_counter(session['candidate_id'], MESSAGES_UNREAD)
+
+    return {
+        'current_candidate': current_candidate,
+        'current_plan_codes': current_plan_codes,
+        'current_active_plan': current_active_plan,
+        'current_unread': current_unread,
+        'remember_unread': lambda count: count,
+    }
+
+
+def measure(candidate_id: int, rounds: int):
+    """میانگین تعداد کوئری و status هر route"""
+    counter = {'queries': 0}
+
+    with panel.app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(*args):
+        counter['queries'] += 1
+
+    client = panel.app.test_client()
+    with client.session_transaction() as client_session:
+        client_session['candidate_id'] = candidate_id
+
+    results = {}
+    try:
+        for route in ROUTES:
+            client.get(route)  # گرم کردن کش‌ها (entitlements، قالب‌ها)
+            counter['queries'] = 0
+            for _ in range(rounds):
+                response = client.get(route)
+            results[route] = (counter['queries'] / rounds, response.status_code)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_query)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Candidate panel queries-per-request benchmark')
+    parser.add_argument('--messages', type=int, default=200, help='تعداد پیام نماینده نمونه')
+    parser.add_argument('--rounds', type=int, default=5, help='تعداد درخواست به هر route')
+    args = parser.parse_args()
+
+    candidate_id = setup_database(args.messages)
+
+    current = {name: getattr(panel, name) for name in legacy_loaders()}
+    vars(panel).update(legacy_loaders())
+    before = measure(candidate_id, args.rounds)
+    vars(panel).update(current)
+    after = measure(candidate_id, args.rounds)
+
+    print(f"\n{'route':16s} {'before':>8s} {'after':>8s}  status")
+    for route in ROUTES:
+        (old, old_status), (new, new_status) = before[route], after[route]
+        print(f"{route:16s} {old:8.1f} {new:8.1f}  {old_status} -> {new_status}")
+    print(f"{'total':16s} {sum(v[0] for v in before.values()):8.1f} {sum(v[0] for v in after.values()):8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -56,12 +56,15 @@ class MessageRepository(BaseRepository):
         """علامت‌گذاری همه پیام‌ها به عنوان خوانده شده"""
         try:
             from database.models import db
+            from database.counters import adjust_counters, MESSAGES_UNREAD
             from utils.db_utils import safe_commit
             
             count = cls.model.query.filter_by(
                 candidate_id=candidate_id,
                 is_read=False
             ).update({'is_read': True, 'read_at': datetime.now()})
+            # update گروهی رویداد ORM ندارد
+            adjust_counters(db.session, candidate_id, {MESSAGES_UNREAD: -count})
             
             if safe_commit(db):
                 logger.info(f"Marked {count} messages as read for candidate {candidate_id}")
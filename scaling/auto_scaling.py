@@ -353,18 +353,27 @@ class CacheManager:
 # 6. DATABASE CONNECTION POOLING
 # ============================================================
 
+from config.settings import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+)
+
 class DatabasePoolConfig:
-    """تنظیمات connection pool"""
+    """
+    تنظیمات connection pool
+    
+    مقادیر از config.settings خوانده می‌شوند و database.engine.get_engine
+    همان‌ها را برای engine مشترک همه زیرسیستم‌ها استفاده می‌کند.
+    """
     
     # SQLAlchemy Pool Settings
-    SQLALCHEMY_POOL_SIZE = 20  # تعداد connectionهای permanent
-    SQLALCHEMY_MAX_OVERFLOW = 40  # تعداد اضافی در شرایط peak
-    SQLALCHEMY_POOL_TIMEOUT = 30  # timeout برای گرفتن connection
-    SQLALCHEMY_POOL_RECYCLE = 3600  # recycle بعد از 1 ساعت
-    SQLALCHEMY_POOL_PRE_PING = True  # بررسی سلامت قبل از استفاده
+    SQLALCHEMY_POOL_SIZE = DB_POOL_SIZE  # تعداد connectionهای permanent
+    SQLALCHEMY_MAX_OVERFLOW = DB_MAX_OVERFLOW  # تعداد اضافی در شرایط peak
+    SQLALCHEMY_POOL_TIMEOUT = DB_POOL_TIMEOUT  # timeout برای گرفتن connection
+    SQLALCHEMY_POOL_RECYCLE = DB_POOL_RECYCLE  # recycle بعد از 1 ساعت
+    SQLALCHEMY_POOL_PRE_PING = DB_POOL_PRE_PING  # بررسی سلامت قبل از استفاده
     
     # برای Production با PostgreSQL
     @staticmethod
     def get_database_url():
-        """ساخت URL با pooling"""
-        return f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT', 5432)}/{os.getenv('DB_NAME')}?pool_size=20&max_overflow=40"
+        """ساخت URL (تنظیمات pool جداگانه توسط database.engine اعمال می‌شود)"""
+        return f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT', 5432)}/{os.getenv('DB_NAME')}"
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Migration: ایجاد جدول admin_broadcasts (ارسال پیام ادمین در پس‌زمینه)
+"""
+import sqlite3
+import os
+
+# مسیر دیتابیس
+db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'election_bot.db')
+print(f"📂 مسیر دیتابیس: {db_path}")
+
+conn = None
+try:
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    print("🔄 شروع Migration...")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS admin_broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_type VARCHAR(20) DEFAULT 'text',
+            message_text TEXT,
+            file_path VARCHAR(500),
+            file_name VARCHAR(255),
+            file_id VARCHAR(255),
+            recipients TEXT NOT NULL,
+            status VARCHAR(20) DEFAULT 'pending',
+            total_users INTEGER DEFAULT 0,
+            sent_count INTEGER DEFAULT 0,
+            failed_count INTEGER DEFAULT 0,
+            processed_count INTEGER DEFAULT 0,
+            error_message TEXT,
+            lease_owner VARCHAR(100),
+            lease_expires_at DATETIME,
+            created_at DATETIME,
+            started_at DATETIME,
+            completed_at DATETIME
+        )
+    """)
+    print("✅ جدول 'admin_broadcasts' ساخته شد")
+
+    cursor.execute("PRAGMA table_info(admin_broadcasts)")
+    if 'file_id' in {row[1] for row in cursor.fetchall()}:
+        print("⏭️  ستون 'file_id' از قبل وجود دارد")
+    else:
+        cursor.execute("ALTER TABLE admin_broadcasts ADD COLUMN file_id VARCHAR(255)")
+        print("✅ ستون 'file_id' اضافه شد")
+
+    conn.commit()
+    print("\n✨ Migration با موفقیت انجام شد!")
+
+except Exception as e:
+    print(f"❌ خطا: {e}")
+    if conn:
+        conn.rollback()
+finally:
+    if conn:
+        conn.close()
+
+print("\n📊 جدول جدید:")
+print("- admin_broadcasts: صف ارسال پیام ادمین به نماینده‌ها با شمارنده‌های پیشرفت")
+print("- file_id: رسانه پیوست پس از اولین آپلود فقط با file_id ارسال می‌شود")
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Migration: ستون‌های جدید analytics، یکتایی (نماینده، روز) و جدول ساعتی analytics_hourly
+"""
+import sqlite3
+import os
+
+# مسیر دیتابیس
+db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'election_bot.db')
+print(f"📂 مسیر دیتابیس: {db_path}")
+
+NEW_COLUMNS = [
+    ('total_interactions', 'INTEGER DEFAULT 0'),
+    ('contributions', 'INTEGER DEFAULT 0'),
+]
+
+conn = None
+try:
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    print("🔄 شروع Migration...")
+
+    cursor.execute("PRAGMA table_info(analytics)")
+    existing = {row[1] for row in cursor.fetchall()}
+    if not existing:
+        print("⏭️  جدول 'analytics' وجود ندارد (با db.create_all ساخته می‌شود)")
+    else:
+        for name, definition in NEW_COLUMNS:
+            if name in existing:
+                print(f"⏭️  ستون '{name}' از قبل وجود دارد")
+                continue
+            cursor.execute(f"ALTER TABLE analytics ADD COLUMN {name} {definition}")
+            print(f"✅ ستون '{name}' اضافه شد")
+
+        # ردیف‌های تکراری یک روز (قبل از یکتایی) در قدیمی‌ترین ردیف جمع می‌شوند
+        cursor.execute("""
+            SELECT candidate_id, date, MIN(id) FROM analytics
+            GROUP BY candidate_id, date HAVING COUNT(*) > 1
+        """)
+        duplicates = cursor.fetchall()
+        for candidate_id, date, keep_id in duplicates:
+            cursor.execute("""
+                UPDATE analytics SET
+                    total_users = (SELECT MAX(total_users) FROM analytics WHERE candidate_id = ? AND date = ?),
+                    new_users = (SELECT SUM(new_users) FROM analytics WHERE candidate_id = ? AND date = ?),
+                    active_users = (SELECT SUM(active_users) FROM analytics WHERE candidate_id = ? AND date = ?),
+                    total_messages = (SELECT SUM(total_messages) FROM analytics WHERE candidate_id = ? AND date = ?),
+                    resume_views = (SELECT SUM(resume_views) FROM analytics WHERE candidate_id = ? AND date = ?),
+                    programs_views = (SELECT SUM(programs_views) FROM analytics WHERE candidate_id = ? AND date = ?),
+                    headquarters_views = (SELECT SUM(headquarters_views) FROM analytics WHERE candidate_id = ? AND date = ?)
+                WHERE id = ?
+            """, (candidate_id, date) * 7 + (keep_id,))
+            cursor.execute(
+                "DELETE FROM analytics WHERE candidate_id = ? AND date = ? AND id != ?",
+                (candidate_id, date, keep_id)
+            )
+        if duplicates:
+            print(f"✅ {len(duplicates)} روز تکراری ادغام شد")
+
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS unique_candidate_analytics_date
+            ON analytics (candidate_id, date)
+        """)
+        print("✅ ایندکس یکتای 'unique_candidate_analytics_date' ساخته شد")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_hourly (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            candidate_id INTEGER NOT NULL REFERENCES candidates(id),
+            hour DATETIME NOT NULL,
+            new_users INTEGER DEFAULT 0,
+            active_users INTEGER DEFAULT 0,
+            total_interactions INTEGER DEFAULT 0,
+            total_messages INTEGER DEFAULT 0,
+            contributions INTEGER DEFAULT 0,
+            resume_views INTEGER DEFAULT 0,
+            programs_views INTEGER DEFAULT 0,
+            headquarters_views INTEGER DEFAULT 0,
+            CONSTRAINT unique_candidate_analytics_hour UNIQUE (candidate_id, hour)
+        )
+    """)
+    print("✅ جدول 'analytics_hourly' ساخته شد")
+
+    conn.commit()
+    print("\n✨ Migration با موفقیت انجام شد!")
+
+except Exception as e:
+    print(f"❌ خطا: {e}")
+    if conn:
+        conn.rollback()
+finally:
+    if conn:
+        conn.close()
+
+print("\n📊 تغییرات:")
+print("- analytics: ستون‌های total_interactions و contributions و یک ردیف به ازای (نماینده، روز)")
+print("- analytics_hourly: آمار ساعتی هر نماینده")
+print("- هر دو جدول از رویدادهای بات با flush دسته‌ای پر می‌شوند (bot_engine/analytics_events.py)")
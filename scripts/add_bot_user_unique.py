@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Migration: یکتایی کاربر بات (bot_instance_id, telegram_id) در bot_users
+"""
+import sqlite3
+import os
+
+# مسیر دیتابیس
+db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'election_bot.db')
+print(f"📂 مسیر دیتابیس: {db_path}")
+
+# جدول‌های گیمیفیکیشن که به bot_users.id ارجاع می‌دهند
+REFERENCING_TABLES = ['user_badges', 'user_points', 'leaderboards']
+
+conn = None
+try:
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    print("🔄 شروع Migration...")
+
+    cursor.execute("PRAGMA table_info(bot_users)")
+    if not cursor.fetchall():
+        print("⏭️  جدول 'bot_users' وجود ندارد (با db.create_all ساخته می‌شود)")
+    else:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {row[0] for row in cursor.fetchall()}
+
+        # کاربران تکراری (ثبت همزمان /start و flush) در قدیمی‌ترین ردیف ادغام می‌شوند
+        cursor.execute("""
+            SELECT bot_instance_id, telegram_id, MIN(id) FROM bot_users
+            GROUP BY bot_instance_id, telegram_id HAVING COUNT(*) > 1
+        """)
+        duplicates = cursor.fetchall()
+        for bot_instance_id, telegram_id, keep_id in duplicates:
+            cursor.execute("""
+                UPDATE bot_users SET
+                    total_points = (SELECT SUM(total_points) FROM bot_users WHERE bot_instance_id = ? AND telegram_id = ?),
+                    level = (SELECT MAX(level) FROM bot_users WHERE bot_instance_id = ? AND telegram_id = ?),
+                    streak_days = (SELECT MAX(streak_days) FROM bot_users WHERE bot_instance_id = ? AND telegram_id = ?),
+                    last_daily_login = (SELECT MAX(last_daily_login) FROM bot_users WHERE bot_instance_id = ? AND telegram_id = ?),
+                    joined_at = (SELECT MIN(joined_at) FROM bot_users WHERE bot_instance_id = ? AND telegram_id = ?),
+                    last_interaction = (SELECT MAX(last_interaction) FROM bot_users WHERE bot_instance_id = ? AND telegram_id = ?)
+                WHERE id = ?
+            """, (bot_instance_id, telegram_id) * 6 + (keep_id,))
+            for table in REFERENCING_TABLES:
+                if table not in tables:
+                    continue
+                cursor.execute(f"""
+                    UPDATE {table} SET bot_user_id = ?
+                    WHERE bot_user_id IN (
+                        SELECT id FROM bot_users WHERE bot_instance_id = ? AND telegram_id = ? AND id != ?
+                    )
+                """, (keep_id, bot_instance_id, telegram_id, keep_id))
+            cursor.execute(
+                "DELETE FROM bot_users WHERE bot_instance_id = ? AND telegram_id = ? AND id != ?",
+                (bot_instance_id, telegram_id, keep_id)
+            )
+        if duplicates:
+            print(f"✅ {len(duplicates)} کاربر تکراری ادغام شد")
+
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS unique_bot_user
+            ON bot_users (bot_instance_id, telegram_id)
+        """)
+        print("✅ ایندکس یکتای 'unique_bot_user' ساخته شد")
+
+    conn.commit()
+    print("\n✨ Migration با موفقیت انجام شد!")
+
+except Exception as e:
+    print(f"❌ خطا: {e}")
+    if conn:
+        conn.rollback()
+finally:
+    if conn:
+        conn.close()
+
+print("\n📊 تغییرات:")
+print("- bot_users: یک ردیف به ازای (بات، کاربر تلگرام)؛ امتیازها و نشان‌های تکراری‌ها منتقل شد")
+print("- ثبت کاربر با INSERT ... ON CONFLICT DO NOTHING (bot_engine/user_activity.py)")
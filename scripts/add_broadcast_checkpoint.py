@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Migration: اضافه کردن cursor ادامه ارسال به broadcast_messages
+"""
+import sqlite3
+import os
+
+# مسیر دیتابیس
+db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'election_bot.db')
+print(f"📂 مسیر دیتابیس: {db_path}")
+
+conn = None
+try:
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    print("🔄 شروع Migration...")
+
+    try:
+        cursor.execute("ALTER TABLE broadcast_messages ADD COLUMN last_user_id INTEGER DEFAULT 0")
+        print("✅ فیلد 'last_user_id' اضافه شد")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" in str(e):
+            print("⏭️  فیلد 'last_user_id' از قبل موجود است")
+        else:
+            print(f"❌ خطا در 'last_user_id': {e}")
+
+    # برای پیمایش ترتیبی گیرندگان بر اساس id
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bot_users_bot_id ON bot_users(bot_instance_id, id)"
+    )
+    print("✅ Index 'idx_bot_users_bot_id' ساخته شد")
+
+    conn.commit()
+    print("\n✨ Migration با موفقیت انجام شد!")
+
+except Exception as e:
+    print(f"❌ خطا: {e}")
+    if conn:
+        conn.rollback()
+finally:
+    if conn:
+        conn.close()
+
+print("\n📊 فیلدهای جدید:")
+print("- last_user_id: آخرین BotUser.id که ارسال به آن ثبت شده (ادامه پس از ری‌استارت)")
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Migration: جدول شمارنده‌های denormalized نماینده‌ها (candidate_counters)
+"""
+import sqlite3
+import os
+
+# مسیر دیتابیس
+db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'election_bot.db')
+print(f"📂 مسیر دیتابیس: {db_path}")
+
+# مقدار اولیه شمارنده‌ها از جدول‌های اصلی (همان تعریف database/counters.py)
+INITIAL_COUNTERS = [
+    ("messages", "SELECT candidate_id, 'messages', COUNT(*) FROM messages GROUP BY candidate_id"),
+    ("messages_unread", "SELECT candidate_id, 'messages_unread', COUNT(*) FROM messages WHERE is_read = 0 GROUP BY candidate_id"),
+    ("messages:<ماه جاری>", """
+        SELECT candidate_id, 'messages:' || strftime('%Y-%m', 'now'), COUNT(*) FROM messages
+        WHERE created_at >= strftime('%Y-%m-01 00:00:00', 'now') GROUP BY candidate_id
+    """),
+    ("programs", "SELECT candidate_id, 'programs', COUNT(*) FROM programs GROUP BY candidate_id"),
+    ("headquarters", "SELECT candidate_id, 'headquarters', COUNT(*) FROM headquarters GROUP BY candidate_id"),
+    ("contributions", "SELECT candidate_id, 'contributions', COUNT(*) FROM citizen_contributions GROUP BY candidate_id"),
+    ("contributions:<وضعیت>", """
+        SELECT candidate_id, 'contributions:' || status, COUNT(*) FROM citizen_contributions
+        WHERE status IS NOT NULL GROUP BY candidate_id, status
+    """),
+]
+
+conn = None
+try:
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    print("🔄 شروع Migration...")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS candidate_counters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            candidate_id INTEGER NOT NULL REFERENCES candidates(id),
+            name VARCHAR(50) NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME,
+            CONSTRAINT unique_candidate_counter UNIQUE (candidate_id, name)
+        )
+    """)
+    print("✅ جدول 'candidate_counters' ساخته شد")
+
+    for name, select in INITIAL_COUNTERS:
+        try:
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO candidate_counters (candidate_id, name, value, updated_at)
+                SELECT *, CURRENT_TIMESTAMP FROM ({select})
+            """)
+            print(f"✅ شمارنده '{name}' مقداردهی شد ({cursor.rowcount} نماینده)")
+        except sqlite3.OperationalError as e:
+            # جدول اصلی هنوز ساخته نشده
+            print(f"⏭️  شمارنده '{name}': {e}")
+
+    conn.commit()
+    print("\n✨ Migration با موفقیت انجام شد!")
+
+except Exception as e:
+    print(f"❌ خطا: {e}")
+    if conn:
+        conn.rollback()
+finally:
+    if conn:
+        conn.close()
+
+print("\n📊 تغییرات:")
+print("- candidate_counters: شمارنده پیام‌ها، برنامه‌ها، دفاتر و مشارکت‌های هر نماینده")
+print("- اصلاح دستی اختلاف‌ها: python scripts/reconcile_counters.py")
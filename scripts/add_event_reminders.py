@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Migration: جدول لاگ یادآوری رویدادها و lease رویدادهای زنده
+"""
+import sqlite3
+import os
+
+# مسیر دیتابیس
+db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'election_bot.db')
+print(f"📂 مسیر دیتابیس: {db_path}")
+
+conn = None
+try:
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    print("🔄 شروع Migration...")
+
+    for column, column_type in (('lease_owner', 'VARCHAR(100)'), ('lease_expires_at', 'DATETIME')):
+        try:
+            cursor.execute(f"ALTER TABLE live_events ADD COLUMN {column} {column_type}")
+            print(f"✅ فیلد '{column}' اضافه شد")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e):
+                print(f"⏭️  فیلد '{column}' از قبل موجود است")
+            else:
+                print(f"❌ خطا در '{column}': {e}")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS event_reminder_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL REFERENCES live_events(id),
+            registration_id INTEGER NOT NULL REFERENCES event_registrations(id),
+            stage VARCHAR(20) NOT NULL,
+            status VARCHAR(20),
+            error_message TEXT,
+            sent_at DATETIME,
+            CONSTRAINT unique_registration_reminder UNIQUE (registration_id, stage)
+        )
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS ix_event_reminder_logs_event_id ON event_reminder_logs(event_id)"
+    )
+    print("✅ جدول 'event_reminder_logs' ساخته شد")
+
+    # برای پیمایش ترتیبی ثبت‌نام‌های هر رویداد
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_event_registrations_event_id ON event_registrations(event_id, id)"
+    )
+    print("✅ Index 'idx_event_registrations_event_id' ساخته شد")
+
+    conn.commit()
+    print("\n✨ Migration با موفقیت انجام شد!")
+
+except Exception as e:
+    print(f"❌ خطا: {e}")
+    if conn:
+        conn.rollback()
+finally:
+    if conn:
+        conn.close()
+
+print("\n📊 تغییرات:")
+print("- event_reminder_logs: نتیجه ارسال هر مرحله یادآوری به هر ثبت‌نام")
+print("- live_events.lease_owner / lease_expires_at: ارسال یادآوری فقط روی یک نود")
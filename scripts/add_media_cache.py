@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Migration: ایجاد جدول کش file_id رسانه‌ها (media_cache)
+"""
+import sqlite3
+import os
+
+# مسیر دیتابیس
+db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'election_bot.db')
+print(f"📂 مسیر دیتابیس: {db_path}")
+
+conn = None
+try:
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    print("🔄 شروع Migration...")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS media_cache (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bot_instance_id INTEGER NOT NULL,
+        media_hash VARCHAR(64) NOT NULL,
+        media_type VARCHAR(20) NOT NULL,
+        media_url VARCHAR(500),
+        file_id VARCHAR(255) NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (bot_instance_id) REFERENCES bot_instances(id),
+        CONSTRAINT unique_bot_media UNIQUE (bot_instance_id, media_hash)
+    )
+    """)
+    print("✅ جدول media_cache ایجاد شد")
+
+    conn.commit()
+    print("\n✨ Migration با موفقیت انجام شد!")
+
+except Exception as e:
+    print(f"❌ خطا: {e}")
+    if conn:
+        conn.rollback()
+finally:
+    if conn:
+        conn.close()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Migration: اضافه کردن ستون‌های lease برای اجرای زمان‌بندها روی چند سرور
+"""
+import sqlite3
+import os
+
+# مسیر دیتابیس
+db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'election_bot.db')
+print(f"📂 مسیر دیتابیس: {db_path}")
+
+conn = None
+try:
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    print("🔄 شروع Migration...")
+
+    migrations = [
+        ("broadcast_messages", "lease_owner", "VARCHAR(100)"),
+        ("broadcast_messages", "lease_expires_at", "DATETIME"),
+        ("scheduled_posts", "lease_owner", "VARCHAR(100)"),
+        ("scheduled_posts", "lease_expires_at", "DATETIME"),
+    ]
+
+    for table, field_name, field_type in migrations:
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {field_name} {field_type}")
+            print(f"✅ فیلد '{field_name}' به {table} اضافه شد")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e):
+                print(f"⏭️  فیلد '{field_name}' در {table} از قبل موجود است")
+            else:
+                print(f"❌ خطا در '{field_name}': {e}")
+
+    conn.commit()
+    print("\n✨ Migration با موفقیت انجام شد!")
+
+except Exception as e:
+    print(f"❌ خطا: {e}")
+    if conn:
+        conn.rollback()
+finally:
+    if conn:
+        conn.close()
+
+print("\n📊 فیلدهای جدید:")
+print("- lease_owner: شناسه نودی که در حال ارسال است")
+print("- lease_expires_at: انقضای lease؛ پس از آن نود دیگری ادامه می‌دهد")
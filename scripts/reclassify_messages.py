@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+دسته‌بندی و تحلیل احساس دوباره پیام‌های ذخیره‌شده
+=================================================
+پیام‌ها به ترتیب id در دسته‌های --chunk تایی خوانده می‌شوند و هر دسته با
+batch_categorize / batch_analyze (در حالت --ml با batchهای --batch-size تایی
+مدل) پردازش و با یک bulk update ذخیره می‌شود؛ اجرای متوقف‌شده با
+--after-id از همان‌جا ادامه می‌یابد.
+
+مثال:
+    python scripts/reclassify_messages.py --missing-only
+    python scripts/reclassify_messages.py --ml --batch-size 64 --candidate-id 12
+"""
+import sys
+import os
+import time
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Message
+from database.engine import get_engine
+from ai_services.message_categorization import MessageCategorizer
+from ai_services.sentiment_analyzer import SentimentAnalyzer
+from ai_services.inference import ML_BATCH_SIZE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def reclassify_messages(session, categorizer, analyzer, chunk_size=1000, batch_size=ML_BATCH_SIZE,
+                        candidate_id=None, missing_only=False, after_id=0):
+    """
+    پردازش دوباره پیام‌ها
+
+    Returns:
+        tuple: (تعداد پیام پردازش‌شده، آخرین id)
+    """
+    processed = 0
+    while True:
+        query = session.query(Message.id, Message.message_text).filter(Message.id > after_id)
+        if candidate_id is not None:
+            query = query.filter(Message.candidate_id == candidate_id)
+        if missing_only:
+            query = query.filter(Message.category.is_(None))
+        rows = query.order_by(Message.id).limit(chunk_size).all()
+        if not rows:
+            break
+
+        texts = [row.message_text for row in rows]
+        categories = categorizer.batch_categorize(texts, batch_size)
+        sentiments = analyzer.batch_analyze(texts, batch_size)
+
+        session.bulk_update_mappings(Message, [
+            {
+                'id': row.id,
+                'category': category['category'],
+                'category_fa': category['category_fa'],
+                'category_confidence': category['confidence'],
+                'category_priority': category['priority'],
+                'sentiment_score': sentiment['score'],
+                'sentiment_label': sentiment['label'],
+            }
+            for row, category, sentiment in zip(rows, categories, sentiments)
+        ])
+        session.commit()
+
+        processed += len(rows)
+        after_id = rows[-1].id
+        logger.info(f"✅ {processed} پیام پردازش شد (آخرین id: {after_id})")
+
+    return processed, after_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="دسته‌بندی و تحلیل احساس دوباره پیام‌ها")
+    parser.add_argument('--ml', action='store_true', help="استفاده از مدل‌های transformers")
+    parser.add_argument('--chunk', type=int, default=1000, help="تعداد پیام در هر تراکنش")
+    parser.add_argument('--batch-size', type=int, default=ML_BATCH_SIZE, help="تعداد متن در هر batch مدل")
+    parser.add_argument('--candidate-id', type=int, help="فقط پیام‌های این نماینده")
+    parser.add_argument('--missing-only', action='store_true', help="فقط پیام‌های بدون دسته")
+    parser.add_argument('--after-id', type=int, default=0, help="ادامه از بعد از این id")
+    args = parser.parse_args()
+
+    categorizer = MessageCategorizer(use_ml=args.ml)
+    analyzer = SentimentAnalyzer(use_ml=args.ml)
+
+    session = sessionmaker(bind=get_engine())()
+    started = time.perf_counter()
+    try:
+        processed, last_id = reclassify_messages(
+            session, categorizer, analyzer, args.chunk, args.batch_size,
+            args.candidate_id, args.missing_only, args.after_id
+        )
+    except KeyboardInterrupt:
+        session.rollback()
+        logger.warning("⚠️ متوقف شد؛ برای ادامه از --after-id با آخرین id گزارش‌شده استفاده کنید")
+        return
+    finally:
+        session.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"🎉 {processed} پیام در {elapsed:.1f} ثانیه پردازش شد (آخرین id: {last_id})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+اصلاح شمارنده‌های candidate_counters با مقدار واقعی جدول‌ها
+
+زمان‌بند broadcast همین کار را هر COUNTER_RECONCILE_INTERVAL دقیقه انجام می‌دهد؛
+این اسکریپت برای اجرای دستی (مثلاً پس از تغییرات مستقیم دیتابیس) است.
+
+مثال:
+    python scripts/reconcile_counters.py
+    python scripts/reconcile_counters.py 12 15
+"""
+import sys
+import os
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.counters import run_reconciliation
+
+logging.basicConfig(level=logging.INFO)
+
+
+if __name__ == "__main__":
+    candidate_ids = [int(arg) for arg in sys.argv[1:]] or None
+    fixed = run_reconciliation(candidate_ids)
+    print(f"✅ {fixed} شمارنده اصلاح شد")
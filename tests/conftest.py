@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+fixtureهای مشترک تست‌ها
+Shared Test Fixtures
+"""
+
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.models import db
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """
+    سازنده دیتابیس sqlite موقت فقط با جدول‌های لازم هر تست
+
+    factory = sqlite_db(BotUser, candidate_plans) یک sessionmaker برمی‌گرداند؛
+    engine آن در factory.kw['bind'] است و پس از تست بسته می‌شود.
+    """
+    engines = []
+
+    def create(*models):
+        engine = create_engine(f"sqlite:///{tmp_path / f'test_{len(engines)}.db'}")
+        engines.append(engine)
+        db.metadata.create_all(engine, tables=[getattr(model, '__table__', model) for model in models])
+        return sessionmaker(bind=engine)
+
+    yield create
+    for engine in engines:
+        engine.dispose()
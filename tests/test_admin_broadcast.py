@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های ارسال پیام ادمین در پس‌زمینه
+Admin Broadcast Tests
+"""
+
+import pytest
+import sys
+import os
+import json
+import asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import AdminBroadcast
+from bot_engine import admin_broadcast
+from bot_engine.admin_broadcast import create_admin_broadcast
+from bot_engine.broadcast_engine import build_send_request
+
+
+@pytest.fixture
+def session_factory(sqlite_db, monkeypatch):
+    """دیتابیس موقت برای توابع دیتابیسی ارسال ادمین"""
+    factory = sqlite_db(AdminBroadcast)
+    monkeypatch.setattr(admin_broadcast, 'SessionFactory', factory)
+    return factory
+
+
+def test_create_requires_file_for_media(session_factory):
+    """پیام عکس/فایل بدون فایل و نوع پیام ناشناخته در صف ثبت نمی‌شوند"""
+    session = session_factory()
+    with pytest.raises(ValueError):
+        create_admin_broadcast(session, [1, 2], 'photo', 'caption')
+    with pytest.raises(ValueError):
+        create_admin_broadcast(session, [1, 2], 'sticker', 'x')
+
+    job = create_admin_broadcast(session, [10, 20, 30], 'text', 'سلام')
+    session.commit()
+    assert job.status == 'pending'
+    assert job.total_users == 3
+    assert json.loads(job.recipients) == [10, 20, 30]
+    session.close()
+
+
+def test_progress_percent():
+    """درصد پیشرفت از مجموع ارسال‌های موفق و ناموفق"""
+    job = AdminBroadcast(id=1, status='sending', total_users=8, sent_count=3, failed_count=1)
+    assert job.progress()['percent'] == 50.0
+    assert AdminBroadcast(id=2, status='pending', total_users=0).progress()['percent'] == 0
+
+
+def test_resume_from_processed_count(session_factory):
+    """ارسال نیمه‌تمام از cursor و با همان شمارنده‌ها ادامه می‌یابد"""
+    session = session_factory()
+    job = create_admin_broadcast(session, [1, 2, 3, 4, 5], 'text', 'x')
+    session.commit()
+    job_id = job.id
+    session.close()
+
+    started = admin_broadcast._start_admin_broadcast(job_id, 60)
+    assert started['processed_count'] == 0
+    admin_broadcast._flush_admin_progress(job_id, {
+        'logs': [], 'sent_count': 2, 'failed_count': 1, 'last_user_id': 3
+    }, 60)
+    # توقف موتور: lease آزاد و وضعیت sending باقی می‌ماند
+    admin_broadcast._release_admin_broadcast(job_id)
+
+    resumed = admin_broadcast._start_admin_broadcast(job_id, 60)
+    assert resumed['processed_count'] == 3
+    assert (resumed['sent_count'], resumed['failed_count']) == (2, 1)
+
+    admin_broadcast._finish_admin_broadcast(job_id, 'completed', 4, 1)
+    session = session_factory()
+    job = session.query(AdminBroadcast).get(job_id)
+    assert job.status == 'completed'
+    assert job.processed_count == 5
+    assert job.lease_owner is None
+    session.close()
+
+
+def _photo_job(session_factory, file_path, **values):
+    session = session_factory()
+    job = create_admin_broadcast(session, [1, 2, 3], 'photo', 'caption', str(file_path), 'a.jpg')
+    for key, value in values.items():
+        setattr(job, key, value)
+    session.commit()
+    job_id = job.id
+    session.close()
+    return job_id
+
+
+def test_first_upload_stores_file_id(session_factory, tmp_path, monkeypatch):
+    """file_id اولین آپلود روی job ذخیره و بقیه گیرنده‌ها با file_id ارسال می‌شوند"""
+    file_path = tmp_path / 'a.jpg'
+    file_path.write_bytes(b'jpeg')
+    job_id = _photo_job(session_factory, file_path)
+    job = admin_broadcast._start_admin_broadcast(job_id, 60)
+    assert job['file_content'] == b'jpeg'
+
+    calls = []
+
+    async def send(*args, upload=None, parse_mode='HTML'):
+        assert parse_mode is None
+        calls.append((args[-1], upload))
+        return True, None, {'photo': [{'file_id': 'small'}, {'file_id': 'big'}]}
+
+    monkeypatch.setattr(admin_broadcast.broadcast_engine, 'send_with_result', send)
+
+    async def run():
+        lock = asyncio.Lock()
+        for telegram_id in job['recipients']:
+            await admin_broadcast._send_to_recipient(job, telegram_id, lock)
+
+    asyncio.run(run())
+
+    assert calls[0] == ('photo', ('a.jpg', b'jpeg'))
+    assert [call[0] for call in calls[1:]] == ['big', 'big']
+    session = session_factory()
+    assert session.query(AdminBroadcast).get(job_id).file_id == 'big'
+    session.close()
+
+
+def test_resume_on_other_node_uses_stored_file_id(session_factory, tmp_path):
+    """ادامه ارسال بدون فایل محلی ولی با file_id ذخیره‌شده"""
+    job_id = _photo_job(session_factory, tmp_path / 'missing.jpg', status='sending',
+                        processed_count=1, file_id='big')
+
+    job = admin_broadcast._start_admin_broadcast(job_id, 60)
+    assert job['file_id'] == 'big'
+    assert job['file_content'] is None
+    assert job['processed_count'] == 1
+
+
+def test_missing_file_without_file_id_fails_job(session_factory, tmp_path):
+    job_id = _photo_job(session_factory, tmp_path / 'missing.jpg')
+
+    assert admin_broadcast._start_admin_broadcast(job_id, 60) is None
+    session = session_factory()
+    job = session.query(AdminBroadcast).get(job_id)
+    assert job.status == 'failed'
+    assert 'فایل پیوست' in job.error_message
+    assert job.lease_owner is None
+    session.close()
+
+
+def test_admin_text_is_sent_without_parse_mode(monkeypatch):
+    """متن ادمین escape نمی‌شود؛ «<» و «&» نباید ارسال را با خطای HTML شکست دهند"""
+    requests = []
+
+    async def send_with_result(bot_key, bot_token, chat_id, text, media_type=None,
+                               media_url=None, upload=None, parse_mode='HTML'):
+        requests.append(build_send_request(media_type, chat_id, text, media_url, parse_mode))
+        return True, None, {}
+
+    monkeypatch.setattr(admin_broadcast.broadcast_engine, 'send_with_result', send_with_result)
+    job = {'id': 1, 'message_text': 'قیمت < 100 & بیشتر', 'media_type': None}
+
+    assert asyncio.run(admin_broadcast._send_to_recipient(job, 10, asyncio.Lock())) == (True, None)
+    assert requests == [('sendMessage', {'chat_id': 10, 'text': 'قیمت < 100 & بیشتر'})]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های جمع‌آوری رویدادهای آمار بات و rollup ساعتی/روزانه
+Bot Analytics Event Rollup Tests
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime, date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import Analytics, AnalyticsHourly, BotInstance, BotUser
+from bot_engine.analytics_events import AnalyticsBuffer, START, MESSAGE, CONTRIBUTION
+
+
+@pytest.fixture
+def session_factory(sqlite_db):
+    """دیتابیس موقت با دو بات متعلق به نماینده 7"""
+    factory = sqlite_db(Analytics, AnalyticsHourly, BotInstance, BotUser)
+    session = factory()
+    session.add_all([
+        BotInstance(id=1, candidate_id=7, bot_token='1:a', bot_username='a_bot'),
+        BotInstance(id=2, candidate_id=7, bot_token='2:b', bot_username='b_bot'),
+        BotUser(bot_instance_id=1, telegram_id=10),
+        BotUser(bot_instance_id=2, telegram_id=20),
+    ])
+    session.commit()
+    session.close()
+    return factory
+
+
+def _buffer(session_factory):
+    buffer = AnalyticsBuffer(session_factory=session_factory)
+    buffer.start = lambda: None  # بدون thread پس‌زمینه؛ flush دستی
+    return buffer
+
+
+def _rows(session_factory, model):
+    session = session_factory()
+    rows = session.query(model).all()
+    session.close()
+    return rows
+
+
+def test_events_roll_up_per_candidate_hour_and_day(session_factory):
+    buffer = _buffer(session_factory)
+    morning, noon = datetime(2026, 3, 1, 9, 15), datetime(2026, 3, 1, 12, 40)
+
+    buffer.record(1, 10, START, at=morning)
+    buffer.record(1, 10, 'resume', at=morning)
+    buffer.record(1, 10, MESSAGE, at=noon)
+    buffer.record(2, 20, CONTRIBUTION, at=noon)
+    buffer.record(2, 20, 'contact', at=noon)
+    buffer.record_new_user(2, at=noon)
+
+    assert buffer.flush(now=noon) == 6
+
+    hourly = {row.hour: row for row in _rows(session_factory, AnalyticsHourly)}
+    assert set(hourly) == {datetime(2026, 3, 1, 9), datetime(2026, 3, 1, 12)}
+    assert (hourly[datetime(2026, 3, 1, 9)].total_interactions, hourly[datetime(2026, 3, 1, 9)].resume_views) == (2, 1)
+    assert hourly[datetime(2026, 3, 1, 9)].active_users == 1
+    # کاربر 10 در ساعت 12 هم فعال بوده؛ کاربر 20 از بات دوم
+    assert hourly[datetime(2026, 3, 1, 12)].active_users == 2
+
+    [daily] = _rows(session_factory, Analytics)
+    assert (daily.candidate_id, daily.date) == (7, date(2026, 3, 1))
+    assert daily.total_interactions == 5
+    assert daily.active_users == 2
+    assert (daily.total_messages, daily.contributions, daily.new_users) == (1, 1, 1)
+    assert daily.total_users == 2
+
+
+def test_second_flush_adds_to_existing_rows(session_factory):
+    buffer = _buffer(session_factory)
+    at = datetime(2026, 3, 1, 9)
+
+    buffer.record(1, 10, MESSAGE, at=at)
+    buffer.flush(now=at)
+
+    session = session_factory()
+    session.add(BotUser(bot_instance_id=1, telegram_id=11))
+    session.commit()
+    session.close()
+
+    buffer.record(1, 10, MESSAGE, at=at)
+    buffer.record(1, 11, MESSAGE, at=at)
+    buffer.flush(now=at)
+
+    [daily] = _rows(session_factory, Analytics)
+    assert daily.total_messages == 3
+    assert daily.active_users == 2
+    assert daily.total_users == 3
+    assert len(_rows(session_factory, AnalyticsHourly)) == 1
+
+
+def test_active_users_reset_for_new_day(session_factory):
+    buffer = _buffer(session_factory)
+
+    buffer.record(1, 10, START, at=datetime(2026, 3, 1, 23, 50))
+    buffer.flush(now=datetime(2026, 3, 2, 0, 5))
+    buffer.record(1, 10, START, at=datetime(2026, 3, 2, 0, 10))
+    buffer.flush(now=datetime(2026, 3, 2, 0, 10))
+
+    daily = {row.date: row.active_users for row in _rows(session_factory, Analytics)}
+    assert daily == {date(2026, 3, 1): 1, date(2026, 3, 2): 1}
+
+
+def test_unknown_bot_is_skipped(session_factory):
+    buffer = _buffer(session_factory)
+    buffer.record(99, 1, START, at=datetime(2026, 3, 1, 9))
+
+    assert buffer.flush(now=datetime(2026, 3, 1, 9)) == 1
+    assert _rows(session_factory, Analytics) == []
+
+
+def test_failed_flush_requeues_counts(session_factory):
+    buffer = _buffer(session_factory)
+    at = datetime(2026, 3, 1, 9)
+    buffer.record(1, 10, MESSAGE, at=at)
+
+    engine = session_factory.kw['bind']
+    Analytics.__table__.drop(engine)
+    with pytest.raises(Exception):
+        buffer.flush(now=at)
+    assert buffer.get_stats()['pending_events'] == 1
+
+    Analytics.__table__.create(engine)
+    assert buffer.flush(now=at) == 1
+    [daily] = _rows(session_factory, Analytics)
+    assert (daily.total_messages, daily.active_users) == (1, 1)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های پاسخ خودکار بات (Aho-Corasick)
+Auto Reply Matcher Tests
+"""
+
+import pytest
+import sys
+import os
+import random
+from collections import namedtuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import db, AutoReply, BotInstance, Candidate, Plan, candidate_plans
+from bot_engine.auto_reply import AhoCorasick, AutoReplyMatcher, AutoReplyIndex
+
+RuleRow = namedtuple('RuleRow', 'id keyword reply_text case_sensitive exact_match')
+
+
+def test_automaton_finds_all_overlapping_patterns():
+    """نتیجه automaton با جستجوی ساده همه الگوها یکسان است"""
+    random.seed(7)
+    for _ in range(200):
+        patterns = {''.join(random.choice('اب') for _ in range(random.randint(1, 4))) for _ in range(6)}
+        text = ''.join(random.choice('اب') for _ in range(25))
+        automaton = AhoCorasick((p, p) for p in patterns)
+        found = sorted(automaton.iter_matches(text))
+        expected = sorted(
+            (i + len(p) - 1, p) for p in patterns for i in range(len(text)) if text.startswith(p, i)
+        )
+        assert found == expected
+
+
+def test_matcher_priorities():
+    matcher = AutoReplyMatcher([
+        RuleRow(1, 'سلام', 'درود', False, False),
+        RuleRow(2, 'سلام علیکم', 'علیکم السلام', False, False),
+        RuleRow(3, 'Help', 'راهنما', True, False),
+        RuleRow(4, 'آدرس', 'آدرس ستاد: ...', False, True),
+    ])
+    # طولانی‌ترین کلمه کلیدی برنده است
+    assert matcher.match('سلام علیکم آقای نماینده').id == 2
+    assert matcher.match('یک سلام ساده').id == 1
+    # حساس به حروف
+    assert matcher.match('need Help').id == 3
+    assert matcher.match('need help') is None
+    # تطابق دقیق فقط برای کل پیام
+    assert matcher.match('  آدرس ').id == 4
+    assert matcher.match('آدرس ستاد کجاست') is None
+
+
+def test_index_rebuilds_only_when_rules_change(sqlite_db):
+    factory = sqlite_db(BotInstance, AutoReply)
+    session = factory()
+    session.add(BotInstance(id=1, candidate_id=5, bot_token='1:x', bot_username='b'))
+    session.add(AutoReply(id=1, candidate_id=5, keyword='ستاد', reply_text='آدرس ستاد'))
+    session.commit()
+
+    index = AutoReplyIndex(revalidate_interval=0, session_factory=factory)
+    assert index.match(1, 'ستاد کجاست؟').reply_text == 'آدرس ستاد'
+    assert index.match(1, 'سلام') is None
+    assert index.builds == 1
+
+    session.add(AutoReply(id=2, candidate_id=5, keyword='سلام', reply_text='درود'))
+    session.commit()
+    assert index.match(1, 'سلام').reply_text == 'درود'
+    assert index.builds == 2
+
+    assert session.query(AutoReply).get(1).usage_count == 1
+    session.close()
+
+
+@pytest.fixture
+def panel(sqlite_db, monkeypatch):
+    """پنل نماینده روی دیتابیس موقت با نماینده دارای پلن AI_RESPONDER"""
+    from candidate_panel import app as panel_app
+
+    factory = sqlite_db(Candidate, Plan, candidate_plans, BotInstance, AutoReply)
+    monkeypatch.setitem(db._app_engines[panel_app.app], None, factory.kw['bind'])
+
+    session = factory()
+    candidate = Candidate(id=5, username='c5', password='x', full_name='نماینده',
+                          plans=[Plan(name='AI', code='AI_RESPONDER')])
+    session.add_all([candidate, BotInstance(id=1, candidate_id=5, bot_token='1:x', bot_username='b')])
+    session.commit()
+    session.close()
+
+    client = panel_app.app.test_client()
+    with client.session_transaction() as client_session:
+        client_session['candidate_id'] = 5
+    return client, factory, panel_app.auto_reply_index
+
+
+def test_panel_add_and_delete_invalidate_bot_matcher(panel):
+    """افزودن و حذف قانون در پنل matcher کش‌شده بات نماینده را باطل می‌کند"""
+    client, factory, index = panel
+    index._session_factory = factory
+    index.invalidate(5)
+    assert index.get_matcher(1).match('سلام') is None
+
+    response = client.post('/auto-replies', data={'action': 'add', 'keyword': 'سلام', 'reply_text': 'درود'})
+    assert response.status_code == 302
+    assert 1 not in index._entries
+    assert index.match(1, 'سلام').reply_text == 'درود'
+
+    rule_id = factory().query(AutoReply.id).scalar()
+    response = client.post('/auto-replies', data={'action': 'delete', 'reply_id': rule_id})
+    assert response.status_code == 302
+    assert index.get_matcher(1).match('سلام') is None
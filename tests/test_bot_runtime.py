@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های endpoint مشترک webhook و حذف webhook در runtime بات‌ها
+Bot Runtime Webhook Tests
+"""
+
+import pytest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from telegram import Bot
+
+from config.settings import WEBHOOK_PATH
+from bot_engine.bot_runtime import BotRuntime, webhook_path_secret, webhook_header_secret
+from bot_engine.bot_manager import BotManager
+
+TOKEN = '123456:TEST-token'
+PAYLOAD = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1, 'date': 0, 'text': 'سلام',
+        'chat': {'id': 10, 'type': 'private'},
+        'from': {'id': 10, 'is_bot': False, 'first_name': 'A'},
+    },
+}
+
+
+class FakeBot:
+    def __init__(self):
+        self.deleted_webhooks = 0
+
+    async def delete_webhook(self):
+        self.deleted_webhooks += 1
+
+
+@pytest.fixture
+def runtime():
+    """runtime در حالت webhook با یک بات ثبت‌شده (بدون thread و شبکه)"""
+    runtime = BotRuntime(webhook_mode=True)
+    runtime.loop = asyncio.new_event_loop()
+    queued = []
+    runtime.applications[1] = SimpleNamespace(
+        bot=Bot(TOKEN), update_queue=SimpleNamespace(put_nowait=queued.append)
+    )
+    runtime.webhook_routes[webhook_path_secret(TOKEN)] = 1
+    runtime._header_secrets[1] = webhook_header_secret(TOKEN)
+    runtime.queued = queued
+    yield runtime
+    runtime.loop.close()
+
+
+def _feed(runtime, path_secret, header_secret, payload=PAYLOAD):
+    status = runtime.feed_webhook_update(path_secret, payload, header_secret)
+    # اجرای callbackهای call_soon_threadsafe
+    runtime.loop.run_until_complete(asyncio.sleep(0))
+    return status
+
+
+def test_valid_update_is_queued(runtime):
+    status = _feed(runtime, webhook_path_secret(TOKEN), webhook_header_secret(TOKEN))
+
+    assert status == 200
+    [update] = runtime.queued
+    assert update.message.text == 'سلام'
+
+
+@pytest.mark.parametrize('header_secret', [None, '', 'wrong', webhook_header_secret('999:other')])
+def test_wrong_header_secret_is_rejected(runtime, header_secret):
+    assert _feed(runtime, webhook_path_secret(TOKEN), header_secret) == 403
+    assert runtime.queued == []
+
+
+def test_unknown_path_is_not_found(runtime):
+    assert _feed(runtime, webhook_path_secret('999:other'), webhook_header_secret(TOKEN)) == 404
+    assert runtime.queued == []
+
+
+def test_invalid_update_is_bad_request(runtime):
+    assert _feed(runtime, webhook_path_secret(TOKEN), webhook_header_secret(TOKEN), payload={}) == 400
+    assert runtime.queued == []
+
+
+@pytest.fixture
+def removable(monkeypatch):
+    """runtime با یک بات که توقف Application آن شبیه‌سازی می‌شود"""
+    runtime = BotRuntime(webhook_mode=True)
+    bot = FakeBot()
+    runtime.applications[1] = SimpleNamespace(bot=bot)
+
+    async def stop_application(bot_instance_id, application):
+        return None
+
+    monkeypatch.setattr(runtime, '_stop_application', stop_application)
+    return runtime, bot
+
+
+def test_process_shutdown_keeps_webhook(removable):
+    """توقف پروسه (atexit هر worker) webhook مشترک را حذف نمی‌کند"""
+    runtime, bot = removable
+    asyncio.run(runtime._shutdown())
+
+    assert runtime.applications == {}
+    assert bot.deleted_webhooks == 0
+
+
+def test_restart_keeps_webhook(removable):
+    runtime, bot = removable
+    assert asyncio.run(runtime._remove_bot(1)) is True
+    assert bot.deleted_webhooks == 0
+
+
+def test_explicit_deactivate_deletes_webhook(removable):
+    """غیرفعال‌سازی از پنل ادمین (BotManager.stop_bot) webhook را حذف می‌کند"""
+    runtime, bot = removable
+    runtime._submit = lambda coroutine, timeout=None: asyncio.run(coroutine)
+
+    BotManager(runtime).stop_bot(1)
+
+    assert runtime.applications == {}
+    assert bot.deleted_webhooks == 1
+
+
+@pytest.fixture
+def wsgi_client(runtime, monkeypatch):
+    """endpoint webhook اپ wsgi با runtime تست"""
+    pytest.importorskip('flask_migrate')
+    from deployment import wsgi
+    from bot_engine import bot_runtime as runtime_module
+
+    monkeypatch.setattr(runtime_module, 'bot_runtime', runtime)
+    return wsgi.main_app.test_client()
+
+
+def test_webhook_endpoint_checks_header_secret(wsgi_client, runtime):
+    url = f"{WEBHOOK_PATH}/{webhook_path_secret(TOKEN)}"
+
+    response = wsgi_client.post(url, json=PAYLOAD, headers={
+        'X-Telegram-Bot-Api-Secret-Token': 'wrong'
+    })
+    assert response.status_code == 403
+    assert response.get_json() == {'ok': False}
+
+    response = wsgi_client.post(url, json=PAYLOAD, headers={
+        'X-Telegram-Bot-Api-Secret-Token': webhook_header_secret(TOKEN)
+    })
+    runtime.loop.run_until_complete(asyncio.sleep(0))
+    assert response.status_code == 200
+    assert len(runtime.queued) == 1
+
+    assert wsgi_client.post(url, data='not json').status_code == 400
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های موتور ارسال انبوه
+Broadcast Engine Tests
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bot_engine import broadcast_engine as engine_module
+from bot_engine.broadcast_engine import (
+    BroadcastEngine, TokenBucket, ChatRateLimiter, BroadcastProgress, build_send_request
+)
+
+
+def test_token_bucket_limits_rate():
+    """پس از مصرف ظرفیت، نرخ به rate محدود می‌شود"""
+    async def run():
+        bucket = TokenBucket(rate=50, capacity=5)
+        started = time.monotonic()
+        for _ in range(15):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # 5 توکن اولیه + 10 توکن با نرخ 50 در ثانیه ≈ 0.2 ثانیه
+    assert asyncio.run(run()) >= 0.18
+
+
+def test_token_bucket_pause_for_retry_after():
+    """pause (پاسخ 429) همه ارسال‌های بات را متوقف می‌کند"""
+    async def run():
+        bucket = TokenBucket(rate=1000)
+        bucket.pause(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.19
+
+
+def test_chat_limiter_spaces_messages_to_same_chat():
+    """دو پیام به یک چت با فاصله interval ارسال می‌شوند ولی چت‌های مختلف منتظر نمی‌مانند"""
+    async def run():
+        limiter = ChatRateLimiter(interval=0.2)
+        started = time.monotonic()
+        await limiter.wait(1, 100)
+        await limiter.wait(1, 200)
+        other_chat = time.monotonic() - started
+        await limiter.wait(1, 100)
+        return other_chat, time.monotonic() - started
+
+    other_chat, same_chat = asyncio.run(run())
+    assert other_chat < 0.05
+    assert same_chat >= 0.19
+
+
+def test_build_send_request():
+    """انتخاب متد API بر اساس نوع رسانه"""
+    assert build_send_request(None, 1, 'hi') == (
+        'sendMessage', {'chat_id': 1, 'text': 'hi', 'parse_mode': 'HTML'}
+    )
+    method, data = build_send_request('photo', 1, 'cap', 'http://x/a.jpg')
+    assert method == 'sendPhoto' and data['photo'] == 'http://x/a.jpg'
+
+    with pytest.raises(ValueError):
+        build_send_request('sticker', 1, 'x')
+
+
+def test_progress_cursor_waits_for_earlier_recipients():
+    """cursor فقط پس از تمام شدن همه گیرندگان قبلی جلو می‌رود"""
+    progress = BroadcastProgress(sent_count=5, failed_count=1, last_user_id=10)
+    for user_id in (11, 12, 15):
+        progress.dispatched(user_id)
+
+    progress.record(12, 1012, True)
+    progress.record(15, 1015, False, 'blocked')
+    assert progress.last_user_id == 10
+
+    progress.record(11, 1011, True)
+    assert progress.last_user_id == 15
+    assert (progress.sent_count, progress.failed_count) == (7, 2)
+
+
+def test_progress_take_and_restore():
+    """flush ناموفق لاگ‌ها را به بافر برمی‌گرداند"""
+    progress = BroadcastProgress()
+    progress.dispatched(1)
+    progress.record(1, 1001, True)
+
+    snapshot = progress.take()
+    assert snapshot['last_user_id'] == 1 and len(snapshot['logs']) == 1
+    assert not progress.dirty
+
+    progress.restore(snapshot)
+    assert progress.dirty and progress.pending_logs == 1
+
+
+def test_iter_target_users_keyset_chunks(sqlite_db):
+    """کاربران هدف به‌صورت chunkهای keyset و از cursor به بعد خوانده می‌شوند"""
+    from types import SimpleNamespace
+    from database.models import BotUser
+    from bot_engine.broadcast_sender import BroadcastSender
+
+    session = sqlite_db(BotUser)()
+    session.bulk_insert_mappings(BotUser, [
+        {'bot_instance_id': bot_id, 'telegram_id': 1000 + i}
+        for i in range(7) for bot_id in (1, 2)
+    ])
+    session.commit()
+
+    sender = BroadcastSender(engine=object())
+    broadcast = SimpleNamespace(bot_instance_id=1, target_filter='all')
+    user_ids = [row.id for row in sender.target_users_query(broadcast, session).order_by(BotUser.id)]
+
+    chunks = list(sender.iter_target_users(broadcast, session, chunk_size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert [telegram_id for chunk in chunks for _, telegram_id in chunk] == list(range(1000, 1007))
+
+    resumed = list(sender.iter_target_users(broadcast, session, after_user_id=user_ids[4], chunk_size=3))
+    assert resumed == [[(user_ids[5], 1005), (user_ids[6], 1006)]]
+
+    session.close()
+
+
+def test_run_broadcast_with_mock_transport(sqlite_db, monkeypatch):
+    """
+    ارسال کامل با پاسخ‌های شبیه‌سازی‌شده تلگرام: یک 429 و سپس موفق، یک 403؛
+    بدون ارسال تکراری، cursor تا آخرین کاربر و lease آزاد
+    """
+    from database.models import BroadcastMessage, BroadcastLog, BotInstance, BotUser
+
+    factory = sqlite_db(BroadcastMessage, BroadcastLog, BotInstance, BotUser)
+    monkeypatch.setattr(engine_module, 'SessionFactory', factory)
+
+    session = factory()
+    session.add(BotInstance(id=1, candidate_id=1, bot_token='1:a', bot_username='a_bot', is_active=True))
+    session.add(BroadcastMessage(id=1, candidate_id=1, bot_instance_id=1, message_text='سلام'))
+    session.bulk_insert_mappings(BotUser, [
+        {'bot_instance_id': 1, 'telegram_id': 1000 + i} for i in range(7)
+    ])
+    session.commit()
+    last_user_id = max(user_id for (user_id,) in session.query(BotUser.id))
+    session.close()
+
+    requests = Counter()
+
+    def handler(request):
+        chat_id = json.loads(request.content)['chat_id']
+        requests[chat_id] += 1
+        if chat_id == 1002 and requests[chat_id] == 1:
+            return httpx.Response(429, json={
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                'parameters': {'retry_after': 0.05}
+            })
+        if chat_id == 1004:
+            return httpx.Response(403, json={
+                'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'
+            })
+        return httpx.Response(200, json={'ok': True, 'result': {'message_id': chat_id}})
+
+    broadcaster = BroadcastEngine(
+        per_bot_rate=1000, per_chat_interval=0, workers_per_broadcast=3, max_retries=2,
+        fetch_chunk=3, log_batch=2, flush_interval=60, lease_ttl=60
+    )
+
+    async def run():
+        broadcaster._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        broadcaster._semaphore = asyncio.Semaphore(4)
+        try:
+            await broadcaster._run_broadcast(1)
+        finally:
+            await broadcaster._client.aclose()
+
+    asyncio.run(run())
+
+    # هر گیرنده یک بار؛ فقط گیرنده 429 یک بار دوباره
+    expected = Counter(1000 + i for i in range(7))
+    expected[1002] += 1
+    assert requests == expected
+
+    session = factory()
+    broadcast = session.query(BroadcastMessage).get(1)
+    assert broadcast.status == 'completed'
+    assert (broadcast.total_users, broadcast.sent_count, broadcast.failed_count) == (7, 6, 1)
+    assert broadcast.last_user_id == last_user_id
+    assert (broadcast.lease_owner, broadcast.lease_expires_at) == (None, None)
+
+    logs = {log.user_telegram_id: log for log in session.query(BroadcastLog).filter_by(broadcast_id=1)}
+    assert len(logs) == 7 and session.query(BroadcastLog).count() == 7
+    assert logs[1002].status == 'sent'
+    assert (logs[1004].status, logs[1004].error_message) == ('failed', 'Forbidden: bot was blocked by the user')
+    session.close()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های کش محتوای منوهای بات
+Bot Menu Content Cache Tests
+"""
+
+import sys
+import os
+import time
+import asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bot_engine.content_cache import ContentCache, RESUME, PROGRAMS
+
+
+def test_read_through_renders_once():
+    """رندر فقط در اولین درخواست انجام می‌شود"""
+    cache = ContentCache(ttl=60)
+    calls = []
+
+    async def render():
+        calls.append(1)
+        return 7, ('text', None)
+
+    assert asyncio.run(cache.get_or_render(1, RESUME, render)) == ('text', None)
+    assert asyncio.run(cache.get_or_render(1, RESUME, render)) == ('text', None)
+    assert len(calls) == 1
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_missing_candidate_is_not_cached():
+    """نبود کاندید کش نمی‌شود"""
+    cache = ContentCache(ttl=60)
+    async def render():
+        return None
+
+    assert asyncio.run(cache.get_or_render(1, RESUME, render)) is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_ttl_expiry():
+    """پس از TTL محتوا دوباره رندر می‌شود"""
+    cache = ContentCache(ttl=0.01)
+    cache.set(1, RESUME, 7, 'old')
+    time.sleep(0.02)
+    assert cache.get(1, RESUME) is None
+
+
+def test_invalidate_by_candidate_and_section():
+    """باطل‌سازی فقط بخش‌های همان کاندید را حذف می‌کند"""
+    cache = ContentCache(ttl=60)
+    cache.set(1, RESUME, 7, 'r')
+    cache.set(1, PROGRAMS, 7, 'p')
+    cache.set(2, RESUME, 8, 'other')
+
+    cache.invalidate(7, [RESUME])
+    assert cache.get(1, RESUME) is None
+    assert cache.get(1, PROGRAMS) == 'p'
+    assert cache.get(2, RESUME) == 'other'
+
+    cache.invalidate(7)
+    assert cache.get(1, PROGRAMS) is None
+
+
+def test_menu_handler_reads_through_cache(monkeypatch):
+    """get_menu_content بات فقط در miss رندر را روی executor اجرا می‌کند"""
+    from bot_engine import telegram_bot
+
+    cache = ContentCache(ttl=60)
+    monkeypatch.setattr(telegram_bot, 'content_cache', cache)
+    calls = []
+
+    def render_menu_content(bot_instance_id, section):
+        calls.append((bot_instance_id, section))
+        return (7, ('رزومه', None)) if bot_instance_id == 1 else None
+
+    monkeypatch.setattr(telegram_bot, 'render_menu_content', render_menu_content)
+
+    async def run():
+        return [await telegram_bot.get_menu_content(bot_id, RESUME) for bot_id in (1, 1, 2)]
+
+    first, second, missing = asyncio.run(run())
+    assert first == second == ('رزومه', None)
+    assert missing == ("❌ خطا در دریافت اطلاعات", None)
+    assert calls == [(1, RESUME), (2, RESUME)]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های شمارنده‌های denormalized نماینده‌ها
+Candidate Counter Tests
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import (
+    CandidateCounter, Message, Program, Headquarters, CitizenContribution
+)
+from database.counters import (
+    get_counters, reconcile_counters, month_counter, contribution_counter,
+    MESSAGES, MESSAGES_UNREAD, PROGRAMS, CONTRIBUTIONS
+)
+
+
+@pytest.fixture
+def session(sqlite_db):
+    """دیتابیس موقت با جدول‌های شمارش‌شده"""
+    session = sqlite_db(CandidateCounter, Message, Program, Headquarters, CitizenContribution)()
+    yield session
+    session.close()
+
+
+def _counters(session, candidate_id=1):
+    return dict(session.query(CandidateCounter.name, CandidateCounter.value).filter_by(candidate_id=candidate_id))
+
+
+def _contribution(code, status='pending'):
+    return CitizenContribution(
+        candidate_id=1, tracking_code=code, user_telegram_id=1, contribution_type='idea',
+        title='t', description='d', category='other', status=status
+    )
+
+
+def test_counters_follow_orm_changes(session):
+    """افزودن، تغییر و حذف ردیف‌ها در همان تراکنش شمارنده‌ها را به‌روز می‌کند"""
+    session.add_all([Message(candidate_id=1, user_telegram_id=i, message_text='x') for i in range(3)])
+    session.add(Message(candidate_id=1, user_telegram_id=9, message_text='old',
+                        created_at=datetime(2020, 5, 1), is_read=True))
+    session.add_all([Program(candidate_id=1, title='p1'), Program(candidate_id=1, title='p2')])
+    session.add(_contribution('A'))
+    session.commit()
+
+    counters = _counters(session)
+    assert (counters[MESSAGES], counters[MESSAGES_UNREAD], counters[month_counter()]) == (4, 3, 3)
+    assert counters[PROGRAMS] == 2
+    assert counters[contribution_counter('pending')] == 1
+
+    # اشیای expire شده پس از commit: مقدار قبلی هنگام تغییر بارگذاری می‌شود
+    message = session.query(Message).filter_by(is_read=False).first()
+    contribution = session.query(CitizenContribution).first()
+    session.commit()
+    message.is_read = True
+    contribution.status = 'approved'
+    session.delete(session.query(Program).first())
+    session.commit()
+
+    counters = _counters(session)
+    assert counters[MESSAGES_UNREAD] == 2
+    assert counters[PROGRAMS] == 1
+    assert (counters[contribution_counter('pending')], counters[contribution_counter('approved')]) == (0, 1)
+    assert counters[CONTRIBUTIONS] == 1
+
+
+def test_rollback_discards_counter_changes(session):
+    session.add(Message(candidate_id=1, user_telegram_id=1, message_text='x'))
+    session.flush()
+    session.rollback()
+    assert _counters(session) == {}
+
+
+def test_reconcile_fixes_drift(session):
+    """تغییرات bulk بدون رویداد ORM با reconciliation اصلاح می‌شوند"""
+    session.add_all([Message(candidate_id=1, user_telegram_id=i, message_text='x') for i in range(2)])
+    session.add(CandidateCounter(candidate_id=1, name='messages:2020-01', value=7))
+    session.commit()
+
+    session.query(Message).update({'is_read': True}, synchronize_session=False)
+    session.commit()
+    assert _counters(session)[MESSAGES_UNREAD] == 2
+
+    assert reconcile_counters(session) == 1
+    session.commit()
+    counters = _counters(session)
+    assert counters[MESSAGES_UNREAD] == 0
+    assert 'messages:2020-01' not in counters
+    assert reconcile_counters(session) == 0
+
+    assert get_counters(1, [MESSAGES, PROGRAMS], session) == {MESSAGES: 2, PROGRAMS: 0}
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های engine و connection pool مشترک پروسه
+Shared Engine And Pool Tests
+"""
+
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from database import engine as engine_module
+from database.engine import InstrumentedQueuePool, get_engine, get_pool_stats
+from database.models import db
+
+
+@pytest.fixture(autouse=True)
+def engines(monkeypatch):
+    """registry خالی engineها (بدون اثر روی engine پیش‌فرض پروسه)"""
+    registry = {}
+    monkeypatch.setattr(engine_module, '_engines', registry)
+    yield registry
+    for engine in registry.values():
+        engine.dispose()
+
+
+def test_get_engine_and_flask_share_one_pool(tmp_path):
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    engine = get_engine(url)
+
+    assert get_engine(url) is engine
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    db.init_app(app)
+    with app.app_context():
+        assert db.engine is engine
+        assert db.engine.pool is engine.pool
+
+
+def test_pool_stats_count_checkouts_and_timeouts(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine_module, 'DB_POOL_SIZE', 1)
+    monkeypatch.setattr(engine_module, 'DB_MAX_OVERFLOW', 0)
+    monkeypatch.setattr(engine_module, 'DB_POOL_TIMEOUT', 0.05)
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = get_engine(url)
+
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+        stats = get_pool_stats()[url]
+        assert (stats['checkouts'], stats['checked_out'], stats['timeouts']) == (1, 1, 0)
+
+        # تنها connection pool در دست است؛ checkout دوم پس از pool_timeout شکست می‌خورد
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+
+    stats = get_pool_stats()[url]
+    assert (stats['checkouts'], stats['timeouts'], stats['checked_out']) == (2, 1, 0)
+    assert stats['max_wait_ms'] >= 40
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های کش پلن فعال و مصرف نماینده
+Plan Entitlement Cache Tests
+"""
+
+import pytest
+import sys
+import os
+import subprocess
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from database.models import Candidate, Plan, PlanPurchase, Message, CandidateCounter, candidate_plans
+from database.entitlements import entitlements
+
+
+@pytest.fixture
+def session(sqlite_db):
+    factory = sqlite_db(Candidate, Plan, PlanPurchase, Message, CandidateCounter, candidate_plans)
+    queries = []
+    event.listen(factory.kw['bind'], 'before_cursor_execute', lambda *args: queries.append(args[2]))
+
+    session = factory()
+    session.queries = queries
+    entitlements.invalidate()
+    yield session
+    session.close()
+    entitlements.invalidate()
+
+
+def _candidate_with_plan(session, max_messages):
+    candidate = Candidate(username='c1', password='x', full_name='نماینده')
+    plan = Plan(name='Connect', code='CONNECT', max_messages=max_messages, has_ai=True)
+    session.add_all([candidate, plan])
+    session.flush()
+    session.add(PlanPurchase(
+        candidate_id=candidate.id, plan_id=plan.id, start_date=datetime.utcnow(),
+        end_date=datetime.utcnow() + timedelta(days=30), payment_amount=0
+    ))
+    session.commit()
+    return candidate, plan
+
+
+def test_quota_checks_need_no_queries_after_load(session):
+    """بررسی محدودیت پیام روی مسیر داغ بدون کوئری؛ مصرف با هر commit به‌روز می‌شود"""
+    candidate, _ = _candidate_with_plan(session, max_messages=2)
+    assert candidate.can_add_message()
+
+    for index in range(2):
+        session.add(Message(candidate_id=candidate.id, user_telegram_id=index, message_text='x'))
+        session.commit()
+
+    session.refresh(candidate)  # نماینده expire شده؛ در بات هر پیام آن را تازه می‌خواند
+    del session.queries[:]
+    assert not candidate.can_add_message()
+    assert candidate.has_feature('has_ai')
+    assert not candidate.has_feature('can_mass_message')
+    assert session.queries == []
+
+
+def test_purchase_change_invalidates_cache(session):
+    """تمدید یا خرید پلن جدید پس از commit کش را باطل می‌کند"""
+    candidate, plan = _candidate_with_plan(session, max_messages=0)
+    assert not candidate.can_add_message()
+
+    unlimited = Plan(name='Pro', code='PRO', max_messages=-1)
+    session.add(unlimited)
+    session.flush()
+    session.add(PlanPurchase(
+        candidate_id=candidate.id, plan_id=unlimited.id, start_date=datetime.utcnow(),
+        end_date=datetime.utcnow() + timedelta(days=60), payment_amount=0
+    ))
+    # قبل از commit کش تغییر نمی‌کند
+    session.flush()
+    assert not candidate.can_add_message()
+
+    session.commit()
+    assert candidate.can_add_message()
+    assert candidate.get_active_plan().code == 'PRO'
+
+
+def test_expired_plan_is_reloaded(session):
+    candidate, _ = _candidate_with_plan(session, max_messages=0)
+    entry = candidate.get_entitlement()
+    entry.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    assert candidate.get_entitlement() is not entry
+
+
+@pytest.mark.parametrize('module', ['database.counters', 'database.entitlements', 'database.models'])
+def test_modules_import_in_fresh_process(module):
+    """ترتیب import بین models، counters و entitlements حلقه نمی‌سازد"""
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    result = subprocess.run(
+        [sys.executable, '-c', f'import {module}'], cwd=root, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های یادآوری رویدادهای زنده
+Event Reminder Tests
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import LiveEvent, EventRegistration, EventReminderLog, BotInstance
+from bot_engine import event_reminders
+from bot_engine.event_reminders import due_stage, build_reminder_text
+
+NOW = datetime(2024, 5, 1, 12, 0)
+
+
+def make_event(starts_in, **kwargs):
+    values = dict(
+        id=1, candidate_id=1, title='جلسه', event_type='ama', status='scheduled',
+        starts_at=NOW + starts_in, duration_minutes=60,
+        reminder_1day_sent=False, reminder_1hour_sent=False, starting_notice_sent=False
+    )
+    values.update(kwargs)
+    return LiveEvent(**values)
+
+
+def test_due_stage_catches_up_late_runs():
+    """اجرای دیرهنگام مرحله را از دست نمی‌دهد (پنجره چند دقیقه‌ای نیست)"""
+    assert due_stage(make_event(timedelta(days=2)), NOW) is None
+    # سه ساعت دیرتر از پنجره یک روز قبل
+    assert due_stage(make_event(timedelta(hours=21)), NOW) == '1day'
+    assert due_stage(make_event(timedelta(minutes=20)), NOW) == '1hour'
+    assert due_stage(make_event(-timedelta(minutes=10)), NOW) == 'starting'
+    # رویداد تمام‌شده
+    assert due_stage(make_event(-timedelta(hours=2)), NOW) is None
+
+
+def test_due_stage_skips_sent_and_cancelled():
+    assert due_stage(make_event(timedelta(minutes=20), reminder_1hour_sent=True), NOW) is None
+    assert due_stage(make_event(timedelta(minutes=20), status='cancelled'), NOW) is None
+    # رویدادی که زودتر شروع شده فقط اطلاع شروع می‌گیرد
+    assert due_stage(make_event(timedelta(hours=5), status='live'), NOW) == 'starting'
+
+
+def test_reminder_text_is_html_escaped():
+    text = build_reminder_text('starting', 'A <b> & B', 'https://x.test/?a=1&b=2')
+    assert '&lt;b&gt; &amp; B' in text
+    assert 'a=1&amp;b=2' in text
+
+
+def test_pending_registrations_exclude_logged(sqlite_db, monkeypatch):
+    """ثبت‌نام‌هایی که لاگ این مرحله را دارند دوباره ارسال نمی‌شوند"""
+    factory = sqlite_db(LiveEvent, EventRegistration, EventReminderLog)
+    monkeypatch.setattr(event_reminders, 'SessionFactory', factory)
+
+    session = factory()
+    session.add(make_event(timedelta(minutes=20)))
+    session.add_all([EventRegistration(id=i, event_id=1, citizen_telegram_id=100 + i) for i in range(1, 6)])
+    session.add(EventReminderLog(event_id=1, registration_id=2, stage='1hour', status='sent'))
+    session.add(EventReminderLog(event_id=1, registration_id=3, stage='1day', status='sent'))
+    session.commit()
+    session.close()
+
+    pending = event_reminders._fetch_pending_registrations(1, '1hour', 0, 10)
+    assert pending == [(1, 101), (3, 103), (4, 104), (5, 105)]
+    assert event_reminders._fetch_pending_registrations(1, '1hour', 3, 1) == [(4, 104)]
+
+
+def test_start_without_active_bot_closes_due_stage(sqlite_db, monkeypatch):
+    """بدون بات فعال، مرحله شروع بسته و رویداد live می‌شود (بدون claim دوباره)"""
+    factory = sqlite_db(LiveEvent, BotInstance)
+    monkeypatch.setattr(event_reminders, 'SessionFactory', factory)
+
+    session = factory()
+    event = make_event(timedelta(0))
+    event.starts_at = datetime.utcnow() - timedelta(minutes=5)
+    session.add(event)
+    session.add(BotInstance(id=1, candidate_id=1, bot_token='1:a', bot_username='a_bot', is_active=False))
+    session.commit()
+    session.close()
+
+    assert event_reminders._start_event_reminder(1) is None
+
+    session = factory()
+    event = session.query(LiveEvent).get(1)
+    assert (event.reminder_1day_sent, event.reminder_1hour_sent, event.starting_notice_sent) == (True, True, True)
+    assert event.status == 'live'
+    assert event.lease_owner is None
+    assert due_stage(event) is None
+    session.close()
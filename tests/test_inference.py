@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های پیش‌بینی دسته‌ای مدل‌های ML
+Batched Inference Tests
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ai_services.inference import batched_predict
+from ai_services.message_categorization import MessageCategorizer
+from ai_services.sentiment_analyzer import SentimentAnalyzer
+
+
+class FakePipeline:
+    """pipeline ساختگی: label از روی متن و ثبت هر فراخوانی"""
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.calls = []
+
+    def __call__(self, texts, batch_size=None, truncation=False):
+        if isinstance(texts, str):
+            texts = [texts]
+        self.calls.append((list(texts), batch_size))
+        return [[self.labels.get(text, {'label': 'other', 'score': 0.1})] for text in texts]
+
+
+def test_batched_predict_keeps_input_order():
+    """متن‌ها بر اساس طول مرتب و در یک فراخوانی به مدل داده می‌شوند"""
+    model = FakePipeline({'aaa': {'label': 'A', 'score': 0.9}, 'b': {'label': 'B', 'score': 0.8}})
+    predictions = batched_predict(model, ['aaa', 'b', 'cc'], batch_size=2)
+
+    assert [p['label'] for p in predictions] == ['A', 'B', 'other']
+    assert model.calls == [(['b', 'cc', 'aaa'], 2)]
+    assert batched_predict(model, []) == []
+
+
+def test_batch_categorize_uses_one_model_call():
+    categorizer = MessageCategorizer(use_ml=False)
+    categorizer.use_ml = True
+    categorizer.ml_model = FakePipeline({'پیشنهاد من': {'label': 'suggestion', 'score': 0.95}})
+
+    results = categorizer.batch_categorize(['پیشنهاد من', '', 'خیابان خراب است'], batch_size=8)
+
+    assert len(categorizer.ml_model.calls) == 1
+    assert (results[0]['category'], results[0]['method']) == ('suggestion', 'ml')
+    assert results[1]['method'] == 'empty'
+    # اطمینان کم مدل -> rule-based
+    assert (results[2]['category'], results[2]['method']) == ('complaint', 'rule_based')
+
+
+def test_batch_analyze_falls_back_when_model_fails():
+    analyzer = SentimentAnalyzer(use_ml=False)
+    analyzer.use_ml = True
+
+    def broken(texts, batch_size=None, truncation=False):
+        raise RuntimeError("out of memory")
+
+    analyzer.ml_model = broken
+    results = analyzer.batch_analyze(['خیلی عالی', 'افتضاح'])
+    assert [r['label'] for r in results] == ['positive', 'negative']
+    assert {r['method'] for r in results} == {'lexicon'}
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های lease ردیف‌ها برای اجرای زمان‌بندها روی چند نود
+Row Leasing Tests
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import BroadcastMessage
+from database.leasing import acquire_lease, renew_lease, release_lease
+
+
+@pytest.fixture
+def session(sqlite_db):
+    """دیتابیس موقت با یک broadcast"""
+    session = sqlite_db(BroadcastMessage)()
+    session.add(BroadcastMessage(id=1, candidate_id=1, bot_instance_id=1, message_text='x'))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_only_one_node_acquires(session):
+    """از دو نود فقط یکی lease را می‌گیرد؛ نود صاحب lease می‌تواند دوباره claim کند"""
+    assert acquire_lease(session, BroadcastMessage, 1, 60, owner='node-a')
+    assert not acquire_lease(session, BroadcastMessage, 1, 60, owner='node-b')
+    assert acquire_lease(session, BroadcastMessage, 1, 60, owner='node-a')
+
+
+def test_expired_lease_is_taken_over(session):
+    """پس از انقضای lease (از کار افتادن نود) نود دیگر ادامه می‌دهد"""
+    assert acquire_lease(session, BroadcastMessage, 1, 60, owner='node-a')
+    session.query(BroadcastMessage).filter_by(id=1).update({
+        'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)
+    })
+    session.commit()
+
+    assert acquire_lease(session, BroadcastMessage, 1, 60, owner='node-b')
+
+    # نود قبلی دیگر نمی‌تواند تمدید یا آزاد کند
+    assert not renew_lease(session, BroadcastMessage, 1, 60, {'sent_count': 5}, owner='node-a')
+    assert not release_lease(session, BroadcastMessage, 1, owner='node-a')
+    session.commit()
+    assert session.get(BroadcastMessage, 1).lease_owner == 'node-b'
+
+
+def test_criteria_and_release(session):
+    """شرط‌های اضافه رعایت می‌شوند و release به‌روزرسانی را همراه lease انجام می‌دهد"""
+    assert not acquire_lease(session, BroadcastMessage, 1, 60,
+                             BroadcastMessage.status == 'completed', owner='node-a')
+    assert acquire_lease(session, BroadcastMessage, 1, 60,
+                         BroadcastMessage.status == 'pending', owner='node-a')
+
+    assert release_lease(session, BroadcastMessage, 1, {'status': 'completed'}, owner='node-a')
+    session.commit()
+    session.expire_all()
+
+    broadcast = session.get(BroadcastMessage, 1)
+    assert broadcast.status == 'completed' and broadcast.lease_owner is None
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های کش file_id رسانه‌ها
+Media file_id Cache Tests
+"""
+
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import MediaCache
+from bot_engine.media_cache import (
+    MediaFileCache, media_hash, extract_file_id, is_invalid_file_id_error
+)
+
+
+@pytest.fixture
+def session_factory(sqlite_db):
+    """دیتابیس موقت برای کش"""
+    return sqlite_db(MediaCache)
+
+
+def test_extract_file_id():
+    """بزرگ‌ترین سایز عکس و file_id ویدیو/فایل استخراج می‌شود"""
+    photo = {'photo': [{'file_id': 'small'}, {'file_id': 'large'}]}
+    assert extract_file_id('photo', photo) == 'large'
+    assert extract_file_id('video', {'video': {'file_id': 'v1'}}) == 'v1'
+    assert extract_file_id('video', {'animation': {'file_id': 'a1'}}) == 'a1'
+    assert extract_file_id('document', {'text': 'x'}) is None
+    assert extract_file_id('photo', None) is None
+
+
+def test_store_get_and_invalidate(session_factory):
+    """file_id به ازای (بات، رسانه) ذخیره و بین instanceها از دیتابیس خوانده می‌شود"""
+    cache = MediaFileCache(session_factory=session_factory)
+    url = 'https://example.com/a.jpg'
+
+    assert cache.get(1, 'photo', url) is None
+    cache.store(1, 'photo', url, 'FILE1')
+    assert cache.get(1, 'photo', url) == 'FILE1'
+
+    # بات دیگر و نوع دیگر کلید جدا دارند
+    assert cache.get(2, 'photo', url) is None
+    assert media_hash('photo', url) != media_hash('document', url)
+
+    fresh = MediaFileCache(session_factory=session_factory)
+    assert fresh.get(1, 'photo', url) == 'FILE1'
+
+    fresh.invalidate(1, 'photo', url)
+    assert MediaFileCache(session_factory=session_factory).get(1, 'photo', url) is None
+
+
+def test_text_messages_are_not_cached(session_factory):
+    """پیام متنی file_id ندارد"""
+    cache = MediaFileCache(session_factory=session_factory)
+    cache.store(1, None, 'x', 'FILE')
+    assert cache.get(1, None, 'x') is None
+    assert is_invalid_file_id_error('Bad Request: wrong file identifier/HTTP URL specified')
+    assert not is_invalid_file_id_error('Forbidden: bot was blocked by the user')
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های دسته‌بندی rule-based پیام‌ها
+Rule-based Message Categorizer Tests
+"""
+
+import pytest
+import sys
+import os
+import re
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ai_services.message_categorization import (
+    KEYWORD_PATTERNS, MessageCategorizer, compile_keyword_patterns, keyword_scores
+)
+
+
+def findall_scores(text):
+    """مرجع: یک re.findall به ازای هر الگو (روش قبل از regex ترکیبی)"""
+    return {
+        category: sum(len(re.findall(pattern, text, re.IGNORECASE)) for pattern in patterns)
+        for category, patterns in KEYWORD_PATTERNS.items()
+    }
+
+
+def test_shared_keyword_counts_for_every_category():
+    """«چرا» هم شکایت و هم سوال است؛ یک بار جستجو و برای هر دو شمرده می‌شود"""
+    scores = keyword_scores('چرا؟ چرا')
+    assert scores['complaint'] == 2
+    assert scores['question'] == 2
+    assert keyword_scores('why?')['question'] == 1
+
+
+def test_nested_keywords_are_counted():
+    """کلیدواژه داخل کلیدواژه دیگر هم شمرده می‌شود («می شود» در «نمی شود»، «نه» در «متاسفانه»)"""
+    scores = keyword_scores('اینجا هیچ کاری نمی   شود')
+    assert scores['complaint'] == 1
+    assert scores['suggestion'] == 1
+    assert keyword_scores('بد نیست')['complaint'] == 1
+    assert keyword_scores('متاسفانه با سیاست‌های شما موافق نیستم')['criticism'] == 4
+    # تطابق‌های هم‌پوشان یک الگو مثل findall یک بار شمرده می‌شوند
+    assert keyword_scores('اماما')['criticism'] == 1
+
+
+@pytest.mark.parametrize('text', [
+    'سلام، چرا خیابون محله ما آسفالت نشده؟',
+    'شما عالی هستید، موفق باشید',
+    'پیشنهاد می‌کنم یک پارک در محله بسازید',
+    'برنامه شما برای ترافیک چیه؟',
+    'متاسفانه با سیاست‌های شما موافق نیستم',
+    'آقای محترم، ممنون از زحمات شما. خسته نباشید',
+    'چطور می‌توان در ستاد انتخاباتی ثبت‌نام کرد؟',
+    'وضعیت آلودگی هوا و بیکاری جوانان افتضاح است و کسی پیگیری نمی‌کند',
+    'سلامامااموفق\u200cقصد نمیشود؟ Why? WHY?',
+])
+def test_scores_match_findall_per_pattern(text):
+    assert keyword_scores(text) == findall_scores(text)
+
+
+def test_categorize_rule_based():
+    categorizer = MessageCategorizer(use_ml=False)
+    assert categorizer.categorize('شما عالی هستید، موفق باشید')['category'] == 'support'
+    assert categorizer.categorize('سلام، چرا خیابون محله ما آسفالت نشده؟')['category'] == 'complaint'
+    assert categorizer.categorize('xyz')['category'] == 'unknown'
+    assert categorizer.categorize('متاسفانه با سیاست‌های شما موافق نیستم')['category'] == 'criticism'
+
+
+def test_unsupported_pattern_is_rejected():
+    with pytest.raises(ValueError):
+        compile_keyword_patterns({'x': [r'(الف|ب)']})
+    regex, patterns = compile_keyword_patterns({'a': [r'خوب\s+است'], 'b': [r'خوب']})
+    assert [m.group() for m in regex.finditer('خوب  است و خوب')] == ['خوب  است', 'خوب']
+    assert [(pattern.pattern, category) for pattern, category in patterns] == [(r'خوب\s+است', 'a'), ('خوب', 'b')]
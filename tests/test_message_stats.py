@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های آمار و صفحه‌بندی پیام‌های نماینده
+Candidate Message Stats and Pagination Tests
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+from database.models import db, Message, CandidateCounter
+from candidate_panel.message_utils import get_message_stats, paginate_messages
+
+
+@pytest.fixture
+def app():
+    """اپ Flask با دیتابیس موقت فقط برای جدول پیام‌ها"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[Message.__table__, CandidateCounter.__table__])
+        yield app
+        db.session.remove()
+
+
+def _add_messages(candidate_id, rows):
+    started = datetime(2026, 1, 1)
+    for index, (category, priority, is_read, label, score) in enumerate(rows):
+        db.session.add(Message(
+            candidate_id=candidate_id, user_telegram_id=index, message_text=f'پیام {index}',
+            created_at=started + timedelta(minutes=index),
+            category=category, category_priority=priority, is_read=is_read,
+            sentiment_label=label, sentiment_score=score,
+        ))
+    db.session.commit()
+
+
+def test_stats_match_per_bucket_counts(app):
+    _add_messages(1, [
+        ('complaint', 'high', False, 'negative', -0.8),
+        ('complaint', 'high', True, 'negative', -0.4),
+        ('question', 'medium', False, 'neutral', 0.0),
+        ('support', 'low', True, 'positive', 0.6),
+        (None, None, False, None, None),
+    ])
+    _add_messages(2, [('complaint', 'high', False, 'negative', -1.0)])
+
+    stats = get_message_stats(1)
+    assert stats['total'] == 5
+    assert stats['unread'] == 3
+    assert (stats['complaint'], stats['question'], stats['support'], stats['criticism']) == (2, 1, 1, 0)
+    assert stats['high_priority'] == 2
+    assert (stats['positive'], stats['neutral'], stats['negative']) == (1, 1, 2)
+    assert stats['avg_sentiment'] == -0.15
+    assert stats['filtered'] == 5
+
+    assert get_message_stats(1, category='complaint', read='unread')['filtered'] == 1
+    assert get_message_stats(3)['satisfaction_rate'] == 50
+
+
+def test_keyset_pages_cover_all_messages_once(app):
+    _add_messages(1, [('question', 'medium', False, 'neutral', 0.0)] * 7)
+    query = Message.query.filter_by(candidate_id=1)
+
+    seen = []
+    before_id = None
+    while True:
+        page, before_id = paginate_messages(query, 1, before_id, per_page=3)
+        seen.extend(message.id for message in page)
+        if before_id is None:
+            break
+
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == len(set(seen)) == 7
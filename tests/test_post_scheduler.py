@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های زمان‌بند پست کانال‌ها
+Post Scheduler Tests
+"""
+
+import pytest
+import sys
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import BotInstance, BotChannel, ScheduledPost
+from bot_engine.post_scheduler import PostScheduler
+
+
+@pytest.fixture
+def session_factory(sqlite_db):
+    """دیتابیس موقت با یک بات و دو کانال"""
+    factory = sqlite_db(BotInstance, BotChannel, ScheduledPost)
+
+    session = factory()
+    session.add(BotInstance(id=1, candidate_id=1, bot_token='1:x', bot_username='b', is_active=True))
+    for channel_id in (1, 2):
+        session.add(BotChannel(id=channel_id, bot_instance_id=1, candidate_id=1,
+                               channel_id=-100 - channel_id, channel_title=f'ch{channel_id}'))
+    session.commit()
+    session.close()
+
+    return factory
+
+
+def add_post(factory, channel_id, delay, status='pending'):
+    session = factory()
+    post = ScheduledPost(channel_id=channel_id, candidate_id=1, content='x', status=status,
+                         scheduled_time=datetime.utcnow() + timedelta(seconds=delay))
+    session.add(post)
+    session.commit()
+    post_id = post.id
+    session.close()
+    return post_id
+
+
+class RecordingScheduler(PostScheduler):
+    """ارسال به تلگرام با ثبت زمان و تأخیر مصنوعی"""
+
+    def __init__(self, send_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.send_delay = send_delay
+        self.sent = []
+        self._sent_lock = threading.Lock()
+
+    def send_to_telegram(self, bot_token, chat_id, content, **kwargs):
+        time.sleep(self.send_delay)
+        with self._sent_lock:
+            self.sent.append((chat_id, time.monotonic()))
+        return len(self.sent)
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not predicate():
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_post_sent_at_due_time_not_next_poll(session_factory):
+    """پست در موعد خودش ارسال می‌شود، نه در دور بعدی polling"""
+    add_post(session_factory, 1, delay=0.5)
+    scheduler = RecordingScheduler(resync_interval=30, session_factory=session_factory)
+
+    started = time.monotonic()
+    scheduler.start()
+    try:
+        assert wait_for(lambda: scheduler.sent)
+        assert 0.4 <= scheduler.sent[0][1] - started < 1.5
+    finally:
+        scheduler.stop()
+
+    session = session_factory()
+    assert session.query(ScheduledPost).one().status == 'sent'
+    session.close()
+
+
+def test_channels_are_sent_concurrently(session_factory):
+    """ارسال کند یک کانال، کانال دیگر را معطل نمی‌کند"""
+    for channel_id in (1, 2):
+        add_post(session_factory, channel_id, delay=-1)
+    scheduler = RecordingScheduler(send_delay=0.5, session_factory=session_factory)
+
+    started = time.monotonic()
+    scheduler.check_and_send_posts()
+    try:
+        assert wait_for(lambda: len(scheduler.sent) == 2)
+        assert scheduler.sent[-1][1] - started < 0.9
+    finally:
+        scheduler.stop()
+
+
+def test_db_state_wins_over_queued_entry(session_factory):
+    """پستی که پس از قرار گرفتن در صف لغو شده ارسال نمی‌شود"""
+    post_id = add_post(session_factory, 1, delay=0.3)
+    scheduler = RecordingScheduler(session_factory=session_factory)
+    scheduler.check_and_send_posts()
+
+    session = session_factory()
+    session.query(ScheduledPost).filter_by(id=post_id).update({'status': 'cancelled'})
+    session.commit()
+    session.close()
+
+    time.sleep(0.4)
+    scheduler.check_and_send_posts()
+    scheduler.stop()
+    assert scheduler.sent == []
+
+
+def test_two_nodes_send_post_once(session_factory):
+    """دو زمان‌بند روی نودهای مختلف یک پست را فقط یک بار ارسال می‌کنند"""
+    add_post(session_factory, 1, delay=-1)
+    nodes = [
+        RecordingScheduler(send_delay=0.3, session_factory=session_factory, node_id=f'node-{i}')
+        for i in range(2)
+    ]
+
+    for scheduler in nodes:
+        scheduler.check_and_send_posts()
+    for scheduler in nodes:
+        scheduler.stop()
+
+    assert sum(len(scheduler.sent) for scheduler in nodes) == 1
+    session = session_factory()
+    post = session.query(ScheduledPost).one()
+    assert post.status == 'sent' and post.lease_owner is None
+    session.close()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های بارگذاری نماینده در طول یک درخواست پنل
+Candidate Panel Request Context Tests
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, session
+from sqlalchemy import event
+
+from database.models import db, Candidate, Plan, PlanPurchase, Message, CandidateCounter, candidate_plans
+from database.entitlements import entitlements
+from candidate_panel.request_context import (
+    current_candidate, current_plan_codes, current_active_plan, current_unread, remember_unread
+)
+
+
+@pytest.fixture
+def app():
+    """اپ Flask با دیتابیس موقت و یک نماینده دارای پلن"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'test'
+    db.init_app(app)
+
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[
+            model.__table__ for model in (Candidate, Plan, PlanPurchase, Message, CandidateCounter)
+        ] + [candidate_plans])
+
+        plan = Plan(name='Analytics', code='ANALYTICS')
+        candidate = Candidate(username='c1', password='x', full_name='نماینده', plans=[plan])
+        db.session.add(candidate)
+        db.session.flush()
+        db.session.add(PlanPurchase(
+            candidate_id=candidate.id, plan_id=plan.id, start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=30), payment_amount=0
+        ))
+        db.session.add_all([
+            Message(candidate_id=candidate.id, user_telegram_id=index, message_text='سلام', is_read=False)
+            for index in range(3)
+        ])
+        db.session.commit()
+        db.session.remove()
+
+        queries = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+        app.queries = queries
+        entitlements.invalidate()
+        yield app
+        db.session.remove()
+        entitlements.invalidate()
+
+
+def test_candidate_loaded_once_without_plans(app):
+    """نماینده یک بار و بدون کوئری پلن‌ها خوانده می‌شود"""
+    with app.test_request_context('/dashboard'):
+        session['candidate_id'] = 1
+        candidate = current_candidate()
+        assert current_candidate() is candidate
+        assert len(app.queries) == 1
+        assert 'plans' not in app.queries[0]
+
+        assert current_plan_codes() == {'ANALYTICS'}
+        assert current_plan_codes() == {'ANALYTICS'}
+        assert len(app.queries) == 2
+
+
+def test_active_plan_and_unread_memoized(app):
+    with app.test_request_context('/dashboard'):
+        session['candidate_id'] = 1
+        assert current_active_plan().code == 'ANALYTICS'
+        assert current_unread() == 3
+        count = len(app.queries)
+
+        assert current_active_plan().code == 'ANALYTICS'
+        assert current_unread() == 3
+        assert len(app.queries) == count
+
+
+def test_remembered_unread_skips_counter_query(app):
+    with app.test_request_context('/messages'):
+        session['candidate_id'] = 1
+        remember_unread(3)
+        assert current_unread() == 3
+        assert app.queries == []
+
+
+def test_anonymous_request(app):
+    with app.test_request_context('/login'):
+        assert current_candidate() is None
+        assert current_plan_codes() == frozenset()
+        assert current_unread() == 0
+        assert app.queries == []
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های تحلیل احساسات مبتنی بر lexicon
+Lexicon Sentiment Analyzer Tests
+"""
+
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ai_services.sentiment_analyzer import (
+    SentimentAnalyzer, SentimentLexicon, POSITIVE, NEGATIVE, NEGATION, INTENSIFIER
+)
+
+
+def test_inflected_forms_resolve_to_lexicon_words():
+    lexicon = SentimentLexicon.default()
+    assert lexicon.base_word('دوستان') == 'دوست'
+    assert lexicon.base_word('خوبی‌ها') == 'خوب'
+    assert lexicon.base_word('امیدوارم') == 'امیدوار'
+    assert NEGATION in lexicon.lookup('نمی‌خواهم')
+    # واژه‌ای که فقط شامل یک واژه lexicon است (بدن ⊃ بد) منطبق نمی‌شود
+    assert lexicon.lookup('بدن') == {}
+
+
+def test_phrases_and_intensifiers():
+    lexicon = SentimentLexicon.default()
+    assert list(lexicon.scan('خسته نباشید')) == [{POSITIVE: 1.0}]
+    assert list(lexicon.scan('به شدت ناراحت')) == [{INTENSIFIER: 1.6}, {NEGATIVE: 1.0}]
+
+
+def test_negation_before_and_after_word():
+    analyzer = SentimentAnalyzer()
+    assert analyzer.analyze('اصلا راضی نیستم')['label'] == 'negative'
+    assert analyzer.analyze('هیچ مشکلی نیست')['label'] == 'positive'
+    assert analyzer.analyze('شما واقعا عالی هستید! خیلی موفق باشید')['label'] == 'positive'
+    assert analyzer.analyze('متاسفانه با برنامه‌های شما موافق نیستم')['label'] == 'negative'
+
+
+def test_lexicon_loaded_from_file(tmp_path):
+    path = tmp_path / 'lexicon.json'
+    path.write_text(json.dumps({
+        'positive': {'شاهکار': 2.0},
+        'negative': ['فاجعه'] + [f'واژه{i}' for i in range(5000)],
+        'negations': ['نیست'],
+        'intensifiers': {'خیلی': 1.5},
+    }, ensure_ascii=False), encoding='utf-8')
+
+    analyzer = SentimentAnalyzer(lexicon_path=str(path))
+    assert len(analyzer.lexicon) == 5004
+    assert analyzer.analyze('خیلی شاهکار بود')['label'] == 'positive'
+    assert analyzer.analyze('فاجعه‌ها')['label'] == 'negative'
+    # واژگان داخلی در این lexicon نیستند
+    assert analyzer.analyze('عالی')['label'] == 'neutral'
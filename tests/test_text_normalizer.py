@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های سرویس نرمال‌سازی متن
+Text Normalizer Tests
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ai_services.text_normalizer import TextNormalizer, fallback_normalize
+
+
+def test_fallback_unifies_arabic_characters():
+    """حروف عربی یکسان و اعراب و کشیده حذف می‌شوند"""
+    assert fallback_normalize('كيفيت') == 'کیفیت'
+    assert fallback_normalize('مُشـكل') == 'مشکل'
+
+
+def test_normalize_cleans_whitespace_without_hazm():
+    normalizer = TextNormalizer(use_hazm=False)
+    assert normalizer.normalize('  سلام\n\tخوبي  ') == 'سلام خوبی'
+    assert normalizer.normalize('') == ''
+    assert normalizer.backend == 'fallback'
+
+
+def test_lru_cache_hits_and_eviction():
+    """پیام تکراری از کش خوانده می‌شود و قدیمی‌ترین متن حذف می‌شود"""
+    normalizer = TextNormalizer(cache_size=2, use_hazm=False)
+    normalizer.normalize('الف')
+    normalizer.normalize('ب')
+    normalizer.normalize('الف')
+    normalizer.normalize('پ')
+
+    stats = normalizer.get_stats()
+    assert (stats['hits'], stats['misses'], stats['cached']) == (1, 3, 2)
+    assert 'ب' not in normalizer._cache
+    assert list(normalizer._cache) == ['الف', 'پ']
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+تست‌های ثبت دسته‌ای فعالیت کاربران بات
+Batched Bot User Activity Tests
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.models import BotUser
+from bot_engine import telegram_bot
+from bot_engine.analytics_events import analytics_events
+from bot_engine.user_activity import UserActivityBuffer
+
+
+@pytest.fixture
+def session_factory(sqlite_db):
+    """دیتابیس موقت برای بافر"""
+    return sqlite_db(BotUser)
+
+
+def test_flush_inserts_new_and_updates_existing(session_factory):
+    """کاربران جدید درج و last_interaction کاربران موجود به‌روز می‌شود"""
+    old = datetime.utcnow() - timedelta(days=30)
+    session = session_factory()
+    session.add(BotUser(bot_instance_id=1, telegram_id=10, first_name='Old',
+                        joined_at=old, last_interaction=old))
+    session.commit()
+    session.close()
+
+    buffer = UserActivityBuffer(session_factory=session_factory)
+    now = datetime.utcnow()
+    buffer._pending[(1, 10)] = {'username': 'renamed', 'first_name': None, 'last_name': None, 'seen_at': now}
+    buffer._pending[(1, 11)] = {'username': 'new', 'first_name': 'New', 'last_name': None, 'seen_at': now}
+
+    assert buffer.flush() == 2
+
+    session = session_factory()
+    users = {u.telegram_id: u for u in session.query(BotUser).all()}
+    session.close()
+
+    assert len(users) == 2
+    assert users[10].last_interaction == now
+    assert users[10].username == 'renamed'
+    assert users[10].first_name == 'Old'
+    assert users[11].joined_at == now
+    assert buffer.is_known(1, 10) and buffer.is_known(1, 11)
+
+
+def test_repeated_sightings_are_deduplicated(session_factory):
+    """چند دیده‌شدن یک کاربر فقط یک رکورد می‌سازد"""
+    buffer = UserActivityBuffer(session_factory=session_factory)
+    buffer.start = lambda: None  # بدون thread پس‌زمینه
+    for _ in range(5):
+        buffer.record(1, 20, first_name='A')
+
+    assert buffer.get_stats()['pending'] == 1
+    buffer.flush()
+
+    session = session_factory()
+    assert session.query(BotUser).filter_by(telegram_id=20).count() == 1
+    session.close()
+
+
+def test_known_cache_is_bounded():
+    """LRU کاربران شناخته‌شده از سقف بزرگ‌تر نمی‌شود"""
+    buffer = UserActivityBuffer(known_cache_size=2)
+    buffer.mark_known(1, 1)
+    buffer.mark_known(1, 2)
+    buffer.mark_known(1, 3)
+
+    assert not buffer.is_known(1, 1)
+    assert buffer.is_known(1, 3)
+
+
+@pytest.fixture
+def new_users(monkeypatch):
+    """عضویت‌های شمرده‌شده (بدون بافر واقعی آمار)"""
+    recorded = []
+    monkeypatch.setattr(analytics_events, 'record_new_user',
+                        lambda bot_instance_id, at=None: recorded.append(bot_instance_id))
+    return recorded
+
+
+def test_flush_after_register_does_not_duplicate(session_factory, monkeypatch, new_users):
+    """کاربری که /start ثبتش کرده در flush بعدی دوباره درج یا شمرده نمی‌شود"""
+    monkeypatch.setattr(telegram_bot, 'Session', session_factory)
+    buffer = UserActivityBuffer(session_factory=session_factory)
+    now = datetime.utcnow()
+    buffer._pending[(1, 30)] = {'username': 'u30', 'first_name': None, 'last_name': None, 'seen_at': now}
+
+    telegram_bot.register_bot_user(1, 30, 'u30', 'First', None)
+    assert buffer.flush() == 1
+
+    session = session_factory()
+    [user] = session.query(BotUser).filter_by(bot_instance_id=1, telegram_id=30).all()
+    session.close()
+    assert user.first_name == 'First'
+    assert user.last_interaction == now
+    assert new_users == [1]
+    assert buffer.inserted_users == 0
+
+
+def test_register_after_flush_awards_nothing(session_factory, monkeypatch, new_users):
+    """اگر flush کاربر را زودتر درج کرده باشد، register_bot_user عضویت را نمی‌شمارد"""
+    monkeypatch.setattr(telegram_bot, 'Session', session_factory)
+    buffer = UserActivityBuffer(session_factory=session_factory)
+    buffer._pending[(1, 40)] = {'username': None, 'first_name': 'A', 'last_name': None,
+                                'seen_at': datetime.utcnow()}
+    buffer.flush()
+
+    assert telegram_bot.register_bot_user(1, 40, None, 'A', None) is None
+    assert new_users == [1]
+
+    session = session_factory()
+    assert session.query(BotUser).filter_by(bot_instance_id=1, telegram_id=40).count() == 1
+    session.close()